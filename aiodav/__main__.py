@@ -0,0 +1,88 @@
+# coding: utf-8
+import argparse
+import functools
+import logging
+import sys
+import typing
+
+from aiohttp import web
+
+from aiodav import server
+
+logger = logging.getLogger('aiodav.server')
+
+
+def mount(value: str):
+    prefix, sep, root_dir = value.partition('=')
+    if not sep or not prefix:
+        raise argparse.ArgumentTypeError("PREFIX=DIRECTORY expected")
+    return prefix.strip('/'), root_dir
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m aiodav',
+                                     description='asyncio WebDAV server')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    serve = commands.add_parser(
+        'serve', help='run multi-process server',
+        description='Runs workers sharing listening port. SIGHUP restarts '
+                    'workers gracefully, SIGTERM stops them.')
+    serve.add_argument('--host', default='0.0.0.0')
+    serve.add_argument('--port', type=int, default=8080)
+    serve.add_argument('-w', '--workers', type=int, default=1,
+                       help='worker processes (default: %(default)s); '
+                            'more than one requires application keeping '
+                            'mount state outside of process')
+    serve.add_argument('--threads', type=int,
+                       help='executor threads per worker (default: '
+                            '5 * CPU count / workers, at least 4)')
+    serve.add_argument('--backlog', type=int, default=128)
+    serve.add_argument('--shutdown-timeout', type=float, default=30.0,
+                       help='time to finish active requests on stop '
+                            '(default: %(default)s)')
+    source = serve.add_mutually_exclusive_group()
+    source.add_argument('-m', '--mount', dest='mounts', type=mount,
+                        action='append', metavar='PREFIX=DIRECTORY',
+                        help='serve directory at prefix, may be repeated')
+    source.add_argument('--app', metavar='MODULE:ATTRIBUTE',
+                        help='web.Application or factory returning it')
+    serve.add_argument('--log-level', default='INFO')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    logging.basicConfig(level=options.log_level,
+                        format='%(asctime)s %(process)d %(name)s '
+                               '%(levelname)s %(message)s')
+    if options.app:
+        factory = functools.partial(server.load_app, options.app)
+    else:
+        factory = functools.partial(server.mounts_app,
+                                    dict(options.mounts or ()))
+    if options.workers > 1:
+        # i.e. lock taken on one worker is not checked by others
+        local_state = server.app_process_local_state(factory)
+        if local_state:
+            logger.error("Can't run %s workers, mount state is kept in "
+                         "process memory: %s", options.workers,
+                         ', '.join(local_state))
+            return 2
+    return serve(options, factory)
+
+
+def serve(options: argparse.Namespace,
+          factory: typing.Callable[[], web.Application]) -> int:
+    """ Runs supervisor with workers serving application from factory."""
+    workers = options.workers
+    worker = server.Worker(
+        factory, host=options.host, port=options.port,
+        threads=options.threads or server.default_threads(workers),
+        backlog=options.backlog, shutdown_timeout=options.shutdown_timeout)
+    supervisor = server.Supervisor(worker, workers)
+    return supervisor.run()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
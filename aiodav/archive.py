@@ -0,0 +1,186 @@
+# coding: utf-8
+"""
+Streaming zip and tar archives.
+
+Archives are written sequentially to an async ``write`` callback while
+file contents are being read, so neither archive nor its members are
+staged in memory or on disk. Zip members are stored without compression,
+their CRC and sizes follow content in data descriptors and zip64 fields
+are always written, so members and archives may exceed 4 GiB.
+"""
+import struct
+import tarfile
+import time
+import typing
+import zlib
+
+#: async callback receiving archive bytes
+Write = typing.Callable[[bytes], typing.Awaitable]
+#: streams member content to ``write`` callback, like
+#: ``AbstractResource.get_content``
+Read = typing.Callable[[typing.Callable[[bytes], typing.Any]],
+                       typing.Awaitable]
+
+ZIP64_VERSION = 45
+ZIP_FLAGS = 0x08 | 0x800  # data descriptor, utf-8 names
+ZIP_UNIX = 3 << 8
+ZIP_MAX = 0xffffffff
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+ZIP64_LOCAL_EXTRA = struct.Struct('<HHQQ')
+DATA_DESCRIPTOR = struct.Struct('<IIQQ')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+ZIP64_CENTRAL_EXTRA = struct.Struct('<HHQQQ')
+ZIP64_END = struct.Struct('<IQHHIIQQQQ')
+ZIP64_LOCATOR = struct.Struct('<IIQI')
+END = struct.Struct('<IHHHHIIH')
+
+TAR_BLOCK = 512
+
+
+def dos_datetime(mtime: float) -> typing.Tuple[int, int]:
+    """ Returns (time, date) in MS-DOS format used by zip."""
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class ZipStreamWriter:
+    """ Writes store-only zip64 archive."""
+
+    def __init__(self, write: Write):
+        self._write = write
+        self._offset = 0
+        # (name, dos time, dos date, crc, size, offset, external attrs)
+        self._entries = []
+
+    async def _emit(self, data: bytes):
+        self._offset += len(data)
+        await self._write(data)
+
+    async def _local_header(self, name: bytes, mtime: float
+                            ) -> typing.Tuple[int, int, int]:
+        offset = self._offset
+        dos_time, dos_date = dos_datetime(mtime)
+        extra = ZIP64_LOCAL_EXTRA.pack(1, 16, 0, 0)
+        await self._emit(LOCAL_HEADER.pack(
+            0x04034b50, ZIP64_VERSION, ZIP_FLAGS, 0, dos_time, dos_date, 0,
+            ZIP_MAX, ZIP_MAX, len(name), len(extra)) + name + extra)
+        return offset, dos_time, dos_date
+
+    async def _entry(self, name: str, mtime: float, attrs: int,
+                     read: typing.Optional[Read]) -> int:
+        """
+        :param attrs: external attributes, unix mode in high word
+        """
+        encoded = name.encode('utf-8')
+        offset, dos_time, dos_date = await self._local_header(encoded, mtime)
+        crc = 0
+        size = 0
+
+        async def write(data: bytes):
+            nonlocal crc, size
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+            await self._emit(data)
+
+        if read is not None:
+            await read(write)
+        await self._emit(DATA_DESCRIPTOR.pack(0x08074b50, crc, size, size))
+        self._entries.append((encoded, dos_time, dos_date, crc, size, offset,
+                              attrs))
+        return size
+
+    async def add_directory(self, name: str, mtime: float):
+        """
+        :param name: member path without trailing slash
+        """
+        # MS-DOS directory attribute in low byte
+        await self._entry(name.rstrip('/') + '/', mtime,
+                          (0o40755 << 16) | 0x10, None)
+
+    async def add_file(self, name: str, mtime: float, size: int,
+                       read: Read) -> int:
+        """ Streams file content into archive.
+
+        :param size: expected size, not needed for zip
+        :returns: number of bytes written
+        """
+        return await self._entry(name, mtime, 0o100644 << 16, read)
+
+    async def close(self):
+        """ Writes central directory."""
+        start = self._offset
+        for name, dos_time, dos_date, crc, size, offset, attrs in \
+                self._entries:
+            extra = ZIP64_CENTRAL_EXTRA.pack(1, 24, size, size, offset)
+            await self._emit(CENTRAL_HEADER.pack(
+                0x02014b50, ZIP_UNIX | ZIP64_VERSION, ZIP64_VERSION,
+                ZIP_FLAGS, 0, dos_time, dos_date, crc, ZIP_MAX, ZIP_MAX,
+                len(name), len(extra), 0, 0, 0, attrs, ZIP_MAX) +
+                name + extra)
+        end = self._offset
+        count = len(self._entries)
+        await self._emit(ZIP64_END.pack(
+            0x06064b50, ZIP64_END.size - 12, ZIP_UNIX | ZIP64_VERSION,
+            ZIP64_VERSION, 0, 0, count, count, end - start, start))
+        await self._emit(ZIP64_LOCATOR.pack(0x07064b50, 0, end, 1))
+        await self._emit(END.pack(
+            0x06054b50, 0, 0, min(count, 0xffff), min(count, 0xffff),
+            min(end - start, ZIP_MAX), min(start, ZIP_MAX), 0))
+
+
+class TarStreamWriter:
+    """ Writes POSIX pax tar archive.
+
+    Member size is written before content, so content is truncated or
+    padded with zeros if file changed since its size was read.
+    """
+
+    def __init__(self, write: Write):
+        self._write = write
+
+    async def _header(self, info: tarfile.TarInfo):
+        await self._write(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'strict'))
+
+    async def add_directory(self, name: str, mtime: float):
+        info = tarfile.TarInfo(name.rstrip('/'))
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        info.mtime = int(mtime)
+        await self._header(info)
+
+    async def add_file(self, name: str, mtime: float, size: int,
+                       read: Read) -> int:
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mode = 0o644
+        info.mtime = int(mtime)
+        await self._header(info)
+        written = 0
+
+        async def write(data: bytes):
+            nonlocal written
+            data = data[:size - written]
+            if data:
+                written += len(data)
+                await self._write(data)
+
+        await read(write)
+        padding = size - written + -size % TAR_BLOCK
+        while padding:
+            chunk = min(padding, 64 * 1024)
+            await self._write(bytes(chunk))
+            padding -= chunk
+        return written
+
+    async def close(self):
+        await self._write(bytes(2 * TAR_BLOCK))
+
+
+#: format -> (writer class, content type)
+ARCHIVE_FORMATS = {
+    'zip': (ZipStreamWriter, 'application/zip'),
+    'tar': (TarStreamWriter, 'application/x-tar'),
+}
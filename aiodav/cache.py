@@ -0,0 +1,97 @@
+# coding: utf-8
+"""
+Cache of serialized PROPFIND responses.
+
+Each ``<D:response>`` fragment of a multistatus body is stored by resource
+href, resource version and parsed PROPFIND request, so listings of mostly
+unchanged collections are assembled from cached bytes. Resource version
+changes with every live property, so stale fragments are never matched and
+are evicted as least recently used. Requests changing dead properties
+drop fragments of the changed href, its ancestors and its descendants.
+"""
+import typing
+from collections import OrderedDict
+
+from aiodav.propfind import PropfindRequest
+from aiodav.resources import AbstractResource
+
+#: approximate memory used by cache entry besides fragment and href
+ENTRY_OVERHEAD = 200
+
+
+class PropstatCache:
+    """ Memory-bounded LRU cache of serialized ``<D:response>`` fragments.
+
+    Keys contain full hrefs, so a single cache may be shared by mounts.
+    """
+    #: writes made by other server processes don't invalidate entries
+    process_local = True
+
+    def __init__(self, max_size: int=4 * 1024 * 1024):
+        """
+        :param max_size: approximate memory limit in bytes
+        """
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, href: str, resource: AbstractResource,
+            propfind: PropfindRequest) -> typing.Optional[tuple]:
+        """ Returns cache key, None if resource is not versioned."""
+        version = resource.version
+        if version is None:
+            return None
+        return href, version, propfind
+
+    def get(self, key: typing.Optional[tuple]) -> typing.Optional[bytes]:
+        if key is None:
+            return None
+        fragment = self._entries.get(key)
+        if fragment is not None:
+            self._entries.move_to_end(key)
+        return fragment
+
+    def put(self, key: typing.Optional[tuple], fragment: bytes):
+        if key is None:
+            return
+        size = self._size(key, fragment)
+        if size > self.max_size:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= self._size(key, old)
+        self._entries[key] = fragment
+        self.size += size
+        while self.size > self.max_size:
+            old_key, old = self._entries.popitem(last=False)
+            self.size -= self._size(old_key, old)
+
+    @staticmethod
+    def _size(key: tuple, fragment: bytes) -> int:
+        return len(fragment) + len(key[0]) + ENTRY_OVERHEAD
+
+    def invalidate(self, href: str):
+        """ Drops fragments of resources whose dead properties may change.
+
+        :param href: absolute href of written resource
+        """
+        path = href.rstrip('/')
+        prefix = path + '/'
+        ancestors = set()
+        parent = path
+        while parent:
+            parent = parent.rpartition('/')[0]
+            ancestors.add(parent)
+        for key, fragment in list(self._entries.items()):
+            entry = key[0].rstrip('/')
+            if (entry == path or entry in ancestors or
+                    entry.startswith(prefix)):
+                del self._entries[key]
+                self.size -= self._size(key, fragment)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
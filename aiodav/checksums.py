@@ -0,0 +1,149 @@
+# coding: utf-8
+"""
+Background content checksums.
+
+Files are hashed in a bounded thread pool after they are written or when a
+checksum is first requested, never while a request waits. Digest is stored
+with file mtime and size in ``user.aiodav.checksum`` extended attribute, so
+it survives restarts and renames; filesystems without user xattrs keep
+digests in memory only. Checksum is served only while stored mtime and size
+match the file.
+"""
+import asyncio
+import hashlib
+import os
+import typing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+#: extended attribute holding ``<algorithm>:<hexdigest>:<mtime_ns>:<size>``
+XATTR_NAME = 'user.aiodav.checksum'
+
+#: live property with ``ALGORITHM:hexdigest`` value
+CHECKSUM_PROP = '{urn:aiodav}checksum'
+
+#: (mtime_ns, size, digest)
+Record = typing.Tuple[int, int, str]
+
+
+class ChecksumService:
+    """ Computes and caches file checksums in background."""
+
+    def __init__(self, algorithm: str='sha1', *, workers: int=2,
+                 max_pending: int=1000, cache_size: int=65536,
+                 block_size: int=1024 * 1024):
+        """
+        :param algorithm: hashlib algorithm name
+        :param workers: number of hashing threads
+        :param max_pending: hashing requests over this limit are dropped and
+            retried on next checksum request
+        :param cache_size: number of digests kept in memory
+        """
+        hashlib.new(algorithm)
+        self.algorithm = algorithm
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self.block_size = block_size
+        self._executor = ThreadPoolExecutor(workers)
+        self._records = OrderedDict()
+        self._pending = {}
+
+    def checksum(self, path: str, st: os.stat_result) -> typing.Optional[str]:
+        """ Returns ``ALGORITHM:hexdigest`` if digest for file state is known,
+        otherwise requests hashing in background and returns None.
+
+        :param path: absolute file path
+        :param st: current file stat
+        """
+        checksum = self.peek(path, st)
+        if checksum is None:
+            self.request(path)
+        return checksum
+
+    def peek(self, path: str, st: os.stat_result) -> typing.Optional[str]:
+        """ Returns ``ALGORITHM:hexdigest`` if digest for file state is known.
+        """
+        record = self._records.get(path)
+        if record is None or record[:2] != (st.st_mtime_ns, st.st_size):
+            return None
+        self._records.move_to_end(path)
+        return '%s:%s' % (self.algorithm.upper(), record[2])
+
+    def request(self, path: str):
+        """ Loads stored digest or hashes file in background."""
+        if path in self._pending or len(self._pending) >= self.max_pending:
+            return
+        loop = asyncio.get_event_loop()
+        future = loop.run_in_executor(self._executor, self._load, path)
+        self._pending[path] = future
+        future.add_done_callback(lambda f: self._loaded(path, f))
+
+    def _loaded(self, path: str, future: asyncio.Future):
+        del self._pending[path]
+        if future.cancelled() or future.exception() is not None:
+            return
+        record = future.result()
+        if record is None:
+            self._records.pop(path, None)
+            return
+        self._records[path] = record
+        self._records.move_to_end(path)
+        while len(self._records) > self.cache_size:
+            self._records.popitem(last=False)
+
+    async def join(self):
+        """ Waits for all pending hashing to complete."""
+        while self._pending:
+            await asyncio.wait(list(self._pending.values()))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def _load(self, path: str) -> typing.Optional[Record]:
+        """ Returns fresh stored record or hashes file, None if file was
+        removed or changed while being hashed."""
+        try:
+            st = os.stat(path)
+            record = self._read_xattr(path)
+            if record is not None and record[:2] == (st.st_mtime_ns,
+                                                     st.st_size):
+                return record
+            digest = self._hash(path)
+            current = os.stat(path)
+            if (current.st_mtime_ns, current.st_size) != (st.st_mtime_ns,
+                                                           st.st_size):
+                return None
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            return None
+        record = (st.st_mtime_ns, st.st_size, digest)
+        self._write_xattr(path, record)
+        return record
+
+    def _hash(self, path: str) -> str:
+        h = hashlib.new(self.algorithm)
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(self.block_size)
+                if not block:
+                    break
+                h.update(block)
+        return h.hexdigest()
+
+    def _read_xattr(self, path: str) -> typing.Optional[Record]:
+        try:
+            value = os.getxattr(path, XATTR_NAME).decode('ascii')
+            algorithm, digest, mtime_ns, size = value.split(':')
+            if algorithm != self.algorithm:
+                return None
+            return int(mtime_ns), int(size), digest
+        except (OSError, AttributeError, ValueError):
+            # no attribute, xattrs not supported or malformed value
+            return None
+
+    def _write_xattr(self, path: str, record: Record):
+        mtime_ns, size, digest = record
+        value = '%s:%s:%d:%d' % (self.algorithm, digest, mtime_ns, size)
+        try:
+            os.setxattr(path, XATTR_NAME, value.encode('ascii'))
+        except (OSError, AttributeError):
+            pass
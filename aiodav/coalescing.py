@@ -0,0 +1,65 @@
+# coding: utf-8
+"""
+Single-flight coalescing of concurrent identical reads.
+
+First request for a key starts computation; identical requests arriving
+while it runs wait for the same result instead of repeating backend calls.
+Results are not cached: a key is forgotten as soon as its computation ends,
+or earlier when a write invalidates its path, so requests arriving after a
+write always start fresh computation.
+"""
+import asyncio
+import typing
+
+
+def _parent(path: str) -> str:
+    return path.rpartition('/')[0]
+
+
+class SingleFlight:
+    """ In-flight computations of a single mount by key."""
+
+    def __init__(self, *, loop: asyncio.AbstractEventLoop=None):
+        self.loop = loop
+        # key -> (path, task)
+        self._flights = {}
+
+    def __len__(self):
+        return len(self._flights)
+
+    async def run(self, key: typing.Hashable, path: str,
+                  factory: typing.Callable[[], typing.Awaitable]):
+        """ Returns result of running or new computation for key.
+
+        :param path: resource path the result depends on, for invalidation
+        :param factory: starts computation
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(factory(), loop=self.loop)
+            flight = self._flights[key] = (path.strip('/'), task)
+            task.add_done_callback(lambda t: self._forget(key, t))
+        # cancelled request doesn't cancel computation shared with others
+        return await asyncio.shield(flight[1], loop=self.loop)
+
+    def _forget(self, key: typing.Hashable, task: asyncio.Task):
+        flight = self._flights.get(key)
+        if flight is not None and flight[1] is task:
+            del self._flights[key]
+        if not task.cancelled():
+            # retrieve exception when all waiters are gone
+            task.exception()
+
+    def invalidate(self, path: str):
+        """ Stops sharing computations affected by write to path.
+
+        These are computations for path itself, its descendants and its
+        parent, which lists path as a member.
+        """
+        path = path.strip('/')
+        prefix = path + '/' if path else ''
+        parent = _parent(path)
+        for key, (flight_path, task) in list(self._flights.items()):
+            if (flight_path == path or flight_path.startswith(prefix) or
+                    flight_path == parent):
+                del self._flights[key]
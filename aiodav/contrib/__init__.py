@@ -6,13 +6,34 @@ import jinja2
 from aiohttp import web
 
 from aiodav import views, resources, conf
+from aiodav.routing import MountDispatcher
 
+from aiodav.contrib.admission import setup_admission
 from aiodav.contrib.debugtoolbar import setup_aiodav_panels
+from aiodav.contrib.metrics import setup_metrics
+from aiodav.contrib.profiler import setup_profiler
 
 
 def setup(app: web.Application, *, prefix:str ='/', hack_debugtoolbar: bool=True,
-          mounts: Dict[str, resources.AbstractResource]=None):
+          mounts: Dict[str, resources.AbstractResource]=None,
+          metrics: bool=False, metrics_path: str='/metrics',
+          mount_options: Dict[str, dict]=None, profiler: dict=None,
+          admission: dict=None):
+    """ Registers aiodav views in application.
+
+    :param mounts: WebDAV resources by mount prefix
+    :param mount_options: ResourceView options by mount prefix, i.e.
+        ``{'webdav': {'server_timing': True, 'timing_log': True}}``
+    :param metrics: register Prometheus metrics middleware and endpoint
+    :param profiler: ``setup_profiler`` arguments to enable on-demand
+        request profiling, i.e. ``{'directory': '/tmp/profiles',
+        'token': 'secret'}``
+    :param admission: ``setup_admission`` arguments to enable concurrency
+        limits, i.e. ``{'client_limits': {'transfer': 2}}``; queue metrics
+        are exposed when ``metrics`` is enabled
+    """
     mounts = mounts or {'webdav': resources.FileSystemResource('webdav')}
+    mount_options = mount_options or {}
     # setup jinja2 for aiodav templates
     loader = jinja2.PackageLoader('aiodav')
     aiohttp_jinja2.setup(app, loader=loader, extensions=['jinja2.ext.with_'])
@@ -22,17 +43,88 @@ def setup(app: web.Application, *, prefix:str ='/', hack_debugtoolbar: bool=True
 
     app.router.add_route('GET', prefix, views.root_view)
 
-    for prefix, resource in mounts.items():
-        resource_view = views.ResourceView.with_resource(resource, prefix)
-        path = '/%s{relative:.*}' % prefix.strip('/')
-        dav_resource = app.router.add_resource(path)
-        route = views.DavResourceRoute('*', resource_view, dav_resource)
-        dav_resource.register_route(route)
+    dav_metrics = None
+    if metrics:
+        dav_metrics = setup_metrics(app, mounts, path=metrics_path)
+
+    admission_controller = None
+    if admission is not None:
+        # metrics middleware is registered first, so rejections are counted
+        registry = dav_metrics.registry if dav_metrics else None
+        admission_controller = setup_admission(app, registry=registry,
+                                               **admission)
+
+    request_profiler = None
+    if profiler:
+        request_profiler = setup_profiler(app, **profiler)
+
+    # single router resource for all mounts
+    dispatcher = MountDispatcher()
+    # aiohttp 0.22 has no public method to register custom resource
+    register = getattr(app.router, 'register_resource',
+                       app.router._reg_resource)
+    register(dispatcher)
 
     app[conf.APP_KEY] = {
-        'mounts': mounts
+        'mounts': {},
+        'metrics': dav_metrics,
+        'profiler': request_profiler,
+        'admission': admission_controller,
+        'dispatcher': dispatcher,
     }
+    for prefix, resource in mounts.items():
+        add_mount(app, prefix, resource, **mount_options.get(prefix, {}))
+    app.on_cleanup.append(close_mounts)
+
+
+def _close_mount(view: views.ResourceView):
+    """ Stops inotify watcher and closes property store of mount."""
+    feed = view.kw.get('change_feed')
+    if feed is not None:
+        feed.close()
+    store = view.kw.get('property_store')
+    if store is not None:
+        store.close()
+
+
+async def close_mounts(app: web.Application):
+    """ Releases change feeds and property stores of mounts."""
+    for route in app[conf.APP_KEY]['dispatcher']:
+        _close_mount(route.handler)
+
+
+def add_mount(app: web.Application, prefix: str,
+              resource: resources.AbstractResource, **options):
+    """ Mounts WebDAV resource to application configured by ``setup``.
+
+    May be called while application is running. Prefix slashes are
+    ignored, ``/dav/`` and ``dav`` is the same mount.
+
+    :param options: ResourceView options, as in ``mount_options`` of
+        ``setup``
+    :raises: ValueError if prefix is already mounted
+    """
+    aiodav_conf = app[conf.APP_KEY]
+    prefix = prefix.strip('/')
+    resource_view = views.ResourceView.with_resource(resource, prefix,
+                                                     **options)
+    aiodav_conf['dispatcher'].add_mount(prefix, resource_view)
+    aiodav_conf['mounts'][prefix] = resource
+    if aiodav_conf['metrics'] is not None:
+        aiodav_conf['metrics'].instrument(resource)
 
 
+def remove_mount(app: web.Application,
+                 prefix: str) -> resources.AbstractResource:
+    """ Unmounts WebDAV resource.
 
+    Change feed and property store of mount are closed, requests in
+    progress fail on property store access.
 
+    :raises: KeyError if prefix is not mounted
+    """
+    aiodav_conf = app[conf.APP_KEY]
+    prefix = prefix.strip('/')
+    route = aiodav_conf['dispatcher'].remove_mount(prefix)
+    _close_mount(route.handler)
+    return aiodav_conf['mounts'].pop(prefix)
@@ -0,0 +1,228 @@
+# coding: utf-8
+"""
+Admission control for WebDAV requests.
+
+Each request to a mount takes a slot from per-client and per-mount budgets of
+its class: metadata requests (PROPFIND, LOCK, MKCOL...) and bulk transfers
+(GET, PUT, COPY) are limited separately, so long transfers don't block
+listings. Requests exceeding budget wait in a bounded FIFO queue; when queue
+is full or wait takes too long, request is rejected with ``503`` and
+``Retry-After`` header.
+"""
+import asyncio
+import typing
+from collections import deque
+
+from aiohttp import web
+
+from aiodav import views
+from aiodav.contrib.metrics import Registry
+
+METADATA = 'metadata'
+TRANSFER = 'transfer'
+
+TRANSFER_METHODS = {'GET', 'PUT', 'POST', 'COPY'}
+
+
+class Overloaded(Exception):
+    """ Request was not admitted."""
+
+
+def request_class(request: web.Request) -> str:
+    if request.method in TRANSFER_METHODS and 'search' not in request.GET:
+        return TRANSFER
+    return METADATA
+
+
+def client_address(request: web.Request) -> str:
+    peername = request.transport.get_extra_info('peername')
+    if isinstance(peername, (list, tuple)):
+        return peername[0]
+    return str(peername)
+
+
+class Limiter:
+    """ Semaphore with bounded FIFO wait queue."""
+
+    def __init__(self, limit: int, queue_size: int, *, loop=None):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.loop = loop
+        self.active = 0
+        self._waiters = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def idle(self) -> bool:
+        return not self.active and not self._waiters
+
+    async def acquire(self, timeout: float=None):
+        """
+        :raises: Overloaded if queue is full or timeout expired
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            raise Overloaded()
+        waiter = asyncio.Future(loop=self.loop)
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout, loop=self.loop)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # slot was handed over at timeout
+                return
+            raise Overloaded()
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # slot was handed over meanwhile
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self):
+        # slot is handed over to next waiter without decrementing
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionController:
+    """ Per-mount and per-client concurrency limits by request class."""
+
+    def __init__(self, *,
+                 mount_limits: typing.Dict[str, int]=None,
+                 client_limits: typing.Dict[str, int]=None,
+                 queue_size: int=100, queue_timeout: float=10.0,
+                 retry_after: int=5, registry: Registry=None,
+                 client_key: typing.Callable[[web.Request], str]=None):
+        """
+        :param mount_limits: concurrent requests per mount by request class
+        :param client_limits: concurrent requests per client by request class
+        :param queue_size: max requests waiting for a slot of single budget
+        :param queue_timeout: max time to wait for a slot, in seconds
+        :param retry_after: Retry-After value for rejected requests
+        :param registry: metrics registry for queue depth and rejections
+        :param client_key: returns client identity, peer address by default
+        """
+        self.mount_limits = {METADATA: 64, TRANSFER: 16}
+        self.mount_limits.update(mount_limits or {})
+        self.client_limits = {METADATA: 16, TRANSFER: 4}
+        self.client_limits.update(client_limits or {})
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.client_key = client_key or client_address
+        self._mounts = {}
+        self._clients = {}
+        self.queued = self.active = self.rejected = None
+        if registry is not None:
+            self.queued = registry.gauge(
+                'aiodav_admission_queued', 'Requests waiting for admission',
+                ('mount', 'class'))
+            self.active = registry.gauge(
+                'aiodav_admission_active', 'Admitted requests in progress',
+                ('mount', 'class'))
+            self.rejected = registry.counter(
+                'aiodav_admission_rejected_total',
+                'Requests rejected by admission control',
+                ('mount', 'class', 'budget'))
+
+    def _limiter(self, limiters: dict, key: tuple, limit: int) -> Limiter:
+        limiter = limiters.get(key)
+        if limiter is None:
+            limiter = limiters[key] = Limiter(limit, self.queue_size)
+        return limiter
+
+    def _release(self, limiters: dict, key: tuple):
+        limiter = limiters[key]
+        limiter.release()
+        # per-client limiters are dropped when unused
+        if limiter.idle and limiters is self._clients:
+            del limiters[key]
+
+    async def _acquire(self, mount: str, kind: str, client: tuple):
+        """ Takes client slot, then mount slot, so single client can't fill
+        mount queue."""
+        budgets = ((self._clients, client, self.client_limits[kind], 'client'),
+                   (self._mounts, (mount, kind), self.mount_limits[kind],
+                    'mount'))
+        acquired = []
+        try:
+            for limiters, key, limit, budget in budgets:
+                limiter = self._limiter(limiters, key, limit)
+                try:
+                    await limiter.acquire(self.queue_timeout)
+                except Overloaded:
+                    if self.rejected is not None:
+                        self.rejected.inc(mount, kind, budget)
+                    raise
+                acquired.append((limiters, key))
+        except BaseException:
+            for limiters, key in acquired:
+                self._release(limiters, key)
+            if client in self._clients and self._clients[client].idle:
+                del self._clients[client]
+            raise
+
+    async def admit(self, request: web.Request, mount: str, handler):
+        if request.method == 'GET' and 'events' in request.GET:
+            # change feed subscriptions are idle most of the time
+            return await handler(request)
+        kind = request_class(request)
+        client = (mount, self.client_key(request), kind)
+        # gauge changes without suspension between them are not observable,
+        # so only requests actually waiting are counted
+        if self.queued is not None:
+            self.queued.inc(mount, kind)
+        try:
+            await self._acquire(mount, kind, client)
+        except Overloaded:
+            raise web.HTTPServiceUnavailable(
+                text="Server is overloaded",
+                headers={'Retry-After': str(self.retry_after)})
+        finally:
+            if self.queued is not None:
+                self.queued.dec(mount, kind)
+        if self.active is not None:
+            self.active.inc(mount, kind)
+        try:
+            return await handler(request)
+        finally:
+            if self.active is not None:
+                self.active.dec(mount, kind)
+            self._release(self._mounts, (mount, kind))
+            self._release(self._clients, client)
+
+    def middleware(self):
+        controller = self
+
+        async def admission_middleware(app, handler):
+            async def middleware(request):
+                mount = views.request_mount(request)
+                if mount is None:
+                    return await handler(request)
+                return await controller.admit(request, mount, handler)
+            return middleware
+
+        return admission_middleware
+
+
+def setup_admission(app: web.Application, *, registry: Registry=None,
+                    **kwargs) -> AdmissionController:
+    """ Registers admission control middleware.
+
+    :param kwargs: AdmissionController options
+    """
+    controller = AdmissionController(registry=registry, **kwargs)
+    app.middlewares.append(controller.middleware())
+    return controller
@@ -1,6 +1,9 @@
 # coding: utf-8
 
 import asyncio
+import cProfile
+import os
+import pstats
 from pathlib import Path
 
 import aiohttp_debugtoolbar
@@ -8,32 +11,169 @@ import aiohttp_jinja2
 
 from aiohttp_debugtoolbar.panels.base import DebugPanel
 
+from aiodav import resources, views
+from aiodav.resources.abc import BACKEND_COROUTINES
+
+#: ResourceView and MultiStatusResponse methods building or parsing WebDAV XML
+XML_FUNCTIONS = ('parse_propfind', 'propstat_xml', 'construct_multistatus_xml',
+                 'dump_xml', 'response_xml', 'dump_response', 'dump_fragments')
+
+#: directory of bundled backends, stdlib functions share names with them
+RESOURCES_DIR = os.path.dirname(resources.__file__) + os.sep
+
+
+def _decode(data: bytes, size: int, total: int) -> str:
+    text = bytes(data[:size]).decode('utf-8', errors='replace')
+    if total > size:
+        text += '\n... (%s bytes total)' % total
+    return text
+
 
 class RequestResponseBodyPanel(DebugPanel):
+    """ Shows bounded prefixes of request and response bodies.
+
+    Request body is captured while handler reads it, so uploads are never
+    buffered; streamed responses are only described.
+    """
     name = 'RequestResponse'
     has_content = True
     template = 'request_body.jinja2'
     title = 'Request / Response'
     nav_title = title
+    #: max captured body prefix size in bytes
+    max_body_size = 16 * 1024
+
+    def __init__(self, request):
+        super().__init__(request)
+        self._request_body = bytearray()
+        self._request_size = 0
+        self._reading = False
+
+    def wrap_handler(self, handler, context_switcher):
+        payload = self.request.content
+        for name in ('read', 'readany', 'readexactly', 'readline'):
+            setattr(payload, name, self._tee(getattr(payload, name)))
+        return handler
+
+    def _tee(self, read):
+        @asyncio.coroutine
+        def wrapper(*args, **kwargs):
+            if self._reading:
+                # i.e. read(-1) calls readany, readexactly calls read; data
+                # is captured by outer call only
+                return (yield from read(*args, **kwargs))
+            self._reading = True
+            try:
+                data = yield from read(*args, **kwargs)
+            finally:
+                self._reading = False
+            self._request_size += len(data)
+            missing = self.max_body_size - len(self._request_body)
+            if missing > 0:
+                self._request_body.extend(data[:missing])
+            return data
+        return wrapper
 
     @asyncio.coroutine
     def process_response(self, response):
         self.data = data = {}
-        text = yield from self.request.text()
-        data['request_body'] = text
-        try:
-            data['response_body'] = response.text
-        except AttributeError:
-            data['response_body'] = repr(response)
+        data['request_body'] = _decode(self._request_body, self.max_body_size,
+                                       self._request_size)
+        body = getattr(response, 'body', None)
+        if body is not None:
+            data['response_body'] = _decode(body, self.max_body_size,
+                                            len(body))
+        else:
+            data['response_body'] = '%s, %s bytes streamed' % (
+                type(response).__name__, response.content_length or 'unknown')
+
+
+class DavProfilerPanel(DebugPanel):
+    """ Profiles request with cProfile.
+
+    Shows hottest functions and time spent in resource backend calls compared
+    with WebDAV XML building. Profiler is process-wide, so concurrent requests
+    contribute to the profile too.
+    """
+    name = 'DavProfiler'
+    has_content = True
+    user_activate = True
+    template = 'profiler.jinja2'
+    title = 'WebDAV Profile'
+    nav_title = 'DAV Profile'
+    #: number of functions shown
+    top = 30
+
+    def wrap_handler(self, handler, context_switcher):
+        if not self.is_active:
+            return handler
+
+        @asyncio.coroutine
+        def profile_handler(request):
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                return (yield from handler(request))
+            finally:
+                profiler.disable()
+                self.data = self.summarize(pstats.Stats(profiler))
+
+        return profile_handler
+
+    @property
+    def nav_subtitle(self):
+        if 'total' not in self.data:
+            return ''
+        return '%0.2fms' % self.data['total']
+
+    @classmethod
+    def summarize(cls, stats: pstats.Stats) -> dict:
+        views_file = views.__file__
+        kinds = {}
+        for func in stats.stats:
+            filename, line, name = func
+            if name in XML_FUNCTIONS and filename == views_file:
+                kinds[func] = 'xml'
+            elif name in BACKEND_COROUTINES and \
+                    filename.startswith(RESOURCES_DIR):
+                kinds[func] = 'backend'
+        groups = {'xml': {}, 'backend': {}}
+        totals = {'xml': 0, 'backend': 0}
+        functions = []
+        for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+            kind = kinds.get(func)
+            if kind is not None:
+                group = groups[kind]
+                group[func[2]] = group.get(func[2], 0) + ct * 1000
+                # time of calls from same group is already in its total
+                nested = sum(c[3] for caller, c in callers.items()
+                             if kinds.get(caller) == kind)
+                totals[kind] += (ct - nested) * 1000
+            functions.append({
+                'ncalls': nc,
+                'tottime': tt * 1000,
+                'cumtime': ct * 1000,
+                'function': pstats.func_std_string(func),
+            })
+        functions.sort(key=lambda f: f['tottime'], reverse=True)
+        return {
+            'total': stats.total_tt * 1000,
+            'functions': functions[:cls.top],
+            'backend': sorted(groups['backend'].items()),
+            'backend_total': totals['backend'],
+            'xml': sorted(groups['xml'].items()),
+            'xml_total': totals['xml'],
+        }
 
 
 def setup_aiodav_panels(app):
-    # Add RequestBody panel to debugtoolbar
-    aiohttp_debugtoolbar.main.default_panel_names.append(RequestResponseBodyPanel)
+    # Add RequestBody and profiler panels to debugtoolbar
+    panels = aiohttp_debugtoolbar.main.default_panel_names
+    panels.extend([RequestResponseBodyPanel, DavProfilerPanel])
     env = (app.get(aiohttp_debugtoolbar.main.TEMPLATE_KEY) or
            app.get(aiohttp_jinja2.APP_KEY))
     """:type env: jinja2.Environment"""
     loader = env.loader
     """:type loader: jinja2.loaders.FileSystemLoader"""
     templates = Path(__file__).parent.parent / 'templates'
-    loader.searchpath.append(str(templates))
\ No newline at end of file
+    loader.searchpath.append(str(templates))
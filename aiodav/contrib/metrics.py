@@ -0,0 +1,297 @@
+# coding: utf-8
+"""
+Prometheus metrics for aiodav.
+
+Request counts, latencies and transferred bytes are recorded by a middleware
+per DAV method and mount; backend operation timings are recorded by wrappers
+around ``AbstractResource`` coroutines of mounted resources. Metrics are
+exposed in Prometheus text format.
+
+Transferred bytes are counted as received and written, so chunked requests
+and streamed responses are accounted too; streamed response bytes include
+transfer encoding framing.
+"""
+import bisect
+import functools
+import time
+import typing
+from collections import OrderedDict
+
+from aiohttp import hdrs, web
+
+from aiodav import conf, views
+from aiodav.resources.abc import AbstractResource, BACKEND_COROUTINES
+
+#: methods recorded with their own label, others are recorded as "other"
+KNOWN_METHODS = hdrs.METH_ALL | views.DAV_METHODS
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5,
+                   5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+        for k, v in pairs)
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """ Base labelled metric.
+
+    Values are stored in a dict keyed by tuple of label values, so recording
+    costs a single dict lookup.
+    """
+    type = None
+
+    def __init__(self, name: str, documentation: str,
+                 labels: typing.Sequence[str]=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def samples(self):
+        """ Yields (name, labels string, value) tuples."""
+        for key, value in sorted(self._values.items()):
+            yield self.name, _format_labels(self.labels, key), value
+
+    def expose(self) -> typing.Iterator[str]:
+        yield '# HELP %s %s' % (self.name, self.documentation)
+        yield '# TYPE %s %s' % (self.name, self.type)
+        for name, labels, value in self.samples():
+            yield '%s%s %s' % (name, labels, _format_value(value))
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value, *label_values):
+        self._values[label_values] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str,
+                 labels: typing.Sequence[str]=(),
+                 buckets: typing.Sequence[float]=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values):
+        data = self._values.get(label_values)
+        if data is None:
+            data = self._values[label_values] = [
+                [0] * (len(self.buckets) + 1), 0.0]
+        data[0][bisect.bisect_left(self.buckets, value)] += 1
+        data[1] += value
+
+    def count(self, *label_values) -> int:
+        data = self._values.get(label_values)
+        return sum(data[0]) if data else 0
+
+    def samples(self):
+        bounds = self.buckets + (float('inf'),)
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = (('le', _format_value(bound)),)
+                yield (self.name + '_bucket',
+                       _format_labels(self.labels, key, le), cumulative)
+            labels = _format_labels(self.labels, key)
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, cumulative
+
+
+class Registry:
+    """ Collection of named metrics."""
+
+    def __init__(self):
+        self._metrics = OrderedDict()
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        if not isinstance(metric, cls):
+            raise ValueError("%s is already registered as %s" % (
+                name, metric.type))
+        return metric
+
+    def counter(self, name, documentation, labels=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation, labels=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation, labels=(),
+                  buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labels,
+                                   buckets=buckets)
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+#: default process-wide registry
+REGISTRY = Registry()
+
+
+class DavMetrics:
+    """ Standard aiodav metrics in a registry."""
+
+    def __init__(self, registry: Registry=REGISTRY):
+        self.registry = registry
+        self.requests = registry.counter(
+            'aiodav_requests_total', 'Requests processed',
+            ('method', 'mount', 'status'))
+        self.latency = registry.histogram(
+            'aiodav_request_duration_seconds', 'Request processing time',
+            ('method', 'mount'))
+        self.bytes_in = registry.counter(
+            'aiodav_request_bytes_total', 'Request body bytes received',
+            ('method', 'mount'))
+        self.bytes_out = registry.counter(
+            'aiodav_response_bytes_total', 'Response body bytes sent',
+            ('method', 'mount'))
+        self.in_progress = registry.gauge(
+            'aiodav_requests_in_progress', 'Requests being processed',
+            ('method', 'mount'))
+        self.backend = registry.histogram(
+            'aiodav_backend_duration_seconds',
+            'AbstractResource coroutine execution time',
+            ('operation', 'mount'))
+
+    def middleware(self):
+        """ Returns aiohttp middleware factory recording request metrics."""
+        metrics = self
+
+        async def metrics_middleware(app, handler):
+            async def middleware(request):
+                method = request.method
+                if method not in KNOWN_METHODS:
+                    # don't create label values for arbitrary methods
+                    method = 'other'
+                mount = views.request_mount(request) or ''
+                metrics.in_progress.inc(method, mount)
+                started = time.perf_counter()
+                response = None
+                status = 500
+                try:
+                    response = await handler(request)
+                    status = response.status
+                    return response
+                except web.HTTPException as e:
+                    status = e.status
+                    response = e
+                    raise
+                finally:
+                    metrics.in_progress.dec(method, mount)
+                    metrics.latency.observe(time.perf_counter() - started,
+                                            method, mount)
+                    metrics.requests.inc(method, mount, str(status))
+                    received = request_length(request)
+                    if received:
+                        metrics.bytes_in.inc(method, mount, amount=received)
+                    if response is not None:
+                        sent = response_length(response)
+                        if sent:
+                            metrics.bytes_out.inc(method, mount, amount=sent)
+            return middleware
+
+        return metrics_middleware
+
+    def instrument(self, resource: AbstractResource):
+        """ Wraps backend coroutines of mounted resource with timers.
+
+        Resource class is replaced with a subclass defining wrappers, so
+        other instances of the backend are not affected; resources derived
+        from mounted one by backend (``with_relative`` etc.) are timed if
+        backend creates them with ``self.__class__``. Resource already
+        timed to same registry is not wrapped again.
+        """
+        resource_class = type(resource)
+        histograms = [c.__dict__.get('_aiodav_backend')
+                      for c in resource_class.__mro__]
+        if self.backend in histograms:
+            return
+        attrs = {name: self._timed(getattr(resource_class, name), name)
+                 for name in BACKEND_COROUTINES}
+        attrs['_aiodav_backend'] = self.backend
+        resource.__class__ = type(resource_class.__name__, (resource_class,),
+                                  attrs)
+
+    def _timed(self, func, operation):
+        histogram = self.backend
+
+        @functools.wraps(func)
+        async def wrapper(resource, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(resource, *args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started,
+                                  operation, resource.prefix)
+
+        return wrapper
+
+
+def request_length(request: web.Request) -> int:
+    """ Returns number of request body bytes received, including ones not
+    read by handler."""
+    return getattr(request.content, 'total_bytes', 0)
+
+
+def response_length(response: web.StreamResponse) -> int:
+    """ Returns number of response body bytes written by handler or to be
+    written by server."""
+    if response.prepared:
+        # streamed response, aiohttp doesn't expose written bytes count
+        return response._resp_impl.body_length
+    body = getattr(response, 'body', None)
+    return len(body) if body else 0
+
+
+async def metrics_view(request):
+    metrics = request.app[conf.APP_KEY]['metrics']
+    return web.Response(
+        body=metrics.registry.expose().encode('utf-8'),
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+def setup_metrics(app: web.Application,
+                  mounts: typing.Dict[str, AbstractResource], *,
+                  path: str='/metrics', registry: Registry=REGISTRY):
+    """ Registers metrics middleware, backend timers and metrics endpoint."""
+    metrics = DavMetrics(registry)
+    app.middlewares.append(metrics.middleware())
+    for resource in mounts.values():
+        metrics.instrument(resource)
+    app.router.add_route('GET', path, metrics_view)
+    return metrics
@@ -0,0 +1,155 @@
+# coding: utf-8
+"""
+On-demand request profiling.
+
+Requests carrying authorized profiling header (or every N-th request) are
+run under cProfile and written as ``.pstats`` files to a directory. Recent
+profiles are listed by an index view.
+"""
+import cProfile
+import hmac
+import os
+import time
+import uuid
+from collections import deque
+
+import aiohttp_jinja2
+from aiohttp import web
+
+from aiodav import conf
+
+PROFILE_HEADER = 'X-Aiodav-Profile'
+
+
+class RequestProfiler:
+    """ Profiles individual requests with cProfile.
+
+    cProfile hooks whole interpreter, so only one request is profiled at a
+    time and profile includes other coroutines running meanwhile.
+    """
+
+    def __init__(self, directory: str, *, token: str=None,
+                 header: str=PROFILE_HEADER, every: int=0, keep: int=100):
+        """
+        :param directory: directory for .pstats files
+        :param token: secret value of profiling header; if not set, header
+            is ignored and recent profiles are not served
+        :param every: profile every N-th request, 0 to disable
+        :param keep: number of recent profiles kept on disk
+        """
+        self.directory = directory
+        self.token = token
+        self.header = header
+        self.every = every
+        self.profiles = deque()
+        self.keep = keep
+        self._counter = 0
+        self._active = False
+        os.makedirs(directory, exist_ok=True)
+
+    def authorized(self, value: str) -> bool:
+        return bool(self.token and value and
+                    hmac.compare_digest(value.encode('utf-8'),
+                                        self.token.encode('utf-8')))
+
+    def should_profile(self, request: web.Request) -> bool:
+        if self._active:
+            return False
+        value = request.headers.get(self.header)
+        if value is not None and self.authorized(value):
+            return True
+        if self.every:
+            self._counter += 1
+            return not self._counter % self.every
+        return False
+
+    def middleware(self):
+        profiler = self
+
+        async def profiler_middleware(app, handler):
+            async def middleware(request):
+                if not profiler.should_profile(request):
+                    return await handler(request)
+                return await profiler.profile(handler, request)
+            return middleware
+
+        return profiler_middleware
+
+    async def profile(self, handler, request: web.Request):
+        self._active = True
+        profile = cProfile.Profile()
+        status = 500
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            profile.disable()
+            duration = time.perf_counter() - started
+            self._active = False
+            self.save(profile, request, status, duration)
+
+    def save(self, profile: cProfile.Profile, request: web.Request,
+             status: int, duration: float):
+        name = '%d-%s-%s.pstats' % (time.time() * 1000, request.method,
+                                    uuid.uuid4().hex[:8])
+        profile.dump_stats(os.path.join(self.directory, name))
+        self.profiles.appendleft({
+            'name': name,
+            'timestamp': time.time(),
+            'method': request.method,
+            'path': request.path,
+            'status': status,
+            'duration': duration * 1000,
+        })
+        while len(self.profiles) > self.keep:
+            expired = self.profiles.pop()
+            try:
+                os.unlink(os.path.join(self.directory, expired['name']))
+            except FileNotFoundError:
+                pass
+
+    def check_access(self, request: web.Request):
+        """ Allows requests with profiling header only, so secret does not
+        get into access logs."""
+        if not self.authorized(request.headers.get(self.header)):
+            raise web.HTTPForbidden()
+
+
+@aiohttp_jinja2.template('profiles.jinja2')
+async def profiles_view(request):
+    profiler = request.app[conf.APP_KEY]['profiler']
+    profiler.check_access(request)
+    return {'profiles': profiler.profiles}
+
+
+async def profile_download_view(request):
+    profiler = request.app[conf.APP_KEY]['profiler']
+    profiler.check_access(request)
+    name = request.match_info['name']
+    if name not in {p['name'] for p in profiler.profiles}:
+        raise web.HTTPNotFound()
+    with open(os.path.join(profiler.directory, name), 'rb') as f:
+        body = f.read()
+    return web.Response(body=body, headers={
+        'Content-Type': 'application/octet-stream',
+        'Content-Disposition': 'attachment; filename="%s"' % name})
+
+
+def setup_profiler(app: web.Application, directory: str, *,
+                   path: str='/_profiles', **kwargs) -> RequestProfiler:
+    """ Registers profiling middleware and recent profiles index.
+
+    :param kwargs: RequestProfiler options
+    """
+    profiler = RequestProfiler(directory, **kwargs)
+    app.middlewares.append(profiler.middleware())
+    path = path.rstrip('/')
+    app.router.add_route('GET', path + '/', profiles_view)
+    app.router.add_route('GET', path + '/{name}', profile_download_view)
+    return profiler
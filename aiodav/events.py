@@ -0,0 +1,557 @@
+# coding: utf-8
+"""
+Change notifications for mounts.
+
+Every mount has a ``ChangeFeed`` collecting changes made through aiodav
+and, when the feed watches a directory on Linux, changes made by other
+processes (``InotifyWatcher``). Clients subscribe to a subtree with
+``GET /<mount>/<path>?events`` and receive server-sent events instead of
+polling PROPFIND. Events are hints to refresh: the same change may be
+reported twice by aiodav and by inotify.
+
+The watcher keeps running for ``watch_grace`` seconds after the last
+subscriber left, so long-polling clients don't walk the tree with each
+poll; when it is started again, ``reset`` event tells clients that
+changes made meanwhile were lost.
+
+Recent events are kept in a backlog, so a client reconnecting with
+``Last-Event-ID`` header receives events it missed; when they are not in
+backlog anymore, the id was issued by another feed or server run, or a slow
+client overflows its queue, ``reset`` event tells the client to refresh
+everything. Event ids are ``<epoch>-<sequence number>``, epoch is random
+for every feed.
+
+Feed also records changes in ``ChangeJournal`` backing RFC 6578
+``sync-collection`` reports. When the watcher can't watch every directory
+(``max_watches`` or kernel limit, unreadable directories), the journal is
+marked incomplete and its tokens are refused, so clients do full sync.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import json
+import logging
+import os
+import struct
+import sys
+import typing
+import uuid
+from collections import OrderedDict, deque, namedtuple
+
+from aiodav.properties import is_reserved_name
+
+CREATED = 'created'
+MODIFIED = 'modified'
+DELETED = 'deleted'
+MOVED = 'moved'
+PROPERTIES = 'properties'
+#: events were lost, client should refresh whole subtree
+RESET = 'reset'
+
+SYNC_TOKEN_PREFIX = 'urn:aiodav:sync:'
+
+logger = logging.getLogger('aiodav.events')
+
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_ONLYDIR)
+INOTIFY_EVENT = struct.Struct('iIII')
+
+INOTIFY_TYPES = (
+    (IN_CREATE | IN_MOVED_TO, CREATED),
+    (IN_CLOSE_WRITE, MODIFIED),
+    (IN_DELETE | IN_MOVED_FROM, DELETED),
+)
+
+if sys.platform.startswith('linux'):
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                        use_errno=True)
+else:  # pragma: no cover
+    _libc = None
+
+
+def normalize_path(path: str) -> str:
+    return '/' + '/'.join(p for p in path.split('/') if p)
+
+
+def in_subtree(path: typing.Optional[str], root: str) -> bool:
+    if path is None:
+        return False
+    return root == '/' or path == root or path.startswith(root + '/')
+
+
+class ChangeEvent(namedtuple('ChangeEvent', 'id type path destination')):
+    """ Single change of mount.
+
+    :param id: feed sequence number
+    :param path: changed path relative to mount root
+    :param destination: new path for ``moved`` events
+    """
+
+    def matches(self, root: str) -> bool:
+        return (self.type == RESET or in_subtree(self.path, root) or
+                in_subtree(self.destination, root))
+
+    def to_sse(self, epoch: str) -> bytes:
+        """
+        :param epoch: epoch of feed published the event
+        """
+        data = {'type': self.type, 'path': self.path}
+        if self.destination is not None:
+            data['destination'] = self.destination
+        return ('id: %s-%d\nevent: %s\ndata: %s\n\n' % (
+            epoch, self.id, self.type, json.dumps(data))).encode('utf-8')
+
+
+class InvalidSyncToken(ValueError):
+    """ Sync token is malformed, issued by other journal or compacted."""
+
+
+class ChangeJournal:
+    """ Latest change of every recently changed path.
+
+    Journal is compacted as it grows: each path keeps its latest change
+    only, and when there are more than ``max_entries`` paths, the oldest
+    ones are dropped and tokens issued before them become invalid, so
+    clients holding them do full sync. Journal lives in memory, tokens
+    of previous server run are invalid. Changes made outside aiodav are
+    recorded only while feed runs inotify watcher, so feed resets journal
+    when watcher stops, and marks it incomplete while watcher misses some
+    directories.
+    """
+
+    def __init__(self, max_entries: int=10000):
+        self.max_entries = max_entries
+        self.epoch = uuid.uuid4().hex
+        #: sequence number of last change
+        self.seq = 0
+        #: tokens with lesser sequence numbers are invalid
+        self.min_seq = 0
+        #: False while some changes are not recorded, tokens are refused
+        self.complete = True
+        # path -> (seq, event type), ordered by seq
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, event: ChangeEvent):
+        if event.type == RESET:
+            self.reset()
+            return
+        if event.type == MOVED:
+            self._record(event.path, DELETED)
+            self._record(event.destination, MOVED)
+        else:
+            self._record(event.path, event.type)
+
+    def _record(self, path: str, type: str):
+        self.seq += 1
+        self._entries.pop(path, None)
+        self._entries[path] = (self.seq, type)
+        while len(self._entries) > self.max_entries:
+            _, (seq, _) = self._entries.popitem(last=False)
+            self.min_seq = seq
+
+    def reset(self):
+        """ Invalidates all issued tokens."""
+        self.seq += 1
+        self.min_seq = self.seq
+        self._entries.clear()
+
+    def token(self, seq: int=None) -> str:
+        return '%s%s:%d' % (SYNC_TOKEN_PREFIX, self.epoch,
+                            self.seq if seq is None else seq)
+
+    def parse_token(self, token: str) -> int:
+        """ Returns sequence number of valid token.
+
+        :raises: InvalidSyncToken
+        """
+        token = token.strip()
+        if not token.startswith(SYNC_TOKEN_PREFIX):
+            raise InvalidSyncToken("Unknown sync token")
+        epoch, _, seq = token[len(SYNC_TOKEN_PREFIX):].partition(':')
+        if epoch != self.epoch or not seq.isdigit():
+            raise InvalidSyncToken("Unknown sync token")
+        if not self.complete:
+            raise InvalidSyncToken("Not all changes are recorded")
+        seq = int(seq)
+        if not self.min_seq <= seq <= self.seq:
+            raise InvalidSyncToken("Sync token is expired")
+        return seq
+
+    def changes(self, since: int, root: str='/', *, depth: int=None
+                ) -> typing.List[typing.Tuple[int, str, str]]:
+        """ Returns changes after sequence number in order they were made.
+
+        Cost depends on number of changes, not on journal size.
+
+        :param root: collection path, itself is not included
+        :param depth: 1 for collection members, None for whole subtree
+        :returns: (seq, path, event type) tuples
+        """
+        root = normalize_path(root)
+        result = []
+        for path, (seq, type) in reversed(self._entries.items()):
+            if seq <= since:
+                break
+            if path == root or not in_subtree(path, root):
+                continue
+            if depth == 1 and path.rpartition('/')[0] != root.rstrip('/'):
+                continue
+            result.append((seq, path, type))
+        result.reverse()
+        return result
+
+
+class Subscription:
+    """ Events of feed subtree queued for a single client."""
+
+    def __init__(self, feed: 'ChangeFeed', root: str, queue_size: int):
+        self.feed = feed
+        self.root = root
+        self._queue = deque()
+        self._queue_size = queue_size
+        self._waiter = None
+
+    def put(self, event: ChangeEvent):
+        if not event.matches(self.root):
+            return
+        if len(self._queue) >= self._queue_size:
+            # slow client, drop queued events and ask it to refresh
+            self._queue.clear()
+            event = ChangeEvent(event.id, RESET, None, None)
+        self._queue.append(event)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self, timeout: float=None) -> typing.Optional[ChangeEvent]:
+        """ Returns next event, None on timeout."""
+        if not self._queue:
+            self._waiter = asyncio.Future()
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self._waiter = None
+        return self._queue.popleft()
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ChangeFeed:
+    """ Publishes mount changes to subscribers."""
+    #: event ids and sync journal are kept in process memory
+    process_local = True
+
+    def __init__(self, *, backlog: int=1024, queue_size: int=256,
+                 watch_dir: str=None, max_watches: int=8192,
+                 watch_grace: float=60, sync_grace: float=3600,
+                 journal: ChangeJournal=None):
+        """
+        :param backlog: number of recent events replayed to reconnecting
+            clients
+        :param queue_size: max events queued for a single client
+        :param watch_dir: directory watched with inotify while feed has
+            subscribers, Linux only
+        :param max_watches: max number of watched directories, sync tokens
+            are refused when tree has more
+        :param watch_grace: seconds watcher keeps running after last
+            subscriber left, so long-polling clients don't restart it
+        :param sync_grace: seconds watcher keeps running after last sync
+            report; journal is reset when watcher stops, so sync tokens
+            never miss changes made outside aiodav
+        :param journal: changes journal for sync reports
+        """
+        #: event ids of previous feeds are not replayed
+        self.epoch = uuid.uuid4().hex
+        #: sequence number of last event
+        self.last_id = 0
+        self.queue_size = queue_size
+        self.watch_dir = watch_dir
+        self.max_watches = max_watches
+        self.watch_grace = watch_grace
+        self.sync_grace = sync_grace
+        self._backlog = deque(maxlen=backlog)
+        self._subscriptions = set()
+        self._watcher = None
+        self._stop_handle = None
+        # loop time watcher is kept running until for sync reports
+        self._keep_until = 0
+        # changes made while watcher was stopped are lost
+        self._watch_gap = False
+        self.journal = ChangeJournal() if journal is None else journal
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def publish(self, type: str, path: str,
+                destination: str=None) -> ChangeEvent:
+        self.last_id += 1
+        if destination is not None:
+            destination = normalize_path(destination)
+        event = ChangeEvent(self.last_id, type, normalize_path(path),
+                            destination)
+        self._backlog.append(event)
+        self.journal.record(event)
+        for subscription in self._subscriptions:
+            subscription.put(event)
+        return event
+
+    def parse_event_id(self, event_id: str) -> typing.Optional[int]:
+        """ Returns sequence number of event published by this feed.
+
+        :returns: None for ids of other feeds, malformed ones and ids
+            ahead of feed
+        """
+        epoch, _, seq = event_id.strip().rpartition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        return seq if seq <= self.last_id else None
+
+    def subscribe(self, path: str='/',
+                  last_id: str=None) -> Subscription:
+        """ Starts receiving events for subtree.
+
+        :param last_id: id of last event received by reconnecting client,
+            client gets ``reset`` event when missed events are unknown
+        """
+        subscription = Subscription(self, normalize_path(path),
+                                    self.queue_size)
+        seq = None if last_id is None else self.parse_event_id(last_id)
+        if last_id is not None and seq is None:
+            subscription.put(ChangeEvent(self.last_id, RESET, None, None))
+        elif seq is not None and seq < self.last_id:
+            missed = [e for e in self._backlog if e.id > seq]
+            if not missed or missed[0].id != seq + 1:
+                subscription.put(ChangeEvent(self.last_id, RESET, None, None))
+            else:
+                for event in missed:
+                    subscription.put(event)
+        self._subscriptions.add(subscription)
+        self._watch()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+        if not self._subscriptions:
+            self._schedule_stop(self.watch_grace)
+
+    def close(self):
+        """ Stops watcher, i.e. on application cleanup."""
+        self._stop_watcher()
+
+    async def watch_journal(self):
+        """ Keeps watcher running for ``sync_grace`` seconds, so journal
+        records changes made outside aiodav; waits for watches to be set.
+        """
+        self._watch()
+        if self._watcher is None:
+            return
+        loop = asyncio.get_event_loop()
+        self._keep_until = loop.time() + self.sync_grace
+        if not self._subscriptions:
+            self._schedule_stop(self.watch_grace)
+        await asyncio.shield(self._watcher.ready)
+
+    def _watch(self):
+        """ Starts watcher if it is not running and cancels its stop."""
+        if self._stop_handle is not None:
+            self._stop_handle.cancel()
+            self._stop_handle = None
+        if self.watch_dir is None or self._watcher is not None:
+            return
+        if _libc is None:  # pragma: no cover
+            return
+        try:
+            self._watcher = InotifyWatcher(self, self.watch_dir,
+                                           max_watches=self.max_watches)
+        except OSError:
+            # watches limit or inotify is not available
+            return
+        if self._watch_gap:
+            self._watcher.ready.add_done_callback(self._watch_restarted)
+
+    def watch_incomplete(self):
+        """ Called by watcher missing some directories."""
+        self.journal.reset()
+        self.journal.complete = False
+
+    def _watch_restarted(self, future: asyncio.Future):
+        if not future.cancelled():
+            self.publish(RESET, '/')
+
+    def _schedule_stop(self, delay: float):
+        if self._watcher is None or self._stop_handle is not None:
+            return
+        loop = asyncio.get_event_loop()
+        delay = max(delay, self._keep_until - loop.time())
+        if delay <= 0:
+            self._stop_watcher()
+            return
+        self._stop_handle = loop.call_later(delay, self._stop_watcher)
+
+    def _stop_watcher(self):
+        if self._stop_handle is not None:
+            self._stop_handle.cancel()
+            self._stop_handle = None
+        if self._watcher is None:
+            return
+        self._watcher.close()
+        self._watcher = None
+        self._watch_gap = True
+        # outside changes are not recorded anymore
+        self.journal.reset()
+        # next watcher may cover whole tree
+        self.journal.complete = True
+
+
+class InotifyWatcher:
+    """ Publishes changes of directory tree made outside aiodav.
+
+    Each directory needs its own watch, so tree is walked in executor when
+    watcher starts; new directories are watched as they appear, directories
+    over ``max_watches`` limit are not watched and feed is told coverage is
+    incomplete. Changes inside directories being walked are not reported,
+    their parent reports them as created.
+    """
+
+    def __init__(self, feed: ChangeFeed, root_dir: str, *,
+                 max_watches: int=8192):
+        self.feed = feed
+        self.root_dir = os.path.abspath(root_dir)
+        self.max_watches = max_watches
+        self._loop = asyncio.get_event_loop()
+        self._fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> path relative to root_dir
+        self._watches = {}
+        #: False when some directories are not watched
+        self.complete = True
+        self._closed = False
+        # tree walks in progress, descriptor is closed after them
+        self._walks = set()
+        self._loop.add_reader(self._fd, self._read)
+        #: done when initial tree walk is finished
+        self.ready = self._watch_tree('')
+
+    def _watch_tree(self, relative: str) -> asyncio.Future:
+        """ Watches directory and its subdirectories."""
+        future = self._loop.run_in_executor(
+            None, self._add_watches, relative,
+            self.max_watches - len(self._watches))
+        self._walks.add(future)
+        future.add_done_callback(self._watches_added)
+        return future
+
+    def _add_watches(self, relative: str, limit: int
+                     ) -> typing.Tuple[typing.List[typing.Tuple[int, str]],
+                                       typing.Optional[str]]:
+        """ Walks directory tree in executor.
+
+        :returns: added watches and reason some directories are missed
+        """
+        added = []
+        missed = None
+        top = os.path.join(self.root_dir, relative)
+
+        def walk_error(error: OSError):
+            nonlocal missed
+            if error.errno not in (errno.ENOENT, errno.ENOTDIR):
+                missed = missed or str(error)
+
+        for dir_path, dir_names, _ in os.walk(top, onerror=walk_error):
+            if self._closed:
+                break
+            if len(added) >= limit:
+                missed = missed or "max_watches limit reached"
+                break
+            wd = _libc.inotify_add_watch(
+                self._fd, os.fsencode(dir_path), WATCH_MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                dir_names[:] = []
+                if code not in (errno.ENOENT, errno.ENOTDIR):
+                    # kernel watches limit reached or permission denied
+                    missed = missed or "%s: %s" % (dir_path,
+                                                   os.strerror(code))
+                continue
+            relative = os.path.relpath(dir_path, self.root_dir)
+            added.append((wd, '' if relative == '.' else relative))
+        return added, missed
+
+    def _watches_added(self, future: asyncio.Future):
+        self._walks.discard(future)
+        if self._closed:
+            if not self._walks:
+                os.close(self._fd)
+            return
+        if future.cancelled() or future.exception() is not None:
+            return
+        added, missed = future.result()
+        self._watches.update(added)
+        if missed is not None and self.complete:
+            self.complete = False
+            logger.warning("Not all directories of %s are watched, sync "
+                           "tokens are disabled: %s", self.root_dir, missed)
+            self.feed.watch_incomplete()
+
+    def _read(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            self._handle(wd, mask, name)
+
+    def _handle(self, wd: int, mask: int, name: str):
+        if mask & IN_Q_OVERFLOW:
+            self.feed.publish(RESET, '/')
+            return
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+        directory = self._watches.get(wd)
+        if directory is None or is_reserved_name(name):
+            return
+        path = os.path.join(directory, name)
+        for bits, type in INOTIFY_TYPES:
+            if mask & bits:
+                self.feed.publish(type, path)
+                break
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            self._watch_tree(path)
+
+    def close(self):
+        self._closed = True
+        self._loop.remove_reader(self._fd)
+        if not self._walks:
+            os.close(self._fd)
+        self._watches.clear()
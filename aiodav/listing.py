@@ -0,0 +1,96 @@
+# coding: utf-8
+"""
+Streaming HTML rendering of collection listings.
+
+Template is rendered with ``Template.generate()`` and sent in chunks while
+collection members are still being read from backend. Template iterates
+over ``StreamedMembers`` synchronously; renderer reads next batch of members
+before resuming template generator whenever fewer than two members are
+buffered, and template never consumes more than one member (plus one
+lookahead) per generated chunk.
+"""
+import typing
+from collections import deque
+
+import aiohttp_jinja2
+from aiohttp import web, HttpVersion11
+
+from aiodav.resources import AbstractResource
+from aiodav.resources.abc import CollectionBatches
+
+
+class StreamedMembers:
+    """ Synchronous view of members read by ``CollectionBatches``."""
+
+    def __init__(self, batches: typing.Optional[CollectionBatches]):
+        """
+        :param batches: collection members source, None for non-collections
+        """
+        self.batches = batches
+        self.exhausted = batches is None
+        self._buffer = deque()
+
+    @property
+    def total(self) -> typing.Optional[int]:
+        """ Number of collection members, None until first batch is read."""
+        return self.batches.total if self.batches is not None else None
+
+    async def fill(self, size: int=2):
+        """ Reads batches until at least ``size`` members are buffered."""
+        while len(self._buffer) < size and not self.exhausted:
+            try:
+                self._buffer.extend(await self.batches.__anext__())
+            except StopAsyncIteration:
+                self.exhausted = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> AbstractResource:
+        if self._buffer:
+            return self._buffer.popleft()
+        if self.exhausted:
+            raise StopIteration()
+        raise RuntimeError("Members are consumed ahead of stream")
+
+
+async def render_streamed(request: web.Request, template_name: str,
+                          context: dict, members: StreamedMembers, *,
+                          chunk_size: int=16 * 1024) -> web.StreamResponse:
+    """ Renders template to streamed response, chunked for HTTP/1.1.
+
+    :param members: template context ``members`` value
+    :param chunk_size: generated text is sent in chunks of at least this size
+    """
+    env = aiohttp_jinja2.get_env(request.app)
+    template = env.get_template(template_name)
+    context = dict(context, members=members)
+    for key, value in request.get(aiohttp_jinja2.REQUEST_CONTEXT_KEY,
+                                  {}).items():
+        context.setdefault(key, value)
+    response = web.StreamResponse()
+    response.content_type = 'text/html'
+    response.charset = 'utf-8'
+    if request.version >= HttpVersion11:
+        response.enable_chunked_encoding()
+    await response.prepare(request)
+    generator = template.generate(context)
+    parts = []
+    size = 0
+    while True:
+        await members.fill()
+        try:
+            part = next(generator)
+        except StopIteration:
+            break
+        parts.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            response.write(''.join(parts).encode('utf-8'))
+            await response.drain()
+            parts = []
+            size = 0
+    if parts:
+        response.write(''.join(parts).encode('utf-8'))
+    await response.write_eof()
+    return response
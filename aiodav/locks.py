@@ -0,0 +1,309 @@
+# coding: utf-8
+import heapq
+import time
+import typing
+import uuid
+from abc import ABC, abstractmethod
+
+DEPTH_ZERO = '0'
+DEPTH_INFINITY = 'infinity'
+EXCLUSIVE = 'exclusive'
+SHARED = 'shared'
+
+
+class LockError(Exception):
+    """ Base aiodav lock exception."""
+
+
+class LockConflict(LockError):
+    """ Resource is locked by another lock."""
+
+
+class LockNotFound(LockError):
+    """ Lock token does not match any lock on resource."""
+
+
+def split_path(path: str) -> typing.List[str]:
+    return [p for p in path.split('/') if p]
+
+
+class Lock:
+    """ WebDAV write lock."""
+
+    def __init__(self, path: str, *, depth: str=DEPTH_INFINITY,
+                 scope: str=EXCLUSIVE, owner: bytes=None, timeout: int=None,
+                 token: str=None):
+        """
+        :param path: locked path relative to mount root
+        :param owner: serialized DAV:owner element provided by client
+        :param timeout: lock timeout in seconds, None for infinite lock
+        """
+        self.path = '/' + '/'.join(split_path(path))
+        self.depth = depth
+        self.scope = scope
+        self.owner = owner
+        self.token = token or 'opaquelocktoken:%s' % uuid.uuid4()
+        self.timeout = timeout
+        self.expires = None
+        self.refresh(timeout)
+
+    def refresh(self, timeout: int=None):
+        self.timeout = timeout
+        if timeout is None:
+            self.expires = None
+        else:
+            self.expires = time.monotonic() + timeout
+
+    @property
+    def expired(self) -> bool:
+        return self.expires is not None and self.expires <= time.monotonic()
+
+    def __repr__(self):
+        return 'Lock<%s %s %s>' % (self.path, self.scope, self.token)
+
+
+class AbstractLockManager(ABC):
+    """ Lock storage for a single mount.
+
+    Paths are relative to mount root. All methods are coroutines, so state may
+    be kept outside of the process.
+    """
+
+    #: max lock timeout in seconds, used for infinite lock requests too
+    max_timeout = 24 * 3600
+    #: locks are not visible to other server processes
+    process_local = False
+
+    @abstractmethod
+    async def lock(self, path: str, *, depth: str=DEPTH_INFINITY,
+                   scope: str=EXCLUSIVE, owner: bytes=None,
+                   timeout: int=None) -> Lock:
+        """
+        :raises: LockConflict
+        """
+        raise NotImplementedError()  # pragma: no cover
+
+    @abstractmethod
+    async def refresh(self, path: str, token: str, timeout: int=None) -> Lock:
+        """
+        :raises: LockNotFound
+        """
+        raise NotImplementedError()  # pragma: no cover
+
+    @abstractmethod
+    async def unlock(self, path: str, token: str):
+        """
+        :raises: LockNotFound
+        """
+        raise NotImplementedError()  # pragma: no cover
+
+    @abstractmethod
+    async def check(self, path: str, tokens: typing.Iterable[str]=(), *,
+                    descendants: bool=False):
+        """ Checks that path may be modified by a request with lock tokens.
+
+        :param descendants: check locks on paths below too, for requests
+            modifying whole subtree
+        :raises: LockConflict
+        """
+        raise NotImplementedError()  # pragma: no cover
+
+    @abstractmethod
+    async def discover(self, path: str) -> typing.List[Lock]:
+        """ Returns active locks applied to path."""
+        raise NotImplementedError()  # pragma: no cover
+
+    @abstractmethod
+    async def remove(self, path: str):
+        """ Drops all locks on path and below, i.e. after DELETE."""
+        raise NotImplementedError()  # pragma: no cover
+
+    def clamp_timeout(self, timeout: typing.Optional[int]) -> int:
+        if timeout is None:
+            return self.max_timeout
+        return min(timeout, self.max_timeout)
+
+
+class _Node:
+    __slots__ = ('children', 'locks', 'count')
+
+    def __init__(self):
+        self.children = {}
+        self.locks = {}
+        # number of locks in subtree, including own locks
+        self.count = 0
+
+
+class MemoryLockManager(AbstractLockManager):
+    """ In-memory lock manager.
+
+    Locks are kept in a path prefix trie, so lock checks walk only path
+    ancestors; expiry is handled with a heap of lock deadlines.
+    """
+    process_local = True
+
+    def __init__(self):
+        self._root = _Node()
+        self._tokens = {}
+        self._deadlines = []
+
+    def _expire(self):
+        now = time.monotonic()
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            expires, token = heapq.heappop(deadlines)
+            lock = self._tokens.get(token)
+            # lock may have been refreshed or removed since
+            if lock is not None and lock.expires == expires:
+                self._discard(lock)
+
+    def _walk(self, path: str):
+        """ Yields (node, is_target) for path ancestors and path itself."""
+        node = self._root
+        parts = split_path(path)
+        yield node, not parts
+        for i, part in enumerate(parts, 1):
+            node = node.children.get(part)
+            if node is None:
+                return
+            yield node, i == len(parts)
+
+    def _node(self, path: str, create: bool=False) -> typing.Optional[_Node]:
+        node = self._root
+        for part in split_path(path):
+            child = node.children.get(part)
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[part] = _Node()
+            node = child
+        return node
+
+    @staticmethod
+    def _subtree_locks(node: _Node) -> typing.Iterator[Lock]:
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield from node.locks.values()
+            stack.extend(c for c in node.children.values() if c.count)
+
+    def _covering(self, path: str) -> typing.Iterator[Lock]:
+        """ Yields locks applied to path."""
+        for node, is_target in self._walk(path):
+            for lock in node.locks.values():
+                if is_target or lock.depth == DEPTH_INFINITY:
+                    yield lock
+
+    def _descendant_locks(self, path: str) -> typing.Iterator[Lock]:
+        node = self._node(path)
+        if node is None or node.count == len(node.locks):
+            return
+        for child in node.children.values():
+            if child.count:
+                yield from self._subtree_locks(child)
+
+    def _discard(self, lock: Lock):
+        del self._tokens[lock.token]
+        parts = split_path(lock.path)
+        node = self._root
+        path = [node]
+        for part in parts:
+            node = node.children[part]
+            path.append(node)
+        del node.locks[lock.token]
+        for node in path:
+            node.count -= 1
+        # prune empty branches
+        for parent, part, child in zip(reversed(path[:-1]), reversed(parts),
+                                       reversed(path[1:])):
+            if child.count:
+                break
+            del parent.children[part]
+
+    async def lock(self, path: str, *, depth: str=DEPTH_INFINITY,
+                   scope: str=EXCLUSIVE, owner: bytes=None,
+                   timeout: int=None) -> Lock:
+        self._expire()
+        conflicts = list(self._covering(path))
+        if depth == DEPTH_INFINITY:
+            conflicts.extend(self._descendant_locks(path))
+        for other in conflicts:
+            if scope == EXCLUSIVE or other.scope == EXCLUSIVE:
+                raise LockConflict(other.path)
+        lock = Lock(path, depth=depth, scope=scope, owner=owner,
+                    timeout=self.clamp_timeout(timeout))
+        node = self._root
+        node.count += 1
+        for part in split_path(path):
+            node = node.children.setdefault(part, _Node())
+            node.count += 1
+        node.locks[lock.token] = lock
+        self._tokens[lock.token] = lock
+        heapq.heappush(self._deadlines, (lock.expires, lock.token))
+        return lock
+
+    async def refresh(self, path: str, token: str, timeout: int=None) -> Lock:
+        self._expire()
+        for lock in self._covering(path):
+            if lock.token == token:
+                lock.refresh(self.clamp_timeout(timeout))
+                heapq.heappush(self._deadlines, (lock.expires, lock.token))
+                return lock
+        raise LockNotFound(token)
+
+    async def unlock(self, path: str, token: str):
+        self._expire()
+        for lock in self._covering(path):
+            if lock.token == token:
+                self._discard(lock)
+                return
+        raise LockNotFound(token)
+
+    async def check(self, path: str, tokens: typing.Iterable[str]=(), *,
+                    descendants: bool=False):
+        if not self._root.count:
+            return
+        self._expire()
+        tokens = set(tokens)
+        self._check_tokens(self._covering(path), tokens)
+        if descendants:
+            by_path = {}
+            for lock in self._descendant_locks(path):
+                by_path.setdefault(lock.path, []).append(lock)
+            for path_locks in by_path.values():
+                self._check_tokens(path_locks, tokens)
+
+    @staticmethod
+    def _check_tokens(applied: typing.Iterable[Lock],
+                      tokens: typing.Set[str]):
+        """ Checks tokens against locks applied to a single resource.
+
+        Exclusive lock must be matched by its own token, shared locks are
+        matched by token of any of them (RFC 4918, 7.1).
+
+        :raises: LockConflict
+        """
+        unmatched = None
+        shared_matched = False
+        for lock in applied:
+            if lock.token in tokens:
+                shared_matched |= lock.scope == SHARED
+            elif lock.scope == EXCLUSIVE:
+                raise LockConflict(lock.path)
+            else:
+                unmatched = lock
+        if unmatched is not None and not shared_matched:
+            raise LockConflict(unmatched.path)
+
+    async def discover(self, path: str) -> typing.List[Lock]:
+        if not self._root.count:
+            return []
+        self._expire()
+        return list(self._covering(path))
+
+    async def remove(self, path: str):
+        node = self._node(path)
+        if node is None:
+            return
+        for lock in list(self._subtree_locks(node)):
+            self._discard(lock)
@@ -0,0 +1,223 @@
+# coding: utf-8
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import typing
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from aiodav.uploads import is_staging_name
+
+#: (property name in Clark notation, serialized element or None to remove)
+PropertyUpdate = typing.Tuple[str, typing.Optional[bytes]]
+
+#: default property store of filesystem mount, in mount root
+STORE_NAME = '.aiodav-properties.sqlite'
+
+logger = logging.getLogger('aiodav.properties')
+
+
+def normalize_path(path: str) -> str:
+    return '/' + '/'.join(p for p in path.split('/') if p)
+
+
+def is_reserved_name(name: str) -> bool:
+    """ Checks whether file is kept by aiodav: upload staging files and
+    journals, default property store with its SQLite journal; such files
+    are hidden from clients and can't be written by them."""
+    return is_staging_name(name) or name.startswith(STORE_NAME)
+
+
+class AbstractPropertyStore(ABC):
+    """ Dead properties storage for a single mount.
+
+    Property names are in Clark notation (``{namespace}name``), values are
+    serialized property elements. Paths are relative to mount root.
+    """
+
+    #: properties are not visible to other server processes
+    process_local = False
+
+    @abstractmethod
+    async def get(self, paths: typing.Iterable[str],
+                  names: typing.Iterable[str]=None
+                  ) -> typing.Dict[str, typing.Dict[str, bytes]]:
+        """ Returns properties for a batch of paths.
+
+        :param names: requested property names, all properties if None
+        """
+        raise NotImplementedError()  # pragma: no cover
+
+    @abstractmethod
+    async def update(self, path: str, updates: typing.Iterable[PropertyUpdate]):
+        """ Applies all updates atomically."""
+        raise NotImplementedError()  # pragma: no cover
+
+    @abstractmethod
+    async def move(self, source: str, destination: str):
+        """ Moves properties of source subtree, replacing destination ones."""
+        raise NotImplementedError()  # pragma: no cover
+
+    @abstractmethod
+    async def copy(self, source: str, destination: str):
+        """ Copies properties of source subtree, replacing destination ones."""
+        raise NotImplementedError()  # pragma: no cover
+
+    @abstractmethod
+    async def delete(self, path: str):
+        """ Drops properties of path and all paths below."""
+        raise NotImplementedError()  # pragma: no cover
+
+    def close(self):
+        """ Releases store, i.e. when mount is removed."""
+
+
+class SQLitePropertyStore(AbstractPropertyStore):
+    """ Dead properties stored in SQLite table indexed by (path, name).
+
+    Queries run in executor; subtree operations are range scans over primary
+    key, so MOVE and DELETE of a collection are single statements.
+    """
+
+    #: max number of SQL variables per query
+    batch_size = 500
+
+    @property
+    def process_local(self) -> bool:
+        return self.filename == ':memory:'
+
+    def __init__(self, filename: str=':memory:', *,
+                 loop: asyncio.AbstractEventLoop=None, executor=None):
+        """
+        :param filename: SQLite database file, in-memory database by default
+        """
+        self.filename = filename
+        self.loop = loop
+        self.executor = executor
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS properties ('
+                'path TEXT NOT NULL, '
+                'name TEXT NOT NULL, '
+                'value BLOB NOT NULL, '
+                'PRIMARY KEY (path, name)) WITHOUT ROWID')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    async def _run(self, func, *args):
+        loop = self.loop or asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    @staticmethod
+    def _subtree(path: str) -> typing.Tuple[str, tuple]:
+        """ Returns SQL condition matching path and all paths below."""
+        if path == '/':
+            return '1', ()
+        return ('(path = ? OR (path >= ? AND path < ?))',
+                (path, path + '/', path + '0'))
+
+    def _get(self, paths, names):
+        result = OrderedDict((p, OrderedDict()) for p in paths)
+        paths = list(result)
+        query = 'SELECT path, name, value FROM properties WHERE path IN (%s)'
+        names_params = ()
+        if names is not None:
+            names_params = tuple(names)
+            if not names_params:
+                return result
+            query += ' AND name IN (%s)' % ', '.join('?' * len(names_params))
+        step = max(self.batch_size - len(names_params), 1)
+        with self._lock:
+            for i in range(0, len(paths), step):
+                chunk = tuple(paths[i:i + step])
+                rows = self._db.execute(
+                    query % ', '.join('?' * len(chunk)),
+                    chunk + names_params)
+                for path, name, value in rows:
+                    result[path][name] = value
+        return result
+
+    def _update(self, path, updates):
+        with self._lock, self._db:
+            for name, value in updates:
+                if value is None:
+                    self._db.execute(
+                        'DELETE FROM properties WHERE path = ? AND name = ?',
+                        (path, name))
+                else:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO properties (path, name, value) '
+                        'VALUES (?, ?, ?)', (path, name, value))
+
+    def _delete(self, path):
+        where, params = self._subtree(path)
+        self._db.execute('DELETE FROM properties WHERE %s' % where, params)
+
+    def _move(self, source, destination, *, keep_source):
+        where, params = self._subtree(source)
+        with self._lock, self._db:
+            self._delete(destination)
+            if keep_source:
+                self._db.execute(
+                    'INSERT INTO properties (path, name, value) '
+                    'SELECT ? || substr(path, ?), name, value '
+                    'FROM properties WHERE %s' % where,
+                    (destination, len(source) + 1) + params)
+            else:
+                self._db.execute(
+                    'UPDATE properties SET path = ? || substr(path, ?) '
+                    'WHERE %s' % where,
+                    (destination, len(source) + 1) + params)
+
+    def _delete_subtree(self, path):
+        with self._lock, self._db:
+            self._delete(path)
+
+    async def get(self, paths: typing.Iterable[str],
+                  names: typing.Iterable[str]=None
+                  ) -> typing.Dict[str, typing.Dict[str, bytes]]:
+        paths = [normalize_path(p) for p in paths]
+        return await self._run(self._get, paths, names)
+
+    async def update(self, path: str, updates: typing.Iterable[PropertyUpdate]):
+        await self._run(self._update, normalize_path(path), list(updates))
+
+    async def move(self, source: str, destination: str):
+        await self._run(lambda: self._move(normalize_path(source),
+                                           normalize_path(destination),
+                                           keep_source=False))
+
+    async def copy(self, source: str, destination: str):
+        await self._run(lambda: self._move(normalize_path(source),
+                                           normalize_path(destination),
+                                           keep_source=True))
+
+    async def delete(self, path: str):
+        await self._run(self._delete_subtree, normalize_path(path))
+
+
+def default_store(root_dir: str=None) -> SQLitePropertyStore:
+    """ Returns default property store of mount.
+
+    Filesystem mounts keep properties in ``STORE_NAME`` file in their root
+    directory. In-memory store is meant for tests and backends keeping
+    resources in memory, other backends should configure ``property_store``
+    mount option; it is used for read-only root directories too.
+
+    :param root_dir: root directory of filesystem mount
+    """
+    if root_dir is None:
+        return SQLitePropertyStore()
+    filename = os.path.join(root_dir, STORE_NAME)
+    try:
+        return SQLitePropertyStore(filename)
+    except sqlite3.Error as e:
+        logger.warning("Dead properties of %s are kept in memory: %s",
+                       root_dir, e)
+        return SQLitePropertyStore()
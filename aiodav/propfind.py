@@ -0,0 +1,104 @@
+# coding: utf-8
+"""
+PROPFIND request body parsing.
+
+Clients send the same few PROPFIND bodies over and over, so parsed requests
+are kept in a bounded LRU cache keyed by body bytes. Empty bodies and plain
+``allprop`` bodies are recognized without XML parsing at all.
+"""
+import re
+import typing
+from collections import OrderedDict, namedtuple
+
+from lxml import etree as et
+
+ALLPROP = 'allprop'
+PROPNAME = 'propname'
+PROP = 'prop'
+
+ALLPROP_RE = re.compile(
+    br'^\s*(?:<\?xml[^>]*\?>\s*)?'
+    br'<(?:(\w+):)?propfind\s+xmlns(?::(\w+))?\s*=\s*["\']DAV:["\']\s*>\s*'
+    br'<(?:(\w+):)?allprop\s*/>\s*'
+    br'</(?:(\w+):)?propfind\s*>\s*$')
+
+NAMESPACES = {'D': 'DAV:'}
+
+
+class PropfindRequest(namedtuple('PropfindRequest', 'kind props include')):
+    """ Parsed PROPFIND request.
+
+    :param kind: ALLPROP, PROPNAME or PROP
+    :param props: requested property names for PROP
+    :param include: additional property names for ALLPROP
+
+    Property names in ``DAV:`` namespace are local names, other names are
+    in ``{namespace}name`` form.
+    """
+
+    @property
+    def names(self) -> typing.Tuple[str, ...]:
+        """ Explicitly requested property names."""
+        return self.props if self.kind == PROP else self.include
+
+
+ALLPROP_REQUEST = PropfindRequest(ALLPROP, (), ())
+
+
+def _name(elem: et.Element) -> str:
+    return elem.tag.replace('{DAV:}', '')
+
+
+def parse_propfind(body: bytes) -> PropfindRequest:
+    """ Parses PROPFIND request body.
+
+    :raises: lxml.etree.XMLSyntaxError, ValueError
+    """
+    if not body.strip():
+        return ALLPROP_REQUEST
+    match = ALLPROP_RE.match(body)
+    # element prefixes must be the one bound to DAV: namespace
+    if match and len(set(match.groups())) == 1:
+        return ALLPROP_REQUEST
+    xml = et.fromstring(body)
+    if xml.tag != '{DAV:}propfind':
+        raise ValueError("propfind element expected")
+    if xml.find('D:prop', NAMESPACES) is not None:
+        props = xml.xpath('D:prop/*', namespaces=NAMESPACES)
+        return PropfindRequest(PROP, tuple(_name(e) for e in props), ())
+    if xml.find('D:propname', NAMESPACES) is not None:
+        return PropfindRequest(PROPNAME, (), ())
+    if xml.find('D:allprop', NAMESPACES) is not None:
+        include = xml.xpath('D:include/*', namespaces=NAMESPACES)
+        return PropfindRequest(ALLPROP, (), tuple(_name(e) for e in include))
+    raise ValueError("prop, propname or allprop element expected")
+
+
+class PropfindParser:
+    """ PROPFIND body parser with bounded cache of parsed requests."""
+
+    def __init__(self, *, max_body_size: int=64 * 1024,
+                 cache_size: int=256):
+        """
+        :param max_body_size: larger bodies are rejected without parsing
+        :param cache_size: number of distinct bodies kept parsed
+        """
+        self.max_body_size = max_body_size
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def parse(self, body: bytes) -> PropfindRequest:
+        """
+        :raises: lxml.etree.XMLSyntaxError, ValueError
+        """
+        if len(body) > self.max_body_size:
+            raise ValueError("PROPFIND body is too large")
+        request = self._cache.get(body)
+        if request is not None:
+            self._cache.move_to_end(body)
+            return request
+        request = parse_propfind(body)
+        self._cache[body] = request
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return request
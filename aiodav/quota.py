@@ -0,0 +1,173 @@
+# coding: utf-8
+import asyncio
+import typing
+
+from aiodav.resources import AbstractResource
+from aiodav.resources.abc import first_visit
+
+
+def split_path(path: str) -> typing.List[str]:
+    return [p for p in path.split('/') if p]
+
+
+class _Node:
+    __slots__ = ('children', 'size')
+
+    def __init__(self, size: int=0):
+        self.children = {}
+        # total size of files in subtree
+        self.size = size
+
+    def clone(self) -> '_Node':
+        node = _Node(self.size)
+        node.children = {k: v.clone() for k, v in self.children.items()}
+        return node
+
+
+class Quota:
+    """ Storage usage of a single mount, aggregated per collection.
+
+    Usage is computed once by walking the mount tree and then updated by
+    ResourceView on writes, so each update touches only ancestors of the
+    changed path. Changes made outside aiodav are not accounted.
+    """
+    #: writes made by other server processes are not accounted
+    process_local = True
+
+    def __init__(self, limit: int=None):
+        """
+        :param limit: mount quota in bytes, not limited if None
+        """
+        self.limit = limit
+        self._root = None
+        self._computing = None
+
+    @property
+    def used(self) -> int:
+        return self._root.size
+
+    @property
+    def available(self) -> typing.Optional[int]:
+        if self.limit is None:
+            return None
+        return max(0, self.limit - self.used)
+
+    def allows(self, delta: typing.Optional[int]) -> bool:
+        """ Checks that usage may grow by delta bytes.
+
+        :param delta: None if growth is not known in advance
+        """
+        if self.limit is None:
+            return True
+        if delta is None:
+            return self.used < self.limit
+        return self.used + delta <= self.limit
+
+    async def ensure(self, root: AbstractResource):
+        """ Computes usage on first call, concurrent calls wait for it."""
+        if self._root is not None:
+            return
+        if self._computing is None:
+            self._computing = asyncio.ensure_future(self._compute(root))
+        try:
+            # request cancellation must not interrupt tree walk
+            await asyncio.shield(self._computing)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._computing = None
+            raise
+
+    async def _compute(self, root: AbstractResource):
+        top = _Node()
+        visited = set()
+        first_visit(visited, root)
+        stack = [(root, top)]
+        links = []
+        while stack:
+            resource, node = stack.pop()
+            await resource.populate_collection()
+            for child in resource.collection:
+                await child.populate_props()
+                if child.is_collection:
+                    child_node = node.children[child.name] = _Node()
+                    links.append((node, child_node))
+                    # collections reached twice, i.e. by symlink to
+                    # ancestor, are accounted once
+                    if first_visit(visited, child):
+                        stack.append((child, child_node))
+                else:
+                    node.size += child.size
+        # children follow parents in links, so subtree sizes are summed up
+        # bottom-up
+        for parent, node in reversed(links):
+            parent.size += node.size
+        self._root = top
+
+    def _node(self, path: str) -> typing.Optional[_Node]:
+        node = self._root
+        for part in split_path(path):
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def usage(self, path: str) -> typing.Optional[int]:
+        """ Returns total size of collection, None for non-collections."""
+        node = self._node(path)
+        return node.size if node is not None else None
+
+    def add(self, path: str, delta: int):
+        """ Accounts size change of a file or collection at path."""
+        if not delta:
+            return
+        node = self._root
+        node.size += delta
+        for part in split_path(path)[:-1]:
+            node = node.children.get(part)
+            if node is None:
+                return
+            node.size += delta
+
+    def make_collection(self, path: str):
+        parts = split_path(path)
+        parent = self._node('/'.join(parts[:-1]))
+        if parent is not None:
+            parent.children.setdefault(parts[-1], _Node())
+
+    def _detach(self, path: str) -> typing.Optional[_Node]:
+        parts = split_path(path)
+        parent = self._node('/'.join(parts[:-1]))
+        if parent is None or not parts:
+            return None
+        return parent.children.pop(parts[-1], None)
+
+    def _attach(self, path: str, node: _Node):
+        parts = split_path(path)
+        parent = self._node('/'.join(parts[:-1]))
+        if parent is not None:
+            parent.children[parts[-1]] = node
+
+    def remove(self, path: str, size: int=0):
+        """ Accounts removal of a file of given size or a collection."""
+        node = self._detach(path)
+        if node is not None:
+            size = node.size
+        self.add(path, -size)
+
+    def move(self, source: str, destination: str, size: int=0):
+        """ Accounts move of a file of given size or a collection."""
+        node = self._detach(source)
+        if node is not None:
+            size = node.size
+            self._attach(destination, node)
+        self.add(source, -size)
+        self.add(destination, size)
+
+    def copy(self, source: str, destination: str, size: int=0):
+        """ Accounts copy of a file of given size or a collection."""
+        node = self._node(source)
+        if node is not None:
+            size = node.size
+            self._attach(destination, node.clone())
+        self.add(destination, size)
@@ -4,10 +4,93 @@ import typing
 from abc import ABC, abstractmethod, abstractproperty
 from collections import OrderedDict
 
+from aiodav.resources import errors
+from aiodav.resources.live import LiveProperties, LIVE_PROPERTIES
+from aiodav.search import SearchQuery, resource_values
+
+#: AbstractResource coroutines performing backend I/O
+BACKEND_COROUTINES = ('populate_props', 'populate_collection', 'get_content',
+                      'put_content', 'make_collection', 'move', 'delete',
+                      'copy', 'put_range', 'put_upload_part', 'commit_upload',
+                      'abort_upload', 'log_upload', 'upload_log')
+
+
+class CollectionBatches:
+    """ Async iterator over batches of populated collection members.
+
+    Default implementation populates whole collection at first step;
+    backends may load members lazily by overriding ``load`` and
+    ``populate``.
+    """
+
+    def __init__(self, resource: 'AbstractResource', *, offset: int=0,
+                 limit: int=None, batch_size: int=100):
+        """
+        :param offset: number of members to skip
+        :param limit: max number of members
+        """
+        self.resource = resource
+        self.offset = offset
+        self.limit = limit
+        self.batch_size = batch_size
+        #: number of collection members, known after first step
+        self.total = None
+        self._members = None
+        self._position = 0
+
+    async def load(self) -> typing.List['AbstractResource']:
+        """ Returns all collection members, maybe not populated."""
+        await self.resource.populate_collection()
+        return list(self.resource.collection)
+
+    async def populate(self, batch: typing.List['AbstractResource']
+                       ) -> typing.List['AbstractResource']:
+        """ Populates members, dropping ones that don't exist anymore."""
+        return batch
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> typing.List['AbstractResource']:
+        if self._members is None:
+            members = await self.load()
+            self.total = len(members)
+            end = None if self.limit is None else self.offset + self.limit
+            self._members = members[self.offset:end]
+        while self._position < len(self._members):
+            batch = self._members[
+                self._position:self._position + self.batch_size]
+            self._position += len(batch)
+            batch = await self.populate(batch)
+            if batch:
+                return batch
+        raise StopAsyncIteration()
+
+
+def first_visit(visited: set, collection: 'AbstractResource') -> bool:
+    """ Marks collection as visited by tree walk.
+
+    :returns: False if collection was already visited by another path,
+        e.g. it is reached by symlink to its ancestor
+    """
+    try:
+        identity = collection.identity
+    except OSError:
+        return False
+    if identity is None:
+        return True
+    if identity in visited:
+        return False
+    visited.add(identity)
+    return True
+
 
 class AbstractResource(ABC):
     """ Abstract WebDAV Resource."""
 
+    #: live property providers
+    live_properties = LIVE_PROPERTIES  # type: LiveProperties
+
     def __init__(self, prefix: str, path: str='/'):
         """
         :param prefix: WebDAV root prefix in aiodav mounts
@@ -40,6 +123,19 @@ class AbstractResource(ABC):
     def ctime(self) -> int:
         raise NotImplementedError()  # pragma: no cover
 
+    @property
+    def version(self) -> typing.Optional[typing.Hashable]:
+        """ Value changing whenever live properties may change, None if
+        backend can't tell; used as cache key of serialized properties."""
+        return None
+
+    @property
+    def identity(self) -> typing.Optional[typing.Hashable]:
+        """ Identity of underlying object, same for resources reached by
+        different paths (e.g. through symlinks), None if backend can't tell;
+        used to avoid walking the same collection twice."""
+        return None
+
     @abstractproperty
     def parent(self) -> 'AbstractResource':
         raise NotImplementedError()  # pragma: no cover 
@@ -52,9 +148,14 @@ class AbstractResource(ABC):
     def collection(self)-> typing.List['AbstractResource']:
         raise NotImplementedError()  # pragma: no cover 
 
-    @abstractmethod
-    def propfind(self, *props) -> OrderedDict:
-        raise NotImplementedError()  # pragma: no cover
+    def propfind(self, *props, include: typing.Iterable[str]=()
+                 ) -> OrderedDict:
+        """ Computes requested live properties of populated resource.
+
+        :param props: property names, all ``allprop`` properties if empty
+        :param include: names added to ``allprop`` properties
+        """
+        return self.live_properties.compute(self, props, include)
 
     @abstractmethod
     def with_relative(self, relative) -> 'AbstractResource':
@@ -99,6 +200,104 @@ class AbstractResource(ABC):
     async def copy(self, destination: str) -> 'AbstractResource':
         raise NotImplementedError()  # pragma: no cover
 
+    async def put_range(self, read_some: typing.Awaitable[bytes],
+                        offset: int) -> typing.Tuple[bool, int]:
+        """ Writes content at offset, keeping the rest of file as is.
+
+        :returns: created flag and number of bytes written
+        :raises: aiodav._resources.errors.NotSupported
+        """
+        raise errors.NotSupported()
+
+    async def put_upload_part(self, upload_id: str,
+                              read_some: typing.Awaitable[bytes],
+                              offset: int) -> int:
+        """ Writes part of staged upload at offset.
+
+        Parts of same upload may be written concurrently.
+
+        :returns: number of bytes written
+        :raises: aiodav._resources.errors.NotSupported
+        """
+        raise errors.NotSupported()
+
+    async def commit_upload(self, upload_id: str, size: int) -> bool:
+        """ Atomically replaces content with first size bytes of upload.
+
+        :returns: created flag
+        :raises: aiodav._resources.errors.NotSupported
+        """
+        raise errors.NotSupported()
+
+    async def abort_upload(self, upload_id: str):
+        """ Drops staged upload content and journal.
+
+        :raises: aiodav._resources.errors.NotSupported
+        """
+        raise errors.NotSupported()
+
+    async def log_upload(self, upload_id: str, record: str):
+        """ Appends single-line record to journal of staged upload.
+
+        Journal is kept with staged content and dropped on commit or abort,
+        so any server process may resume the upload. Records appended
+        concurrently must not be lost.
+
+        :raises: aiodav._resources.errors.NotSupported
+        :raises: aiodav._resources.errors.ResourceDoesNotExist if parent
+            does not exist
+        """
+        raise errors.NotSupported()
+
+    async def upload_log(self, upload_id: str) -> typing.List[str]:
+        """ Returns records of staged upload journal.
+
+        :raises: aiodav._resources.errors.NotSupported
+        :raises: aiodav._resources.errors.ResourceDoesNotExist if upload has
+            no journal
+        """
+        raise errors.NotSupported()
+
+    def iter_collection(self, *, offset: int=0, limit: int=None,
+                        batch_size: int=100) -> CollectionBatches:
+        """ Iterates over populated collection members in batches, so
+        members of huge collections may be processed as they are read.
+        """
+        return CollectionBatches(self, offset=offset, limit=limit,
+                                 batch_size=batch_size)
+
+    async def search(self, query: SearchQuery
+                     ) -> typing.List['AbstractResource']:
+        """ Returns populated resources matching query.
+
+        Default implementation walks the tree below query scope, backends
+        with an index should override it.
+
+        :raises: aiodav._resources.errors.ResourceDoesNotExist
+        """
+        scope = self
+        if query.scope != '/':
+            scope = self / query.scope.lstrip('/')
+            await scope.populate_props()
+        candidates = []
+        visited = set()
+        stack = [(scope, 0)]
+        while stack:
+            resource, depth = stack.pop()
+            candidates.append((resource, resource_values(resource)))
+            if not resource.is_collection:
+                continue
+            if query.depth is not None and depth >= query.depth:
+                continue
+            if not first_visit(visited, resource):
+                # symlink loop
+                continue
+            await resource.populate_collection()
+            for child in reversed(resource.collection):
+                await child.populate_props()
+                stack.append((child, depth + 1))
+        return query.select(candidates)
+
     def __eq__(self, other):
         if not isinstance(other, AbstractResource):
             return NotImplemented
@@ -1,7 +1,6 @@
 # coding: utf-8
 import os
 import typing
-from collections import OrderedDict
 from datetime import datetime
 from io import BytesIO
 
@@ -21,6 +20,10 @@ class DummyResource(AbstractResource):
             if self._root:
                 raise ValueError("Second _root")
             self.__class__._root = self
+            # (path, upload id) -> staged content
+            self._uploads = {}
+            # (path, upload id) -> upload journal records
+            self._upload_logs = {}
         else:
             self._exists = exists
         self._is_directory = is_collection
@@ -112,21 +115,69 @@ class DummyResource(AbstractResource):
             if not buffer:
                 return created
 
-    def propfind(self, *props) -> OrderedDict:
-        fmt = '%Y-%m-%dT%H:%M:%SZ'
-        ctime = self._ctime.strftime(fmt)
-        mtime = self._mtime.strftime(fmt)
-        all_props = OrderedDict([
-            ('getcontenttype', ''),
-            ('getlastmodified', mtime),
-            ('getcontentlength', self.size),
-            ('getetag', ''),
-            ('creationdate', ctime),
-            ('displayname', self.name),
-        ])
-        if not props:
-            return all_props
-        return OrderedDict(p for p in all_props.items() if p[0] in props)
+    async def put_range(self, read_some: typing.Awaitable[bytes],
+                        offset: int) -> typing.Tuple[bool, int]:
+        created = not self._exists
+        if created:
+            self._touch_file()
+        elif self.is_collection:
+            raise errors.InvalidResourceType("file resource expected")
+        return created, await self._write_at(self._content, read_some, offset)
+
+    async def put_upload_part(self, upload_id: str,
+                              read_some: typing.Awaitable[bytes],
+                              offset: int) -> int:
+        if self._exists and self.is_collection:
+            raise errors.InvalidResourceType("file resource expected")
+        # noinspection PyProtectedMember
+        content = self._root._uploads.setdefault((self.path, upload_id),
+                                                 BytesIO())
+        return await self._write_at(content, read_some, offset)
+
+    async def commit_upload(self, upload_id: str, size: int) -> bool:
+        # noinspection PyProtectedMember
+        content = self._root._uploads.pop((self.path, upload_id), BytesIO())
+        self._root._upload_logs.pop((self.path, upload_id), None)
+        created = not self._exists
+        if created:
+            self._touch_file()
+        elif self.is_collection:
+            raise errors.InvalidResourceType("file resource expected")
+        content.truncate(size)
+        self._content = content
+        return created
+
+    async def abort_upload(self, upload_id: str):
+        # noinspection PyProtectedMember
+        self._root._uploads.pop((self.path, upload_id), None)
+        # noinspection PyProtectedMember
+        self._root._upload_logs.pop((self.path, upload_id), None)
+
+    async def log_upload(self, upload_id: str, record: str):
+        # noinspection PyProtectedMember
+        self._root._upload_logs.setdefault((self.path, upload_id),
+                                           []).append(record)
+
+    async def upload_log(self, upload_id: str) -> typing.List[str]:
+        try:
+            # noinspection PyProtectedMember
+            return list(self._root._upload_logs[(self.path, upload_id)])
+        except KeyError:
+            raise errors.ResourceDoesNotExist("upload does not exist")
+
+    @staticmethod
+    async def _write_at(content: BytesIO, read_some: typing.Awaitable[bytes],
+                        offset: int) -> int:
+        written = 0
+        while read_some:
+            buffer = await read_some()
+            if not buffer:
+                break
+            # position is shared by concurrent writers
+            content.seek(offset + written)
+            content.write(buffer)
+            written += len(buffer)
+        return written
 
     async def populate_props(self):
         if not self._exists:
@@ -15,3 +15,11 @@ class ResourceAlreadyExists(ResourceError):
 
 class InvalidResourceType(ResourceError):
     """ Incorrect resource type."""
+
+
+class NotSupported(ResourceError):
+    """ Operation is not supported by backend."""
+
+
+class SearchUnavailable(ResourceError):
+    """ Search index is not ready yet."""
@@ -1,23 +1,105 @@
 # coding: utf-8
+import asyncio
+import functools
+import inspect
 import os
 import shutil
 import stat
 import typing
-from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 
+from aiodav.checksums import ChecksumService, CHECKSUM_PROP
+from aiodav.search import SearchQuery
 from aiodav.resources import AbstractResource, errors
+from aiodav.resources.abc import CollectionBatches
+from aiodav.resources.index import MetadataIndex
+from aiodav.resources.live import creation_time, http_date, iso_date
+from aiodav.scheduler import IOScheduler
+from aiodav.properties import is_reserved_name
+from aiodav.uploads import journal_name, staging_name
+
+
+class FileSystemCollectionBatches(CollectionBatches):
+    """ Lists directory names at first step and stats members batch by
+    batch, unless metadata index is fresh."""
+
+    async def load(self) -> typing.List['FileSystemResource']:
+        resource = self.resource
+        if resource._fresh_index() is not None:
+            return await super().load()
+        try:
+            entries = await resource._io('populate_collection',
+                                         resource._list_names,
+                                         resource.absolute)
+        except FileNotFoundError:
+            raise errors.ResourceDoesNotExist()
+        # same order as populate_collection: collections first
+        entries.sort(key=lambda e: (not e[1], e[0]))
+        return [resource.with_relative(name) for name, _ in entries]
+
+    async def populate(self, batch: typing.List['FileSystemResource']
+                       ) -> typing.List['FileSystemResource']:
+        missing = [r for r in batch if r._stat is None]
+        if missing:
+            stats = await self.resource._io(
+                'populate_collection', self._stat_all,
+                [str(r.absolute) for r in missing])
+            for resource, st in zip(missing, stats):
+                resource._stat = st
+        return [r for r in batch if r._stat is not None]
+
+    @staticmethod
+    def _stat_all(paths: typing.List[str]
+                  ) -> typing.List[typing.Optional[os.stat_result]]:
+        stats = []
+        for path in paths:
+            try:
+                stats.append(os.stat(path))
+            except FileNotFoundError:
+                # removed after listing
+                stats.append(None)
+        return stats
 
 
 class FileSystemResource(AbstractResource):
+    #: bounds for get_content adaptive block size
+    min_block_size = 64 * 1024
+    max_block_size = 8 * 1024**2
+    #: desired time to write single block, in seconds
+    block_duration = 0.1
+    #: executor for blocking file reads, None for loop default executor
+    executor = None
+    #: dates are formatted from stat fields without datetime objects
+    live_properties = AbstractResource.live_properties.copy()
+    live_properties.register(
+        'getlastmodified', lambda r: http_date(int(r._stat.st_mtime)))
+    live_properties.register(
+        'creationdate', lambda r: iso_date(int(creation_time(r._stat))))
+    live_properties.register('getetag', lambda r: r._etag())
+    live_properties.register(CHECKSUM_PROP, lambda r: r._checksum(),
+                             allprop=False)
 
     def __init__(self, prefix, path: str = '/',
-                 root_dir=os.path.expanduser('~')):
+                 root_dir=os.path.expanduser('~'), index: MetadataIndex=None,
+                 scheduler: IOScheduler=None,
+                 checksums: ChecksumService=None):
+        """
+        :param index: metadata index for ``root_dir`` used instead of stat
+            calls while it is fresh
+        :param scheduler: runs all blocking calls by operation priority;
+            without it metadata calls and writes block event loop and reads
+            run in ``executor``
+        :param checksums: background hashing of file contents, enables
+            strong ETags and checksum property
+        """
         assert '..' not in path, 'relative navigation is restricted'
         path = path.lstrip('/')
         super().__init__(prefix, path)
         self._root_dir = Path(root_dir)
+        self._index = index
+        self._scheduler = scheduler
+        self._checksums = checksums
         self._stat = None
         self._collection = None
         self._parent = None
@@ -38,7 +120,28 @@ class FileSystemResource(AbstractResource):
 
     @property
     def ctime(self):
-        return datetime.fromtimestamp(self._stat.st_ctime)
+        return datetime.fromtimestamp(creation_time(self._stat))
+
+    @property
+    def version(self) -> typing.Optional[tuple]:
+        st = self._stat
+        if st is None:
+            return None
+        # all fields live properties are computed from; float times may
+        # not change for updates made within their precision
+        version = st.st_mode, st.st_size, st.st_mtime_ns, st.st_ctime_ns
+        if self._checksums is None or stat.S_ISDIR(st.st_mode):
+            return version
+        checksum = self._checksums.peek(str(self.absolute), st)
+        return version + (checksum is not None,)
+
+    @property
+    def identity(self) -> typing.Optional[tuple]:
+        st = self._stat
+        if not hasattr(st, 'st_ino'):
+            # index doesn't keep device and inode numbers
+            st = os.stat(str(self.absolute))
+        return st.st_dev, st.st_ino
 
     @property
     def parent(self) -> 'FileSystemResource':
@@ -50,8 +153,7 @@ class FileSystemResource(AbstractResource):
             path = str(self.absolute.parent.relative_to(self._root_dir))
             if path == '.':
                 path = '/'
-            self._parent = self.__class__(self.prefix, path,
-                                          root_dir=self._root_dir)
+            self._parent = self._new(path)
         return self._parent
 
     @property
@@ -68,96 +170,246 @@ class FileSystemResource(AbstractResource):
 
     def with_relative(self, relative):
         path = Path(self._path) / relative
-        new = self.__class__(self.prefix, str(path), root_dir=self._root_dir)
-        return new
+        return self._new(str(path))
+
+    def _new(self, path: str) -> 'FileSystemResource':
+        return self.__class__(self.prefix, path, root_dir=self._root_dir,
+                              index=self._index, scheduler=self._scheduler,
+                              checksums=self._checksums)
+
+    def _checksum(self) -> typing.Optional[str]:
+        """ Returns known checksum of file, requesting it otherwise."""
+        if self._checksums is None or self.is_collection:
+            return None
+        return self._checksums.checksum(str(self.absolute), self._stat)
+
+    def _etag(self) -> str:
+        """ Returns strong ETag if file checksum is already known."""
+        if self._checksums is None or self.is_collection:
+            return ''
+        checksum = self._checksums.peek(str(self.absolute), self._stat)
+        return '' if checksum is None else '"%s"' % checksum.split(':')[1]
+
+    def _request_checksum(self):
+        if self._checksums is not None:
+            self._checksums.request(str(self.absolute))
+
+    def _io_future(self, operation: str, func, *args) -> asyncio.Future:
+        """ Runs blocking call in scheduler or executor.
+
+        :param operation: AbstractResource method making the call
+        """
+        if self._scheduler is not None:
+            return self._scheduler.run(operation, func, *args)
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.executor, func, *args)
+
+    async def _io(self, operation: str, func, *args, inline: bool=False):
+        """ Runs blocking call.
+
+        :param inline: call in event loop thread when there is no scheduler
+        """
+        if inline and self._scheduler is None:
+            return func(*args)
+        return await self._io_future(operation, func, *args)
+
+    def _fresh_index(self) -> typing.Optional[MetadataIndex]:
+        index = self._index
+        if index is None:
+            return None
+        index.start()
+        return index if index.fresh else None
 
     async def populate_props(self):
+        if is_reserved_name(self.name):
+            raise errors.ResourceDoesNotExist()
+        index = self._fresh_index()
+        if index is not None:
+            # members of indexed collection listing are populated already
+            if self._stat is None:
+                self._stat = await index.lookup(self.path)
+            if self._stat is not None:
+                return
         try:
-            self._stat = os.stat(str(self.absolute))
+            self._stat = await self._io('populate_props', os.stat,
+                                        str(self.absolute), inline=True)
         except FileNotFoundError:
             raise errors.ResourceDoesNotExist()
 
     async def populate_collection(self):
-        self._collection = []
+        index = self._fresh_index()
+        children = None
+        if index is not None:
+            children = await index.children(self.path)
+        if children is None:
+            try:
+                children = await self._io('populate_collection',
+                                          self._list_dir, self.absolute,
+                                          inline=True)
+            except FileNotFoundError:
+                raise errors.ResourceDoesNotExist()
         collections = []
         files = []
-        try:
-            for child in self.absolute.iterdir():
-                relative = self.with_relative(child.relative_to(self.absolute))
-                relative._stat = os.stat(str(relative.absolute))
-                if child.is_dir():
-                    collections.append(relative)
-                else:
-                    files.append(relative)
-        except FileNotFoundError:
-            raise errors.ResourceDoesNotExist()
+        for name, child_stat in children:
+            relative = self.with_relative(name)
+            relative._stat = child_stat
+            if stat.S_ISDIR(child_stat.st_mode):
+                collections.append(relative)
+            else:
+                files.append(relative)
+        self._collection = []
         self._collection.extend(sorted(collections, key=lambda r: r.name))
         self._collection.extend(sorted(files, key=lambda r: r.name))
 
-    def propfind(self, *props) -> OrderedDict:
-        fmt = '%Y-%m-%dT%H:%M:%SZ'
-        ctime = datetime.fromtimestamp(self._stat.st_ctime).strftime(fmt)
-        mtime = datetime.fromtimestamp(self._stat.st_mtime).strftime(fmt)
-        all_props = OrderedDict([
-            ('getcontenttype', ''),
-            ('getlastmodified', mtime),
-            ('getcontentlength', self.size),
-            ('getetag', ''),
-            ('creationdate', ctime),
-            ('displayname', self.name),
-        ])
-        if not props:
-            return all_props
-
-        return OrderedDict(p for p in all_props.items() if p[0] in props)
+    def iter_collection(self, *, offset: int=0, limit: int=None,
+                        batch_size: int=100) -> FileSystemCollectionBatches:
+        return FileSystemCollectionBatches(self, offset=offset, limit=limit,
+                                           batch_size=batch_size)
+
+    @staticmethod
+    def _list_names(path: Path) -> typing.List[typing.Tuple[str, bool]]:
+        return [(e.name, e.is_dir()) for e in os.scandir(str(path))
+                if not is_reserved_name(e.name)]
+
+    @staticmethod
+    def _list_dir(path: Path) -> typing.List[typing.Tuple[str, os.stat_result]]:
+        return [(child.name, os.stat(str(child))) for child in path.iterdir()
+                if not is_reserved_name(child.name)]
+
+    async def search(self, query: SearchQuery
+                     ) -> typing.List['FileSystemResource']:
+        """ Answers query from metadata index without touching filesystem.
+
+        :raises: aiodav._resources.errors.NotSupported if resource has no
+            index
+        :raises: aiodav._resources.errors.SearchUnavailable
+        :raises: aiodav._resources.errors.ResourceDoesNotExist
+        """
+        if self._index is None:
+            raise errors.NotSupported("Search requires metadata index")
+        index = self._fresh_index()
+        if index is None:
+            raise errors.SearchUnavailable()
+        matches = await index.search(query)
+        if matches is None:
+            raise errors.ResourceDoesNotExist()
+        results = []
+        for key, index_stat in matches:
+            resource = self._new(key.lstrip('/') or '/')
+            resource._stat = index_stat
+            results.append(resource)
+        return results
 
     async def get_content(self, write: typing.Callable[[bytes], typing.Any],
                           *, offset: int=None, limit: int=None):
+        """ Streams file content to ``write`` callback.
+
+        Block size follows measured ``write`` throughput within
+        ``min_block_size``..``max_block_size`` bounds, so each block takes
+        about ``block_duration`` seconds to drain. Next block is read in
+        executor while current one is being written, so at most two blocks
+        per connection are kept in memory.
+
+        :raises: aiodav._resources.errors.ResourceDoesNotExist
+        """
+        loop = asyncio.get_event_loop()
         try:
-            with self.absolute.open('rb') as f:
-                if offset:
-                    f.seek(offset)
-                block_size = 1024**2
-                if not limit:
-                    limit = None
+            f = self.absolute.open('rb')
+        except IsADirectoryError:
+            raise errors.InvalidResourceType("file resource expected")
+        except FileNotFoundError:
+            # stale index entry of a file removed outside aiodav
+            if self._index is not None:
+                await self._index.refresh(self.path)
+            raise errors.ResourceDoesNotExist()
+        with f:
+            if offset:
+                f.seek(offset)
+            if not limit:
+                limit = None
+            block_size = self.min_block_size
+            read_size = self._read_size(block_size, limit)
+            future = self._io_future('get_content', f.read, read_size)
+            try:
                 while True:
-                    if limit is not None:
-                        buffer = f.read(min(block_size, limit))
-                    else:
-                        buffer = f.read(block_size)
-                    await write(buffer)
+                    buffer = await future
+                    future = None
                     if limit is not None:
                         limit -= len(buffer)
-                    if len(buffer) < block_size:
+                    last = len(buffer) < read_size or limit == 0
+                    if not last:
+                        read_size = self._read_size(block_size, limit)
+                        future = self._io_future('get_content', f.read,
+                                                 read_size)
+                    if buffer:
+                        started = loop.time()
+                        result = write(buffer)
+                        if inspect.isawaitable(result):
+                            await result
+                        block_size = self._next_block_size(
+                            block_size, len(buffer), loop.time() - started)
+                    if last:
                         break
-        except IsADirectoryError:
-            raise errors.InvalidResourceType("file resource expected")
+            finally:
+                if future is not None:
+                    # file must not be closed while read is in progress
+                    await asyncio.wait([future])
+
+    @staticmethod
+    def _read_size(block_size, limit):
+        if limit is None:
+            return block_size
+        return min(block_size, limit)
+
+    def _next_block_size(self, block_size: int, sent: int,
+                         elapsed: float) -> int:
+        """ Computes next block size from last block write throughput."""
+        if elapsed > 0:
+            block_size = int(sent / elapsed * self.block_duration)
+        else:
+            block_size *= 2
+        return max(self.min_block_size, min(self.max_block_size, block_size))
 
     async def make_collection(self, collection: str) -> 'AbstractResource':
         new_path = self.absolute / collection
         if new_path.exists():
             raise errors.ResourceAlreadyExists()
         try:
-            new_path.mkdir(exist_ok=True)
+            await self._io('make_collection',
+                           functools.partial(new_path.mkdir, exist_ok=True),
+                           inline=True)
         except NotADirectoryError:
             raise errors.InvalidResourceType("collection expected")
 
         path = str(new_path.relative_to(self._root_dir))
-        return self.__class__(self.prefix, path, root_dir=self._root_dir)
+        if self._index is not None:
+            await self._index.refresh(path)
+        return self._new(path)
 
     async def move(self, destination: str) -> bool:
-        new_resource = self.__class__(self.prefix, destination,
-                                      root_dir=self._root_dir)
+        new_resource = self._new(destination)
         created = not new_resource.absolute.exists()
+        source = self.path
         if created:
-            self.absolute.rename(new_resource.absolute)
+            await self._io('move', self.absolute.rename,
+                           new_resource.absolute, inline=True)
             self._path = new_resource.path.strip('/')
         else:
-            self.absolute.rename(new_resource.absolute / self.name)
+            await self._io('move', self.absolute.rename,
+                           new_resource.absolute / self.name, inline=True)
             self._path = os.path.join(new_resource.path.strip('/'), self.name)
+        if self._index is not None:
+            await self._index.move(source, self.path)
         return created
 
     async def put_content(self, read_some: typing.Awaitable[bytes]) -> bool:
+        created = await self._put_content(read_some)
+        self._request_checksum()
+        if self._index is not None:
+            await self._index.refresh(self.path)
+        return created
+
+    async def _put_content(self, read_some: typing.Awaitable[bytes]) -> bool:
         created = not self.absolute.exists()
         mode = 'wb' if created else 'r+b'
         parent_exists = self.absolute.parent.exists()
@@ -165,36 +417,163 @@ class FileSystemResource(AbstractResource):
             raise errors.ResourceDoesNotExist("parent resource does not exist")
         try:
             with self.absolute.open(mode) as f:
-                if not read_some:
-                    return created
-                while True:
-                    buffer = await read_some()
-                    f.write(buffer)
-                    if not buffer:
-                        return created
+                if read_some:
+                    while True:
+                        buffer = await read_some()
+                        if not buffer:
+                            break
+                        await self._io('put_content', f.write, buffer,
+                                       inline=True)
+                # existing file may be longer than new content
+                f.truncate()
+                return created
+        except NotADirectoryError:
+            raise errors.InvalidResourceType(
+                "parent resource is not a collection")
+        except IsADirectoryError:
+            raise errors.InvalidResourceType("file resource expected")
+
+    async def put_range(self, read_some: typing.Awaitable[bytes],
+                        offset: int) -> typing.Tuple[bool, int]:
+        created = not self.absolute.exists()
+        written = await self._write_at('put_range', self.absolute, read_some,
+                                       offset)
+        self._request_checksum()
+        if self._index is not None:
+            await self._index.refresh(self.path)
+        return created, written
+
+    def _staging(self, upload_id: str) -> Path:
+        # staged next to resource, so commit is a rename within filesystem;
+        # staging files are hidden from listings
+        return self.absolute.with_name(staging_name(self.name, upload_id))
+
+    async def put_upload_part(self, upload_id: str,
+                              read_some: typing.Awaitable[bytes],
+                              offset: int) -> int:
+        if self.absolute.is_dir():
+            raise errors.InvalidResourceType("file resource expected")
+        return await self._write_at('put_upload_part',
+                                    self._staging(upload_id), read_some,
+                                    offset)
+
+    async def commit_upload(self, upload_id: str, size: int) -> bool:
+        staging = str(self._staging(upload_id))
+        if self.absolute.is_dir():
+            raise errors.InvalidResourceType("file resource expected")
+        created = not self.absolute.exists()
+        try:
+            os.truncate(staging, size)
+        except FileNotFoundError:
+            if size:
+                raise errors.ResourceDoesNotExist("upload does not exist")
+            # no parts for empty file
+            open(staging, 'wb').close()
+        try:
+            os.replace(staging, str(self.absolute))
+        except FileNotFoundError:
+            # committed by another server process
+            raise errors.ResourceDoesNotExist("upload does not exist")
+        try:
+            self._journal(upload_id).unlink()
+        except FileNotFoundError:
+            pass
+        self._stat = None
+        self._request_checksum()
+        if self._index is not None:
+            await self._index.refresh(self.path)
+        return created
+
+    async def abort_upload(self, upload_id: str):
+        for path in self._staging(upload_id), self._journal(upload_id):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _journal(self, upload_id: str) -> Path:
+        return self.absolute.with_name(journal_name(self.name, upload_id))
+
+    async def log_upload(self, upload_id: str, record: str):
+        # appends of a single short line are atomic, so processes don't
+        # need to lock journal
+        data = (record + '\n').encode('utf-8')
+        try:
+            fd = os.open(str(self._journal(upload_id)),
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        except (FileNotFoundError, NotADirectoryError):
+            raise errors.ResourceDoesNotExist("parent resource does not exist")
+        try:
+            await self._io('log_upload', os.write, fd, data, inline=True)
+        finally:
+            os.close(fd)
+
+    async def upload_log(self, upload_id: str) -> typing.List[str]:
+        try:
+            with self._journal(upload_id).open('rb') as f:
+                data = await self._io('upload_log', f.read, inline=True)
+        except (FileNotFoundError, NotADirectoryError):
+            raise errors.ResourceDoesNotExist("upload does not exist")
+        # last line may be partially written yet
+        return data.decode('utf-8').split('\n')[:-1]
+
+    async def _write_at(self, operation: str, path: Path,
+                        read_some: typing.Awaitable[bytes], offset: int) -> int:
+        """ Writes stream to file at offset, creating file if missing.
+
+        Writes are positional, so concurrent writers to the same file don't
+        share file position.
+        """
+        try:
+            fd = os.open(str(path), os.O_WRONLY | os.O_CREAT, 0o666)
+        except FileNotFoundError:
+            raise errors.ResourceDoesNotExist("parent resource does not exist")
         except NotADirectoryError:
             raise errors.InvalidResourceType(
                 "parent resource is not a collection")
         except IsADirectoryError:
             raise errors.InvalidResourceType("file resource expected")
+        written = 0
+        try:
+            while read_some:
+                buffer = await read_some()
+                if not buffer:
+                    break
+                await self._io(operation, self._pwrite, fd, buffer,
+                               offset + written)
+                written += len(buffer)
+        finally:
+            os.close(fd)
+        return written
+
+    @staticmethod
+    def _pwrite(fd: int, buffer: bytes, offset: int):
+        view = memoryview(buffer)
+        while view:
+            count = os.pwrite(fd, view, offset)
+            view = view[count:]
+            offset += count
 
     async def delete(self):
         if self.absolute.is_dir():
-            shutil.rmtree(str(self.absolute))
+            await self._io('delete', shutil.rmtree, str(self.absolute),
+                           inline=True)
         elif not self.absolute.exists():
             raise errors.ResourceDoesNotExist()
         else:
-            self.absolute.unlink()
+            await self._io('delete', self.absolute.unlink, inline=True)
+        if self._index is not None:
+            await self._index.remove(self.path)
 
     async def copy(self, destination: str) -> 'AbstractResource':
-        new_resource = self.__class__(self.prefix, destination,
-                                      root_dir=self._root_dir)
+        new_resource = self._new(destination)
         if not self._stat:
             await self.populate_props()
 
         if not self.is_collection:
             try:
-                shutil.copy(str(self.absolute), str(new_resource.absolute))
+                await self._io('copy', shutil.copy, str(self.absolute),
+                               str(new_resource.absolute), inline=True)
             except shutil.SameFileError:
                 raise errors.ResourceAlreadyExists(
                     "destination file already exists")
@@ -205,11 +584,14 @@ class FileSystemResource(AbstractResource):
             await new_resource.populate_props()
         else:
             try:
-                shutil.copytree(str(self.absolute), str(new_resource.absolute))
+                await self._io('copy', shutil.copytree, str(self.absolute),
+                               str(new_resource.absolute), inline=True)
             except FileExistsError:
                 raise errors.InvalidResourceType("collection expected")
             await new_resource.populate_props()
             await new_resource.populate_collection()
+        if self._index is not None:
+            await self._index.refresh(new_resource.path)
         return new_resource
 
     def __repr__(self):
@@ -0,0 +1,420 @@
+# coding: utf-8
+import asyncio
+import logging
+import os
+import posixpath
+import sqlite3
+import stat
+import sys
+import threading
+import time
+import typing
+from collections import namedtuple
+from pathlib import Path
+
+from aiodav.resources.live import creation_time
+from aiodav.search import SearchQuery, COMPARISONS
+from aiodav.properties import is_reserved_name
+
+logger = logging.getLogger('aiodav.index')
+
+#: index files of other versions are rebuilt
+SCHEMA_VERSION = 2
+
+
+class IndexStat(namedtuple('IndexStat', ['st_mode', 'st_size', 'st_mtime',
+                                           'st_ctime'])):
+    """ Subset of os.stat_result fields kept in index; ``ctime`` column
+    keeps creation time computed by ``creation_time``."""
+    __slots__ = ()
+
+    @property
+    def st_birthtime(self) -> float:
+        return self.st_ctime
+
+    @property
+    def st_mtime_ns(self) -> int:
+        return int(self.st_mtime * 1e9)
+
+    @property
+    def st_ctime_ns(self) -> int:
+        return int(self.st_ctime * 1e9)
+
+
+def index_key(path: str) -> str:
+    return '/' + '/'.join(p for p in str(path).split('/') if p)
+
+
+class MetadataIndex:
+    """ Persistent SQLite index of file tree metadata.
+
+    Index is filled by background scan of ``root_dir`` and kept current by
+    aiodav own writes and by periodic rescans, which re-list only directories
+    with changed mtime. Changes to existing files' content made outside aiodav
+    don't touch directory mtime, so they are not picked up by rescans.
+
+    Index is used by ``FileSystemResource`` only while it is fresh: first scan
+    pass is finished and background rescans are running.
+
+    Names are kept case folded and reversed too, so name patterns with
+    literal prefix or suffix (``report*``, ``*.txt``) are looked up by index.
+    """
+
+    def __init__(self, filename: str, root_dir: str, *,
+                 rescan_interval: float=60.0, max_age: float=None,
+                 loop: asyncio.AbstractEventLoop=None, executor=None):
+        """
+        :param filename: SQLite database file
+        :param root_dir: indexed directory, same as resource ``root_dir``
+        :param rescan_interval: delay between rescan passes, in seconds
+        :param max_age: max time since last finished scan pass for index to
+            be used, in seconds; not limited if None
+        """
+        self.filename = filename
+        self.root_dir = Path(root_dir)
+        self.rescan_interval = rescan_interval
+        self.max_age = max_age
+        self.loop = loop
+        self.executor = executor
+        self.scanned = None
+        self._task = None
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        with self._db:
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+            if version != SCHEMA_VERSION:
+                # index is filled again by scan
+                self._db.execute('DROP TABLE IF EXISTS entries')
+                self._db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'path TEXT NOT NULL PRIMARY KEY, '
+                'parent TEXT NOT NULL, '
+                'name TEXT NOT NULL, '
+                'is_dir INTEGER NOT NULL, '
+                'mode INTEGER NOT NULL, '
+                'size INTEGER NOT NULL, '
+                'mtime REAL NOT NULL, '
+                'ctime REAL NOT NULL, '
+                'folded TEXT NOT NULL, '
+                'folded_rev TEXT NOT NULL) WITHOUT ROWID')
+            self._db.execute('CREATE INDEX IF NOT EXISTS entries_parent '
+                             'ON entries (parent)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS entries_dirs '
+                             'ON entries (path) WHERE is_dir = 1')
+            self._db.execute('CREATE INDEX IF NOT EXISTS entries_folded '
+                             'ON entries (folded)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS entries_folded_rev '
+                             'ON entries (folded_rev)')
+
+    @property
+    def fresh(self) -> bool:
+        if self.scanned is None or self._task is None or self._task.done():
+            return False
+        if self.max_age is None:
+            return True
+        return time.monotonic() - self.scanned <= self.max_age
+
+    def start(self):
+        """ Starts background scanning if not started yet."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run(), loop=self.loop)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.wait([self._task])
+        self._task = None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    async def run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.scan()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Index scan failed")
+            else:
+                self.scanned = started
+            await asyncio.sleep(self.rescan_interval, loop=self.loop)
+
+    async def _run(self, func, *args):
+        loop = self.loop or asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def scan(self):
+        """ Performs scan pass: full scan for empty index, rescan otherwise."""
+        await self._run(self._rescan)
+
+    async def lookup(self, path: str) -> typing.Optional[IndexStat]:
+        return await self._run(self._lookup, index_key(path))
+
+    async def children(self, path: str
+                       ) -> typing.Optional[typing.List[typing.Tuple[
+                           str, IndexStat]]]:
+        """ Returns names and stats of collection members.
+
+        :returns: None if path is not indexed as collection
+        """
+        return await self._run(self._children, index_key(path))
+
+    async def refresh(self, path: str):
+        """ Updates index after path was written."""
+        await self._run(self._refresh, index_key(path))
+
+    async def remove(self, path: str):
+        await self._run(self._remove, index_key(path))
+
+    async def move(self, source: str, destination: str):
+        await self._run(self._move, index_key(source), index_key(destination))
+
+    async def search(self, query: SearchQuery
+                     ) -> typing.List[typing.Tuple[str, IndexStat]]:
+        """ Returns paths and stats of entries matching query.
+
+        :returns: None if query scope is not indexed
+        """
+        return await self._run(self._search, query)
+
+    def _absolute(self, key: str) -> str:
+        return str(self.root_dir.joinpath(key.lstrip('/')))
+
+    @staticmethod
+    def _row(key: str, st) -> tuple:
+        parent = posixpath.dirname(key) if key != '/' else ''
+        name = posixpath.basename(key)
+        return (key, parent, name, int(stat.S_ISDIR(st.st_mode)), st.st_mode,
+                st.st_size, st.st_mtime, creation_time(st), name.lower(),
+                name.lower()[::-1])
+
+    @staticmethod
+    def _subtree(key: str) -> typing.Tuple[str, tuple]:
+        """ Returns SQL condition matching key and all keys below."""
+        if key == '/':
+            return '1', ()
+        return ('(path = ? OR (path >= ? AND path < ?))',
+                (key, key + '/', key + '0'))
+
+    def _lookup(self, key):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT mode, size, mtime, ctime FROM entries WHERE path = ?',
+                (key,)).fetchone()
+        return IndexStat(*row) if row else None
+
+    def _children(self, key):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT is_dir FROM entries WHERE path = ?', (key,)).fetchone()
+            if not row or not row[0]:
+                return None
+            rows = self._db.execute(
+                'SELECT path, mode, size, mtime, ctime FROM entries '
+                'WHERE parent = ?', (key,)).fetchall()
+        return [(posixpath.basename(r[0]), IndexStat(*r[1:])) for r in rows]
+
+    #: query fields -> SQL expressions, collection size is 0 for resources
+    _columns = {
+        'name': 'name',
+        'size': 'CASE WHEN is_dir THEN 0 ELSE size END',
+        'mtime': 'mtime',
+        'ctime': 'ctime',
+    }
+
+    def _compile(self, expr: tuple, params: list) -> str:
+        """ Compiles query expression to SQL condition."""
+        op = expr[0]
+        if op in ('and', 'or'):
+            if not expr[1]:
+                return '1' if op == 'and' else '0'
+            parts = [self._compile(e, params) for e in expr[1]]
+            return '(%s)' % (' %s ' % op.upper()).join(parts)
+        if op == 'not':
+            return 'NOT %s' % self._compile(expr[1], params)
+        if op == 'is-collection':
+            return 'is_dir = 1'
+        field, value = expr[1:]
+        if op == 'like':
+            # like is supported for names only
+            return self._like(value, params)
+        params.append(value)
+        return '%s %s ?' % (self._columns[field], COMPARISONS[op])
+
+    @staticmethod
+    def _like(pattern: str, params: list) -> str:
+        """ Compiles case insensitive LIKE on name to GLOB on folded name.
+
+        SQLite uses index for GLOB with bound pattern only when literal
+        prefix range is given explicitly; patterns starting with wildcard
+        and ending with literal are matched against reversed name.
+        """
+        # (GLOB text, literal character or None for wildcard)
+        tokens = []
+        escaped = False
+        for char in pattern.lower():
+            if escaped or char not in '\\%_':
+                tokens.append(('[%s]' % char if char in '*?[' else char,
+                               char))
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            else:
+                tokens.append(('*' if char == '%' else '?', None))
+        column = 'folded'
+        if tokens and tokens[0][1] is None and tokens[-1][1] is not None:
+            column = 'folded_rev'
+            tokens.reverse()
+        prefix = ''
+        for _, literal in tokens:
+            if literal is None:
+                break
+            prefix += literal
+        glob = ''.join(t[0] for t in tokens)
+        if not prefix:
+            params.append(glob)
+            return '%s GLOB ?' % column
+        if ord(prefix[-1]) == sys.maxunicode:
+            params.extend([prefix, glob])
+            return '(%s >= ? AND %s GLOB ?)' % (column, column)
+        params.extend([prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1), glob])
+        return '(%s >= ? AND %s < ? AND %s GLOB ?)' % (column, column, column)
+
+    def _search(self, query: SearchQuery):
+        key = index_key(query.scope)
+        if query.depth == 0:
+            where, params = 'path = ?', [key]
+        elif query.depth == 1:
+            where, params = '(path = ? OR parent = ?)', [key, key]
+        else:
+            where, params = self._subtree(key)
+            params = list(params)
+        if query.where is not None:
+            where += ' AND ' + self._compile(query.where, params)
+        order = ', '.join('%s%s' % (self._columns[field],
+                                    ' DESC' if descending else '')
+                          for field, descending in query.order_by)
+        sql = ('SELECT path, mode, size, mtime, ctime FROM entries '
+               'WHERE %s ORDER BY %s' % (where, order + ', path' if order
+                                         else 'path'))
+        if query.limit is not None:
+            sql += ' LIMIT ?'
+            params.append(query.limit)
+        with self._lock:
+            if not self._db.execute('SELECT 1 FROM entries WHERE path = ?',
+                                    (key,)).fetchone():
+                return None
+            rows = self._db.execute(sql, params).fetchall()
+        return [(r[0], IndexStat(*r[1:])) for r in rows]
+
+    def _delete(self, key):
+        where, params = self._subtree(key)
+        self._db.execute('DELETE FROM entries WHERE %s' % where, params)
+
+    def _sync_dir(self, key) -> typing.List[str]:
+        """ Replaces indexed directory members with current listing.
+
+        :returns: keys of directories that were not indexed before
+        """
+        absolute = self._absolute(key)
+        try:
+            # directory is stat'ed before listing, so changes made meanwhile
+            # are detected by next rescan
+            st = os.stat(absolute)
+            entries = list(os.scandir(absolute))
+        except (FileNotFoundError, NotADirectoryError):
+            with self._lock, self._db:
+                self._delete(key)
+            return []
+        rows = [self._row(key, st)]
+        prefix = key.rstrip('/') + '/'
+        for entry in entries:
+            if is_reserved_name(entry.name):
+                continue
+            try:
+                rows.append(self._row(prefix + entry.name, entry.stat()))
+            except FileNotFoundError:
+                continue
+        with self._lock, self._db:
+            known = dict(self._db.execute(
+                'SELECT path, is_dir FROM entries WHERE parent = ?', (key,)))
+            current = {r[0]: r[3] for r in rows[1:]}
+            for path, is_dir in known.items():
+                # removed, or directory replaced with a file
+                if path not in current or is_dir and not current[path]:
+                    self._delete(path)
+            self._db.executemany(
+                'INSERT OR REPLACE INTO entries '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows)
+        return [r[0] for r in rows[1:] if r[3] and not known.get(r[0])]
+
+    def _scan_tree(self, key):
+        stack = [key]
+        while stack:
+            stack.extend(self._sync_dir(stack.pop()))
+
+    def _rescan(self):
+        with self._lock:
+            dirs = self._db.execute(
+                'SELECT path, mtime FROM entries WHERE is_dir = 1').fetchall()
+        if not dirs:
+            self._scan_tree('/')
+            return
+        for key, mtime in dirs:
+            try:
+                st = os.stat(self._absolute(key))
+            except (FileNotFoundError, NotADirectoryError):
+                # removed from index with parent directory listing
+                continue
+            if stat.S_ISDIR(st.st_mode) and st.st_mtime != mtime:
+                self._scan_tree(key)
+
+    def _refresh(self, key):
+        try:
+            st = os.stat(self._absolute(key))
+        except FileNotFoundError:
+            self._remove(key)
+            return
+        # parent directory row is left as is, so external changes made to it
+        # are still detected by next rescan
+        if not stat.S_ISDIR(st.st_mode):
+            with self._lock, self._db:
+                self._delete(key)
+                self._db.execute(
+                    'INSERT INTO entries '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    self._row(key, st))
+            return
+        with self._lock:
+            row = self._db.execute(
+                'SELECT is_dir FROM entries WHERE path = ?', (key,)).fetchone()
+        if not row or not row[0]:
+            self._scan_tree(key)
+
+    def _remove(self, key):
+        with self._lock, self._db:
+            self._delete(key)
+
+    def _move(self, source, destination):
+        where, params = self._subtree(source)
+        name = posixpath.basename(destination)
+        offset = len(source) + 1
+        with self._lock, self._db:
+            self._delete(destination)
+            self._db.execute(
+                'UPDATE entries SET path = ? || substr(path, ?), '
+                'parent = CASE WHEN path = ? THEN ? '
+                'ELSE ? || substr(parent, ?) END, '
+                'name = CASE WHEN path = ? THEN ? ELSE name END, '
+                'folded = CASE WHEN path = ? THEN ? ELSE folded END, '
+                'folded_rev = CASE WHEN path = ? THEN ? ELSE folded_rev END '
+                'WHERE %s' % where,
+                (destination, offset, source, posixpath.dirname(destination),
+                 destination, offset, source, name, source, name.lower(),
+                 source, name.lower()[::-1]) + params)
@@ -0,0 +1,120 @@
+# coding: utf-8
+"""
+Live properties of WebDAV resources.
+
+Each property is computed by its own provider, so PROPFIND computes only
+requested properties. Resource classes share ``LIVE_PROPERTIES`` registry
+unless they define their own (``copy()`` of parent registry), applications
+may register extra properties on a resource class registry::
+
+    FileSystemResource.live_properties.register(
+        'getcontenttype', lambda r: mimetypes.guess_type(r.name)[0] or '')
+
+Serialized properties are cached by resource version, so providers should
+depend on backend metadata only.
+"""
+import time
+import typing
+from collections import OrderedDict
+from email.utils import formatdate
+from functools import lru_cache
+
+#: computes property value for populated resource
+Provider = typing.Callable[['AbstractResource'], typing.Any]
+
+
+@lru_cache(maxsize=4096)
+def http_date(seconds: int) -> str:
+    """ Formats epoch seconds as RFC 1123 date (``getlastmodified``)."""
+    return formatdate(seconds, usegmt=True)
+
+
+@lru_cache(maxsize=4096)
+def iso_date(seconds: int) -> str:
+    """ Formats epoch seconds as RFC 3339 UTC date (``creationdate``)."""
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+def creation_time(st) -> float:
+    """ Returns ``creationdate`` of stat result: birth time where platform
+    reports it, modification time otherwise. ``st_ctime`` is not used, it
+    changes with metadata updates like checksum xattrs."""
+    return getattr(st, 'st_birthtime', None) or st.st_mtime
+
+
+class LiveProperties:
+    """ Ordered registry of live property providers."""
+
+    def __init__(self):
+        # name -> (provider, returned for allprop)
+        self._providers = OrderedDict()
+
+    def __contains__(self, name: str):
+        return name in self._providers
+
+    def __iter__(self):
+        return iter(self._providers)
+
+    def register(self, name: str, provider: Provider, *,
+                 allprop: bool=True):
+        """ Adds property provider, replacing existing one in place.
+
+        :param name: DAV: property local name, or Clark notation name
+        :param allprop: return property for ``allprop`` requests, expensive
+            properties are returned only when requested by name or in
+            ``include``
+        """
+        self._providers[name] = (provider, allprop)
+
+    def unregister(self, name: str):
+        self._providers.pop(name, None)
+
+    def provider(self, name: str, *, allprop: bool=True):
+        """ Decorator registering property provider."""
+        def decorator(func: Provider) -> Provider:
+            self.register(name, func, allprop=allprop)
+            return func
+        return decorator
+
+    def copy(self) -> 'LiveProperties':
+        """ Returns registry with same providers for a resource subclass."""
+        registry = LiveProperties()
+        registry._providers.update(self._providers)
+        return registry
+
+    def compute(self, resource: 'AbstractResource',
+                props: typing.Iterable[str]=(),
+                include: typing.Iterable[str]=()) -> OrderedDict:
+        """ Computes properties in registration order.
+
+        :param props: requested names, ``allprop`` properties if empty;
+            unknown names are skipped
+        :param include: names added to ``allprop`` properties
+        :returns: property values, providers return None for properties
+            currently unavailable
+        """
+        if props:
+            wanted = set(props)
+            selected = [(n, p) for n, (p, _) in self._providers.items()
+                        if n in wanted]
+        else:
+            include = set(include)
+            selected = [(n, p) for n, (p, a) in self._providers.items()
+                        if a or n in include]
+        values = OrderedDict()
+        for name, provider in selected:
+            value = provider(resource)
+            if value is not None:
+                values[name] = value
+        return values
+
+
+LIVE_PROPERTIES = LiveProperties()
+LIVE_PROPERTIES.register('getcontenttype', lambda r: '')
+LIVE_PROPERTIES.register(
+    'getlastmodified', lambda r: http_date(int(r.mtime.timestamp())))
+LIVE_PROPERTIES.register('getcontentlength', lambda r: r.size)
+LIVE_PROPERTIES.register('getetag', lambda r: '')
+LIVE_PROPERTIES.register(
+    'creationdate', lambda r: iso_date(int(r.ctime.timestamp())))
+LIVE_PROPERTIES.register('displayname', lambda r: r.name)
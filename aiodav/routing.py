@@ -0,0 +1,132 @@
+# coding: utf-8
+"""
+Mount dispatching.
+
+All WebDAV mounts are served by a single router resource which finds the
+mount by longest matching path prefix in a trie of path segments, so
+routing cost depends on path depth rather than on number of mounts, and
+mounts may be added or removed while application is running.
+"""
+import asyncio
+import typing
+from urllib.parse import unquote
+
+from aiohttp.web import hdrs
+from aiohttp.web_urldispatcher import (AbstractResource, ResourceRoute,
+                                       UrlMappingMatchInfo)
+
+from aiodav.views import DavResourceRoute
+
+
+class _Node:
+    __slots__ = ('children', 'route')
+
+    def __init__(self):
+        self.children = {}
+        self.route = None
+
+
+class MountDispatcher(AbstractResource):
+    """ Router resource matching ``/<prefix>`` and ``/<prefix>/<relative>``
+    paths to routes of WebDAV mounts.
+
+    Matched ``relative`` path is passed to handler in match info, like it is
+    done by ``/<prefix>{relative:.*}`` resource.
+    """
+
+    def __init__(self, *, name: str=None):
+        super().__init__(name=name)
+        self._root = _Node()
+        self._routes = {}
+
+    @staticmethod
+    def _segments(prefix: str) -> typing.List[str]:
+        prefix = prefix.strip('/')
+        return prefix.split('/') if prefix else []
+
+    def add_mount(self, prefix: str, handler) -> ResourceRoute:
+        """ Routes requests to mount prefix to handler.
+
+        :raises: ValueError if prefix is already mounted
+        """
+        prefix = prefix.strip('/')
+        if prefix in self._routes:
+            raise ValueError("Prefix %r is already mounted" % prefix)
+        node = self._root
+        for segment in self._segments(prefix):
+            node = node.children.setdefault(segment, _Node())
+        # all methods are dispatched by ResourceView
+        node.route = DavResourceRoute(hdrs.METH_ANY, handler, self)
+        self._routes[prefix] = node.route
+        return node.route
+
+    def remove_mount(self, prefix: str) -> ResourceRoute:
+        """
+        :raises: KeyError if prefix is not mounted
+        """
+        prefix = prefix.strip('/')
+        route = self._routes.pop(prefix)
+        path = [self._root]
+        segments = self._segments(prefix)
+        for segment in segments:
+            path.append(path[-1].children[segment])
+        path[-1].route = None
+        # prune branches left without mounts
+        for parent, segment in zip(reversed(path[:-1]), reversed(segments)):
+            node = parent.children[segment]
+            if node.route is not None or node.children:
+                break
+            del parent.children[segment]
+        return route
+
+    def match(self, path: str) -> typing.Optional[
+            typing.Tuple[ResourceRoute, str]]:
+        """ Finds mount with longest prefix of raw request path.
+
+        :returns: mount route and unquoted path relative to mount
+        """
+        if not path.startswith('/'):
+            return None
+        node = self._root
+        found = node.route, 1
+        offset = 1
+        while node.children:
+            end = path.find('/', offset)
+            segment = path[offset:] if end < 0 else path[offset:end]
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if node.route is not None:
+                found = node.route, (len(path) if end < 0 else end)
+            if end < 0:
+                break
+            offset = end + 1
+        route, end = found
+        if route is None:
+            return None
+        return route, unquote(path[end:])
+
+    @asyncio.coroutine
+    def resolve(self, method, path):
+        found = self.match(path)
+        if found is None:
+            return None, set()
+        route, relative = found
+        return (UrlMappingMatchInfo({'relative': relative}, route),
+                {hdrs.METH_ANY})
+
+    def url(self, *, prefix: str, relative: str='', query=None):
+        url = '/%s/%s' % (prefix.strip('/'), relative.lstrip('/'))
+        return self._append_query(url, query)
+
+    def get_info(self):
+        return {'prefixes': sorted(self._routes)}
+
+    def __len__(self):
+        return len(self._routes)
+
+    def __iter__(self):
+        return iter(self._routes.values())
+
+    def __repr__(self):
+        return '<MountDispatcher %d mounts>' % len(self._routes)
@@ -0,0 +1,146 @@
+# coding: utf-8
+"""
+Priority scheduling of blocking backend calls.
+
+Blocking calls are classified by ``AbstractResource`` method they are made
+from: metadata calls (stat, directory listing, rename) and bulk calls (file
+block reads and writes, copies). Each class has its own FIFO queue; worker
+threads take the next call by weighted fair (stride) scheduling, so metadata
+calls are not queued behind many bulk reads. Bulk calls are also limited to
+``workers - 1`` threads by default, so one thread is always available for
+metadata.
+"""
+import asyncio
+import concurrent.futures
+import threading
+import typing
+from collections import deque
+
+METADATA = 'metadata'
+BULK = 'bulk'
+
+#: AbstractResource coroutine -> I/O class
+OPERATION_CLASSES = {
+    'populate_props': METADATA,
+    'populate_collection': METADATA,
+    'make_collection': METADATA,
+    'move': METADATA,
+    'delete': METADATA,
+    'search': METADATA,
+    'abort_upload': METADATA,
+    'log_upload': METADATA,
+    'upload_log': METADATA,
+    'get_content': BULK,
+    'put_content': BULK,
+    'copy': BULK,
+    'put_range': BULK,
+    'put_upload_part': BULK,
+    'commit_upload': BULK,
+}
+
+
+class IOScheduler:
+    """ Thread pool running blocking calls by weighted priority classes."""
+
+    def __init__(self, workers: int=8, *,
+                 weights: typing.Dict[str, float]=None,
+                 limits: typing.Dict[str, int]=None,
+                 loop: asyncio.AbstractEventLoop=None):
+        """
+        :param workers: number of threads
+        :param weights: share of dispatched calls by class when all classes
+            have queued calls
+        :param limits: max calls of a class running at once
+        """
+        self.workers = workers
+        self.weights = {METADATA: 4.0, BULK: 1.0}
+        self.weights.update(weights or {})
+        self.limits = {METADATA: workers, BULK: max(1, workers - 1)}
+        self.limits.update(limits or {})
+        self.loop = loop
+        self._queues = {c: deque() for c in self.weights}
+        self._running = {c: 0 for c in self.weights}
+        # stride scheduling virtual time per class
+        self._pass = {c: 0.0 for c in self.weights}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._shutdown = False
+
+    def queued(self, io_class: str) -> int:
+        return len(self._queues[io_class])
+
+    def submit(self, io_class: str, func, *args) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("Scheduler is shut down")
+            queue = self._queues[io_class]
+            if not queue and not self._running[io_class]:
+                # idle class doesn't accumulate credit
+                self._pass[io_class] = max(self._pass[io_class],
+                                           self._virtual_time())
+            queue.append((future, func, args))
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, daemon=True,
+                                          name='aiodav-io-%d' % len(
+                                              self._threads))
+                self._threads.append(thread)
+                thread.start()
+            self._cond.notify()
+        return future
+
+    def run(self, operation: str, func, *args) -> asyncio.Future:
+        """ Schedules blocking call made from ``AbstractResource`` method.
+
+        :param operation: ``AbstractResource`` coroutine name
+        """
+        io_class = OPERATION_CLASSES.get(operation, BULK)
+        return asyncio.wrap_future(self.submit(io_class, func, *args),
+                                   loop=self.loop)
+
+    def shutdown(self, wait: bool=True):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _virtual_time(self) -> float:
+        active = [self._pass[c] for c, q in self._queues.items()
+                  if q or self._running[c]]
+        return min(active) if active else 0.0
+
+    def _next(self) -> typing.Optional[str]:
+        ready = [c for c, q in self._queues.items()
+                 if q and self._running[c] < self.limits[c]]
+        if not ready:
+            return None
+        return min(ready, key=lambda c: self._pass[c])
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    io_class = self._next()
+                    if io_class is not None:
+                        break
+                    if self._shutdown:
+                        return
+                    self._cond.wait()
+                future, func, args = self._queues[io_class].popleft()
+                self._pass[io_class] += 1.0 / self.weights[io_class]
+                self._running[io_class] += 1
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        result = func(*args)
+                    except BaseException as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(result)
+            finally:
+                with self._cond:
+                    self._running[io_class] -= 1
+                    # class limit may have blocked other workers
+                    self._cond.notify()
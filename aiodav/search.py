@@ -0,0 +1,351 @@
+# coding: utf-8
+"""
+Backend-neutral search queries.
+
+Queries are parsed from RFC 5323 ``DAV:basicsearch`` requests or from JSON
+search endpoint parameters. Backends either compile ``SearchQuery.where`` to
+their own index query or evaluate it with ``SearchQuery.select``.
+"""
+import calendar
+import functools
+import posixpath
+import re
+import time
+import typing
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse, unquote
+
+from lxml import etree as et
+
+#: searchable DAV properties -> query fields
+FIELDS = {
+    'displayname': 'name',
+    'getcontentlength': 'size',
+    'getlastmodified': 'mtime',
+    'creationdate': 'ctime',
+}
+
+COMPARISONS = {'eq': '=', 'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>='}
+
+#: scope depth for whole subtree
+DEPTH_INFINITY = None
+
+NS = {'D': 'DAV:'}
+
+
+class SearchError(ValueError):
+    """ Invalid or unsupported search query."""
+
+
+def normalize_path(path: str) -> str:
+    return '/' + '/'.join(p for p in path.split('/') if p)
+
+
+def parse_time(value: str) -> float:
+    """ Parses timestamp, RFC 1123 or ISO 8601 UTC date to epoch seconds."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        pass
+    for fmt in ('%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%d'):
+        try:
+            return calendar.timegm(time.strptime(value, fmt))
+        except ValueError:
+            continue
+    raise SearchError("Invalid date: %s" % value)
+
+
+def convert(field: str, value: str):
+    try:
+        if field == 'size':
+            return int(value)
+    except ValueError:
+        raise SearchError("Invalid size: %s" % value)
+    if field in ('mtime', 'ctime'):
+        return parse_time(value)
+    return value
+
+
+@functools.lru_cache(maxsize=256)
+def like_regex(pattern: str) -> typing.Pattern:
+    """ Translates LIKE pattern with ``\\`` escapes to regular expression.
+
+    Case is folded for any script, not only ASCII; backends evaluating
+    ``like`` themselves must use this function for same results.
+    """
+    parts = []
+    escaped = False
+    for char in pattern:
+        if escaped:
+            parts.append(re.escape(char))
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '%':
+            parts.append('.*')
+        elif char == '_':
+            parts.append('.')
+        else:
+            parts.append(re.escape(char))
+    return re.compile(''.join(parts) + r'\Z', re.IGNORECASE | re.DOTALL)
+
+
+def glob_to_like(pattern: str) -> str:
+    """ Translates ``*`` and ``?`` wildcards to LIKE pattern.
+
+    Pattern without wildcards matches names containing it.
+    """
+    like = re.sub(r'([%_\\])', r'\\\1', pattern)
+    if '*' not in pattern and '?' not in pattern:
+        return '%' + like + '%'
+    return like.replace('*', '%').replace('?', '_')
+
+
+class SearchQuery:
+    """ Search query over mount tree.
+
+    ``where`` is an expression tree of tuples: ``('and', [expr, ...])``,
+    ``('or', [expr, ...])``, ``('not', expr)``, ``(op, field, value)`` for
+    ``COMPARISONS`` operators, ``('like', field, pattern)`` and
+    ``('is-collection',)``. Fields are ``FIELDS`` values; ``like`` is case
+    insensitive.
+    """
+
+    def __init__(self, scope: str='/', *, depth: int=DEPTH_INFINITY,
+                 where: tuple=None,
+                 order_by: typing.Sequence[typing.Tuple[str, bool]]=(),
+                 limit: int=None, props: typing.Sequence[str]=()):
+        """
+        :param scope: searched path relative to mount root
+        :param depth: scope depth, 0, 1 or DEPTH_INFINITY
+        :param order_by: (field, descending) pairs
+        :param props: selected properties, all properties if empty
+        """
+        self.scope = normalize_path(scope)
+        self.depth = depth
+        self.where = where
+        self.order_by = list(order_by)
+        self.limit = limit
+        self.props = list(props)
+
+    def match(self, values: dict, expr: tuple=None) -> bool:
+        """ Evaluates expression for resource field values.
+
+        :param values: field values and ``is_collection`` flag
+        """
+        if expr is None:
+            expr = self.where
+            if expr is None:
+                return True
+        op = expr[0]
+        if op == 'and':
+            return all(self.match(values, e) for e in expr[1])
+        if op == 'or':
+            return any(self.match(values, e) for e in expr[1])
+        if op == 'not':
+            return not self.match(values, expr[1])
+        if op == 'is-collection':
+            return bool(values['is_collection'])
+        field, value = expr[1:]
+        if op == 'like':
+            return bool(like_regex(value).match(values[field]))
+        current = values[field]
+        return {
+            'eq': current == value,
+            'lt': current < value,
+            'lte': current <= value,
+            'gt': current > value,
+            'gte': current >= value,
+        }[op]
+
+    def select(self, candidates: typing.Iterable[typing.Tuple[typing.Any,
+                                                               dict]]) -> list:
+        """ Filters, orders and limits (item, field values) pairs."""
+        matched = [c for c in candidates if self.match(c[1])]
+        for field, descending in reversed(self.order_by):
+            matched.sort(key=lambda c: c[1][field], reverse=descending)
+        items = [item for item, values in matched]
+        if self.limit is not None:
+            items = items[:self.limit]
+        return items
+
+
+def resource_values(resource) -> dict:
+    """ Returns query field values for populated resource."""
+    return {
+        'name': resource.name,
+        'size': resource.size,
+        'mtime': resource.mtime.timestamp(),
+        'ctime': resource.ctime.timestamp(),
+        'is_collection': resource.is_collection,
+    }
+
+
+def _dav_name(element) -> str:
+    if not isinstance(element.tag, str):
+        return ''
+    qname = et.QName(element)
+    if qname.namespace != 'DAV:':
+        raise SearchError("Unsupported element %s" % element.tag)
+    return qname.localname
+
+
+def _prop_field(element) -> str:
+    props = element.xpath('D:prop/*', namespaces=NS)
+    if len(props) != 1:
+        raise SearchError("Single property expected")
+    name = _dav_name(props[0])
+    if name not in FIELDS:
+        raise SearchError("Property %s is not searchable" % name)
+    return FIELDS[name]
+
+
+def parse_where(element) -> tuple:
+    op = _dav_name(element)
+    children = [c for c in element if isinstance(c.tag, str)]
+    if op in ('and', 'or'):
+        return op, [parse_where(c) for c in children]
+    if op == 'not':
+        if len(children) != 1:
+            raise SearchError("Single operand expected for not")
+        return op, parse_where(children[0])
+    if op == 'is-collection':
+        return op,
+    if op in COMPARISONS or op == 'like':
+        field = _prop_field(element)
+        literal = element.find('{DAV:}literal')
+        if literal is None:
+            raise SearchError("Literal expected for %s" % op)
+        value = literal.text or ''
+        if op == 'like':
+            if field != 'name':
+                raise SearchError("like is supported for displayname only")
+            return op, field, value
+        return op, field, convert(field, value)
+    raise SearchError("Unsupported operator %s" % op)
+
+
+def href_path(href: str, prefix: str, base: str) -> str:
+    """ Returns path relative to mount root for scope href.
+
+    :param base: request path relative to mount root, for relative hrefs
+    """
+    path = unquote(urlparse(href).path)
+    if not path.startswith('/'):
+        return normalize_path(posixpath.join(base, path))
+    parts = [p for p in path.split('/') if p]
+    if parts[:1] == [prefix.strip('/')]:
+        parts = parts[1:]
+    return normalize_path('/'.join(parts))
+
+
+def parse_searchrequest(text: bytes, prefix: str, base: str='/') -> SearchQuery:
+    """ Parses RFC 5323 basicsearch request.
+
+    :raises: SearchError, lxml.etree.XMLSyntaxError
+    """
+    xml = et.fromstring(text)
+    if xml.tag != '{DAV:}searchrequest':
+        raise SearchError("searchrequest expected")
+    search = xml.find('{DAV:}basicsearch')
+    if search is None:
+        raise SearchError("Only basicsearch grammar is supported")
+
+    props = [p.tag.replace('{DAV:}', '') for p in
+             search.xpath('D:select/D:prop/*', namespaces=NS)]
+
+    scopes = search.xpath('D:from/D:scope', namespaces=NS)
+    if len(scopes) != 1:
+        raise SearchError("Single scope expected")
+    href = scopes[0].findtext('{DAV:}href')
+    if href is None:
+        raise SearchError("Scope href expected")
+    depth = (scopes[0].findtext('{DAV:}depth') or 'infinity').strip().lower()
+    if depth == 'infinity':
+        depth = DEPTH_INFINITY
+    elif depth in ('0', '1'):
+        depth = int(depth)
+    else:
+        raise SearchError("Invalid scope depth")
+
+    where = None
+    conditions = search.xpath('D:where/*', namespaces=NS)
+    if len(conditions) > 1:
+        raise SearchError("Single where condition expected")
+    if conditions:
+        where = parse_where(conditions[0])
+
+    order_by = []
+    for order in search.xpath('D:orderby/D:order', namespaces=NS):
+        descending = order.find('{DAV:}descending') is not None
+        order_by.append((_prop_field(order), descending))
+
+    limit = search.findtext('{DAV:}limit/{DAV:}nresults')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise SearchError("Invalid nresults")
+
+    return SearchQuery(href_path(href, prefix, base), depth=depth,
+                       where=where, order_by=order_by, limit=limit,
+                       props=props)
+
+
+def query_from_params(params: typing.Mapping[str, str],
+                      scope: str) -> SearchQuery:
+    """ Builds query from JSON search endpoint parameters.
+
+    ``search`` is a name pattern with ``*`` and ``?`` wildcards, other
+    parameters are ``min_size``, ``max_size``, ``modified_after``,
+    ``modified_before``, ``type`` (``file`` or ``collection``), ``depth``
+    (``1`` or ``infinity``), ``order`` (field name, ``-`` prefix for
+    descending order) and ``limit``.
+
+    :raises: SearchError
+    """
+    conditions = []
+    name = params.get('search')
+    if name:
+        conditions.append(('like', 'name', glob_to_like(name)))
+    ranges = (('min_size', 'gte', 'size'), ('max_size', 'lte', 'size'),
+              ('modified_after', 'gte', 'mtime'),
+              ('modified_before', 'lte', 'mtime'))
+    for param, op, field in ranges:
+        if params.get(param):
+            conditions.append((op, field, convert(field, params[param])))
+    kind = params.get('type')
+    if kind == 'collection':
+        conditions.append(('is-collection',))
+    elif kind == 'file':
+        conditions.append(('not', ('is-collection',)))
+    elif kind:
+        raise SearchError("Invalid type: %s" % kind)
+
+    depth = params.get('depth', 'infinity')
+    if depth not in ('1', 'infinity'):
+        raise SearchError("Invalid depth: %s" % depth)
+
+    order_by = []
+    order = params.get('order')
+    if order:
+        field = order.lstrip('-')
+        if field not in FIELDS.values():
+            raise SearchError("Invalid order: %s" % order)
+        order_by.append((field, order.startswith('-')))
+
+    limit = params.get('limit')
+    try:
+        limit = int(limit) if limit else None
+    except ValueError:
+        raise SearchError("Invalid limit: %s" % limit)
+
+    return SearchQuery(scope,
+                       depth=1 if depth == '1' else DEPTH_INFINITY,
+                       where=('and', conditions) if conditions else None,
+                       order_by=order_by, limit=limit)
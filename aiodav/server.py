@@ -0,0 +1,390 @@
+# coding: utf-8
+"""
+Multi-process server.
+
+Supervisor process forks workers, each running its own event loop and
+accepting connections from a listening socket bound with ``SO_REUSEPORT``,
+so kernel balances connections between workers. Where ``SO_REUSEPORT`` is
+not available workers share single listening socket inherited from
+supervisor.
+
+Signals handled by supervisor:
+
+* ``SIGTERM``, ``SIGINT`` - graceful shutdown: workers stop accepting
+  connections and finish active requests;
+* ``SIGHUP`` - graceful reload: new workers are started and old ones are
+  stopped after new ones are listening.
+
+Crashed workers are restarted.
+
+Workers share nothing but the listening socket, so more than one worker is
+only correct when mount state (locks, upload sessions, dead properties,
+change feeds, caches) is kept outside of worker processes, see
+``process_local_state``.
+"""
+import asyncio
+import errno
+import importlib
+import logging
+import os
+import selectors
+import signal
+import socket
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from aiodav import conf, resources
+from aiodav.contrib import setup
+
+logger = logging.getLogger('aiodav.server')
+
+REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+
+
+def default_threads(workers: int) -> int:
+    """ Returns executor size per worker.
+
+    Total number of threads equals ``ThreadPoolExecutor`` default for a
+    single process, so adding workers doesn't multiply concurrent disk I/O.
+    """
+    return max(4, (os.cpu_count() or 1) * 5 // workers)
+
+
+def load_app(spec: str) -> web.Application:
+    """ Imports application from ``module:attribute`` spec.
+
+    Attribute is either ``web.Application`` or a callable returning it.
+    """
+    module_name, _, attribute = spec.partition(':')
+    app = getattr(importlib.import_module(module_name), attribute or 'app')
+    if not isinstance(app, web.Application):
+        app = app()
+    return app
+
+
+def mounts_app(mounts: typing.Dict[str, str]) -> web.Application:
+    """ Creates application serving directories by mount prefix."""
+    app = web.Application()
+    setup(app, hack_debugtoolbar=False, mounts={
+        prefix: resources.FileSystemResource(prefix, root_dir=root_dir)
+        for prefix, root_dir in mounts.items()} or None)
+    return app
+
+
+def process_local_state(app: web.Application) -> typing.List[str]:
+    """ Returns mount options keeping state in process memory, i.e.
+    ``['webdav: lock_manager']``; such mounts misbehave when requests of a
+    client are served by different workers."""
+    aiodav_conf = app.get(conf.APP_KEY)
+    if aiodav_conf is None:
+        return []
+    found = []
+    for route in aiodav_conf['dispatcher']:
+        view = route.handler
+        for name, value in sorted(view.kw.items()):
+            if getattr(value, 'process_local', False):
+                found.append('%s: %s' % (view.prefix or '/', name))
+    return found
+
+
+def app_process_local_state(app_factory: typing.Callable[[], web.Application]
+                            ) -> typing.List[str]:
+    """ Creates application in a temporary event loop and returns its
+    ``process_local_state``."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        app = app_factory()
+        try:
+            return process_local_state(app)
+        finally:
+            loop.run_until_complete(app.cleanup())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def bind_socket(host: str, port: int, *, reuse_port: bool=REUSE_PORT,
+                listen: bool=True, backlog: int=128) -> socket.socket:
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    if listen:
+        sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+class Worker:
+    """ Serves application in forked process."""
+
+    #: interval of checking that supervisor is alive, in seconds
+    check_interval = 1.0
+
+    def __init__(self, app_factory: typing.Callable[[], web.Application], *,
+                 host: str, port: int, sock: socket.socket=None,
+                 threads: int=None, backlog: int=128,
+                 shutdown_timeout: float=30.0):
+        """
+        :param app_factory: creates application, called in worker process
+        :param sock: inherited listening socket, per-worker SO_REUSEPORT
+            socket is bound if None
+        :param threads: default executor size, ``ThreadPoolExecutor`` default
+            if None
+        :param shutdown_timeout: time to finish active requests on stop
+        """
+        self.app_factory = app_factory
+        self.host = host
+        self.port = port
+        self.sock = sock
+        self.threads = threads
+        self.backlog = backlog
+        self.shutdown_timeout = shutdown_timeout
+
+    def run(self, ready_fd: int=None):
+        """ Runs worker until SIGTERM or SIGINT.
+
+        :param ready_fd: pipe closed when worker starts accepting connections
+        """
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.set_default_executor(ThreadPoolExecutor(self.threads))
+        app = self.app_factory()
+        handler = app.make_handler()
+        sock = self.sock or bind_socket(self.host, self.port,
+                                        backlog=self.backlog)
+        server = loop.run_until_complete(
+            loop.create_server(handler, sock=sock, backlog=self.backlog))
+        stopped = asyncio.Event(loop=loop)
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stopped.set)
+        parent = os.getppid()
+
+        def check_parent():
+            # supervisor was killed
+            if os.getppid() != parent:
+                stopped.set()
+            else:
+                loop.call_later(self.check_interval, check_parent)
+
+        check_parent()
+        if ready_fd is not None:
+            os.close(ready_fd)
+        try:
+            loop.run_until_complete(stopped.wait())
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.run_until_complete(app.shutdown())
+            loop.run_until_complete(
+                handler.finish_connections(self.shutdown_timeout))
+            loop.run_until_complete(app.cleanup())
+            loop.close()
+
+
+class Supervisor:
+    """ Forks workers and keeps their number constant."""
+
+    #: workers exiting sooner are restarted with a delay
+    min_uptime = 1.0
+    #: max delay before restarting crashed worker, in seconds
+    max_restart_delay = 30.0
+    #: time added to worker shutdown timeout before it is killed
+    kill_delay = 5.0
+
+    def __init__(self, worker: Worker, workers: int=1):
+        """
+        :param workers: number of worker processes; application must not
+            keep state in process memory if more than one, see
+            ``process_local_state``
+        """
+        self.worker = worker
+        self.workers = workers
+        # pid -> (generation, start time)
+        self.children = {}
+        self.generation = 0
+        self.stopping = False
+        self._restart_delay = 0.0
+        self._restart_at = []
+        # pid -> time to send SIGKILL to stopping worker
+        self._kill_at = {}
+        self._signals = []
+        self._sock = None
+
+    def run(self) -> int:
+        """ Runs workers until SIGTERM or SIGINT.
+
+        :returns: exit code
+        """
+        worker = self.worker
+        # holds port resolved for port 0 across reloads; bound without
+        # listening, so connections are not queued on it
+        self._sock = bind_socket(worker.host, worker.port,
+                                 listen=not REUSE_PORT,
+                                 backlog=worker.backlog)
+        worker.port = self._sock.getsockname()[1]
+        if not REUSE_PORT:
+            worker.sock = self._sock
+        logger.info("Listening on %s:%s with %s workers", worker.host,
+                    worker.port, self.workers)
+
+        wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_r, False)
+        os.set_blocking(wakeup_w, False)
+        signal.set_wakeup_fd(wakeup_w)
+        handled = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP,
+                   signal.SIGCHLD)
+        for signum in handled:
+            signal.signal(signum, self._on_signal)
+        selector = selectors.DefaultSelector()
+        selector.register(wakeup_r, selectors.EVENT_READ)
+        try:
+            self._spawn_generation()
+            while self.children or not self.stopping:
+                deadlines = self._restart_at[:1] + list(self._kill_at.values())
+                timeout = None
+                if deadlines:
+                    timeout = max(0.0, min(deadlines) - time.monotonic())
+                if selector.select(timeout):
+                    try:
+                        os.read(wakeup_r, 4096)
+                    except BlockingIOError:
+                        pass
+                self._handle_signals()
+                self._reap()
+                self._restart()
+                self._kill_stale()
+        finally:
+            signal.set_wakeup_fd(-1)
+            for signum in handled:
+                signal.signal(signum, signal.SIG_DFL)
+            selector.close()
+            os.close(wakeup_r)
+            os.close(wakeup_w)
+            self._sock.close()
+        logger.info("Stopped")
+        return 0
+
+    def _on_signal(self, signum, frame):
+        self._signals.append(signum)
+
+    def _handle_signals(self):
+        while self._signals:
+            signum = self._signals.pop(0)
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                if not self.stopping:
+                    logger.info("Shutting down")
+                    self.stopping = True
+                    self._restart_at = []
+                    self._stop(list(self.children))
+            elif signum == signal.SIGHUP and not self.stopping:
+                logger.info("Reloading")
+                self._reload()
+
+    def _reload(self):
+        old = list(self.children)
+        self._restart_at = []
+        self._spawn_generation()
+        self._stop(old)
+
+    def _stop(self, pids: typing.Iterable[int]):
+        deadline = (time.monotonic() + self.worker.shutdown_timeout +
+                    self.kill_delay)
+        for pid in pids:
+            self._kill_at.setdefault(pid, deadline)
+            self._kill(pid, signal.SIGTERM)
+
+    def _kill_stale(self):
+        now = time.monotonic()
+        for pid, deadline in list(self._kill_at.items()):
+            if deadline <= now:
+                logger.warning("Killing worker %s", pid)
+                del self._kill_at[pid]
+                self._kill(pid, signal.SIGKILL)
+
+    @staticmethod
+    def _kill(pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _spawn_generation(self):
+        """ Starts new set of workers and waits until they are listening."""
+        self.generation += 1
+        pipes = [self._spawn() for _ in range(self.workers)]
+        for fd in pipes:
+            # EOF when worker is listening or has exited
+            os.read(fd, 1)
+            os.close(fd)
+        logger.info("Workers are listening")
+
+    def _spawn(self) -> int:
+        """ Forks worker process.
+
+        :returns: readiness pipe read end
+        """
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            code = 0
+            try:
+                os.close(ready_r)
+                signal.set_wakeup_fd(-1)
+                for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+                    signal.signal(signum, signal.SIG_DFL)
+                self.worker.run(ready_fd=ready_w)
+            except BaseException:
+                logger.exception("Worker failed")
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(ready_w)
+        self.children[pid] = (self.generation, time.monotonic())
+        logger.info("Started worker %s", pid)
+        return ready_r
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            except OSError as e:  # pragma: no cover
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            if pid == 0:
+                return
+            self._kill_at.pop(pid, None)
+            generation, started = self.children.pop(pid, (None, None))
+            if generation is None:
+                continue
+            if os.WIFSIGNALED(status):
+                code = -os.WTERMSIG(status)
+            else:
+                code = os.WEXITSTATUS(status)
+            if self.stopping or generation != self.generation:
+                logger.info("Worker %s exited with %s", pid, code)
+                continue
+            logger.error("Worker %s crashed with %s", pid, code)
+            if time.monotonic() - started < self.min_uptime:
+                self._restart_delay = min(
+                    max(self._restart_delay * 2, self.min_uptime),
+                    self.max_restart_delay)
+            else:
+                self._restart_delay = 0.0
+            self._restart_at.append(time.monotonic() + self._restart_delay)
+
+    def _restart(self):
+        now = time.monotonic()
+        while self._restart_at and self._restart_at[0] <= now:
+            self._restart_at.pop(0)
+            os.close(self._spawn())
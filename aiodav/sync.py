@@ -0,0 +1,68 @@
+# coding: utf-8
+"""
+RFC 6578 collection synchronization requests.
+
+``sync-collection`` REPORT returns collection members changed or removed
+since sync token issued by previous report, so reconnecting clients don't
+walk whole tree. Changes are taken from mount ``ChangeJournal``.
+"""
+from collections import namedtuple
+
+from lxml import etree as et
+
+from aiodav.search import DEPTH_INFINITY
+
+NS = {'D': 'DAV:'}
+
+
+class SyncError(ValueError):
+    """ Invalid sync-collection request."""
+
+
+class UnsupportedReport(SyncError):
+    """ REPORT body is not a sync-collection request."""
+
+
+class SyncRequest(namedtuple('SyncRequest', 'token depth limit props')):
+    """ Parsed ``sync-collection`` REPORT body.
+
+    :param token: sync token of previous report, None for initial sync
+    :param depth: 1 or DEPTH_INFINITY (``sync-level``)
+    :param limit: max number of results, None if not limited
+    :param props: requested properties, all properties if empty
+    """
+
+
+def parse_sync_collection(text: bytes) -> SyncRequest:
+    """
+    :raises: SyncError, lxml.etree.XMLSyntaxError
+    """
+    xml = et.fromstring(text)
+    if xml.tag != '{DAV:}sync-collection':
+        raise UnsupportedReport("sync-collection expected")
+    token = (xml.findtext('{DAV:}sync-token') or '').strip() or None
+    level = (xml.findtext('{DAV:}sync-level') or '1').strip().lower()
+    if level == 'infinite':
+        depth = DEPTH_INFINITY
+    elif level == '1':
+        depth = 1
+    else:
+        raise SyncError("Invalid sync-level")
+    limit = xml.findtext('{DAV:}limit/{DAV:}nresults')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise SyncError("Invalid nresults")
+        if limit < 1:
+            raise SyncError("Invalid nresults")
+    props = [p.tag.replace('{DAV:}', '') for p in
+             xml.xpath('D:prop/*', namespaces=NS)]
+    return SyncRequest(token, depth, limit, props)
+
+
+def error_xml(condition: str) -> bytes:
+    """ Serializes ``DAV:error`` body with precondition element."""
+    error = et.Element('{DAV:}error', nsmap={'D': 'DAV:'})
+    et.SubElement(error, '{DAV:}%s' % condition)
+    return et.tostring(error, xml_declaration=True, encoding='utf-8')
@@ -0,0 +1,96 @@
+# coding: utf-8
+import json
+import logging
+import time
+from collections import OrderedDict
+
+access_logger = logging.getLogger('aiodav.access')
+
+
+class _Measure:
+    __slots__ = ('timings', 'phase', 'started')
+
+    def __init__(self, timings: 'RequestTimings', phase: str):
+        self.timings = timings
+        self.phase = phase
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timings.add(self.phase, time.perf_counter() - self.started)
+
+
+class _NullMeasure:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class RequestTimings:
+    """ Accumulates durations of named request processing phases.
+
+    Usage::
+
+        timings = RequestTimings()
+        with timings.measure('propstat'):
+            ...  # build propstat XML
+        # i.e. 'propstat;dur=0.120, total;dur=0.250'
+        response.headers['Server-Timing'] = timings.server_timing()
+    """
+    enabled = True
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = OrderedDict()
+
+    def measure(self, phase: str):
+        """ Returns context manager adding its duration to a phase."""
+        return _Measure(self, phase)
+
+    def add(self, phase: str, duration: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration
+
+    @property
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """ Formats phases as a ``Server-Timing`` header value."""
+        metrics = ['%s;dur=%.3f' % (phase, duration * 1000)
+                   for phase, duration in self.phases.items()]
+        metrics.append('total;dur=%.3f' % (self.total * 1000))
+        return ', '.join(metrics)
+
+    def log(self, request, status: int, mount: str):
+        """ Writes structured access log line with phase durations."""
+        record = OrderedDict([
+            ('method', request.method),
+            ('path', request.path),
+            ('mount', mount),
+            ('status', status),
+            ('duration_ms', round(self.total * 1000, 3)),
+            ('phases', OrderedDict((k, round(v * 1000, 3))
+                                   for k, v in self.phases.items())),
+        ])
+        access_logger.info(json.dumps(record), extra={'timings': record})
+
+
+class NullTimings(RequestTimings):
+    """ Disabled timings, costs nothing to measure."""
+    enabled = False
+    _measure = _NullMeasure()
+
+    def measure(self, phase: str):
+        return self._measure
+
+    def add(self, phase: str, duration: float):
+        pass
+
+
+NULL_TIMINGS = NullTimings()
@@ -0,0 +1,199 @@
+# coding: utf-8
+"""
+Resumable uploads.
+
+Client uploads parts of a file with ``PUT <path>?upload=<id>`` requests
+carrying ``Content-Range`` header, in any order and over several connections
+at once. Parts are written to backend staging storage at their offsets;
+when received ranges cover whole file, staged content replaces resource
+content atomically.
+
+Backends supporting upload journals keep session size and received ranges
+with staged content, so upload started on one server process may be resumed
+on another one or after restart.
+"""
+import bisect
+import re
+import time
+import typing
+
+UPLOAD_ID_RE = re.compile(r'^[A-Za-z0-9_.-]{1,128}$')
+
+CONTENT_RANGE_RE = re.compile(r'^bytes\s+(\d+)-(\d+)/(\d+|\*)$')
+
+STAGING_NAME_RE = re.compile(
+    r'^\..+\.aiodav-upload-[A-Za-z0-9_.-]{1,128}(~log)?$')
+
+
+class UploadError(ValueError):
+    """ Invalid upload request."""
+
+
+def staging_name(name: str, upload_id: str) -> str:
+    """ Returns name of file staging upload next to resource."""
+    return '.%s.aiodav-upload-%s' % (name, upload_id)
+
+
+def journal_name(name: str, upload_id: str) -> str:
+    """ Returns name of upload journal file next to resource."""
+    return staging_name(name, upload_id) + '~log'
+
+
+def is_staging_name(name: str) -> bool:
+    """ Checks whether file stages an upload; such files are hidden from
+    clients and can't be written by them."""
+    return bool(STAGING_NAME_RE.match(name))
+
+
+def journal_record(kind: str, *args: int) -> str:
+    """ Returns upload journal record: ``start``, ``size <total>`` or
+    ``part <start> <end>``, prefixed with current time."""
+    return ' '.join(['%.3f' % time.time(), kind] + [str(a) for a in args])
+
+
+def parse_content_range(value: str) -> typing.Tuple[int, int,
+                                                     typing.Optional[int]]:
+    """ Parses ``Content-Range: bytes first-last/total`` header.
+
+    :returns: first and last byte positions, total length or None if unknown
+    :raises: UploadError
+    """
+    match = CONTENT_RANGE_RE.match(value.strip())
+    if not match:
+        raise UploadError("Invalid Content-Range: %s" % value)
+    first, last = int(match.group(1)), int(match.group(2))
+    total = None if match.group(3) == '*' else int(match.group(3))
+    if last < first or total is not None and last >= total:
+        raise UploadError("Invalid Content-Range: %s" % value)
+    return first, last, total
+
+
+class RangeSet:
+    """ Sorted disjoint half-open byte ranges."""
+
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+
+    def add(self, start: int, end: int):
+        """ Adds [start, end) range, merging it with adjacent ones."""
+        if start >= end:
+            return
+        # first range ending at or after start
+        left = bisect.bisect_left(self._ends, start)
+        # first range starting after end
+        right = bisect.bisect_right(self._starts, end)
+        if left < right:
+            start = min(start, self._starts[left])
+            end = max(end, self._ends[right - 1])
+        self._starts[left:right] = [start]
+        self._ends[left:right] = [end]
+
+    def covers(self, size: int) -> bool:
+        """ Checks that [0, size) is covered by single range."""
+        if size == 0:
+            return True
+        return bool(self._starts) and self._starts[0] == 0 and \
+            self._ends[0] >= size
+
+    @property
+    def received(self) -> int:
+        return sum(e - s for s, e in zip(self._starts, self._ends))
+
+    def __iter__(self) -> typing.Iterator[typing.Tuple[int, int]]:
+        return iter(zip(self._starts, self._ends))
+
+
+class UploadSession:
+    """ Upload of a single file in parts."""
+
+    def __init__(self, upload_id: str, path: str, resource,
+                 size: int=None):
+        """
+        :param path: uploaded path relative to mount root
+        :param resource: uploaded resource, may not exist yet
+        :param size: total file size, None until known
+        """
+        self.upload_id = upload_id
+        self.path = path
+        self.resource = resource
+        self.size = size
+        self.ranges = RangeSet()
+        #: number of parts being written
+        self.pending = 0
+        self.committing = False
+        #: session state is kept in backend upload journal
+        self.journaled = False
+        self.touched = time.time()
+
+    def replay(self, records: typing.Iterable[str]):
+        """ Merges state recorded in upload journal, possibly by other
+        server processes.
+
+        :raises: UploadError if journal total size doesn't match session
+        """
+        for record in records:
+            fields = record.split()
+            if len(fields) < 2:
+                continue
+            self.touched = max(self.touched, float(fields[0]))
+            if fields[1] == 'size':
+                size = int(fields[2])
+                if self.size is not None and self.size != size:
+                    raise UploadError("Upload size mismatch")
+                self.size = size
+            elif fields[1] == 'part':
+                self.ranges.add(int(fields[2]), int(fields[3]))
+
+    @property
+    def complete(self) -> bool:
+        return self.size is not None and self.ranges.covers(self.size)
+
+    def status(self) -> dict:
+        return {
+            'upload': self.upload_id,
+            'path': self.path,
+            'size': self.size,
+            'received': [[s, e - 1] for s, e in self.ranges],
+            'complete': self.complete,
+        }
+
+
+class UploadManager:
+    """ Upload sessions of a single mount known to this process.
+
+    Sessions not touched for ``expire`` seconds are dropped; their staged
+    content is removed by the view that collected them unless upload journal
+    shows recent parts received by other processes.
+    """
+    #: sessions of backends without upload journals are lost on restart and
+    #: not visible to other processes
+    process_local = False
+
+    def __init__(self, expire: float=24 * 3600):
+        self.expire = expire
+        self._sessions = {}
+
+    def get(self, upload_id: str) -> typing.Optional[UploadSession]:
+        return self._sessions.get(upload_id)
+
+    def create(self, upload_id: str, path: str, resource,
+               size: int=None) -> UploadSession:
+        if not UPLOAD_ID_RE.match(upload_id):
+            raise UploadError("Invalid upload id")
+        session = self._sessions[upload_id] = UploadSession(
+            upload_id, path, resource, size)
+        return session
+
+    def remove(self, session: UploadSession):
+        if self._sessions.get(session.upload_id) is session:
+            del self._sessions[session.upload_id]
+
+    def collect_expired(self) -> typing.List[UploadSession]:
+        """ Removes and returns idle sessions without parts in progress."""
+        deadline = time.time() - self.expire
+        expired = [s for s in self._sessions.values()
+                   if s.touched < deadline and not s.pending]
+        for session in expired:
+            del self._sessions[session.upload_id]
+        return expired
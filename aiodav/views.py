@@ -1,22 +1,80 @@
 # coding: utf-8
 import asyncio
+import functools
+import logging
 import os
+import re
+import time
 import typing
-from urllib.parse import urlparse, unquote
+from urllib.parse import quote, urlparse, unquote
 
 from aiohttp.streams import EmptyStreamReader
 from lxml import etree as et
 
 import aiohttp_jinja2
-from aiohttp import web
+from aiohttp import web, HttpVersion11
 from aiohttp.web import hdrs
 from aiohttp.web_urldispatcher import ResourceRoute
 from io import BytesIO
 
-from aiodav import resources, conf
+from aiodav import resources, conf, events, locks, properties
+from aiodav.archive import ARCHIVE_FORMATS
+from aiodav.cache import PropstatCache
+from aiodav.coalescing import SingleFlight
+from aiodav.listing import StreamedMembers, render_streamed
+from aiodav.propfind import PropfindParser, PropfindRequest, PROPNAME
+from aiodav.quota import Quota
+from aiodav.uploads import (UPLOAD_ID_RE, UploadError, UploadManager,
+                            UploadSession, journal_record, parse_content_range)
 from aiodav.resources import errors
+from aiodav.resources.abc import first_visit
+from aiodav.search import (DEPTH_INFINITY, SearchError, SearchQuery,
+                           parse_searchrequest, query_from_params)
+from aiodav.sync import (SyncError, SyncRequest, UnsupportedReport,
+                         error_xml, parse_sync_collection)
+from aiodav.timing import RequestTimings, NULL_TIMINGS
 
-DAV_METHODS = {"COPY", "MOVE", "MKCOL", "PROPFIND"}
+DAV_METHODS = {"COPY", "MOVE", "MKCOL", "PROPFIND", "PROPPATCH", "LOCK",
+               "UNLOCK", "SEARCH", "REPORT"}
+
+WRITE_METHODS = {"PUT", "DELETE", "MKCOL", "MOVE", "COPY", "PROPPATCH",
+                 "LOCK", "UNLOCK"}
+
+QUOTA_PROPS = {'quota-used-bytes', 'quota-available-bytes'}
+
+LOCK_PROPS = {'lockdiscovery', 'supportedlock'}
+
+#: methods changing dead properties
+DEAD_PROPS_METHODS = {"PROPPATCH", "MOVE", "COPY", "DELETE"}
+
+#: change feed event types of successful write requests
+CHANGE_EVENTS = {
+    "PUT": events.MODIFIED,
+    "DELETE": events.DELETED,
+    "MKCOL": events.CREATED,
+    "MOVE": events.MOVED,
+    "COPY": events.CREATED,
+    "PROPPATCH": events.PROPERTIES,
+}
+
+logger = logging.getLogger('aiodav.views')
+
+LOCK_TOKEN_RE = re.compile(r'<(opaquelocktoken:[^>]+)>')
+
+#: PROPFIND parser shared by mounts without own ``propfind_parser`` option
+PROPFIND_PARSER = PropfindParser()
+
+#: SEARCH, REPORT, PROPPATCH and LOCK bodies limit of mounts without own
+#: ``max_xml_body_size`` option
+MAX_XML_BODY_SIZE = 1024 * 1024
+
+
+class HTTPLocked(web.HTTPClientError):
+    status_code = 423
+
+
+class HTTPInsufficientStorage(web.HTTPServerError):
+    status_code = 507
 
 
 @aiohttp_jinja2.template('root.jinja2')
@@ -27,17 +85,49 @@ async def root_view(request):
     return {'resources': prefixes}
 
 
+def limited_reader(read_some: typing.Optional[typing.Awaitable[bytes]],
+                   limit: int, error: typing.Callable[[], Exception]
+                   ) -> typing.Optional[typing.Awaitable[bytes]]:
+    """ Wraps request body reader, so body longer than limit is rejected
+    before extra bytes are returned.
+
+    :param error: returns exception raised for extra bytes
+    """
+    if read_some is None:
+        return None
+    remaining = limit
+
+    async def read():
+        nonlocal remaining
+        chunk = await read_some()
+        if len(chunk) > remaining:
+            raise error()
+        remaining -= len(chunk)
+        return chunk
+    return read
+
+
+def request_mount(request: web.Request) -> typing.Optional[str]:
+    """ Returns mount prefix handling request, None for non-WebDAV routes."""
+    return getattr(request.match_info.handler, 'prefix', None)
+
+
 class ResourceView(web.View):
     """
     Обрабатывает запросы к WebDAV-ресурсу.
     :type resource: resources.AbstractResource
     :type prefix: str
     :type kw: dict
+    :type timings: aiodav.timing.RequestTimings
     """
 
     resource = None
     prefix = None
     kw = None
+    timings = NULL_TIMINGS
+    #: resulting path of MOVE or COPY, differs from Destination header when
+    #: resource is placed into existing collection
+    target = None
 
     @asyncio.coroutine
     def __iter__(self):
@@ -46,8 +136,80 @@ class ResourceView(web.View):
         method = getattr(self, self.request.method.lower(), None)
         if method is None:
             self._raise_allowed_methods()
-        resp = yield from method()
-        return resp
+        if self.request.method in WRITE_METHODS:
+            method = functools.partial(self._write, method)
+        options = self.kw or {}
+        if not (options.get('server_timing') or options.get('timing_log')):
+            resp = yield from method()
+            return resp
+        self.timings = RequestTimings()
+        status = 500
+        try:
+            resp = yield from method()
+            status = resp.status
+            if not resp.prepared:
+                self.set_server_timing(resp)
+            return resp
+        except web.HTTPException as e:
+            status = e.status
+            # error responses are raised, not returned
+            if not e.prepared:
+                self.set_server_timing(e)
+            raise
+        finally:
+            if options.get('timing_log'):
+                self.timings.log(self.request, status, self.prefix)
+
+    async def _write(self, method):
+        status = None
+        try:
+            response = await method()
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            # PROPFIND started before write completed is not shared with
+            # requests arriving after it
+            cache = self.propstat_cache
+            if cache is not None and self.request.method in DEAD_PROPS_METHODS:
+                cache.invalidate(self.href(self.relative))
+                if self.request.method in ('MOVE', 'COPY') and \
+                        'Destination' in self.request.headers:
+                    cache.invalidate(self.href(self.destination))
+            flights = self.single_flight
+            if flights is not None:
+                flights.invalidate(self.relative)
+                if self.request.method in ('MOVE', 'COPY') and \
+                        'Destination' in self.request.headers:
+                    flights.invalidate(self.destination)
+            # accepted upload parts don't change resource yet
+            if status is not None and 200 <= status < 300 and status != 202:
+                self.publish_change(status)
+
+    def publish_change(self, status: int):
+        """ Notifies change feed subscribers of successful write."""
+        feed = self.change_feed
+        event_type = CHANGE_EVENTS.get(self.request.method)
+        if feed is None or event_type is None:
+            return
+        method = self.request.method
+        if method == 'DELETE' and 'upload' in self.request.GET:
+            # aborted upload session
+            return
+        if method == 'PUT' and status == 201:
+            event_type = events.CREATED
+        if method == 'MOVE':
+            feed.publish(event_type, self.relative, self.target)
+        elif method == 'COPY':
+            feed.publish(event_type, self.target)
+        else:
+            feed.publish(event_type, self.relative)
+
+    def set_server_timing(self, response: web.StreamResponse):
+        if self.kw and self.kw.get('server_timing'):
+            response.headers['Server-Timing'] = self.timings.server_timing()
 
     def _raise_allowed_methods(self):
         allowed_methods = {
@@ -58,6 +220,17 @@ class ResourceView(web.View):
     @classmethod
     def with_resource(cls, resource: resources.AbstractResource,
                       prefix: str, **kwargs) -> 'ResourceView':
+        kwargs.setdefault('lock_manager', locks.MemoryLockManager())
+        kwargs.setdefault('upload_manager', UploadManager())
+        kwargs.setdefault('single_flight', SingleFlight())
+        kwargs.setdefault('propstat_cache', PropstatCache())
+        root_dir = None
+        if isinstance(resource, resources.FileSystemResource):
+            root_dir = str(resource.absolute)
+        if 'change_feed' not in kwargs:
+            kwargs['change_feed'] = events.ChangeFeed(watch_dir=root_dir)
+        if 'property_store' not in kwargs:
+            kwargs['property_store'] = properties.default_store(root_dir)
         attrs = {
             'prefix': prefix,
             'resource': resource,
@@ -71,6 +244,12 @@ class ResourceView(web.View):
     def relative(self):
         return self.request.match_info['relative'].lstrip('/') or '/'
 
+    def href(self, path: str) -> str:
+        """ Returns absolute href of path relative to mount root."""
+        path = '/' + path.lstrip('/')
+        prefix = self.prefix.strip('/')
+        return '/%s%s' % (prefix, path) if prefix else path
+
     @property
     def depth(self):
         return int(self.request.headers.get('Depth', 0))
@@ -84,6 +263,74 @@ class ResourceView(web.View):
             parts = parts[1:]
         return '/'.join(parts)
 
+    @property
+    def lock_manager(self) -> locks.AbstractLockManager:
+        return self.kw['lock_manager']
+
+    @property
+    def property_store(self) -> properties.AbstractPropertyStore:
+        return self.kw['property_store']
+
+    @property
+    def upload_manager(self) -> UploadManager:
+        return self.kw['upload_manager']
+
+    @property
+    def single_flight(self) -> typing.Optional[SingleFlight]:
+        """ Coalescing of identical PROPFIND requests, None if disabled."""
+        return (self.kw or {}).get('single_flight')
+
+    @property
+    def propstat_cache(self) -> typing.Optional[PropstatCache]:
+        """ Cache of serialized PROPFIND responses, None if disabled."""
+        return (self.kw or {}).get('propstat_cache')
+
+    @property
+    def change_feed(self) -> typing.Optional[events.ChangeFeed]:
+        """ Mount changes notifications, None if disabled."""
+        return (self.kw or {}).get('change_feed')
+
+    @property
+    def max_xml_body_size(self) -> int:
+        return (self.kw or {}).get('max_xml_body_size', MAX_XML_BODY_SIZE)
+
+    @property
+    def quota(self) -> typing.Optional[Quota]:
+        """ Mount quota tracker, None if usage is not tracked."""
+        return self.kw.get('quota')
+
+    async def ensure_quota(self) -> typing.Optional[Quota]:
+        quota = self.quota
+        if quota is not None:
+            await quota.ensure(self.resource)
+        return quota
+
+    def check_quota(self, quota: typing.Optional[Quota],
+                    delta: typing.Optional[int]):
+        if quota is not None and not quota.allows(delta):
+            raise HTTPInsufficientStorage(text="Quota exceeded")
+
+    @property
+    def if_tokens(self) -> typing.List[str]:
+        """ Lock tokens submitted in If header."""
+        return LOCK_TOKEN_RE.findall(self.request.headers.get('If', ''))
+
+    @property
+    def timeout(self) -> typing.Optional[int]:
+        """ Requested lock timeout in seconds, None for infinite."""
+        for value in self.request.headers.get('Timeout', '').split(','):
+            value = value.strip()
+            if value.startswith('Second-') and value[7:].isdigit():
+                return int(value[7:])
+        return None
+
+    async def check_locks(self, relative: str, *, descendants: bool=False):
+        try:
+            await self.lock_manager.check(relative, self.if_tokens,
+                                          descendants=descendants)
+        except locks.LockConflict:
+            raise HTTPLocked(text="Resource is locked")
+
     @property
     def range(self) -> typing.Tuple[int, int]:
         byte_range = self.request.headers.get('Range')
@@ -98,7 +345,14 @@ class ResourceView(web.View):
             start = end = 0
         return start, end
 
+    @staticmethod
+    def check_name(path: str):
+        """ Rejects writes to names reserved for aiodav files."""
+        if properties.is_reserved_name(path.rstrip('/').rpartition('/')[2]):
+            raise web.HTTPForbidden(text="Name is reserved")
+
     async def mkcol(self):
+        self.check_name(self.relative)
         try:
             current, resource = await self._instantiate_parent()
         except errors.ResourceDoesNotExist:
@@ -106,7 +360,11 @@ class ResourceView(web.View):
         await resource.populate_props()
         if not resource.is_collection:
             raise web.HTTPBadRequest(text="Collection expected")
+        await self.check_locks(self.relative)
+        quota = await self.ensure_quota()
         await resource.make_collection(current)
+        if quota is not None:
+            quota.make_collection(self.relative)
         return web.HTTPCreated()
 
     async def _instantiate_parent(self):
@@ -115,30 +373,55 @@ class ResourceView(web.View):
         return collection, resource
 
     async def move(self):
+        self.check_name(self.destination)
         resource = await self._instantiate_resource(self.relative)
+        await self.check_locks(self.relative, descendants=True)
+        await self.check_locks(self.destination, descendants=True)
+        quota = await self.ensure_quota()
+        source = resource.path
         try:
             created = await resource.move(self.destination)
         except errors.InvalidResourceType:
             # destination exists and is not a collection
             old = await self._instantiate_resource(self.destination)
             await old.delete()
+            if quota is not None:
+                quota.remove(old.path, old.size)
             await resource.move(self.destination)
             created = False
+        self.target = resource.path
+        if quota is not None:
+            quota.move(source, self.target, resource.size)
+        # locks are not moved with resource
+        await self.lock_manager.remove(self.relative)
+        await self.property_store.move(self.relative, self.target)
         if created:
             return web.HTTPCreated()
         else:
             return web.HTTPNoContent()
 
     async def copy(self):
+        self.check_name(self.destination)
         resource = await self._instantiate_resource(self.relative)
+        await self.check_locks(self.destination, descendants=True)
+        quota = await self.ensure_quota()
+        if quota is not None:
+            size = quota.usage(resource.path)
+            self.check_quota(quota, resource.size if size is None else size)
         try:
-            await resource.copy(self.destination)
+            copied = await resource.copy(self.destination)
             created = True
         except errors.ResourceAlreadyExists:
             old = await self._instantiate_resource(self.destination)
             await old.delete()
-            await resource.copy(self.destination)
+            if quota is not None:
+                quota.remove(old.path, old.size)
+            copied = await resource.copy(self.destination)
             created = False
+        self.target = copied.path
+        if quota is not None:
+            quota.copy(resource.path, self.target, resource.size)
+        await self.property_store.copy(self.relative, self.target)
 
         return web.HTTPCreated() if created else web.HTTPNoContent()
 
@@ -150,9 +433,20 @@ class ResourceView(web.View):
             return web.HTTPNotFound()
 
     async def delete(self):
+        if 'upload' in self.request.GET:
+            session = await self._upload_session()
+            self.upload_manager.remove(session)
+            await session.resource.abort_upload(session.upload_id)
+            return web.HTTPNoContent()
         try:
             resource = await self._instantiate_resource(self.relative)
+            await self.check_locks(self.relative, descendants=True)
+            quota = await self.ensure_quota()
             await resource.delete()
+            if quota is not None:
+                quota.remove(resource.path, resource.size)
+            await self.lock_manager.remove(self.relative)
+            await self.property_store.delete(self.relative)
             return web.HTTPOk()
         except errors.ResourceDoesNotExist:
             return web.HTTPNotFound()
@@ -168,16 +462,32 @@ class ResourceView(web.View):
 
     async def get(self):
         accept = self.request.headers.get('Accept', '')
-        resource = await self._instantiate_resource(self.relative)
+        if 'events' in self.request.GET:
+            return await self.change_events()
+        if 'search' in self.request.GET:
+            return await self.search_json()
+        if 'archive' in self.request.GET:
+            return await self.stream_archive()
+        if 'upload' in self.request.GET:
+            session = await self._upload_session()
+            return web.json_response(session.status())
+        html = ('application/json' not in accept and 'text/html' in accept
+                and not self.request.GET.get('dl'))
+        # html listing reads collection members while streaming
+        try:
+            resource = await self._instantiate_resource(self.relative,
+                                                        collection=not html)
+        except errors.ResourceDoesNotExist:
+            raise web.HTTPNotFound()
         if 'application/json' in accept:
             return self.render_json(resource)
-        elif 'text/html' not in accept or self.request.GET.get('dl'):
+        elif not html:
             if resource.is_collection:
                 raise web.HTTPBadRequest(text="Can't download collection")
             start, end = self.range
             return await self.stream_resource(resource, start=start, end=end)
         else:
-            return self.render_html(resource)
+            return await self.render_html(resource)
 
     def render_json(self, resource):
         data = {'resource': self.dump_resource(resource)}
@@ -186,30 +496,461 @@ class ResourceView(web.View):
                                    for r in resource.collection]
         return web.json_response(data)
 
-    def render_html(self, resource):
-        context = {'resource': resource, 'relative': self.relative}
-        return aiohttp_jinja2.render_template(
-            'resource.jinja2', self.request, context)
+    async def change_events(self) -> web.StreamResponse:
+        """ Streams changes of subtree as server-sent events.
+
+        Stream is closed after ``timeout`` query parameter seconds, limited
+        by ``events_timeout`` mount option, and queued events are sent;
+        clients reconnect with ``Last-Event-ID`` header.
+        """
+        feed = self.change_feed
+        if feed is None:
+            raise web.HTTPNotFound(text="Change feed is disabled")
+        options = self.kw or {}
+        max_timeout = options.get('events_timeout', 300)
+        heartbeat = options.get('events_heartbeat', 15)
+        try:
+            timeout = min(float(self.request.GET.get('timeout', max_timeout)),
+                          max_timeout)
+        except ValueError:
+            raise web.HTTPBadRequest(text="Invalid timeout")
+        # unknown ids get reset event
+        last_id = self.request.headers.get('Last-Event-ID') or None
+        response = web.StreamResponse()
+        response.content_type = 'text/event-stream'
+        response.headers['Cache-Control'] = 'no-cache'
+        if self.request.version >= HttpVersion11:
+            response.enable_chunked_encoding()
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        with feed.subscribe(self.relative, last_id) as subscription:
+            await response.prepare(self.request)
+            response.write(b': subscribed\n\n')
+            while True:
+                remaining = max(0, deadline - loop.time())
+                # handler is cancelled when client disconnects
+                event = await subscription.get(min(remaining, heartbeat))
+                if event is not None:
+                    response.write(event.to_sse(feed.epoch))
+                elif not remaining:
+                    break
+                else:
+                    response.write(b': ping\n\n')
+                await response.drain()
+        await response.write_eof()
+        return response
+
+    async def search_json(self):
+        try:
+            query = query_from_params(self.request.GET, self.relative)
+        except SearchError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        results = await self._search(query)
+        return web.json_response(
+            {'results': [self.dump_resource(r) for r in results]})
+
+    async def _search(self, query: SearchQuery
+                      ) -> typing.List[resources.AbstractResource]:
+        try:
+            return await self.resource.search(query)
+        except errors.NotSupported:
+            raise web.HTTPNotImplemented(text="Search is not supported")
+        except errors.SearchUnavailable:
+            raise web.HTTPServiceUnavailable(
+                text="Search index is not ready", headers={'Retry-After': '5'})
+        except errors.ResourceDoesNotExist:
+            raise web.HTTPNotFound(text="Search scope does not exist")
+
+    @property
+    def paging(self) -> typing.Tuple[int, typing.Optional[int]]:
+        """ Listing page number and size from ``page`` and ``per_page``
+        query parameters; page size defaults to ``html_page_size`` mount
+        option, None for unpaged listing."""
+        try:
+            page = max(1, int(self.request.GET.get('page', 1)))
+            per_page = self.request.GET.get(
+                'per_page', (self.kw or {}).get('html_page_size'))
+            per_page = int(per_page) if per_page else None
+        except ValueError:
+            raise web.HTTPBadRequest(text="Invalid page")
+        if per_page is not None and per_page < 1:
+            raise web.HTTPBadRequest(text="Invalid page size")
+        return page, per_page
+
+    async def render_html(self, resource):
+        page, per_page = self.paging
+        batches = None
+        if resource.is_collection:
+            offset = (page - 1) * per_page if per_page else 0
+            batches = resource.iter_collection(offset=offset, limit=per_page)
+        members = StreamedMembers(batches)
+        try:
+            await members.fill()
+        except errors.ResourceDoesNotExist:
+            raise web.HTTPNotFound()
+        context = {'resource': resource, 'relative': self.relative,
+                   'page': page, 'per_page': per_page}
+        return await render_streamed(self.request, 'resource.jinja2',
+                                     context, members)
 
     async def put(self):
+        self.check_name(self.relative)
         editable_resource = self.resource / self.relative
         try:
             await editable_resource.populate_props()
             is_collection = editable_resource.is_collection
+            is_new = False
         except errors.ResourceDoesNotExist:
             is_collection = False
+            is_new = True
         if is_collection:
             raise web.HTTPMethodNotAllowed(
                 'PUT', ', '.join(DAV_METHODS), text="Can't PUT to collection")
-        if isinstance(self.request.content, EmptyStreamReader):
-            reader = None
-        else:
-            reader = self.request.content.readany
-        created = await editable_resource.put_content(reader)
+        await self.check_locks(self.relative)
+        old_size = 0 if is_new else editable_resource.size
+        if 'upload' in self.request.GET:
+            return await self.put_upload_part(editable_resource, old_size)
+        content_range = self.request.headers.get('Content-Range')
+        if content_range is not None:
+            return await self.put_range(editable_resource, old_size,
+                                        content_range)
+        quota = await self.ensure_quota()
+        # checked before request body is read
+        length = self.request.content_length
+        self.check_quota(quota, None if length is None else length - old_size)
+        read_some = self.body_reader
+        if quota is not None and quota.available is not None:
+            # chunked body is stopped as soon as it exceeds quota
+            read_some = limited_reader(
+                read_some, quota.available + old_size,
+                lambda: HTTPInsufficientStorage(text="Quota exceeded"))
+        try:
+            with self.timings.measure('transfer'):
+                created = await editable_resource.put_content(read_some)
+        except HTTPInsufficientStorage:
+            if is_new:
+                await editable_resource.delete()
+            else:
+                await self.account_write(quota, editable_resource, old_size)
+            raise
+        await self.account_write(quota, editable_resource, old_size)
         if created:
             return web.HTTPCreated()
         return web.HTTPOk()
 
+    @property
+    def body_reader(self) -> typing.Optional[typing.Awaitable[bytes]]:
+        if isinstance(self.request.content, EmptyStreamReader):
+            return None
+        return self.request.content.readany
+
+    async def account_write(self, quota: typing.Optional[Quota],
+                            resource: resources.AbstractResource,
+                            old_size: int):
+        if quota is not None:
+            await resource.populate_props()
+            quota.add(resource.path, resource.size - old_size)
+
+    def range_reader(self, first: int, last: int
+                     ) -> typing.Optional[typing.Awaitable[bytes]]:
+        """ Returns body reader rejecting bytes past Content-Range end."""
+        return limited_reader(
+            self.body_reader, last - first + 1,
+            lambda: web.HTTPBadRequest(
+                text="Request body is longer than Content-Range"))
+
+    def content_range(self, value: str) -> typing.Tuple[int, int, int]:
+        """ Parses Content-Range and checks it against Content-Length."""
+        try:
+            first, last, total = parse_content_range(value)
+        except UploadError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        length = self.request.content_length
+        if length is not None and length != last - first + 1:
+            raise web.HTTPBadRequest(
+                text="Content-Length does not match Content-Range")
+        return first, last, total
+
+    async def put_range(self, resource: resources.AbstractResource,
+                        old_size: int, content_range: str):
+        """ Writes request body at Content-Range offset."""
+        first, last, total = self.content_range(content_range)
+        quota = await self.ensure_quota()
+        self.check_quota(quota, max(0, last + 1 - old_size))
+        try:
+            with self.timings.measure('transfer'):
+                created, written = await resource.put_range(
+                    self.range_reader(first, last), first)
+        except errors.NotSupported:
+            raise web.HTTPNotImplemented(text="Partial PUT is not supported")
+        except errors.ResourceDoesNotExist:
+            raise web.HTTPConflict(text="Parent does not exist")
+        except web.HTTPException:
+            # bytes within range are written already
+            await self.account_write(quota, resource, old_size)
+            raise
+        await self.account_write(quota, resource, old_size)
+        if written != last - first + 1:
+            raise web.HTTPBadRequest(text="Incomplete request body")
+        return web.HTTPCreated() if created else web.HTTPNoContent()
+
+    async def _upload_session(self) -> UploadSession:
+        """ Returns upload session for request path.
+
+        Session started by another server process is restored from upload
+        journal, parts received by other processes are merged into known
+        session.
+        """
+        manager = self.upload_manager
+        for expired in manager.collect_expired():
+            if expired.journaled and await self._replay_upload(expired) \
+                    and expired.touched >= time.time() - manager.expire:
+                # parts are received by other processes, session is
+                # restored from journal by next request
+                continue
+            await expired.resource.abort_upload(expired.upload_id)
+        upload_id = self.request.GET['upload']
+        session = manager.get(upload_id)
+        if session is not None:
+            if session.path != self.relative:
+                raise web.HTTPConflict(
+                    text="Upload belongs to another resource")
+            if session.journaled and not await self._replay_upload(session):
+                # committed or aborted by another process
+                manager.remove(session)
+                session = None
+        elif UPLOAD_ID_RE.match(upload_id):
+            resource = self.resource / self.relative
+            try:
+                records = await resource.upload_log(upload_id)
+            except (errors.NotSupported, errors.ResourceDoesNotExist,
+                    errors.InvalidResourceType):
+                pass
+            else:
+                session = manager.create(upload_id, self.relative, resource)
+                session.journaled = True
+                self._replay_records(session, records)
+        if session is None:
+            raise web.HTTPNotFound(text="Upload does not exist")
+        return session
+
+    async def _replay_upload(self, session: UploadSession) -> bool:
+        """ Merges upload journal into session.
+
+        :returns: False if journal is removed
+        """
+        try:
+            records = await session.resource.upload_log(session.upload_id)
+        except errors.ResourceDoesNotExist:
+            return False
+        self._replay_records(session, records)
+        return True
+
+    @staticmethod
+    def _replay_records(session: UploadSession, records: typing.List[str]):
+        try:
+            session.replay(records)
+        except UploadError as e:
+            raise web.HTTPConflict(text=str(e))
+
+    async def _start_upload(self, resource: resources.AbstractResource
+                            ) -> UploadSession:
+        """ Creates upload session, journaled if backend supports it."""
+        manager = self.upload_manager
+        try:
+            session = manager.create(self.request.GET['upload'],
+                                     self.relative, resource)
+        except UploadError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        try:
+            await resource.log_upload(session.upload_id,
+                                      journal_record('start'))
+            session.journaled = True
+        except errors.NotSupported:
+            pass
+        except errors.ResourceDoesNotExist:
+            manager.remove(session)
+            raise web.HTTPConflict(text="Parent does not exist")
+        return session
+
+    async def put_upload_part(self, resource: resources.AbstractResource,
+                              old_size: int):
+        """ Stages part of upload session, commits completed upload."""
+        value = self.request.headers.get('Content-Range')
+        if value is None:
+            raise web.HTTPBadRequest(text="Content-Range expected")
+        first, last, total = self.content_range(value)
+        manager = self.upload_manager
+        try:
+            session = await self._upload_session()
+        except web.HTTPNotFound:
+            session = await self._start_upload(resource)
+        if total is not None:
+            if session.size is None:
+                self.check_quota(await self.ensure_quota(), total - old_size)
+                session.size = total
+                if session.journaled:
+                    await resource.log_upload(
+                        session.upload_id, journal_record('size', total))
+            elif session.size != total:
+                raise web.HTTPBadRequest(text="Upload size mismatch")
+        session.pending += 1
+        failed = True
+        try:
+            with self.timings.measure('transfer'):
+                written = await resource.put_upload_part(
+                    session.upload_id, self.range_reader(first, last), first)
+            failed = False
+        except errors.NotSupported:
+            manager.remove(session)
+            raise web.HTTPNotImplemented(text="Uploads are not supported")
+        except errors.ResourceDoesNotExist:
+            manager.remove(session)
+            raise web.HTTPConflict(text="Parent does not exist")
+        finally:
+            session.pending -= 1
+            if failed:
+                # parts of concurrent requests may have completed upload
+                self._commit_later(session, resource, old_size)
+        if manager.get(session.upload_id) is not session:
+            raise web.HTTPNotFound(text="Upload was aborted")
+        session.ranges.add(first, first + written)
+        session.touched = time.time()
+        if session.journaled:
+            if written:
+                await resource.log_upload(
+                    session.upload_id,
+                    journal_record('part', first, first + written))
+            # parts may be received by other processes
+            if not await self._replay_upload(session):
+                manager.remove(session)
+                raise web.HTTPNotFound(text="Upload was aborted")
+        if written != last - first + 1:
+            self._commit_later(session, resource, old_size)
+            raise web.HTTPBadRequest(text="Incomplete request body")
+        if not self._upload_ready(session):
+            return web.json_response(session.status(), status=202)
+        return await self._commit_upload(session, resource, old_size)
+
+    def _upload_ready(self, session: UploadSession) -> bool:
+        """ Checks that all parts are received and none is in progress."""
+        return (session.complete and not session.pending and
+                not session.committing and
+                self.upload_manager.get(session.upload_id) is session)
+
+    async def _commit_upload(self, session: UploadSession,
+                             resource: resources.AbstractResource,
+                             old_size: int) -> web.Response:
+        session.committing = True
+        try:
+            quota = await self.ensure_quota()
+            await self.check_locks(self.relative)
+            try:
+                created = await resource.commit_upload(session.upload_id,
+                                                       session.size)
+            except errors.ResourceDoesNotExist:
+                if not session.journaled:
+                    raise
+                # committed by another server process
+                self.upload_manager.remove(session)
+                return web.HTTPOk()
+        finally:
+            session.committing = False
+        self.upload_manager.remove(session)
+        await self.account_write(quota, resource, old_size)
+        return web.HTTPCreated() if created else web.HTTPOk()
+
+    def _commit_later(self, session: UploadSession,
+                      resource: resources.AbstractResource, old_size: int):
+        """ Commits upload completed by other requests when part of failed
+        request was the last one in progress."""
+        if not self._upload_ready(session):
+            return
+
+        async def commit():
+            try:
+                response = await self._commit_upload(session, resource,
+                                                     old_size)
+            except Exception:
+                logger.exception("Upload %s commit failed", session.upload_id)
+                return
+            self.publish_change(response.status)
+
+        asyncio.ensure_future(commit())
+
+    async def stream_archive(self) -> web.StreamResponse:
+        """ Streams collection as zip or tar archive built on the fly."""
+        archive = self.request.GET.get('archive') or 'zip'
+        if archive not in ARCHIVE_FORMATS:
+            raise web.HTTPBadRequest(text="Unsupported archive format")
+        writer_class, content_type = ARCHIVE_FORMATS[archive]
+        try:
+            resource = await self._instantiate_resource(self.relative,
+                                                        collection=False)
+        except errors.ResourceDoesNotExist:
+            raise web.HTTPNotFound()
+        if not resource.is_collection:
+            raise web.HTTPBadRequest(text="Collection expected")
+        if self.relative == '/':
+            # mount at site root has no name of its own
+            name = self.prefix.strip('/').rpartition('/')[2] or 'archive'
+        else:
+            name = resource.name
+        response = web.StreamResponse()
+        response.content_type = content_type
+        response.headers['Content-Disposition'] = (
+            "attachment; filename*=UTF-8''%s.%s" % (quote(name), archive))
+        if self.request.version >= HttpVersion11:
+            response.enable_chunked_encoding()
+        self.set_server_timing(response)
+        await response.prepare(self.request)
+
+        async def write(data):
+            response.write(data)
+            await response.drain()
+
+        writer = writer_class(write)
+        await writer.add_directory(name, resource.mtime.timestamp())
+        visited = set()
+        first_visit(visited, resource)
+        stack = [(resource, name)]
+        while stack:
+            collection, path = stack.pop()
+            try:
+                await collection.populate_collection()
+            except errors.ResourceDoesNotExist:
+                continue
+            # noinspection PyTypeChecker
+            for member in collection.collection:
+                try:
+                    await member.populate_props()
+                except errors.ResourceDoesNotExist:
+                    continue
+                member_path = '%s/%s' % (path, member.name)
+                mtime = member.mtime.timestamp()
+                if member.is_collection:
+                    await writer.add_directory(member_path, mtime)
+                    if first_visit(visited, member):
+                        stack.append((member, member_path))
+                else:
+                    await writer.add_file(member_path, mtime, member.size,
+                                          self._archive_reader(member))
+        await writer.close()
+        await response.write_eof()
+        return response
+
+    @staticmethod
+    def _archive_reader(resource: resources.AbstractResource):
+        """ Returns content reader of archive member, files removed after
+        listing are archived empty."""
+        async def read(write):
+            try:
+                await resource.get_content(write)
+            except (errors.ResourceDoesNotExist, errors.InvalidResourceType,
+                    FileNotFoundError):
+                pass
+        return read
+
     async def stream_resource(self, resource, start=0, end=0):
         response = web.StreamResponse()
         if end:
@@ -222,10 +963,26 @@ class ResourceView(web.View):
             response.headers['Content-Range'] = 'bytes %s-%s/%s' % (
                 start, start + length-1, start + length)
         response.content_length = length
-        await response.prepare(self.request)
-        # noinspection PyTypeChecker
-        await resource.get_content(response.write, offset=start,
-                                   limit=length)
+        self.set_server_timing(response)
+
+        async def write(data):
+            # headers are sent with first block, so missing file is still
+            # reported as 404
+            if not response.prepared:
+                await response.prepare(self.request)
+            # waits until transport buffer drops below its high-water mark,
+            # so slow clients apply backpressure to resource reads
+            response.write(data)
+            await response.drain()
+
+        try:
+            await resource.get_content(write, offset=start, limit=length)
+        except errors.ResourceDoesNotExist:
+            if response.prepared:
+                raise
+            raise web.HTTPNotFound()
+        if not response.prepared:
+            await response.prepare(self.request)
         await response.write_eof()
         response.set_tcp_nodelay(True)
         return response
@@ -235,13 +992,42 @@ class ResourceView(web.View):
         response = web.Response(text="", content_type='text/xml')
         response.headers['Allow'] = ', '.join(DAV_METHODS)
         response.headers['DAV'] = '1, 2'
+        response.headers['DASL'] = '<DAV:basicsearch>'
         return response
 
+    async def read_body(self, limit: int) -> bytes:
+        """ Reads whole request body.
+
+        :raises: HTTPRequestEntityTooLarge if body is longer than limit
+        """
+        length = self.request.content_length
+        if length is not None and length > limit:
+            raise web.HTTPRequestEntityTooLarge()
+        body = bytearray()
+        while True:
+            chunk = await self.request.content.readany()
+            if not chunk:
+                return bytes(body)
+            body.extend(chunk)
+            if len(body) > limit:
+                raise web.HTTPRequestEntityTooLarge()
+
     async def propfind(self):
-        body = await self.request.read()
-        props = self.parse_propfind(body) if body else []
+        parser = (self.kw or {}).get('propfind_parser') or PROPFIND_PARSER
+        body = await self.read_body(parser.max_body_size)
         try:
-            resource = await self._instantiate_resource(self.relative)
+            propfind = self.parse_propfind(body, parser)
+        except (et.XMLSyntaxError, ValueError):
+            raise web.HTTPBadRequest(text="Invalid propfind")
+        flights = self.single_flight
+        try:
+            # quota usage changes with writes anywhere in mount
+            if flights is None or QUOTA_PROPS.intersection(propfind.names):
+                return await self._propfind(propfind)
+            key = (self.request.path, self.depth, propfind)
+            response = await flights.run(key, self.relative,
+                                         lambda: self._propfind(propfind))
+            return MultiStatusResponse(body=response.body)
         except errors.ResourceDoesNotExist:
             if 'gvfs' in self.request.headers.get('User-Agent', ''):
                 raise web.HTTPNotFound()
@@ -254,37 +1040,479 @@ class ResourceView(web.View):
                                   status=http_resp.status_code,
                                   reason=http_resp.reason)
             return MultiStatusResponse(resp)
-        # noinspection PyArgumentList
-        propstat = self.propstat_xml(resource, *props)
-        response = DavXMLResponse(self.request.path, propstat)
 
-        collection = []
+    async def _propfind(self, propfind: PropfindRequest
+                        ) -> 'MultiStatusResponse':
+        """ Builds multistatus response for PROPFIND.
+
+        :raises: ResourceDoesNotExist
+        """
+        resource = await self._instantiate_resource(self.relative)
+        entries = [(self.request.path, resource)]
         if resource.is_collection and self.depth == 1:
             # noinspection PyTypeChecker
             for res in resource.collection:
-                await res.populate_props()
-                propstat = self.propstat_xml(res)
+                with self.timings.measure('populate'):
+                    await res.populate_props()
                 href = os.path.join(self.request.path, res.path.lstrip('/'))
-                resp = DavXMLResponse(href, propstat)
-                collection.append(resp)
-        return MultiStatusResponse(response, *collection)
+                entries.append((href, res))
+
+        cache = self.propstat_cache
+        # lock and quota properties change without resource changes
+        if cache is None or (LOCK_PROPS | QUOTA_PROPS).intersection(
+                propfind.names):
+            responses = await self.propfind_responses(entries, propfind)
+            with self.timings.measure('serialize'):
+                return MultiStatusResponse(*responses)
+
+        keys = [cache.key(href, res, propfind) for href, res in entries]
+        fragments = [cache.get(key) for key in keys]
+        missing = [i for i, f in enumerate(fragments) if f is None]
+        if missing:
+            responses = await self.propfind_responses(
+                [entries[i] for i in missing], propfind)
+            with self.timings.measure('serialize'):
+                for i, response in zip(missing, responses):
+                    fragments[i] = MultiStatusResponse.dump_response(response)
+                    cache.put(keys[i], fragments[i])
+        with self.timings.measure('serialize'):
+            return MultiStatusResponse(
+                body=MultiStatusResponse.dump_fragments(fragments))
+
+    async def propfind_responses(
+            self, entries: typing.List[
+                typing.Tuple[str, resources.AbstractResource]],
+            propfind: PropfindRequest) -> typing.List['DavXMLResponse']:
+        """ Builds PROPFIND responses for populated resources.
+
+        :param entries: resources with their hrefs
+        """
+        # live properties selection, all for allprop and propname
+        props = propfind.props
+        names = propfind.names
+        timings = self.timings
+        lock_props = LOCK_PROPS.intersection(names)
+        responses = []
+        propstats = []
+        for href, res in entries:
+            with timings.measure('propstat'):
+                # noinspection PyArgumentList
+                propstat = self.propstat_xml(res, *props,
+                                             include=propfind.include)
+                responses.append(DavXMLResponse(href, propstat))
+            if lock_props:
+                await self.lock_props_xml(propstat[0], res, lock_props)
+            propstats.append((res, propstat))
+        quota_props = QUOTA_PROPS.intersection(names)
+        if quota_props:
+            await self.quota_props_xml(propstats, quota_props)
+        dead_props = [p for p in props if p.startswith('{')]
+        if dead_props or not props:
+            with timings.measure('populate'):
+                # single query for whole listing
+                await self.dead_props_xml(propstats, dead_props or None)
+        if propfind.kind == PROPNAME:
+            for _, propstat in propstats:
+                for prop in propstat[0]:
+                    prop.clear()
+        return responses
+
+    async def search(self):
+        body = await self.read_body(self.max_xml_body_size)
+        try:
+            query = parse_searchrequest(body, self.prefix, self.relative)
+        except (et.XMLSyntaxError, SearchError) as e:
+            raise web.HTTPBadRequest(text=str(e))
+        results = await self._search(query)
+        responses = []
+        propstats = []
+        with self.timings.measure('propstat'):
+            for res in results:
+                propstat = self.propstat_xml(res, *query.props)
+                href = self.href(res.path)
+                responses.append(DavXMLResponse(href, propstat))
+                propstats.append((res, propstat))
+        dead_props = [p for p in query.props if p.startswith('{')]
+        if propstats and (dead_props or not query.props):
+            with self.timings.measure('populate'):
+                await self.dead_props_xml(propstats, dead_props or None)
+        with self.timings.measure('serialize'):
+            return MultiStatusResponse(*responses)
+
+    async def report(self):
+        """ RFC 6578 ``sync-collection`` REPORT."""
+        body = await self.read_body(self.max_xml_body_size)
+        try:
+            sync = parse_sync_collection(body)
+        except UnsupportedReport:
+            return self.error_response('supported-report')
+        except (et.XMLSyntaxError, SyncError) as e:
+            raise web.HTTPBadRequest(text=str(e))
+        feed = self.change_feed
+        if feed is None:
+            raise web.HTTPNotImplemented(text="Collection sync is disabled")
+        await feed.watch_journal()
+        journal = feed.journal
+        # changes made while report is built are reported next time
+        seq = journal.seq
+        changes = None
+        if sync.token is not None:
+            try:
+                since = journal.parse_token(sync.token)
+            except events.InvalidSyncToken:
+                return self.error_response('valid-sync-token')
+            changes = journal.changes(since, self.relative, depth=sync.depth)
+        try:
+            collection = await self._instantiate_resource(
+                self.relative, collection=False)
+        except errors.ResourceDoesNotExist:
+            raise web.HTTPNotFound()
+        if not collection.is_collection:
+            return self.error_response('supported-report')
+
+        truncated = False
+        if changes is None:
+            changed = await self._sync_subtree(collection.path, sync.depth)
+            removed = []
+        else:
+            if sync.limit is not None and len(changes) > sync.limit:
+                changes = changes[:sync.limit]
+                seq = changes[-1][0]
+                truncated = True
+            changed, removed = await self._sync_changes(changes, sync)
+
+        ms = et.Element('{DAV:}multistatus', nsmap={'D': 'DAV:'})
+        propstats = []
+        with self.timings.measure('propstat'):
+            for res in changed:
+                propstat = self.propstat_xml(res, *sync.props)
+                href = self.href(res.path)
+                ms.append(MultiStatusResponse.response_xml(
+                    DavXMLResponse(href, propstat)))
+                propstats.append((res, propstat))
+        dead_props = [p for p in sync.props if p.startswith('{')]
+        if propstats and (dead_props or not sync.props):
+            with self.timings.measure('populate'):
+                await self.dead_props_xml(propstats, dead_props or None)
+        for path in removed:
+            ms.append(self.status_response_xml(
+                self.href(path), '404 Not Found'))
+        if truncated:
+            ms.append(self.status_response_xml(
+                self.request.path, '507 Insufficient Storage'))
+        token = et.SubElement(ms, '{DAV:}sync-token', nsmap={'D': 'DAV:'})
+        token.text = journal.token(seq)
+        with self.timings.measure('serialize'):
+            return MultiStatusResponse(body=MultiStatusResponse.dump_xml(ms))
 
-    async def _instantiate_resource(self, relative):
+    async def _sync_subtree(self, path: str, depth: typing.Optional[int]
+                            ) -> typing.List[resources.AbstractResource]:
+        """ Returns populated members of collection, empty if it vanished.
+        """
+        scope = self.resource
+        if path.strip('/'):
+            scope = scope / path.strip('/')
+        members = []
+        visited = set()
+        stack = [scope]
+        try:
+            with self.timings.measure('populate'):
+                await scope.populate_props()
+                first_visit(visited, scope)
+                while stack:
+                    collection = stack.pop()
+                    await collection.populate_collection()
+                    for member in collection.collection:
+                        await member.populate_props()
+                        members.append(member)
+                        if depth == DEPTH_INFINITY and \
+                                member.is_collection and \
+                                first_visit(visited, member):
+                            stack.append(member)
+        except errors.ResourceDoesNotExist:
+            return []
+        return members
+
+    async def _sync_changes(self, changes: typing.List[
+            typing.Tuple[int, str, str]], sync: SyncRequest
+                            ) -> typing.Tuple[
+            typing.List[resources.AbstractResource], typing.List[str]]:
+        """ Splits journal changes into existing resources and removed
+        paths; new collections are reported with their members for
+        infinite sync level."""
+        changed = []
+        removed = []
+        seen = set()
+        for _, path, change in changes:
+            if path in seen:
+                continue
+            seen.add(path)
+            if change == events.DELETED:
+                removed.append(path)
+                continue
+            resource = self.resource / path.lstrip('/')
+            try:
+                with self.timings.measure('populate'):
+                    await resource.populate_props()
+            except errors.ResourceDoesNotExist:
+                removed.append(path)
+                continue
+            changed.append(resource)
+            if sync.depth == DEPTH_INFINITY and resource.is_collection and \
+                    change in (events.CREATED, events.MOVED):
+                for member in await self._sync_subtree(path, DEPTH_INFINITY):
+                    if member.path not in seen:
+                        seen.add(member.path)
+                        changed.append(member)
+        return changed, removed
+
+    @staticmethod
+    def status_response_xml(href: str, status: str) -> et.Element:
+        response = et.Element('{DAV:}response', nsmap={'D': 'DAV:'})
+        et.SubElement(response, '{DAV:}href', nsmap={'D': 'DAV:'}).text = href
+        et.SubElement(response, '{DAV:}status',
+                      nsmap={'D': 'DAV:'}).text = 'HTTP/1.1 %s' % status
+        return response
+
+    @staticmethod
+    def error_response(condition: str) -> web.Response:
+        """ Returns 403 response for failed precondition."""
+        return web.Response(status=403, body=error_xml(condition),
+                            content_type='application/xml')
+
+    async def proppatch(self):
+        body = await self.read_body(self.max_xml_body_size)
+        try:
+            updates = self.parse_proppatch(body)
+        except (et.XMLSyntaxError, ValueError):
+            raise web.HTTPBadRequest(text="Invalid propertyupdate")
+        try:
+            await self._instantiate_resource(self.relative)
+        except errors.ResourceDoesNotExist:
+            raise web.HTTPNotFound()
+        await self.check_locks(self.relative)
+        names = [name for name, value in updates]
+        # live properties are computed by backend
+        protected = [name for name in names if name.startswith('{DAV:}')]
+        if protected:
+            failed = [name for name in names if name not in protected]
+            response = DavXMLResponse(self.request.path,
+                                      self.names_propstat_xml(protected),
+                                      status=403, reason="Forbidden")
+            if failed:
+                response.add_propstat(self.names_propstat_xml(failed),
+                                      status=424, reason="Failed Dependency")
+            return MultiStatusResponse(response)
+        await self.property_store.update(self.relative, updates)
+        return MultiStatusResponse(DavXMLResponse(
+            self.request.path, self.names_propstat_xml(names)))
+
+    async def quota_props_xml(self, propstats: typing.List[
+            typing.Tuple[resources.AbstractResource, et.Element]],
+                              names: typing.Set[str]):
+        """ Adds RFC 4331 properties to propstat elements of collections."""
+        quota = await self.ensure_quota()
+        if quota is None:
+            return
+        nsmap = {'D': 'DAV:'}
+        for resource, propstat in propstats:
+            used = quota.usage(resource.path)
+            if used is None:
+                continue
+            prop = propstat[0]
+            if 'quota-used-bytes' in names:
+                el = et.SubElement(prop, '{DAV:}quota-used-bytes', nsmap=nsmap)
+                el.text = str(used)
+            available = quota.available
+            if 'quota-available-bytes' in names and available is not None:
+                el = et.SubElement(prop, '{DAV:}quota-available-bytes',
+                                   nsmap=nsmap)
+                el.text = str(available)
+
+    async def dead_props_xml(self, propstats: typing.List[
+            typing.Tuple[resources.AbstractResource, et.Element]],
+                             names: typing.Optional[typing.List[str]]):
+        """ Adds stored properties to propstat elements of resources."""
+        paths = [properties.normalize_path(r.path) for r, _ in propstats]
+        values = await self.property_store.get(paths, names)
+        for path, (resource, propstat) in zip(paths, propstats):
+            prop = propstat[0]
+            for value in values[path].values():
+                prop.append(et.fromstring(value))
+
+    @staticmethod
+    def names_propstat_xml(names: typing.Iterable[str]) -> et.Element:
+        ps = et.Element('{DAV:}propstat', nsmap={'D': 'DAV:'})
+        prop = et.SubElement(ps, '{DAV:}prop', nsmap={'D': 'DAV:'})
+        for name in names:
+            et.SubElement(prop, name)
+        return ps
+
+    @staticmethod
+    def parse_proppatch(text) -> typing.List[properties.PropertyUpdate]:
+        """ Returns property updates in document order."""
+        xml = et.fromstring(text)
+        if xml.tag != '{DAV:}propertyupdate':
+            raise ValueError("propertyupdate expected")
+        updates = []
+        for action in xml:
+            if action.tag not in ('{DAV:}set', '{DAV:}remove'):
+                continue
+            for elem in action.xpath('D:prop/*', namespaces={'D': 'DAV:'}):
+                if action.tag == '{DAV:}set':
+                    value = et.tostring(elem, with_tail=False)
+                else:
+                    value = None
+                updates.append((elem.tag, value))
+        if not updates:
+            raise ValueError("empty propertyupdate")
+        return updates
+
+    async def lock(self):
+        body = await self.read_body(self.max_xml_body_size)
+        manager = self.lock_manager
+        relative = self.relative
+        if not body:
+            # lock refresh
+            for token in self.if_tokens:
+                try:
+                    lock = await manager.refresh(relative, token, self.timeout)
+                    return self.lock_response(lock)
+                except locks.LockNotFound:
+                    continue
+            raise web.HTTPPreconditionFailed(text="Lock token required")
+        try:
+            scope, owner = self.parse_lockinfo(body)
+        except (et.XMLSyntaxError, ValueError):
+            raise web.HTTPBadRequest(text="Invalid lockinfo")
+        depth = self.request.headers.get('Depth', locks.DEPTH_INFINITY)
+        depth = depth.lower()
+        if depth not in (locks.DEPTH_ZERO, locks.DEPTH_INFINITY):
+            raise web.HTTPBadRequest(text="Invalid depth")
+        try:
+            await self._instantiate_resource(relative)
+            created = False
+        except errors.ResourceDoesNotExist:
+            created = True
+        try:
+            lock = await manager.lock(relative, depth=depth, scope=scope,
+                                      owner=owner, timeout=self.timeout)
+        except locks.LockConflict:
+            raise HTTPLocked(text="Resource is locked")
+        if created:
+            # locking unmapped url creates empty resource
+            try:
+                await (self.resource / relative).put_content(None)
+            except (errors.ResourceDoesNotExist, errors.InvalidResourceType):
+                await manager.unlock(relative, lock.token)
+                raise web.HTTPConflict(text="Parent collection does not exist")
+        response = self.lock_response(lock, status=201 if created else 200)
+        response.headers['Lock-Token'] = '<%s>' % lock.token
+        return response
+
+    async def unlock(self):
+        token = self.request.headers.get('Lock-Token', '').strip().strip('<>')
+        if not token:
+            raise web.HTTPBadRequest(text="Lock-Token header expected")
+        try:
+            await self.lock_manager.unlock(self.relative, token)
+        except locks.LockNotFound:
+            raise web.HTTPConflict(text="Lock token does not match resource")
+        return web.HTTPNoContent()
+
+    @staticmethod
+    def parse_lockinfo(text) -> typing.Tuple[str, typing.Optional[bytes]]:
+        """ Returns lock scope and serialized owner element."""
+        xml = et.fromstring(text)
+        if xml.tag != '{DAV:}lockinfo':
+            raise ValueError("lockinfo expected")
+        ns = {'D': 'DAV:'}
+        if not xml.xpath('D:locktype/D:write', namespaces=ns):
+            raise ValueError("write lock expected")
+        if xml.xpath('D:lockscope/D:shared', namespaces=ns):
+            scope = locks.SHARED
+        else:
+            scope = locks.EXCLUSIVE
+        owner = xml.find('{DAV:}owner')
+        if owner is not None:
+            owner = et.tostring(owner)
+        return scope, owner
+
+    def lock_response(self, lock: locks.Lock, status=200) -> web.Response:
+        prop = et.Element('{DAV:}prop', nsmap={'D': 'DAV:'})
+        discovery = et.SubElement(prop, '{DAV:}lockdiscovery',
+                                  nsmap={'D': 'DAV:'})
+        discovery.append(self.activelock_xml(lock))
+        return web.Response(status=status, content_type='text/xml',
+                            body=MultiStatusResponse.dump_xml(prop))
+
+    def activelock_xml(self, lock: locks.Lock) -> et.Element:
+        nsmap = {'D': 'DAV:'}
+        active = et.Element('{DAV:}activelock', nsmap=nsmap)
+        locktype = et.SubElement(active, '{DAV:}locktype', nsmap=nsmap)
+        et.SubElement(locktype, '{DAV:}write', nsmap=nsmap)
+        scope = et.SubElement(active, '{DAV:}lockscope', nsmap=nsmap)
+        et.SubElement(scope, '{DAV:}%s' % lock.scope, nsmap=nsmap)
+        et.SubElement(active, '{DAV:}depth', nsmap=nsmap).text = lock.depth
+        if lock.owner:
+            active.append(et.fromstring(lock.owner))
+        timeout = et.SubElement(active, '{DAV:}timeout', nsmap=nsmap)
+        if lock.timeout is None:
+            timeout.text = 'Infinite'
+        else:
+            timeout.text = 'Second-%d' % lock.timeout
+        token = et.SubElement(active, '{DAV:}locktoken', nsmap=nsmap)
+        et.SubElement(token, '{DAV:}href', nsmap=nsmap).text = lock.token
+        root = et.SubElement(active, '{DAV:}lockroot', nsmap=nsmap)
+        et.SubElement(root, '{DAV:}href', nsmap=nsmap).text = self.href(
+            lock.path)
+        return active
+
+    async def lock_props_xml(self, prop: et.Element,
+                             resource: resources.AbstractResource,
+                             names: typing.Set[str]):
+        nsmap = {'D': 'DAV:'}
+        if 'supportedlock' in names:
+            supported = et.SubElement(prop, '{DAV:}supportedlock',
+                                      nsmap=nsmap)
+            for scope in (locks.EXCLUSIVE, locks.SHARED):
+                entry = et.SubElement(supported, '{DAV:}lockentry',
+                                      nsmap=nsmap)
+                el = et.SubElement(entry, '{DAV:}lockscope', nsmap=nsmap)
+                et.SubElement(el, '{DAV:}%s' % scope, nsmap=nsmap)
+                el = et.SubElement(entry, '{DAV:}locktype', nsmap=nsmap)
+                et.SubElement(el, '{DAV:}write', nsmap=nsmap)
+        if 'lockdiscovery' in names:
+            discovery = et.SubElement(prop, '{DAV:}lockdiscovery',
+                                      nsmap=nsmap)
+            for lock in await self.lock_manager.discover(resource.path):
+                discovery.append(self.activelock_xml(lock))
+
+    async def _instantiate_resource(self, relative, *,
+                                    collection: bool=True):
+        """
+        :param collection: populate collection members
+        """
         if relative == '':
             return self.resource
-        resource = self.resource / relative
-        await resource.populate_props()
-        if resource.is_collection:
-            await resource.populate_collection()
+        with self.timings.measure('instantiate'):
+            resource = self.resource / relative
+            await resource.populate_props()
+            if collection and resource.is_collection:
+                await resource.populate_collection()
         return resource
 
     @staticmethod
-    def propstat_xml(
-            resource: resources.AbstractResource, *props) -> et.Element:
+    def propstat_xml(resource: resources.AbstractResource, *props,
+                     include: typing.Iterable[str]=()) -> et.Element:
+        """
+        :param include: live properties added to ``allprop`` response
+        """
         ps = et.Element('{DAV:}propstat', nsmap={'D': 'DAV:'})
         prop = et.SubElement(ps, '{DAV:}prop', nsmap={'D': 'DAV:'})
-        for k, v in resource.propfind(*props).items():
-            el = et.SubElement(prop, '{DAV:}%s' % k, nsmap={'D': 'DAV:'})
+        for k, v in resource.propfind(*props, include=include).items():
+            tag = k if k.startswith('{') else '{DAV:}%s' % k
+            el = et.SubElement(prop, tag, nsmap={'D': 'DAV:'})
             el.text = str(v)
 
         rt = et.SubElement(prop, '{DAV:}resourcetype', nsmap={'D': 'DAV:'})
@@ -294,13 +1522,13 @@ class ResourceView(web.View):
         return ps
 
     @staticmethod
-    def parse_propfind(text) -> typing.List[str]:
-        xml = et.fromstring(text)
-        props = []
-        prop_elems = xml.xpath('D:prop/*', namespaces={'D': 'DAV:'})
-        for elem in prop_elems:
-            props.append(elem.tag.replace('{DAV:}', ''))
-        return props
+    def parse_propfind(body: bytes,
+                       parser: PropfindParser=PROPFIND_PARSER
+                       ) -> PropfindRequest:
+        """
+        :raises: lxml.etree.XMLSyntaxError, ValueError
+        """
+        return parser.parse(body)
 
 
 class DavResourceRoute(ResourceRoute):
@@ -309,17 +1537,27 @@ class DavResourceRoute(ResourceRoute):
 
 class DavXMLResponse:
     def __init__(self, href, propstat, *, status=200, reason="OK"):
+        self.propstat = propstat
+        self.propstats = []
+        self.href = href
+        self.add_propstat(propstat, status=status, reason=reason)
+
+    def add_propstat(self, propstat, *, status=200, reason="OK"):
         s = et.Element('{DAV:}status', nsmap={'D': 'DAV:'})
         s.text = 'HTTP/1.1 %s %s' % (status, reason)
         propstat.append(s)
-        self.propstat = propstat
-        self.href = href
+        self.propstats.append(propstat)
 
 
 class MultiStatusResponse(web.Response):
-    def __init__(self, *responses: typing.Iterable[DavXMLResponse]):
-        ms = self.construct_multistatus_xml(responses)
-        body = self.dump_xml(ms)
+    def __init__(self, *responses: typing.Iterable[DavXMLResponse],
+                 body: bytes=None):
+        """
+        :param body: already serialized multistatus instead of responses
+        """
+        if body is None:
+            ms = self.construct_multistatus_xml(responses)
+            body = self.dump_xml(ms)
         super().__init__(status=207, reason="Multi Status", body=body)
         del self.headers['Content-Length']
 
@@ -336,8 +1574,30 @@ class MultiStatusResponse(web.Response):
             responses: typing.Iterable[DavXMLResponse]) -> et.Element:
         ms = et.Element('{DAV:}multistatus', nsmap={'D': 'DAV:'})
         for xml_response in responses:
-            response = et.SubElement(ms, '{DAV:}response', nsmap={'D': 'DAV:'})
-            href = et.SubElement(response, '{DAV:}href', nsmap={'D': 'DAV:'})
-            href.text = xml_response.href
-            response.append(xml_response.propstat)
+            ms.append(MultiStatusResponse.response_xml(xml_response))
         return ms
+
+    @staticmethod
+    def response_xml(xml_response: DavXMLResponse) -> et.Element:
+        response = et.Element('{DAV:}response', nsmap={'D': 'DAV:'})
+        href = et.SubElement(response, '{DAV:}href', nsmap={'D': 'DAV:'})
+        href.text = xml_response.href
+        for propstat in xml_response.propstats:
+            response.append(propstat)
+        return response
+
+    @staticmethod
+    def dump_response(xml_response: DavXMLResponse) -> bytes:
+        """ Serializes ``<D:response>`` element for ``dump_fragments``."""
+        xml = MultiStatusResponse.response_xml(xml_response)
+        fragment = et.tostring(xml, pretty_print=True)
+        # namespace is declared by multistatus element
+        return fragment.replace(b' xmlns:D="DAV:"', b'', 1)
+
+    @staticmethod
+    def dump_fragments(fragments: typing.Iterable[bytes]) -> bytes:
+        """ Joins serialized responses into multistatus document."""
+        return b''.join([
+            b'<?xml version="1.0" encoding="utf-8" ?>\n',
+            b'<D:multistatus xmlns:D="DAV:">\n'] + list(fragments) + [
+            b'</D:multistatus>\n'])
@@ -0,0 +1,6 @@
+# coding: utf-8
+"""
+aiodav performance benchmarks.
+
+Run ``python -m benchmarks --help`` for usage.
+"""
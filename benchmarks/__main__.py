@@ -0,0 +1,97 @@
+# coding: utf-8
+import argparse
+import sys
+
+from benchmarks import runner, scenarios  # noqa: registers scenarios
+
+
+def int_list(value: str):
+    return [int(v) for v in value.split(',')]
+
+
+def size_list(value: str):
+    units = {'k': 1024, 'm': 1024**2, 'g': 1024**3}
+    result = []
+    for v in value.lower().split(','):
+        multiplier = units.get(v[-1], 1)
+        result.append(int(v.rstrip('kmg')) * multiplier)
+    return result
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='aiodav performance benchmarks')
+    parser.add_argument('-b', '--backend', dest='backends', action='append',
+                        choices=list(runner.BACKENDS),
+                        help='backends to run against (default: all)')
+    parser.add_argument('-s', '--scenario', dest='scenarios',
+                        action='append', choices=list(runner.SCENARIOS),
+                        help='scenarios to run (default: all)')
+    parser.add_argument('--entries', type=int_list,
+                        default=[1000, 10000, 100000],
+                        help='PROPFIND collection sizes (default: %(default)s)')
+    parser.add_argument('--file-sizes', type=size_list,
+                        default=size_list('4k,1m,64m'),
+                        help='GET/PUT file sizes (default: 4k,1m,64m)')
+    parser.add_argument('--tree-depth', type=int, default=3)
+    parser.add_argument('--tree-fanout', type=int, default=4)
+    parser.add_argument('--tree-files', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='measurements per result (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help='concurrent clients (default: %(default)s)')
+    parser.add_argument('--mixed-requests', type=int, default=2000)
+    parser.add_argument('--index-entries', type=int, default=1000000,
+                        help='synthetic tree size for metadata index '
+                             'scenario (default: %(default)s)')
+    parser.add_argument('--workers', type=int_list, default=[1, 2, 4],
+                        help='worker process counts for workers scenario '
+                             '(default: %(default)s)')
+    parser.add_argument('--mounts', type=int, default=1000,
+                        help='number of mounts for routing scenario '
+                             '(default: %(default)s)')
+    parser.add_argument('--quick', action='store_true',
+                        help='small sizes for smoke runs')
+    parser.add_argument('-o', '--output', default='benchmark-results.json',
+                        help='results file (default: %(default)s)')
+    parser.add_argument('--baseline',
+                        help='baseline results file to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative slowdown (default: %(default)s)')
+    options = parser.parse_args(argv)
+    options.backends = options.backends or list(runner.BACKENDS)
+    options.scenarios = options.scenarios or list(runner.SCENARIOS)
+    if options.quick:
+        options.entries = [100, 1000]
+        options.file_sizes = size_list('4k,1m')
+        options.tree_depth = 2
+        options.repeat = 3
+        options.mixed_requests = 200
+        options.index_entries = 10000
+        options.workers = [1, 2]
+    return options
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    results = runner.run(options)
+    runner.dump(results, options.output)
+    print('results written to %s' % options.output)
+    if not options.baseline:
+        return 0
+    report = runner.compare(results, runner.load(options.baseline),
+                            options.tolerance)
+    failed = False
+    for name, base, value, change, regressed in report:
+        failed = failed or regressed
+        if value is None:
+            print('%-45s %12.6g %12s %8s  MISSING' % (name, base, '-', '-'))
+            continue
+        print('%-45s %12.6g %12.6g %+7.1f%%%s' % (
+            name, base, value, change * 100, '  REGRESSION' if regressed else ''))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
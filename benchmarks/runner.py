@@ -0,0 +1,300 @@
+# coding: utf-8
+import asyncio
+import json
+import math
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import typing
+from collections import OrderedDict
+
+import aiohttp
+from aiohttp import web
+
+from aiodav import resources
+from aiodav.contrib import setup
+from aiodav.resources.dummy import DummyResource
+
+MOUNT = 'bench'
+
+#: registered benchmark scenarios, name -> coroutine function
+SCENARIOS = OrderedDict()
+
+
+def scenario(name: str):
+    """ Registers benchmark scenario.
+
+    Scenario is a coroutine function accepting ``Bench`` instance and
+    returning mapping of result names to metric dicts.
+    """
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+
+class Backend:
+    """ Creates fresh mount root for a benchmark scenario."""
+    name = None
+
+    def create(self) -> resources.AbstractResource:
+        raise NotImplementedError()  # pragma: no cover
+
+    def cleanup(self):
+        pass
+
+
+class FileSystemBackend(Backend):
+    name = 'filesystem'
+
+    def __init__(self):
+        self.root_dir = None
+
+    def create(self):
+        self.root_dir = tempfile.mkdtemp(prefix='aiodav-bench-')
+        return resources.FileSystemResource(MOUNT, root_dir=self.root_dir)
+
+    def cleanup(self):
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+
+class DummyBackend(Backend):
+    name = 'dummy'
+
+    def create(self):
+        DummyResource._root = None
+        return DummyResource(MOUNT)
+
+    def cleanup(self):
+        DummyResource._root = None
+
+
+BACKENDS = OrderedDict((b.name, b) for b in (FileSystemBackend, DummyBackend))
+
+
+class BenchmarkServer:
+    """ Runs aiodav application from ``aiodav.contrib.setup`` on a local port.
+    """
+
+    def __init__(self, loop, mounts: typing.Dict[str, resources.AbstractResource],
+                 *, concurrency: int=100, **setup_kwargs):
+        self.loop = loop
+        self.mounts = mounts
+        self.concurrency = concurrency
+        self.setup_kwargs = setup_kwargs
+        self.app = self.handler = self.server = self.session = None
+        self.base_url = None
+
+    async def start(self):
+        self.app = web.Application(loop=self.loop)
+        setup(self.app, mounts=self.mounts, hack_debugtoolbar=False,
+              **self.setup_kwargs)
+        self.handler = self.app.make_handler(access_log=None)
+        self.server = await self.loop.create_server(
+            self.handler, '127.0.0.1', 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.base_url = 'http://127.0.0.1:%s/' % port
+        connector = aiohttp.TCPConnector(loop=self.loop,
+                                         limit=self.concurrency)
+        self.session = aiohttp.ClientSession(loop=self.loop,
+                                             connector=connector)
+
+    async def stop(self):
+        self.session.close()
+        self.server.close()
+        await self.server.wait_closed()
+        await self.app.shutdown()
+        await self.handler.finish_connections(1.0)
+        await self.app.cleanup()
+
+    async def request(self, method: str, path: str, *, headers=None,
+                      data=None) -> typing.Tuple[int, int]:
+        """ Performs request and reads whole response.
+
+        :returns: response status and body length
+        """
+        url = self.base_url + path.lstrip('/')
+        response = await self.session.request(method, url, headers=headers,
+                                              data=data)
+        try:
+            body = await response.read()
+        finally:
+            response.release()
+        if response.status >= 400:
+            raise RuntimeError('%s %s: %s' % (method, path, response.status))
+        return response.status, len(body)
+
+
+class Bench:
+    """ Benchmark scenario context: server, mount root and CLI options."""
+
+    def __init__(self, loop, server: BenchmarkServer,
+                 root: resources.AbstractResource, options):
+        self.loop = loop
+        self.server = server
+        self.root = root
+        self.options = options
+
+    def url(self, *parts: str) -> str:
+        return '/'.join((MOUNT,) + tuple(p.strip('/') for p in parts))
+
+    async def timed(self, coro_func, *args, **kwargs) -> float:
+        started = time.perf_counter()
+        await coro_func(*args, **kwargs)
+        return time.perf_counter() - started
+
+    async def repeat(self, count: int, coro_func, *args,
+                     **kwargs) -> typing.List[float]:
+        return [await self.timed(coro_func, *args, **kwargs)
+                for _ in range(count)]
+
+
+def content_reader(content: bytes, chunk_size: int=1024**2):
+    """ Returns ``read_some`` callable for ``put_content``."""
+    chunks = iter([content[i:i + chunk_size]
+                   for i in range(0, len(content), chunk_size)] + [b''])
+
+    async def read_some():
+        return next(chunks)
+
+    return read_some
+
+
+async def make_files(collection: resources.AbstractResource, count: int, *,
+                     size: int=0, name='file-%06d.bin'):
+    content = b'x' * size
+    for i in range(count):
+        await (collection / (name % i)).put_content(content_reader(content))
+
+
+async def make_tree(collection: resources.AbstractResource, *, depth: int,
+                    fanout: int, files: int, size: int=0):
+    """ Fills collection with tree of ``fanout ** depth`` leaf collections."""
+    await make_files(collection, files, size=size)
+    if not depth:
+        return
+    for i in range(fanout):
+        child = await collection.make_collection('dir-%03d' % i)
+        await make_tree(child, depth=depth - 1, fanout=fanout, files=files,
+                        size=size)
+
+
+def latency(samples: typing.List[float]) -> dict:
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return OrderedDict([
+        ('value', statistics.median(samples)),
+        ('unit', 's'),
+        ('better', 'lower'),
+        ('count', len(samples)),
+        ('min', samples[0]),
+        ('mean', statistics.mean(samples)),
+        ('p95', p95),
+        ('max', samples[-1]),
+    ])
+
+
+def throughput(size: int, samples: typing.List[float]) -> dict:
+    return OrderedDict([
+        ('value', size * len(samples) / sum(samples) / 1024**2),
+        ('unit', 'MiB/s'),
+        ('better', 'higher'),
+        ('count', len(samples)),
+    ])
+
+
+def rate(count: int, elapsed: float) -> dict:
+    return OrderedDict([
+        ('value', count / elapsed),
+        ('unit', 'req/s'),
+        ('better', 'higher'),
+        ('count', count),
+    ])
+
+
+async def run_scenario(loop, name: str, backend_cls, options) -> dict:
+    backend = backend_cls()
+    root = backend.create()
+    server = BenchmarkServer(loop, {MOUNT: root},
+                             concurrency=options.concurrency)
+    await server.start()
+    try:
+        bench = Bench(loop, server, root, options)
+        return await SCENARIOS[name](bench)
+    finally:
+        await server.stop()
+        backend.cleanup()
+
+
+def run(options, *, log=print) -> dict:
+    """ Runs selected scenarios against selected backends.
+
+    :returns: machine-readable results document
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    results = OrderedDict()
+    try:
+        for backend_name in options.backends:
+            for name in options.scenarios:
+                log('running %s on %s' % (name, backend_name))
+                data = loop.run_until_complete(run_scenario(
+                    loop, name, BACKENDS[backend_name], options))
+                for key, metrics in data.items():
+                    results['%s/%s' % (backend_name, key)] = metrics
+    finally:
+        loop.close()
+    return OrderedDict([
+        ('meta', OrderedDict([
+            ('timestamp', time.time()),
+            ('python', sys.version.split()[0]),
+            ('platform', platform.platform()),
+            ('aiohttp', aiohttp.__version__),
+        ])),
+        ('results', results),
+    ])
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> \
+        typing.List[typing.Tuple[str, float, typing.Optional[float],
+                                 typing.Optional[float], bool]]:
+    """ Compares results with baseline document.
+
+    :returns: (name, baseline value, current value, relative change,
+        regression flag) for each baseline result. Results missing from
+        current run have None value and change and are reported as
+        regressions.
+    """
+    report = []
+    current = results['results']
+    for name, base in baseline['results'].items():
+        if name not in current:
+            report.append((name, base['value'], None, None, True))
+            continue
+        value = current[name]['value']
+        if base['value']:
+            change = (value - base['value']) / base['value']
+        elif value:
+            # any change of zero baseline is infinitely large
+            change = math.copysign(math.inf, value)
+        else:
+            change = 0.0
+        if base['better'] == 'lower':
+            regressed = change > tolerance
+        else:
+            regressed = change < -tolerance
+        report.append((name, base['value'], value, change, regressed))
+    return report
+
+
+def dump(results: dict, path: str):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,304 @@
+# coding: utf-8
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict, namedtuple
+
+import aiohttp
+from aiohttp import web
+
+from aiodav import views
+from aiodav.contrib import setup
+from aiodav.resources import FileSystemResource
+from aiodav.resources.index import MetadataIndex
+from benchmarks.runner import (scenario, Bench, BenchmarkServer, MOUNT,
+                               make_files, make_tree, latency, throughput,
+                               rate)
+
+
+@scenario('propfind')
+async def bench_propfind(bench: Bench) -> dict:
+    """ PROPFIND Depth 0 and 1 on collections of different size."""
+    results = OrderedDict()
+    for entries in bench.options.entries:
+        name = 'list-%d' % entries
+        collection = await bench.root.make_collection(name)
+        await make_files(collection, entries)
+        for depth in (0, 1):
+            samples = await bench.repeat(
+                bench.options.repeat, bench.server.request, 'PROPFIND',
+                bench.url(name), headers={'Depth': str(depth)})
+            key = 'propfind_depth%d_%d' % (depth, entries)
+            results[key] = latency(samples)
+    return results
+
+
+@scenario('transfer')
+async def bench_transfer(bench: Bench) -> dict:
+    """ PUT and GET throughput for different file sizes."""
+    results = OrderedDict()
+    for size in bench.options.file_sizes:
+        url = bench.url('file-%d.bin' % size)
+        data = b'x' * size
+        samples = await bench.repeat(bench.options.repeat,
+                                     bench.server.request, 'PUT', url,
+                                     data=data)
+        results['put_%d' % size] = throughput(size, samples)
+        samples = await bench.repeat(bench.options.repeat,
+                                     bench.server.request, 'GET', url)
+        results['get_%d' % size] = throughput(size, samples)
+    return results
+
+
+@scenario('tree')
+async def bench_tree(bench: Bench) -> dict:
+    """ COPY, MOVE and DELETE of collection trees."""
+    source = await bench.root.make_collection('tree')
+    await make_tree(source, depth=bench.options.tree_depth,
+                    fanout=bench.options.tree_fanout,
+                    files=bench.options.tree_files, size=1024)
+    samples = OrderedDict((k, []) for k in ('copy', 'move', 'delete'))
+    for i in range(bench.options.repeat):
+        copy_url = bench.url('copy-%d' % i)
+        move_url = bench.url('moved-%d' % i)
+        samples['copy'].append(await bench.timed(
+            bench.server.request, 'COPY', bench.url('tree'),
+            headers={'Destination': '/' + copy_url, 'Depth': 'infinity'}))
+        samples['move'].append(await bench.timed(
+            bench.server.request, 'MOVE', copy_url,
+            headers={'Destination': '/' + move_url}))
+        samples['delete'].append(await bench.timed(
+            bench.server.request, 'DELETE', move_url))
+    return OrderedDict(('%s_tree' % k, latency(v)) for k, v in samples.items())
+
+
+@scenario('mixed')
+async def bench_mixed(bench: Bench) -> dict:
+    """ Concurrent mix of listings, reads and writes."""
+    listing = await bench.root.make_collection('mixed')
+    await make_files(listing, 100, size=64 * 1024)
+    payload = b'x' * 64 * 1024
+    request = bench.server.request
+    operations = [
+        lambda n: request('PROPFIND', bench.url('mixed'),
+                          headers={'Depth': '1'}),
+        lambda n: request('PROPFIND', bench.url('mixed/file-%06d.bin' % n)),
+        lambda n: request('GET', bench.url('mixed/file-%06d.bin' % n)),
+        lambda n: request('PUT', bench.url('mixed/upload-%06d.bin' % n),
+                          data=payload),
+    ]
+    counter = iter(range(bench.options.mixed_requests))
+    samples = []
+
+    async def worker():
+        for n in counter:
+            operation = operations[n % len(operations)]
+            samples.append(await bench.timed(operation, n % 100))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(bench.options.concurrency)],
+                         loop=bench.loop)
+    elapsed = time.perf_counter() - started
+    return OrderedDict([
+        ('mixed_rate', rate(len(samples), elapsed)),
+        ('mixed_latency', latency(samples)),
+    ])
+
+
+def make_synthetic_tree(root_dir: str, entries: int, *, fanout: int=1000):
+    """ Creates ``entries`` empty files in directories of ``fanout`` files."""
+    for d in range(0, entries, fanout):
+        directory = os.path.join(root_dir, 'dir-%06d' % (d // fanout))
+        os.mkdir(directory)
+        for i in range(min(fanout, entries - d)):
+            open(os.path.join(directory, 'file-%06d' % i), 'wb').close()
+
+
+@scenario('index')
+async def bench_index(bench: Bench) -> dict:
+    """ PROPFIND on a large tree with and without metadata index, and name
+    search answered from the index."""
+    if not isinstance(bench.root, FileSystemResource):
+        return OrderedDict()
+    root_dir = str(bench.root.absolute)
+    make_synthetic_tree(root_dir, bench.options.index_entries)
+    dirs = sorted(os.listdir(root_dir))
+    urls = [''] + [dirs[i * len(dirs) // 10] for i in range(10)]
+    results = OrderedDict()
+
+    async def measure(server, suffix):
+        for name, url in (('root', urls[0]), ('dir', urls[1:])):
+            samples = []
+            for _ in range(bench.options.repeat):
+                for u in ([url] if isinstance(url, str) else url):
+                    samples.append(await bench.timed(
+                        server.request, 'PROPFIND', bench.url(u),
+                        headers={'Depth': '1'}))
+            results['propfind_%s_%s' % (name, suffix)] = latency(samples)
+
+    await measure(bench.server, 'stat')
+
+    fd, filename = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(fd)
+    index = MetadataIndex(filename, root_dir, rescan_interval=3600,
+                          loop=bench.loop)
+    root = FileSystemResource(MOUNT, root_dir=root_dir, index=index)
+    server = BenchmarkServer(bench.loop, {MOUNT: root},
+                             concurrency=bench.options.concurrency)
+    await server.start()
+    try:
+        started = time.perf_counter()
+        index.start()
+        while not index.fresh:
+            await asyncio.sleep(0.01, loop=bench.loop)
+        results['index_initial_scan'] = latency(
+            [time.perf_counter() - started])
+        results['index_rescan'] = latency(
+            await bench.repeat(bench.options.repeat, index.scan))
+        await measure(server, 'index')
+        results['search_name_index'] = latency(await bench.repeat(
+            bench.options.repeat, server.request, 'GET',
+            bench.url('') + '?search=file-000123'))
+        # literal prefix is looked up by index, substring is not
+        results['search_prefix_index'] = latency(await bench.repeat(
+            bench.options.repeat, server.request, 'GET',
+            bench.url('') + '?search=file-000123*'))
+    finally:
+        await server.stop()
+        await index.stop()
+        index.close()
+        os.unlink(filename)
+    return results
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ServeProcess:
+    """ Runs ``python -m aiodav serve`` for a directory on a free port.
+
+    Server is started with ``benchmarks.serve``, which allows several
+    workers for mounts with process-local state.
+    """
+
+    def __init__(self, loop, root_dir: str, workers: int, *,
+                 concurrency: int=100):
+        self.loop = loop
+        self.root_dir = root_dir
+        self.workers = workers
+        self.concurrency = concurrency
+        self.process = self.session = None
+        self.base_url = None
+
+    async def start(self, timeout: float=30.0):
+        port = free_port()
+        self.base_url = 'http://127.0.0.1:%s/' % port
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.serve', 'serve',
+             '--host', '127.0.0.1',
+             '--port', str(port), '--workers', str(self.workers),
+             '--log-level', 'WARNING', '--mount',
+             '%s=%s' % (MOUNT, self.root_dir)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        connector = aiohttp.TCPConnector(loop=self.loop,
+                                         limit=self.concurrency)
+        self.session = aiohttp.ClientSession(loop=self.loop,
+                                             connector=connector)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                await self.request('OPTIONS', MOUNT)
+                return
+            except (aiohttp.ClientError, OSError):
+                if (self.process.poll() is not None or
+                        time.monotonic() > deadline):
+                    self.stop()
+                    raise RuntimeError('aiodav serve failed to start')
+                await asyncio.sleep(0.1, loop=self.loop)
+
+    def stop(self):
+        self.session.close()
+        self.process.terminate()
+        self.process.wait()
+
+    # same request helper as for in-process server
+    request = BenchmarkServer.request
+
+
+@scenario('workers')
+async def bench_workers(bench: Bench) -> dict:
+    """ Concurrent PROPFIND throughput of ``python -m aiodav serve`` with
+    different number of worker processes."""
+    if not isinstance(bench.root, FileSystemResource):
+        return OrderedDict()
+    listing = await bench.root.make_collection('workers')
+    await make_files(listing, 100)
+    results = OrderedDict()
+    for workers in bench.options.workers:
+        server = ServeProcess(bench.loop, str(bench.root.absolute), workers,
+                              concurrency=bench.options.concurrency)
+        await server.start()
+        try:
+            counter = iter(range(bench.options.mixed_requests))
+
+            async def client():
+                for _ in counter:
+                    await server.request('PROPFIND', bench.url('workers'),
+                                         headers={'Depth': '1'})
+
+            started = time.perf_counter()
+            await asyncio.gather(
+                *[client() for _ in range(bench.options.concurrency)],
+                loop=bench.loop)
+            elapsed = time.perf_counter() - started
+        finally:
+            server.stop()
+        results['propfind_rate_workers%d' % workers] = rate(
+            bench.options.mixed_requests, elapsed)
+    return results
+
+
+RoutedRequest = namedtuple('RoutedRequest', 'method raw_path')
+
+
+@scenario('routing')
+async def bench_routing(bench: Bench) -> dict:
+    """ Router resolve time with ``--mounts`` mounts: one regex resource per
+    mount versus prefix trie dispatcher."""
+    if not isinstance(bench.root, FileSystemResource):
+        return OrderedDict()
+    mounts = OrderedDict(
+        ('tenant-%06d' % i, FileSystemResource('tenant-%06d' % i,
+                                               root_dir=bench.root.absolute))
+        for i in range(bench.options.mounts))
+    # per-mount regex resources, as registered before dispatcher
+    regex_app = web.Application(loop=bench.loop)
+    for prefix, resource in mounts.items():
+        dav_resource = regex_app.router.add_resource(
+            '/%s{relative:.*}' % prefix)
+        dav_resource.register_route(views.DavResourceRoute(
+            '*', views.ResourceView.with_resource(resource, prefix),
+            dav_resource))
+    trie_app = web.Application(loop=bench.loop)
+    setup(trie_app, mounts=mounts, hack_debugtoolbar=False)
+
+    prefixes = list(mounts)
+    step = max(1, len(prefixes) // 100)
+    requests = [RoutedRequest('PROPFIND', '/%s/dir/file-%d.txt' % (p, i))
+                for i, p in enumerate(prefixes[::step])]
+    results = OrderedDict()
+    for name, app in (('regex', regex_app), ('trie', trie_app)):
+        async def resolve_all():
+            for request in requests:
+                await app.router.resolve(request)
+        samples = await bench.repeat(bench.options.repeat, resolve_all)
+        results['routing_%s_%d' % (name, len(mounts))] = latency(
+            [s / len(requests) for s in samples])
+    return results
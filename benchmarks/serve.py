@@ -0,0 +1,24 @@
+# coding: utf-8
+"""
+``python -m aiodav serve`` for the ``workers`` scenario.
+
+Mount state kept in process memory is not checked: the scenario sends
+PROPFIND requests only, which don't depend on state shared by workers.
+"""
+import functools
+import logging
+import sys
+
+from aiodav import server
+from aiodav.__main__ import parse_args, serve
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    logging.basicConfig(level=options.log_level)
+    factory = functools.partial(server.mounts_app, dict(options.mounts))
+    return serve(options, factory)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,27 @@
 # coding: utf-8
 
+from .test_admission import *
+from .test_archive import *
+from .test_cache import *
+from .test_checksums import *
+from .test_coalescing import *
+from .test_debugtoolbar import *
 from .test_dummy_backend import *
+from .test_events import *
 from .test_filesystem_backend import *
+from .test_index import *
+from .test_listing import *
+from .test_live_properties import *
+from .test_locks import *
+from .test_metrics import *
+from .test_profiler import *
+from .test_properties import *
+from .test_propfind import *
+from .test_quota import *
+from .test_search import *
+from .test_routing import *
+from .test_scheduler import *
+from .test_server import *
+from .test_sync import *
+from .test_uploads import *
 from .test_webdav import *
\ No newline at end of file
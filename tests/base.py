@@ -6,7 +6,8 @@ from io import BytesIO
 from aiohttp_tests import async_test
 
 from aiodav.resources import errors
-from tests.helpers import format_time, fill_file, read_file
+from tests.helpers import (format_time, format_http_time, fill_file,
+                           read_file, content_reader)
 
 
 # noinspection PyPep8Naming,PyAttributeOutsideInit
@@ -152,7 +153,7 @@ class BackendTestsMixin(object):
         props = file_resource.propfind()
         self.assertDictEqual(props, OrderedDict([
             ('getcontenttype', ''),
-            ('getlastmodified', format_time(file_resource.mtime)),
+            ('getlastmodified', format_http_time(file_resource.mtime)),
             ('getcontentlength', len(b'CONTENT')),
             ('getetag', ''),
             ('creationdate', format_time(file_resource.ctime)),
@@ -167,7 +168,7 @@ class BackendTestsMixin(object):
 
         self.assertDictEqual(props, OrderedDict([
             ('getcontenttype', ''),
-            ('getlastmodified', format_time(file_resource.mtime))
+            ('getlastmodified', format_http_time(file_resource.mtime))
         ]))
 
     async def testPopulateCollection(self):
@@ -385,3 +386,50 @@ class BackendTestsMixin(object):
         relative = self.root / 'dir1/dir2/dir3'
         await self.populate(relative)
         self.assertResourcesEqual(relative, d3)
+
+    async def testOverwriteWithShorterContent(self):
+        file_resource = self.root / 'filename.txt'
+        await fill_file(file_resource, content=b'LONG_CONTENT')
+        await fill_file(self.root / 'filename.txt', content=b'SHORT')
+        content = await read_file(self.root / 'filename.txt')
+        self.assertEqual(content, b'SHORT')
+
+    async def testPutRange(self):
+        file_resource = self.root / 'filename.txt'
+        await fill_file(file_resource, content=b'0123456789')
+        created, written = await (self.root / 'filename.txt').put_range(
+            content_reader(b'ABC'), 8)
+        self.assertFalse(created)
+        self.assertEqual(written, 3)
+        content = await read_file(self.root / 'filename.txt')
+        self.assertEqual(content, b'01234567ABC')
+
+        created, written = await (self.root / 'new.txt').put_range(
+            content_reader(b'ABC'), 0)
+        self.assertTrue(created)
+
+    async def testUploadParts(self):
+        resource = self.root / 'filename.txt'
+        await fill_file(resource, content=b'OLD CONTENT WITH TAIL')
+        parts = [(6, b'GHIJ'), (0, b'ABCDEF'), (10, b'KL')]
+        written = await asyncio.gather(*[
+            resource.put_upload_part('id', content_reader(data), offset)
+            for offset, data in parts])
+        self.assertListEqual(written, [4, 6, 2])
+        # staged content is not visible until commit
+        content = await read_file(self.root / 'filename.txt')
+        self.assertEqual(content, b'OLD CONTENT WITH TAIL')
+
+        created = await (self.root / 'filename.txt').commit_upload('id', 12)
+        self.assertFalse(created)
+        content = await read_file(self.root / 'filename.txt')
+        self.assertEqual(content, b'ABCDEFGHIJKL')
+
+    async def testAbortUpload(self):
+        resource = self.root / 'filename.txt'
+        await resource.put_upload_part('id', content_reader(b'DATA'), 0)
+        await resource.abort_upload('id')
+        created = await resource.commit_upload('id', 0)
+        self.assertTrue(created)
+        content = await read_file(self.root / 'filename.txt')
+        self.assertEqual(content, b'')
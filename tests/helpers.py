@@ -1,9 +1,16 @@
 # coding: utf-8
+import asyncio
+import time
+from email.utils import formatdate
 from io import BytesIO
 
 
 def format_time(t):
-    return t.replace(microsecond=0).isoformat() + 'Z'
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(t.timestamp()))
+
+
+def format_http_time(t):
+    return formatdate(int(t.timestamp()), usegmt=True)
 
 
 async def fill_file(file_resource, content=None):
@@ -21,6 +28,17 @@ async def fill_file(file_resource, content=None):
     return await file_resource.put_content(read_any)
 
 
+def content_reader(content, chunk_size=4):
+    chunks = iter([content[i:i + chunk_size]
+                   for i in range(0, len(content), chunk_size)] + [b''])
+
+    async def read_some():
+        await asyncio.sleep(0)
+        return next(chunks)
+
+    return read_some
+
+
 async def read_file(resource, offset=0, limit=None):
     content = BytesIO()
 
@@ -0,0 +1,120 @@
+# coding: utf-8
+import asyncio
+from unittest import TestCase, mock
+
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav.contrib import setup
+from aiodav.contrib.admission import (AdmissionController, Limiter,
+                                      Overloaded, METADATA, TRANSFER)
+from aiodav.contrib.metrics import Registry
+from aiodav.resources.dummy import DummyResource
+
+
+__all__ = ['AdmissionTestCase', 'AdmissionMiddlewareTestCase']
+
+
+class AdmissionTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.registry = Registry()
+        self.controller = AdmissionController(
+            mount_limits={METADATA: 2, TRANSFER: 1},
+            client_limits={METADATA: 1, TRANSFER: 1},
+            queue_size=1, queue_timeout=None, registry=self.registry,
+            client_key=lambda r: r.client)
+        self.release = asyncio.Event()
+
+    def tearDown(self):
+        self.loop.close()
+
+    async def handler(self, request):
+        await self.release.wait()
+        return request.client
+
+    def admit(self, client, method='PROPFIND'):
+        request = mock.Mock(method=method, GET={}, client=client)
+        return asyncio.ensure_future(
+            self.controller.admit(request, 'mount', self.handler))
+
+    def run_coro(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def testLimiterQueue(self):
+        limiter = Limiter(1, 1)
+        self.run_coro(limiter.acquire())
+        waiter = asyncio.ensure_future(limiter.acquire())
+        self.run_coro(asyncio.sleep(0))
+        self.assertEqual(limiter.queued, 1)
+        with self.assertRaises(Overloaded):
+            self.run_coro(limiter.acquire())
+        limiter.release()
+        self.run_coro(waiter)
+        self.assertEqual(limiter.active, 1)
+        with self.assertRaises(Overloaded):
+            self.run_coro(limiter.acquire(timeout=0.01))
+        limiter.release()
+        self.assertTrue(limiter.idle)
+
+    def testClientBudget(self):
+        first = self.admit('a')
+        queued = self.admit('a')
+        other = self.admit('b')
+        self.run_coro(asyncio.sleep(0))
+        rejected = self.admit('a')
+        with self.assertRaises(web.HTTPServiceUnavailable) as ctx:
+            self.run_coro(rejected)
+        self.assertEqual(ctx.exception.headers['Retry-After'], '5')
+        expose = self.registry.expose()
+        self.assertIn('aiodav_admission_queued{mount="mount",'
+                      'class="metadata"} 1', expose)
+        self.assertIn('aiodav_admission_active{mount="mount",'
+                      'class="metadata"} 2', expose)
+        self.assertIn('aiodav_admission_rejected_total{mount="mount",'
+                      'class="metadata",budget="client"} 1', expose)
+        self.release.set()
+        results = self.run_coro(asyncio.gather(first, queued, other))
+        self.assertListEqual(results, ['a', 'a', 'b'])
+        self.assertDictEqual(self.controller._clients, {})
+
+    def testSeparateClasses(self):
+        listing = self.admit('a')
+        download = self.admit('a', method='GET')
+        self.run_coro(asyncio.sleep(0))
+        self.assertIn('aiodav_admission_active{mount="mount",'
+                      'class="transfer"} 1', self.registry.expose())
+        self.release.set()
+        self.run_coro(asyncio.gather(listing, download))
+
+
+@async_test
+class AdmissionMiddlewareTestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = DummyResource('prefix')
+
+    @classmethod
+    def tearDownClass(cls):
+        DummyResource._root = None
+
+    def init_app(self, loop):
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False,
+              admission={'mount_limits': {METADATA: 0}, 'queue_size': 0,
+                         'retry_after': 3})
+        return app
+
+    async def testShedLoad(self):
+        response = await self.client.request('PROPFIND', '/prefix/')
+        self.assertEqual(response.status, 503)
+        self.assertEqual(response.headers['Retry-After'], '3')
+        response = await self.client.get('/prefix/',
+                                         headers={'Accept': 'text/html'})
+        self.assertEqual(response.status, 200)
+        # non-WebDAV routes are not limited
+        response = await self.client.get('/')
+        self.assertEqual(response.status, 200)
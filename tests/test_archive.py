@@ -0,0 +1,188 @@
+# coding: utf-8
+import asyncio
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from unittest import TestCase
+
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav.archive import TarStreamWriter, ZipStreamWriter
+from aiodav.contrib import setup
+from aiodav.resources import FileSystemResource
+from tests.helpers import content_reader
+
+
+__all__ = ['ArchiveWriterTestCase', 'ArchiveViewTestCase',
+           'RootArchiveTestCase']
+
+
+def reader(content):
+    async def read(write):
+        read_some = content_reader(content)
+        while True:
+            chunk = await read_some()
+            if not chunk:
+                break
+            await write(chunk)
+    return read
+
+
+class ArchiveWriterTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def build(self, writer_class, size=None):
+        output = io.BytesIO()
+        chunks = []
+
+        async def write(data):
+            chunks.append(len(data))
+            output.write(data)
+
+        async def archive():
+            writer = writer_class(write)
+            await writer.add_directory('root', 1500000000)
+            await writer.add_file('root/a.txt', 1500000000,
+                                  size or 7, reader(b'CONTENT'))
+            await writer.add_directory('root/dir', 1500000000)
+            await writer.add_file('root/dir/ы.bin', 0, 0, reader(b''))
+            await writer.close()
+
+        self.loop.run_until_complete(archive())
+        output.seek(0)
+        return output, chunks
+
+    def testZip(self):
+        output, chunks = self.build(ZipStreamWriter)
+        with zipfile.ZipFile(output) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertListEqual(archive.namelist(), [
+                'root/', 'root/a.txt', 'root/dir/', 'root/dir/ы.bin'])
+            self.assertEqual(archive.read('root/a.txt'), b'CONTENT')
+            info = archive.getinfo('root/a.txt')
+            self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+            self.assertEqual(info.file_size, 7)
+            self.assertTrue(archive.getinfo('root/dir/').is_dir())
+        # content is written as it is read
+        self.assertIn(4, chunks)
+
+    def testTar(self):
+        output, _ = self.build(TarStreamWriter)
+        with tarfile.open(fileobj=output) as archive:
+            self.assertListEqual(archive.getnames(), [
+                'root', 'root/a.txt', 'root/dir', 'root/dir/ы.bin'])
+            self.assertTrue(archive.getmember('root/dir').isdir())
+            self.assertEqual(archive.extractfile('root/a.txt').read(),
+                             b'CONTENT')
+            self.assertEqual(archive.getmember('root/a.txt').mtime,
+                             1500000000)
+
+    def testTarSizeChanged(self):
+        output, _ = self.build(TarStreamWriter, size=4)
+        with tarfile.open(fileobj=output) as archive:
+            self.assertEqual(archive.extractfile('root/a.txt').read(),
+                             b'CONT')
+        output, _ = self.build(TarStreamWriter, size=10)
+        with tarfile.open(fileobj=output) as archive:
+            self.assertEqual(archive.extractfile('root/a.txt').read(),
+                             b'CONTENT\0\0\0')
+            self.assertListEqual(archive.getnames()[-1:], ['root/dir/ы.bin'])
+
+
+@async_test
+class ArchiveViewTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root_dir, 'photos', 'trip'))
+        os.mkdir(os.path.join(self.root_dir, 'photos', 'empty'))
+        for path, content in (('photos/a.jpg', b'a' * 100000),
+                              ('photos/trip/b.jpg', b'b' * 10),
+                              ('c.txt', b'c')):
+            with open(os.path.join(self.root_dir, path), 'wb') as f:
+                f.write(content)
+        self.root = FileSystemResource('prefix', root_dir=self.root_dir)
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False)
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.root_dir)
+
+    async def testZip(self):
+        response = await self.client.get('/prefix/photos/?archive=zip')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers['Content-Type'], 'application/zip')
+        self.assertEqual(response.headers['Content-Disposition'],
+                         "attachment; filename*=UTF-8''photos.zip")
+        with zipfile.ZipFile(io.BytesIO(response.body)) as archive:
+            self.assertSetEqual(set(archive.namelist()), {
+                'photos/', 'photos/a.jpg', 'photos/trip/',
+                'photos/trip/b.jpg', 'photos/empty/'})
+            self.assertEqual(archive.read('photos/a.jpg'), b'a' * 100000)
+            self.assertEqual(archive.read('photos/trip/b.jpg'), b'b' * 10)
+
+    async def testTar(self):
+        response = await self.client.get('/prefix/?archive=tar')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers['Content-Type'],
+                         'application/x-tar')
+        with tarfile.open(fileobj=io.BytesIO(response.body)) as archive:
+            self.assertIn('prefix/photos/trip/b.jpg', archive.getnames())
+            self.assertEqual(archive.extractfile('prefix/c.txt').read(),
+                             b'c')
+
+    async def testErrors(self):
+        response = await self.client.get('/prefix/photos/?archive=rar')
+        self.assertEqual(response.status, 400)
+        response = await self.client.get('/prefix/c.txt?archive=zip')
+        self.assertEqual(response.status, 400)
+        response = await self.client.get('/prefix/missing/?archive=zip')
+        self.assertEqual(response.status, 404)
+
+    async def testSymlinkLoop(self):
+        os.symlink(os.path.join(self.root_dir, 'photos'),
+                   os.path.join(self.root_dir, 'photos', 'trip', 'loop'))
+        response = await self.client.get('/prefix/photos/?archive=tar')
+        self.assertEqual(response.status, 200)
+        with tarfile.open(fileobj=io.BytesIO(response.body)) as archive:
+            names = archive.getnames()
+        self.assertIn('photos/trip/loop', names)
+        self.assertFalse([n for n in names
+                          if n.startswith('photos/trip/loop/')])
+
+
+
+@async_test
+class RootArchiveTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.root_dir, 'c.txt'), 'wb') as f:
+            f.write(b'c')
+        app = web.Application(loop=loop)
+        setup(app, prefix='/index/', hack_debugtoolbar=False,
+              mounts={'': FileSystemResource('', root_dir=self.root_dir)})
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.root_dir)
+
+    async def testName(self):
+        response = await self.client.get('/?archive=tar')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers['Content-Disposition'],
+                         "attachment; filename*=UTF-8''archive.tar")
+        with tarfile.open(fileobj=io.BytesIO(response.body)) as archive:
+            self.assertListEqual(archive.getnames(),
+                                 ['archive', 'archive/c.txt'])
@@ -0,0 +1,143 @@
+# coding: utf-8
+import shutil
+import stat
+import tempfile
+from unittest import TestCase, mock
+
+from lxml import etree as et
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav import views
+from aiodav.cache import PropstatCache, ENTRY_OVERHEAD
+from aiodav.contrib import setup
+from aiodav.propfind import ALLPROP_REQUEST
+from aiodav.resources import FileSystemResource
+from tests.helpers import fill_file
+
+
+__all__ = ['PropstatCacheTestCase', 'PropstatCacheViewTestCase']
+
+PROPPATCH = b'''<?xml version="1.0" encoding="utf-8" ?>
+<D:propertyupdate xmlns:D="DAV:" xmlns:Z="urn:z">
+  <D:set><D:prop><Z:color>red</Z:color></D:prop></D:set>
+</D:propertyupdate>'''
+
+
+class PropstatCacheTestCase(TestCase):
+
+    def resource(self, version):
+        return mock.Mock(version=version)
+
+    def testLRU(self):
+        cache = PropstatCache(max_size=2 * (ENTRY_OVERHEAD + 12))
+        keys = [cache.key('/%s' % n, self.resource(1), ALLPROP_REQUEST)
+                for n in 'abc']
+        cache.put(keys[0], b'a' * 10)
+        cache.put(keys[1], b'b' * 10)
+        self.assertEqual(cache.get(keys[0]), b'a' * 10)
+        cache.put(keys[2], b'c' * 10)
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.size, 2 * (ENTRY_OVERHEAD + 12))
+        # too large fragment is not cached
+        cache.put(keys[1], b'b' * cache.max_size)
+        self.assertEqual(len(cache), 2)
+
+    def testKey(self):
+        cache = PropstatCache()
+        self.assertIsNone(cache.key('/a', self.resource(None),
+                                    ALLPROP_REQUEST))
+        key = cache.key('/a', self.resource(1), ALLPROP_REQUEST)
+        cache.put(key, b'a')
+        self.assertNotEqual(
+            key, cache.key('/a', self.resource(2), ALLPROP_REQUEST))
+        self.assertEqual(cache.get(
+            cache.key('/a', self.resource(1), ALLPROP_REQUEST)), b'a')
+
+    def testInvalidate(self):
+        cache = PropstatCache()
+        hrefs = ['/m/', '/m/a/', '/m/a/b.txt', '/m/a/c/', '/m/a/c/d.txt',
+                 '/m/ab.txt', '/m/e/', '/m/e/f.txt', '/n/a/']
+        for href in hrefs:
+            cache.put(cache.key(href, self.resource(1), ALLPROP_REQUEST),
+                      href.encode('utf-8'))
+        cache.invalidate('/m/a/c')
+        cached = [href for href in hrefs if cache.get(
+            cache.key(href, self.resource(1), ALLPROP_REQUEST)) is not None]
+        self.assertEqual(cached, ['/m/a/b.txt', '/m/ab.txt', '/m/e/',
+                                  '/m/e/f.txt', '/n/a/'])
+        self.assertEqual(cache.size, sum(
+            len(href) * 2 + ENTRY_OVERHEAD for href in cached))
+        cache.invalidate('/m/')
+        self.assertEqual(len(cache), 1)
+
+    def testVersionPrecision(self):
+        versions = []
+        for delta in 0, 1:
+            # float times are same for both stats
+            time_ns = 1500000000 * 10 ** 9 + 100 + delta
+            resource = FileSystemResource('prefix', '/a.txt', root_dir='/')
+            resource._stat = mock.Mock(
+                st_mode=stat.S_IFREG, st_size=1, st_mtime=time_ns / 1e9,
+                st_ctime=time_ns / 1e9, st_mtime_ns=time_ns,
+                st_ctime_ns=time_ns)
+            versions.append(resource.version)
+        self.assertNotEqual(versions[0], versions[1])
+
+
+@async_test
+class PropstatCacheViewTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        self.root = FileSystemResource('prefix', root_dir=self.root_dir)
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root, 'plain': self.root},
+              hack_debugtoolbar=False,
+              mount_options={'plain': {'propstat_cache': None}})
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.root_dir)
+
+    async def listing(self, mount='prefix'):
+        response = await self.client.request('PROPFIND', '/%s/' % mount,
+                                             headers={'Depth': '1'})
+        self.assertEqual(response.status, 207)
+        return et.fromstring(response.text.encode('utf-8'))
+
+    async def testCachedListing(self):
+        for name in ('a.txt', 'b.txt', 'c.txt'):
+            await fill_file(self.root / name)
+        propstat_xml = mock.Mock(wraps=views.ResourceView.propstat_xml)
+        with mock.patch.object(views.ResourceView, 'propstat_xml',
+                               propstat_xml):
+            first = await self.listing()
+            self.assertEqual(propstat_xml.call_count, 4)
+            second = await self.listing()
+            self.assertEqual(propstat_xml.call_count, 4)
+            self.assertEqual(et.tostring(first), et.tostring(second))
+
+            # only changed file is rebuilt
+            response = await self.client.put('/prefix/b.txt', body=b'new')
+            self.assertEqual(response.status, 200)
+            xml = await self.listing()
+            self.assertEqual(propstat_xml.call_count, 5)
+            self.assertIn('<D:getcontentlength>3<', et.tostring(
+                xml).decode('utf-8'))
+
+            # dead properties change file and its ancestors
+            response = await self.client.request(
+                'PROPPATCH', '/prefix/a.txt', body=PROPPATCH)
+            self.assertEqual(response.status, 207)
+            xml = await self.listing()
+            self.assertEqual(propstat_xml.call_count, 7)
+            self.assertEqual(len(xml.xpath('//Z:color',
+                                           namespaces={'Z': 'urn:z'})), 1)
+
+            # disabled cache
+            await self.listing('plain')
+            await self.listing('plain')
+            self.assertEqual(propstat_xml.call_count, 15)
+
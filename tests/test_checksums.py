@@ -0,0 +1,140 @@
+# coding: utf-8
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from lxml import etree as et
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav.checksums import ChecksumService, XATTR_NAME
+from aiodav.contrib import setup
+from aiodav.resources import FileSystemResource
+
+
+__all__ = ['ChecksumServiceTestCase', 'ChecksumPropertyTestCase']
+
+SHA1 = hashlib.sha1(b'CONTENT').hexdigest()
+
+CHECKSUM_PROPFIND = b'''<?xml version="1.0" encoding="utf-8" ?>
+<D:propfind xmlns:D="DAV:" xmlns:A="urn:aiodav">
+  <D:prop><A:checksum/><D:getetag/></D:prop>
+</D:propfind>'''
+
+NS = {'D': 'DAV:', 'A': 'urn:aiodav'}
+
+
+class ChecksumServiceTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.root_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.root_dir, 'f.txt')
+        with open(self.path, 'wb') as f:
+            f.write(b'CONTENT')
+        self.service = ChecksumService()
+
+    def tearDown(self):
+        self.service.shutdown()
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        shutil.rmtree(self.root_dir)
+
+    def checksum(self, service):
+        st = os.stat(self.path)
+        result = service.checksum(self.path, st)
+        self.loop.run_until_complete(service.join())
+        return result, service.peek(self.path, os.stat(self.path))
+
+    def testBackground(self):
+        self.assertTupleEqual(self.checksum(self.service),
+                              (None, 'SHA1:%s' % SHA1))
+        self.assertTrue(os.getxattr(self.path, XATTR_NAME).startswith(
+            ('sha1:%s:' % SHA1).encode('ascii')))
+
+        # stored digest is reused by new service
+        service = ChecksumService()
+        with mock.patch.object(service, '_hash') as hash_file:
+            self.assertEqual(self.checksum(service)[1], 'SHA1:%s' % SHA1)
+        self.assertFalse(hash_file.called)
+        service.shutdown()
+
+    def testStale(self):
+        self.checksum(self.service)
+        with open(self.path, 'ab') as f:
+            f.write(b'!')
+        result, checksum = self.checksum(self.service)
+        self.assertIsNone(result)
+        self.assertEqual(checksum, 'SHA1:%s' % hashlib.sha1(
+            b'CONTENT!').hexdigest())
+        os.unlink(self.path)
+        self.service.request(self.path)
+        self.loop.run_until_complete(self.service.join())
+        self.assertNotIn(self.path, self.service._records)
+
+
+@async_test
+class ChecksumPropertyTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        self.checksums = ChecksumService()
+        self.root = FileSystemResource('prefix', root_dir=self.root_dir,
+                                       checksums=self.checksums)
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False)
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        self.checksums.shutdown()
+        shutil.rmtree(self.root_dir)
+
+    async def propfind(self, body=CHECKSUM_PROPFIND):
+        response = await self.client.request(
+            'PROPFIND', '/prefix/f.txt', body=body, headers={'Depth': '0'})
+        self.assertEqual(response.status, 207)
+        return et.fromstring(response.text.encode('utf-8'))
+
+    async def testChecksumProperty(self):
+        with mock.patch.object(self.checksums, '_hash',
+                               return_value=SHA1) as hash_file:
+            response = await self.client.put('/prefix/f.txt', body=b'CONTENT')
+            self.assertEqual(response.status, 201)
+            await self.checksums.join()
+            self.assertEqual(hash_file.call_count, 1)
+        xml = await self.propfind()
+        self.assertEqual(xml.xpath('//A:checksum/text()', namespaces=NS),
+                         ['SHA1:%s' % SHA1])
+        self.assertEqual(xml.xpath('//D:getetag/text()', namespaces=NS),
+                         ['"%s"' % SHA1])
+        # not an allprop property
+        xml = await self.propfind(b'')
+        self.assertListEqual(xml.xpath('//A:checksum', namespaces=NS), [])
+
+    async def testFirstRequest(self):
+        with open(os.path.join(self.root_dir, 'f.txt'), 'wb') as f:
+            f.write(b'CONTENT')
+        xml = await self.propfind()
+        self.assertListEqual(xml.xpath('//A:checksum', namespaces=NS), [])
+        self.assertListEqual(xml.xpath('//D:getetag/text()', namespaces=NS),
+                             [])
+        await self.checksums.join()
+        xml = await self.propfind()
+        self.assertEqual(xml.xpath('//A:checksum/text()', namespaces=NS),
+                         ['SHA1:%s' % SHA1])
+
+    async def testCreationDate(self):
+        path = os.path.join(self.root_dir, 'f.txt')
+        with open(path, 'wb') as f:
+            f.write(b'CONTENT')
+        os.utime(path, (1000000000, 1000000000))
+        await self.propfind()
+        await self.checksums.join()
+        # xattr write changes st_ctime, but not creationdate
+        xml = await self.propfind(b'')
+        self.assertEqual(xml.xpath('//D:creationdate/text()', namespaces=NS),
+                         ['2001-09-09T01:46:40Z'])
@@ -0,0 +1,125 @@
+# coding: utf-8
+import asyncio
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav.coalescing import SingleFlight
+from aiodav.contrib import setup
+from aiodav.resources import FileSystemResource
+from tests.helpers import fill_file
+
+
+__all__ = ['SingleFlightTestCase', 'PropfindCoalescingTestCase']
+
+
+class SingleFlightTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.flights = SingleFlight(loop=self.loop)
+        self.calls = 0
+        self.release = asyncio.Event(loop=self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    async def compute(self):
+        self.calls += 1
+        await self.release.wait()
+        return self.calls
+
+    def start(self, key, path):
+        return asyncio.ensure_future(
+            self.flights.run(key, path, self.compute), loop=self.loop)
+
+    def run_coro(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def testShared(self):
+        first = self.start('a', '/dir')
+        second = self.start('a', '/dir')
+        other = self.start('b', '/dir')
+        self.run_coro(asyncio.sleep(0, loop=self.loop))
+        self.assertEqual(len(self.flights), 2)
+        self.release.set()
+        results = self.run_coro(asyncio.gather(first, second, other,
+                                               loop=self.loop))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(len(self.flights), 0)
+
+    def testInvalidate(self):
+        for path in ('/', '/dir', '/dir/file', '/dir/sub/file', '/other'):
+            self.start(path, path)
+        self.run_coro(asyncio.sleep(0, loop=self.loop))
+        self.flights.invalidate('/dir/sub')
+        # parent listing, path itself and descendants
+        self.assertSetEqual(set(self.flights._flights),
+                            {'/', '/dir/file', '/other'})
+        late = self.start('/dir', '/dir')
+        self.run_coro(asyncio.sleep(0, loop=self.loop))
+        self.assertEqual(self.calls, 6)
+        self.release.set()
+        self.run_coro(late)
+        self.flights.invalidate('/')
+        self.assertEqual(len(self.flights), 0)
+
+    def testCancelWaiter(self):
+        first = self.start('a', '/')
+        second = self.start('a', '/')
+        self.run_coro(asyncio.sleep(0, loop=self.loop))
+        first.cancel()
+        self.release.set()
+        self.assertEqual(self.run_coro(second), 1)
+        self.assertTrue(first.cancelled())
+
+
+@async_test
+class PropfindCoalescingTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        self.root = FileSystemResource('prefix', root_dir=self.root_dir)
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False)
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.root_dir)
+
+    def propfind(self):
+        return self.client.request('PROPFIND', '/prefix/',
+                                   headers={'Depth': '1'})
+
+    async def testCoalesce(self):
+        await fill_file(self.root / 'a.txt', b'a')
+        populate = FileSystemResource.populate_collection
+        calls = []
+
+        async def slow_populate(resource):
+            calls.append(resource.path)
+            await asyncio.sleep(0.05)
+            await populate(resource)
+
+        with mock.patch.object(FileSystemResource, 'populate_collection',
+                               slow_populate):
+            responses = await asyncio.gather(*[self.propfind()
+                                               for _ in range(3)])
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(len({r.text for r in responses}), 1)
+            self.assertTrue(all(r.status == 207 for r in responses))
+
+            # request after write doesn't share listing started before it
+            listing = asyncio.ensure_future(self.propfind())
+            await asyncio.sleep(0.01)
+            response = await self.client.put('/prefix/b.txt', body=b'b')
+            self.assertEqual(response.status, 201)
+            response = await self.propfind()
+            self.assertIn('b.txt', response.text)
+            await listing
+            self.assertEqual(len(calls), 3)
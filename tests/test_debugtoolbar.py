@@ -0,0 +1,101 @@
+# coding: utf-8
+import copy
+import cProfile
+import pstats
+from unittest import TestCase
+
+import asyncio
+from aiohttp import web
+from aiohttp.streams import StreamReader
+
+from aiodav.contrib.debugtoolbar import (RequestResponseBodyPanel,
+                                         DavProfilerPanel)
+from aiodav.views import DavXMLResponse, MultiStatusResponse, ResourceView
+from aiodav.resources.dummy import DummyResource
+
+
+__all__ = ['DebugToolbarPanelsTestCase']
+
+
+class FakeRequest:
+    def __init__(self, content):
+        self.content = content
+
+
+class DebugToolbarPanelsTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        DummyResource._root = None
+
+    def testRequestBodyPrefix(self):
+        content = StreamReader(loop=self.loop)
+        content.feed_data(b'A' * 100 + b'B' * 100)
+        content.feed_eof()
+        panel = RequestResponseBodyPanel(FakeRequest(content))
+        panel.max_body_size = 150
+
+        async def handler(request):
+            while await request.content.readany():
+                pass
+            return web.StreamResponse()
+
+        wrapped = panel.wrap_handler(handler, None)
+        response = self.loop.run_until_complete(wrapped(panel.request))
+        self.loop.run_until_complete(panel.process_response(response))
+        self.assertEqual(panel.data['request_body'],
+                         'A' * 100 + 'B' * 50 + '\n... (200 bytes total)')
+        self.assertIn('bytes streamed', panel.data['response_body'])
+
+    def testNestedReads(self):
+        content = StreamReader(loop=self.loop)
+        content.feed_data(b'ABCDEF')
+        content.feed_eof()
+        panel = RequestResponseBodyPanel(FakeRequest(content))
+
+        async def handler(request):
+            # readexactly calls read, read(-1) calls readany
+            await request.content.readexactly(2)
+            await request.content.read()
+            return web.StreamResponse()
+
+        wrapped = panel.wrap_handler(handler, None)
+        response = self.loop.run_until_complete(wrapped(panel.request))
+        self.loop.run_until_complete(panel.process_response(response))
+        self.assertEqual(panel.data['request_body'], 'ABCDEF')
+
+    def testResponseBodyPrefix(self):
+        content = StreamReader(loop=self.loop)
+        content.feed_eof()
+        panel = RequestResponseBodyPanel(FakeRequest(content))
+        panel.max_body_size = 4
+        response = web.Response(body=b'CONTENT')
+        self.loop.run_until_complete(panel.process_response(response))
+        self.assertEqual(panel.data['request_body'], '')
+        self.assertEqual(panel.data['response_body'],
+                         'CONT\n... (7 bytes total)')
+
+    def testProfileSummary(self):
+        root = DummyResource('prefix')
+        profiler = cProfile.Profile()
+        profiler.enable()
+        self.loop.run_until_complete(root.populate_props())
+        propstat = ResourceView.propstat_xml(root)
+        MultiStatusResponse.dump_response(DavXMLResponse('/', propstat))
+        # stdlib function named as backend operation
+        copy.copy([])
+        profiler.disable()
+        data = DavProfilerPanel.summarize(pstats.Stats(profiler))
+        self.assertListEqual([k for k, v in data['backend']],
+                             ['populate_props'])
+        self.assertSetEqual({k for k, v in data['xml']},
+                            {'propstat_xml', 'dump_response', 'response_xml'})
+        xml = dict(data['xml'])
+        # response_xml is called by dump_response
+        self.assertAlmostEqual(data['xml_total'],
+                               xml['propstat_xml'] + xml['dump_response'])
+        self.assertTrue(data['functions'])
@@ -0,0 +1,214 @@
+# coding: utf-8
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav import events
+from aiodav.contrib import setup
+from aiodav.events import ChangeFeed
+from aiodav.resources import FileSystemResource
+
+
+__all__ = ['ChangeFeedTestCase', 'InotifyWatcherTestCase',
+           'ChangeEventsViewTestCase']
+
+
+class ChangeFeedTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def drain(self, subscription):
+        result = []
+        while True:
+            event = self.loop.run_until_complete(subscription.get(0.01))
+            if event is None:
+                return result
+            result.append((event.type, event.path))
+
+    def testSubtree(self):
+        feed = ChangeFeed()
+        with feed.subscribe('/a') as subscription:
+            self.assertEqual(len(feed), 1)
+            feed.publish(events.CREATED, 'a/b.txt')
+            feed.publish(events.CREATED, 'ab.txt')
+            feed.publish(events.MOVED, 'c.txt', 'a/c.txt')
+            feed.publish(events.DELETED, 'a')
+            self.assertListEqual(self.drain(subscription), [
+                (events.CREATED, '/a/b.txt'),
+                (events.MOVED, '/c.txt'),
+                (events.DELETED, '/a')])
+        self.assertEqual(len(feed), 0)
+
+    def testReplay(self):
+        feed = ChangeFeed(backlog=2)
+        for name in 'abc':
+            feed.publish(events.MODIFIED, name)
+        with feed.subscribe('/', feed.epoch + '-1') as subscription:
+            self.assertListEqual(self.drain(subscription), [
+                (events.MODIFIED, '/b'), (events.MODIFIED, '/c')])
+        with feed.subscribe('/', feed.epoch + '-3') as subscription:
+            self.assertListEqual(self.drain(subscription), [])
+        # missed events are not in backlog, id of other feed or server run,
+        # id ahead of feed
+        for last_id in (feed.epoch + '-0', ChangeFeed().epoch + '-3', '3',
+                        feed.epoch + '-4'):
+            with feed.subscribe('/', last_id) as subscription:
+                self.assertListEqual(self.drain(subscription),
+                                     [(events.RESET, None)])
+
+    def testOverflow(self):
+        feed = ChangeFeed(queue_size=2)
+        with feed.subscribe() as subscription:
+            for name in 'abc':
+                feed.publish(events.MODIFIED, name)
+            feed.publish(events.MODIFIED, 'd')
+            self.assertListEqual(self.drain(subscription), [
+                (events.RESET, None), (events.MODIFIED, '/d')])
+
+
+class InotifyWatcherTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.root_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root_dir, 'dir'))
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        shutil.rmtree(self.root_dir)
+
+    def changes(self, subscription):
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+        result = set()
+        while True:
+            event = self.loop.run_until_complete(subscription.get(0.05))
+            if event is None:
+                return result
+            result.add((event.type, event.path))
+
+    def testOutsideChanges(self):
+        feed = ChangeFeed(watch_dir=self.root_dir, watch_grace=0)
+        with feed.subscribe() as subscription:
+            self.loop.run_until_complete(feed._watcher.ready)
+            with open(os.path.join(self.root_dir, 'dir', 'f.txt'), 'wb') as f:
+                f.write(b'data')
+            os.mkdir(os.path.join(self.root_dir, 'new'))
+            self.assertSetEqual(self.changes(subscription), {
+                (events.CREATED, '/dir/f.txt'),
+                (events.MODIFIED, '/dir/f.txt'),
+                (events.CREATED, '/new')})
+            # new directory is watched
+            os.rename(os.path.join(self.root_dir, 'dir', 'f.txt'),
+                      os.path.join(self.root_dir, 'new', 'f.txt'))
+            self.assertSetEqual(self.changes(subscription), {
+                (events.DELETED, '/dir/f.txt'),
+                (events.CREATED, '/new/f.txt')})
+        self.assertIsNone(feed._watcher)
+
+    def testGracePeriod(self):
+        feed = ChangeFeed(watch_dir=self.root_dir, watch_grace=0.1)
+        with feed.subscribe():
+            watcher = feed._watcher
+            self.loop.run_until_complete(watcher.ready)
+        # next poll reuses running watcher
+        with feed.subscribe() as subscription:
+            self.assertIs(feed._watcher, watcher)
+            self.assertSetEqual(self.changes(subscription), set())
+        self.loop.run_until_complete(asyncio.sleep(0.15))
+        self.assertIsNone(feed._watcher)
+        # changes made while watcher was stopped are lost
+        with feed.subscribe() as subscription:
+            self.assertIsNot(feed._watcher, watcher)
+            self.assertSetEqual(self.changes(subscription),
+                                {(events.RESET, '/')})
+        feed.close()
+        self.assertIsNone(feed._watcher)
+
+
+@async_test
+class ChangeEventsViewTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        self.root = FileSystemResource('prefix', root_dir=self.root_dir)
+        self.feed = ChangeFeed()
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False,
+              mount_options={'prefix': {'change_feed': self.feed}})
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.root_dir)
+
+    def parse(self, text):
+        result = []
+        for block in text.split('\n\n'):
+            lines = dict(line.split(': ', 1) for line in block.splitlines()
+                         if not line.startswith(':'))
+            if lines:
+                epoch, _, seq = lines['id'].rpartition('-')
+                self.assertEqual(epoch, self.feed.epoch)
+                result.append((int(seq), json.loads(lines['data'])))
+        return result
+
+    async def testStream(self):
+        stream = asyncio.ensure_future(self.client.get(
+            '/prefix/dir/?events&timeout=0.5'))
+        while not len(self.feed):
+            await asyncio.sleep(0.01)
+        response = await self.client.request('MKCOL', '/prefix/dir/')
+        self.assertEqual(response.status, 201)
+        response = await self.client.put('/prefix/dir/a.txt', body=b'a')
+        self.assertEqual(response.status, 201)
+        response = await self.client.put('/prefix/other.txt', body=b'a')
+        self.assertEqual(response.status, 201)
+        response = await self.client.request(
+            'MOVE', '/prefix/dir/a.txt',
+            headers={'Destination': '/prefix/b.txt'})
+        self.assertEqual(response.status, 201)
+        response = await self.client.request('MKCOL', '/prefix/dir/sub/')
+        self.assertEqual(response.status, 201)
+        # moved into existing collection
+        response = await self.client.request(
+            'MOVE', '/prefix/b.txt', headers={'Destination': '/prefix/dir/sub'})
+        self.assertEqual(response.status, 204)
+        response = await stream
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers['Content-Type'],
+                         'text/event-stream')
+        self.assertListEqual(self.parse(response.text), [
+            (1, {'type': 'created', 'path': '/dir'}),
+            (2, {'type': 'created', 'path': '/dir/a.txt'}),
+            (4, {'type': 'moved', 'path': '/dir/a.txt',
+                 'destination': '/b.txt'}),
+            (5, {'type': 'created', 'path': '/dir/sub'}),
+            (6, {'type': 'moved', 'path': '/b.txt',
+                 'destination': '/dir/sub/b.txt'})])
+        self.assertEqual(len(self.feed), 0)
+
+        response = await self.client.get(
+            '/prefix/?events&timeout=0',
+            headers={'Last-Event-ID': self.feed.epoch + '-3'})
+        self.assertListEqual([e[0] for e in self.parse(response.text)],
+                             [4, 5, 6])
+        # feed of previous server run
+        response = await self.client.get(
+            '/prefix/?events&timeout=0', headers={'Last-Event-ID': '3'})
+        self.assertListEqual(self.parse(response.text),
+                             [(6, {'type': 'reset', 'path': None})])
+        response = await self.client.get('/prefix/?events&timeout=x')
+        self.assertEqual(response.status, 400)
@@ -4,14 +4,17 @@ import tempfile
 from unittest import TestCase
 
 import shutil
+from aiohttp_tests import async_test
 
 from aiodav.resources import FileSystemResource
 from tests.base import BackendTestsMixin
+from tests.helpers import fill_file, read_file
 
 
 __all__ = ['FileSystemBackendTestCase']
 
 
+@async_test
 class FileSystemBackendTestCase(BackendTestsMixin, TestCase):
 
     Resource = FileSystemResource
@@ -49,3 +52,26 @@ class FileSystemBackendTestCase(BackendTestsMixin, TestCase):
         self.assertIsInstance(second, self.Resource, msg=None)
         self.assertIs(first.is_collection, second.is_collection, msg=None)
         self.assertEqual(first.path, second.path, msg=None)
+
+    async def testReadSmallBlocks(self):
+        file_resource = self.root / 'filename.txt'
+        expected = bytes(range(256)) * 1000
+        await fill_file(file_resource, content=expected)
+        file_resource.min_block_size = 1000
+        file_resource.max_block_size = 5000
+        chunks = []
+        await file_resource.get_content(chunks.append, offset=10, limit=20000)
+        self.assertEqual(b''.join(chunks), expected[10:20010])
+        self.assertTrue(all(len(c) <= 5000 for c in chunks))
+
+    def testNextBlockSize(self):
+        resource = self.root
+        next_size = resource._next_block_size
+        self.assertEqual(next_size(1024, 1024, 0), resource.min_block_size)
+        self.assertEqual(next_size(resource.max_block_size, 1024, 0),
+                         resource.max_block_size)
+        self.assertEqual(next_size(1024, 100 * 1024, 1.0),
+                         resource.min_block_size)
+        self.assertEqual(next_size(1024, 1024**3, 0.01),
+                         resource.max_block_size)
+        self.assertEqual(next_size(1024, 4 * 1024**2, 0.1), 4 * 1024**2)
@@ -0,0 +1,207 @@
+# coding: utf-8
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import TestCase, mock
+
+from aiohttp_tests import async_test
+
+from aiodav.resources import FileSystemResource
+from aiodav.resources import errors
+from aiodav.resources.index import MetadataIndex
+from aiodav.search import SearchQuery
+from tests.helpers import fill_file
+
+
+__all__ = ['MetadataIndexTestCase']
+
+
+@async_test
+class MetadataIndexTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.root_dir = tempfile.mkdtemp()
+        self.index = MetadataIndex(':memory:', self.root_dir,
+                                   rescan_interval=3600, loop=self.loop)
+        self.root = FileSystemResource('prefix', root_dir=self.root_dir,
+                                       index=self.index)
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.index.stop())
+        self.index.close()
+        self.loop.close()
+        shutil.rmtree(self.root_dir)
+
+    def make(self, *paths):
+        for path in paths:
+            absolute = os.path.join(self.root_dir, path)
+            if path.endswith('/'):
+                os.makedirs(absolute)
+            else:
+                with open(absolute, 'wb') as f:
+                    f.write(b'x' * len(path))
+
+    async def assertIndexed(self, path):
+        st = os.stat(os.path.join(self.root_dir, path.lstrip('/')))
+        indexed = await self.index.lookup(path)
+        self.assertIsNotNone(indexed, path)
+        self.assertEqual(indexed.st_size, st.st_size)
+        self.assertEqual(indexed.st_mode, st.st_mode)
+        self.assertEqual(indexed.st_mtime, st.st_mtime)
+
+    async def children(self, path):
+        children = await self.index.children(path)
+        return sorted(name for name, _ in children)
+
+    async def start(self):
+        self.index.start()
+        while not self.index.fresh:
+            await asyncio.sleep(0.01)
+
+    async def testScan(self):
+        self.make('dir/', 'dir/sub/', 'dir/sub/f.txt', 'file.txt')
+        await self.index.scan()
+        for path in '/', '/dir', '/dir/sub', '/dir/sub/f.txt', '/file.txt':
+            await self.assertIndexed(path)
+        self.assertListEqual(await self.children('/'), ['dir', 'file.txt'])
+        self.assertIsNone(await self.index.children('/file.txt'))
+        self.assertIsNone(await self.index.lookup('/missing'))
+
+    async def testRescanChangedDirectories(self):
+        self.make('dir/', 'dir/sub/', 'dir/sub/f.txt', 'other/', 'other/f')
+        await self.index.scan()
+        shutil.rmtree(os.path.join(self.root_dir, 'dir', 'sub'))
+        self.make('dir/sub', 'new/', 'new/deep/', 'new/deep/f.txt')
+        with mock.patch.object(self.index, '_sync_dir',
+                               wraps=self.index._sync_dir) as sync_dir:
+            await self.index.scan()
+        synced = {c[0][0] for c in sync_dir.call_args_list}
+        self.assertSetEqual(synced, {'/', '/dir', '/new', '/new/deep'})
+        await self.assertIndexed('/dir/sub')
+        self.assertIsNone(await self.index.lookup('/dir/sub/f.txt'))
+        await self.assertIndexed('/new/deep/f.txt')
+
+    async def testResourceUsesIndex(self):
+        self.make('dir/', 'dir/f.txt', 'dir/sub/')
+        await self.start()
+        with mock.patch('os.stat', side_effect=AssertionError):
+            resource = self.root / 'dir'
+            await resource.populate_props()
+            self.assertTrue(resource.is_collection)
+            await resource.populate_collection()
+        self.assertListEqual([(r.name, r.is_collection)
+                              for r in resource.collection],
+                             [('sub', True), ('f.txt', False)])
+        self.assertEqual(resource.collection[1].size, len('dir/f.txt'))
+
+    async def testStaleEntry(self):
+        self.make('f.txt')
+        await self.start()
+        os.unlink(os.path.join(self.root_dir, 'f.txt'))
+        resource = self.root / 'f.txt'
+        # stale entry is trusted while index is fresh
+        await resource.populate_props()
+        with self.assertRaises(errors.ResourceDoesNotExist):
+            await resource.get_content(lambda data: None)
+        self.assertIsNone(await self.index.lookup('/f.txt'))
+
+    async def testWriteThrough(self):
+        self.make('dir/')
+        await self.start()
+        f = self.root / 'dir/f.txt'
+        await fill_file(f, content=b'content')
+        await self.assertIndexed('/dir/f.txt')
+        await self.root.make_collection('dir/sub')
+        await self.assertIndexed('/dir/sub')
+        d = self.root / 'dir'
+        await d.populate_props()
+        await d.move('moved')
+        await self.assertIndexed('/moved/f.txt')
+        self.assertIsNone(await self.index.lookup('/dir/f.txt'))
+        self.assertListEqual(await self.children('/moved'), ['f.txt', 'sub'])
+        copy = await d.copy('copied')
+        self.assertListEqual(await self.children('/copied'), ['f.txt', 'sub'])
+        await copy.delete()
+        self.assertIsNone(await self.index.lookup('/copied'))
+        self.assertIsNone(await self.index.lookup('/copied/f.txt'))
+
+    async def testSearch(self):
+        self.make('dir/', 'dir/a.txt', 'dir/sub/', 'dir/sub/b.txt',
+                  'dir/sub/c.bin', 'd.txt')
+        query = SearchQuery('/dir', where=('and', [
+            ('like', 'name', '%.TXT'), ('gt', 'size', 0)]),
+            order_by=[('name', True)])
+        with self.assertRaises(errors.SearchUnavailable):
+            await self.root.search(query)
+        await self.start()
+        with mock.patch('os.stat', side_effect=AssertionError):
+            results = await self.root.search(query)
+        self.assertListEqual([(r.path, r.size) for r in results], [
+            ('/dir/sub/b.txt', len('dir/sub/b.txt')),
+            ('/dir/a.txt', len('dir/a.txt'))])
+
+        query = SearchQuery('/', depth=1, where=('is-collection',), limit=1)
+        results = await self.root.search(query)
+        self.assertListEqual([r.path for r in results], ['/'])
+        query.where = ('not', ('or', [('is-collection',),
+                                      ('lt', 'mtime', 0)]))
+        query.limit = None
+        results = await self.root.search(query)
+        self.assertListEqual([r.path for r in results], ['/d.txt'])
+
+    async def testSearchMatching(self):
+        self.make('dir/', 'dir/File.txt')
+        await self.start()
+        query = SearchQuery('/', where=('like', 'name', 'file%'))
+        results = await self.root.search(query)
+        self.assertListEqual([r.path for r in results], ['/dir/File.txt'])
+        # same case folding as search.like_regex, not ASCII only
+        with self.index._db:
+            self.index._db.execute(
+                'INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                self.index._row('/dir/Файл_[1].txt', os.stat(self.root_dir)))
+        for pattern, matches in (('файл%', True), ('%_[1].TXT', True),
+                                 ('%\\_[1]%', True), ('ф_йл%', True),
+                                 ('файл\\%', False), ('%[1]', False)):
+            query = SearchQuery('/', where=('like', 'name', pattern))
+            paths = [p for p, _ in self.index._search(query)]
+            self.assertEqual(paths == ['/dir/Файл_[1].txt'], matches, pattern)
+        # patterns with literal prefix or suffix are looked up by index
+        for pattern, index in (('file%', 'entries_folded'),
+                               ('%.txt', 'entries_folded_rev')):
+            params = []
+            plan = self.index._db.execute(
+                'EXPLAIN QUERY PLAN SELECT path FROM entries WHERE ' +
+                self.index._like(pattern, params), params).fetchall()
+            self.assertIn('INDEX %s (' % index, plan[0][-1])
+
+        with self.assertRaises(errors.ResourceDoesNotExist):
+            await self.root.search(SearchQuery('/missing'))
+
+    def testSchemaUpgrade(self):
+        fd, filename = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        try:
+            db = sqlite3.connect(filename)
+            with db:
+                db.execute('CREATE TABLE entries (path TEXT PRIMARY KEY)')
+            db.close()
+            index = MetadataIndex(filename, self.root_dir)
+            # old index is dropped and filled by next scan
+            self.loop.run_until_complete(index.scan())
+            self.assertIsNotNone(index._lookup('/'))
+            index.close()
+        finally:
+            os.unlink(filename)
+
+    async def testNotFresh(self):
+        self.make('dir/')
+        resource = self.root / 'dir'
+        with mock.patch.object(self.index, 'lookup') as lookup:
+            await resource.populate_props()
+        self.assertFalse(lookup.called)
+        self.assertTrue(resource.is_collection)
@@ -0,0 +1,96 @@
+# coding: utf-8
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav.contrib import setup
+from aiodav.listing import StreamedMembers
+from aiodav.resources import FileSystemResource
+from aiodav.resources.filesystem import FileSystemCollectionBatches
+
+
+__all__ = ['StreamedMembersTestCase', 'StreamedListingTestCase']
+
+
+class StreamedMembersTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.root_dir = tempfile.mkdtemp()
+        for name in ('b', 'a', 'c'):
+            open(os.path.join(self.root_dir, name), 'wb').close()
+        os.mkdir(os.path.join(self.root_dir, 'z'))
+        self.root = FileSystemResource('prefix', root_dir=self.root_dir)
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.root_dir)
+
+    def testBatches(self):
+        batches = self.root.iter_collection(offset=1, batch_size=2)
+        members = StreamedMembers(batches)
+        self.loop.run_until_complete(members.fill(1))
+        self.assertEqual(batches.total, 4)
+        self.assertListEqual([next(members).name, next(members).name],
+                             ['a', 'b'])
+        with self.assertRaises(RuntimeError):
+            next(members)
+        self.loop.run_until_complete(members.fill())
+        self.assertListEqual([r.name for r in members], ['c'])
+
+
+@async_test
+class StreamedListingTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root_dir, 'zdir'))
+        for i in range(250):
+            open(os.path.join(self.root_dir, 'f%03d' % i), 'wb').close()
+        self.root = FileSystemResource('prefix', root_dir=self.root_dir)
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False)
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.root_dir)
+
+    def names(self, text):
+        return re.findall(r'<li><a href="/prefix/[^"]+">([^<]+)</a></li>',
+                          text)
+
+    async def testStream(self):
+        stat_all = mock.Mock(wraps=FileSystemCollectionBatches._stat_all)
+        with mock.patch.object(FileSystemCollectionBatches, '_stat_all',
+                               stat_all):
+            response = await self.client.get(
+                '/prefix/', headers={'Accept': 'text/html'})
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers['Content-Type'],
+                         'text/html; charset=utf-8')
+        self.assertListEqual(self.names(response.text),
+                             ['zdir'] + ['f%03d' % i for i in range(250)])
+        # members are read in batches while rendering
+        self.assertEqual(stat_all.call_count, 3)
+        self.assertNotIn('next', response.text)
+
+    async def testPaging(self):
+        response = await self.client.get(
+            '/prefix/?page=2&per_page=100', headers={'Accept': 'text/html'})
+        self.assertListEqual(self.names(response.text),
+                             ['f%03d' % i for i in range(99, 199)])
+        self.assertIn('?page=1&amp;per_page=100">previous', response.text)
+        self.assertIn('?page=3&amp;per_page=100">next', response.text)
+        response = await self.client.get(
+            '/prefix/?page=3&per_page=100', headers={'Accept': 'text/html'})
+        self.assertEqual(len(self.names(response.text)), 51)
+        self.assertNotIn('next', response.text)
+        response = await self.client.get(
+            '/prefix/?page=x', headers={'Accept': 'text/html'})
+        self.assertEqual(response.status, 400)
@@ -0,0 +1,98 @@
+# coding: utf-8
+import shutil
+import tempfile
+from collections import OrderedDict
+from unittest import TestCase, mock
+
+from lxml import etree as et
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav.contrib import setup
+from aiodav.resources import FileSystemResource
+from aiodav.resources.live import LiveProperties, http_date, iso_date
+from tests.helpers import fill_file
+
+
+__all__ = ['LivePropertiesTestCase', 'LivePropertiesViewTestCase']
+
+NS = {'D': 'DAV:', 'Z': 'urn:z'}
+
+
+class ChecksumResource(FileSystemResource):
+    live_properties = FileSystemResource.live_properties.copy()
+    checksum = mock.Mock(return_value='abc')
+    live_properties.register('{urn:z}checksum', lambda r: r.checksum(),
+                             allprop=False)
+
+
+class LivePropertiesTestCase(TestCase):
+
+    def testDates(self):
+        self.assertEqual(http_date(784111777), 'Sun, 06 Nov 1994 08:49:37 GMT')
+        self.assertEqual(iso_date(784111777), '1994-11-06T08:49:37Z')
+
+    def testCompute(self):
+        registry = LiveProperties()
+        size = mock.Mock(return_value=1)
+        registry.register('getcontentlength', size)
+        registry.register('displayname', lambda r: 'name')
+        registry.register('{urn:z}slow', lambda r: 'slow', allprop=False)
+        resource = object()
+        self.assertDictEqual(registry.compute(resource, ('displayname',)),
+                             OrderedDict([('displayname', 'name')]))
+        self.assertFalse(size.called)
+        self.assertListEqual(list(registry.compute(resource)),
+                             ['getcontentlength', 'displayname'])
+        self.assertListEqual(
+            list(registry.compute(resource, include=('{urn:z}slow',))),
+            ['getcontentlength', 'displayname', '{urn:z}slow'])
+        # replaced provider keeps its position
+        copy = registry.copy()
+        copy.register('getcontentlength', lambda r: 2)
+        self.assertDictEqual(copy.compute(resource), OrderedDict(
+            [('getcontentlength', 2), ('displayname', 'name')]))
+        self.assertEqual(registry.compute(resource)['getcontentlength'], 1)
+
+
+@async_test
+class LivePropertiesViewTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        self.root = ChecksumResource('prefix', root_dir=self.root_dir)
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False)
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.root_dir)
+        ChecksumResource.checksum.reset_mock()
+
+    async def propfind(self, body):
+        response = await self.client.request(
+            'PROPFIND', '/prefix/f.txt', body=body, headers={'Depth': '0'})
+        self.assertEqual(response.status, 207)
+        return et.fromstring(response.text.encode('utf-8'))
+
+    async def testExtraProperty(self):
+        await fill_file(self.root / 'f.txt')
+        xml = await self.propfind(b'')
+        self.assertListEqual(xml.xpath('//Z:checksum', namespaces=NS), [])
+        self.assertFalse(ChecksumResource.checksum.called)
+
+        xml = await self.propfind(
+            b'<D:propfind xmlns:D="DAV:" xmlns:Z="urn:z"><D:prop>'
+            b'<Z:checksum/></D:prop></D:propfind>')
+        self.assertEqual(xml.xpath('//Z:checksum/text()', namespaces=NS),
+                         ['abc'])
+        self.assertListEqual(
+            xml.xpath('//D:getlastmodified', namespaces=NS), [])
+
+        xml = await self.propfind(
+            b'<D:propfind xmlns:D="DAV:" xmlns:Z="urn:z"><D:allprop/>'
+            b'<D:include><Z:checksum/></D:include></D:propfind>')
+        self.assertEqual(xml.xpath('//Z:checksum/text()', namespaces=NS),
+                         ['abc'])
+        modified = xml.xpath('//D:getlastmodified/text()', namespaces=NS)[0]
+        self.assertTrue(modified.endswith(' GMT'))
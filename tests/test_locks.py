@@ -0,0 +1,245 @@
+# coding: utf-8
+import asyncio
+from unittest import TestCase, mock
+
+from lxml import etree as et
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav import locks
+from aiodav.contrib import setup
+from aiodav.resources.dummy import DummyResource
+from tests.helpers import fill_file
+
+
+__all__ = ['MemoryLockManagerTestCase', 'LockViewTestCase']
+
+LOCKINFO = b'''<?xml version="1.0" encoding="utf-8" ?>
+<D:lockinfo xmlns:D="DAV:">
+    <D:lockscope><D:%s/></D:lockscope>
+    <D:locktype><D:write/></D:locktype>
+    <D:owner><D:href>mailto:user@example.com</D:href></D:owner>
+</D:lockinfo>'''
+
+
+class MemoryLockManagerTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.manager = locks.MemoryLockManager()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_coro(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def lock(self, path, **kwargs):
+        return self.run_coro(self.manager.lock(path, **kwargs))
+
+    def check(self, path, *tokens, descendants=False):
+        return self.run_coro(self.manager.check(path, tokens,
+                                                descendants=descendants))
+
+    def testExclusiveConflict(self):
+        self.lock('/dir')
+        with self.assertRaises(locks.LockConflict):
+            self.lock('/dir/file.txt')
+        with self.assertRaises(locks.LockConflict):
+            self.lock('/', scope=locks.SHARED)
+
+    def testSharedLocks(self):
+        self.lock('/dir', scope=locks.SHARED)
+        self.lock('/dir/file.txt', scope=locks.SHARED)
+        with self.assertRaises(locks.LockConflict):
+            self.lock('/dir/file.txt')
+
+    def testCheckShared(self):
+        first = self.lock('/dir', scope=locks.SHARED)
+        second = self.lock('/dir', scope=locks.SHARED)
+        # any holder of a shared lock may write
+        self.check('/dir/file.txt', first.token)
+        self.check('/dir/file.txt', second.token)
+        with self.assertRaises(locks.LockConflict):
+            self.check('/dir/file.txt')
+        third = self.lock('/dir/sub/file.txt', scope=locks.SHARED)
+        self.check('/', first.token, third.token, descendants=True)
+        with self.assertRaises(locks.LockConflict):
+            self.check('/', first.token, descendants=True)
+
+    def testDepthZero(self):
+        self.lock('/dir', depth=locks.DEPTH_ZERO)
+        self.lock('/dir/file.txt')
+        self.check('/dir/other.txt')
+        with self.assertRaises(locks.LockConflict):
+            self.check('/dir')
+
+    def testCheck(self):
+        lock = self.lock('/dir/sub')
+        self.check('/dir')
+        self.check('/dir/sub/file.txt', lock.token)
+        with self.assertRaises(locks.LockConflict):
+            self.check('/dir/sub/file.txt')
+        with self.assertRaises(locks.LockConflict):
+            self.check('/dir', descendants=True)
+        self.check('/dir', lock.token, descendants=True)
+
+    def testUnlock(self):
+        lock = self.lock('/dir/sub')
+        with self.assertRaises(locks.LockNotFound):
+            self.run_coro(self.manager.unlock('/other', lock.token))
+        self.run_coro(self.manager.unlock('/dir/sub/file.txt', lock.token))
+        self.check('/dir/sub', descendants=True)
+        # empty trie branches are pruned
+        self.assertDictEqual(self.manager._root.children, {})
+
+    def testExpire(self):
+        with mock.patch('time.monotonic', return_value=100):
+            lock = self.lock('/dir', timeout=10)
+        with mock.patch('time.monotonic', return_value=105):
+            self.run_coro(self.manager.refresh('/dir', lock.token, 10))
+        with mock.patch('time.monotonic', return_value=111):
+            with self.assertRaises(locks.LockConflict):
+                self.check('/dir')
+        with mock.patch('time.monotonic', return_value=116):
+            self.check('/dir')
+            self.assertEqual(self.manager._root.count, 0)
+
+    def testMaxTimeout(self):
+        lock = self.lock('/dir')
+        self.assertEqual(lock.timeout, self.manager.max_timeout)
+
+    def testDiscoverAndRemove(self):
+        first = self.lock('/dir', scope=locks.SHARED)
+        second = self.lock('/dir/file.txt', scope=locks.SHARED)
+        found = self.run_coro(self.manager.discover('/dir/file.txt'))
+        self.assertSetEqual({l.token for l in found},
+                            {first.token, second.token})
+        self.run_coro(self.manager.remove('/dir/file.txt'))
+        found = self.run_coro(self.manager.discover('/dir/file.txt'))
+        self.assertListEqual(found, [first])
+
+
+@async_test
+class LockViewTestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = DummyResource('prefix')
+
+    @classmethod
+    def tearDownClass(cls):
+        DummyResource._root = None
+
+    def init_app(self, loop):
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False)
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        self.root._resources.clear()
+
+    async def lock(self, url, scope='exclusive', **headers):
+        response = await self.client.request('LOCK', url, headers=headers,
+                                             body=LOCKINFO % scope.encode())
+        return response
+
+    async def testLockAndPut(self):
+        f = self.root / 'f.txt'
+        await fill_file(f)
+        response = await self.lock('/prefix/f.txt', Timeout='Second-600')
+        self.assertEqual(response.status, 200)
+        token = response.headers['Lock-Token']
+        doc = et.fromstring(response.body)
+        ns = {'D': 'DAV:'}
+        self.assertEqual(
+            doc.xpath('//D:locktoken/D:href', namespaces=ns)[0].text,
+            token.strip('<>'))
+        self.assertEqual(doc.xpath('//D:timeout', namespaces=ns)[0].text,
+                         'Second-600')
+        self.assertEqual(
+            doc.xpath('//D:lockroot/D:href', namespaces=ns)[0].text,
+            '/prefix/f.txt')
+        self.assertEqual(
+            doc.xpath('//D:owner/D:href', namespaces=ns)[0].text,
+            'mailto:user@example.com')
+
+        response = await self.client.put('/prefix/f.txt', body=b'NEW')
+        self.assertEqual(response.status, 423)
+        response = await self.client.put('/prefix/f.txt', body=b'NEW',
+                                         headers={'If': '(%s)' % token})
+        self.assertEqual(response.status, 200)
+
+    async def testSharedLockHolders(self):
+        await fill_file(self.root / 'f.txt')
+        tokens = []
+        for _ in range(2):
+            response = await self.lock('/prefix/f.txt', scope='shared')
+            self.assertEqual(response.status, 200)
+            tokens.append(response.headers['Lock-Token'])
+        for token in tokens:
+            response = await self.client.put('/prefix/f.txt', body=b'NEW',
+                                             headers={'If': '(%s)' % token})
+            self.assertEqual(response.status, 200)
+        response = await self.client.put('/prefix/f.txt', body=b'NEW')
+        self.assertEqual(response.status, 423)
+
+    async def testLockConflict(self):
+        d = await self.root.make_collection('dir')
+        await fill_file(d / 'f.txt')
+        response = await self.lock('/prefix/dir/f.txt')
+        self.assertEqual(response.status, 200)
+        response = await self.lock('/prefix/dir/')
+        self.assertEqual(response.status, 423)
+        response = await self.client.delete('/prefix/dir/')
+        self.assertEqual(response.status, 423)
+        response = await self.client.request(
+            'MOVE', '/prefix/dir/', headers={'Destination': '/prefix/new/'})
+        self.assertEqual(response.status, 423)
+
+    async def testLockUnmapped(self):
+        response = await self.lock('/prefix/new.txt')
+        self.assertEqual(response.status, 201)
+        resource = self.root / 'new.txt'
+        await resource.populate_props()
+        self.assertEqual(resource.size, 0)
+        response = await self.lock('/prefix/missing/new.txt')
+        self.assertEqual(response.status, 409)
+
+    async def testRefreshAndUnlock(self):
+        await fill_file(self.root / 'f.txt')
+        response = await self.lock('/prefix/f.txt')
+        token = response.headers['Lock-Token']
+        response = await self.client.request(
+            'LOCK', '/prefix/f.txt',
+            headers={'If': '(%s)' % token, 'Timeout': 'Second-60'})
+        self.assertEqual(response.status, 200)
+        self.assertIn(b'Second-60', response.body)
+        response = await self.client.request(
+            'UNLOCK', '/prefix/f.txt', headers={'Lock-Token': '<bad>'})
+        self.assertEqual(response.status, 409)
+        response = await self.client.request(
+            'UNLOCK', '/prefix/f.txt', headers={'Lock-Token': token})
+        self.assertEqual(response.status, 204)
+        response = await self.client.put('/prefix/f.txt', body=b'NEW')
+        self.assertEqual(response.status, 200)
+
+    async def testPropfindLockDiscovery(self):
+        await fill_file(self.root / 'f.txt')
+        response = await self.lock('/prefix/f.txt', scope='shared')
+        token = response.headers['Lock-Token'].strip('<>')
+        body = b'''<?xml version="1.0" encoding="utf-8" ?>
+<D:propfind xmlns:D="DAV:"><D:prop>
+    <D:lockdiscovery/><D:supportedlock/>
+</D:prop></D:propfind>'''
+        response = await self.client.request(
+            'PROPFIND', '/prefix/', headers={'Depth': '1'}, body=body)
+        self.assertEqual(response.status, 207)
+        doc = et.fromstring(response.body)
+        ns = {'D': 'DAV:'}
+        hrefs = doc.xpath('//D:lockdiscovery//D:locktoken/D:href/text()',
+                          namespaces=ns)
+        self.assertListEqual(hrefs, [token])
+        entries = doc.xpath('//D:supportedlock/D:lockentry', namespaces=ns)
+        self.assertEqual(len(entries), 4)
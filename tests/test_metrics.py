@@ -0,0 +1,163 @@
+# coding: utf-8
+import asyncio
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav import conf
+from aiodav.contrib import setup
+from aiodav.contrib.metrics import DavMetrics, Registry
+from aiodav.resources import FileSystemResource
+from aiodav.resources.dummy import DummyResource
+from tests.helpers import fill_file
+
+
+__all__ = ['MetricsTestCase', 'MetricsEndpointTestCase']
+
+
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def testCounter(self):
+        counter = self.registry.counter('requests', 'Requests', ('method',))
+        counter.inc('GET')
+        counter.inc('GET', amount=2)
+        self.assertEqual(counter.value('GET'), 3)
+        self.assertIs(self.registry.counter('requests', 'Requests'), counter)
+        self.assertIn('requests{method="GET"} 3', self.registry.expose())
+
+    def testTypeConflict(self):
+        self.registry.counter('metric', 'Metric')
+        with self.assertRaises(ValueError):
+            self.registry.histogram('metric', 'Metric')
+
+    def testHistogram(self):
+        histogram = self.registry.histogram('latency', 'Latency', ('method',),
+                                            buckets=(0.1, 1.0))
+        histogram.observe(0.05, 'GET')
+        histogram.observe(0.5, 'GET')
+        histogram.observe(5, 'GET')
+        self.assertEqual(histogram.count('GET'), 3)
+        lines = self.registry.expose().splitlines()
+        self.assertListEqual(lines, [
+            '# HELP latency Latency',
+            '# TYPE latency histogram',
+            'latency_bucket{method="GET",le="0.1"} 1',
+            'latency_bucket{method="GET",le="1.0"} 2',
+            'latency_bucket{method="GET",le="+Inf"} 3',
+            'latency_sum{method="GET"} 5.55',
+            'latency_count{method="GET"} 3',
+        ])
+
+    def testInstrumentMount(self):
+        loop = asyncio.new_event_loop()
+        root_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(root_dir, 'dir'))
+        try:
+            mounted = FileSystemResource('a', root_dir=root_dir)
+            other = FileSystemResource('b', root_dir=root_dir)
+            metrics = DavMetrics(self.registry)
+            metrics.instrument(mounted)
+            metrics.instrument(mounted)
+            for resource in mounted / 'dir', other:
+                loop.run_until_complete(resource.populate_props())
+            self.assertEqual(metrics.backend.count('populate_props', 'a'), 1)
+            self.assertEqual(metrics.backend.count('populate_props', 'b'), 0)
+            # other registry records timings too
+            second = DavMetrics(Registry())
+            second.instrument(mounted)
+            loop.run_until_complete(mounted.populate_props())
+            self.assertEqual(metrics.backend.count('populate_props', 'a'), 2)
+            self.assertEqual(second.backend.count('populate_props', 'a'), 1)
+        finally:
+            loop.close()
+            shutil.rmtree(root_dir)
+
+    def testLabelEscaping(self):
+        gauge = self.registry.gauge('gauge', 'Gauge', ('path',))
+        gauge.set(1, 'a"b\\c')
+        self.assertIn(r'gauge{path="a\"b\\c"} 1', self.registry.expose())
+
+
+@async_test
+class MetricsEndpointTestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = DummyResource('prefix')
+
+    @classmethod
+    def tearDownClass(cls):
+        DummyResource._root = None
+
+    def init_app(self, loop):
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False,
+              metrics=True)
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        self.root._resources.clear()
+
+    async def testMetricsEndpoint(self):
+        f = self.root / 'filename.txt'
+        await fill_file(f)
+        response = await self.client.request('PROPFIND', '/prefix/',
+                                             headers={'Depth': '1'})
+        self.assertEqual(response.status, 207)
+        response = await self.client.get('/prefix/filename.txt')
+        self.assertEqual(response.status, 200)
+
+        response = await self.client.get('/metrics')
+        self.assertEqual(response.status, 200)
+        self.assertTrue(
+            response.headers['Content-Type'].startswith('text/plain'))
+        text = response.text
+        self.assertIn('aiodav_requests_total{method="PROPFIND",'
+                      'mount="prefix",status="207"}', text)
+        self.assertIn('aiodav_request_duration_seconds_count'
+                      '{method="GET",mount="prefix"}', text)
+        self.assertIn('aiodav_response_bytes_total'
+                      '{method="GET",mount="prefix"}', text)
+        self.assertIn('aiodav_requests_in_progress'
+                      '{method="GET",mount=""} 1', text)
+        self.assertIn('aiodav_backend_duration_seconds_count'
+                      '{operation="populate_props",mount="prefix"}', text)
+        # mounted resource is instrumented once, other instances are not
+        self.assertEqual(type(self.root).__bases__, (DummyResource,))
+        self.assertFalse(hasattr(DummyResource, '_aiodav_backend'))
+
+    async def testTransferredBytes(self):
+        metrics = self.app[conf.APP_KEY]['metrics']
+        # registry is shared with other tests
+        received = metrics.bytes_in.value('PUT', 'prefix')
+        sent = metrics.bytes_out.value('GET', 'prefix')
+        # chunked request has no Content-Length
+        with mock.patch.object(web.Request, 'content_length',
+                               new_callable=mock.PropertyMock,
+                               return_value=None):
+            response = await self.client.put('/prefix/f.txt',
+                                             body=b'x' * 100)
+        self.assertEqual(response.status, 201)
+        self.assertEqual(metrics.bytes_in.value('PUT', 'prefix'),
+                         received + 100)
+        response = await self.client.get('/prefix/?events&timeout=0')
+        self.assertEqual(response.status, 200)
+        # streamed response
+        self.assertEqual(metrics.bytes_out.value('GET', 'prefix'),
+                         sent + len(response.body))
+
+    async def testUnknownMethod(self):
+        response = await self.client.request('BREW', '/prefix/')
+        self.assertEqual(response.status, 405)
+        response = await self.client.get('/metrics')
+        self.assertIn('aiodav_requests_total{method="other",'
+                      'mount="prefix",status="405"}', response.text)
+        self.assertNotIn('BREW', response.text)
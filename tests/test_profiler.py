@@ -0,0 +1,96 @@
+# coding: utf-8
+import os
+import pstats
+import shutil
+import tempfile
+
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav.contrib import setup
+from aiodav.resources.dummy import DummyResource
+
+
+__all__ = ['ProfilerTestCase']
+
+
+@async_test
+class ProfilerTestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = DummyResource('prefix')
+
+    @classmethod
+    def tearDownClass(cls):
+        DummyResource._root = None
+
+    def init_app(self, loop):
+        self.directory = tempfile.mkdtemp()
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False,
+              profiler={'directory': self.directory, 'token': 'secret',
+                        'keep': 2})
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.directory)
+
+    @property
+    def profiler(self):
+        return self.app['aiodav']['profiler']
+
+    async def testNoHeader(self):
+        response = await self.client.request('PROPFIND', '/prefix/')
+        self.assertEqual(response.status, 207)
+        response = await self.client.request(
+            'PROPFIND', '/prefix/', headers={'X-Aiodav-Profile': 'wrong'})
+        self.assertEqual(response.status, 207)
+        self.assertListEqual(os.listdir(self.directory), [])
+
+    async def testProfileRequest(self):
+        headers = {'X-Aiodav-Profile': 'secret'}
+        response = await self.client.request('PROPFIND', '/prefix/',
+                                             headers=headers)
+        self.assertEqual(response.status, 207)
+        profile, = self.profiler.profiles
+        self.assertEqual(profile['method'], 'PROPFIND')
+        self.assertEqual(profile['path'], '/prefix/')
+        self.assertEqual(profile['status'], 207)
+        stats = pstats.Stats(os.path.join(self.directory, profile['name']))
+        self.assertTrue(stats.total_calls)
+
+        response = await self.client.get('/_profiles/')
+        self.assertEqual(response.status, 403)
+        response = await self.client.get('/_profiles/?token=secret')
+        self.assertEqual(response.status, 403)
+        response = await self.client.get('/_profiles/', headers=headers)
+        self.assertEqual(response.status, 200)
+        self.assertIn(profile['name'], response.text)
+        response = await self.client.get('/_profiles/%s' % profile['name'],
+                                         headers=headers)
+        self.assertEqual(response.status, 200)
+
+    async def testAccess(self):
+        self.assertFalse(self.profiler.authorized('секрет'))
+        self.assertTrue(self.profiler.authorized('secret'))
+        # profiles are not served without configured token
+        self.profiler.token = None
+        response = await self.client.get(
+            '/_profiles/', headers={'X-Aiodav-Profile': 'secret'})
+        self.assertEqual(response.status, 403)
+
+    async def testKeepRecent(self):
+        headers = {'X-Aiodav-Profile': 'secret'}
+        for _ in range(3):
+            await self.client.request('PROPFIND', '/prefix/', headers=headers)
+        self.assertEqual(len(self.profiler.profiles), 2)
+        self.assertSetEqual(set(os.listdir(self.directory)),
+                            {p['name'] for p in self.profiler.profiles})
+
+    async def testEveryNth(self):
+        self.profiler.every = 2
+        for _ in range(4):
+            await self.client.request('PROPFIND', '/prefix/')
+        self.assertEqual(len(self.profiler.profiles), 2)
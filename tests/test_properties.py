@@ -0,0 +1,249 @@
+# coding: utf-8
+import asyncio
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from lxml import etree as et
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav.contrib import setup
+from aiodav.properties import STORE_NAME, SQLitePropertyStore, default_store
+from aiodav.resources import FileSystemResource
+from aiodav.resources.dummy import DummyResource
+from tests.helpers import fill_file
+
+
+__all__ = ['SQLitePropertyStoreTestCase', 'PropPatchTestCase',
+           'DefaultStoreTestCase']
+
+PROPPATCH = b'''<?xml version="1.0" encoding="utf-8" ?>
+<D:propertyupdate xmlns:D="DAV:" xmlns:Z="urn:schemas-microsoft-com:">
+    <D:set><D:prop>
+        <Z:Win32FileAttributes>00000020</Z:Win32FileAttributes>
+        <Z:Win32LastAccessTime>Mon, 01 Jan 2018 00:00:00 GMT</Z:Win32LastAccessTime>
+    </D:prop></D:set>
+    <D:remove><D:prop><Z:Win32LastAccessTime/></D:prop></D:remove>
+</D:propertyupdate>'''
+
+ATTRS = '{urn:schemas-microsoft-com:}Win32FileAttributes'
+
+
+class SQLitePropertyStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.store = SQLitePropertyStore(loop=self.loop)
+
+    def tearDown(self):
+        self.store.close()
+        self.loop.close()
+
+    def run_coro(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def fill(self, *paths):
+        for path in paths:
+            self.run_coro(self.store.update(path, [('{ns}a', b'<a/>'),
+                                                   ('{ns}b', b'<b/>')]))
+
+    def get(self, *paths, names=None):
+        return self.run_coro(self.store.get(paths, names))
+
+    def testUpdate(self):
+        self.fill('dir/f.txt')
+        self.run_coro(self.store.update('/dir/f.txt/', [
+            ('{ns}a', None), ('{ns}b', b'<b>1</b>')]))
+        self.assertDictEqual(self.get('/dir/f.txt'),
+                             {'/dir/f.txt': {'{ns}b': b'<b>1</b>'}})
+
+    def testGetBatch(self):
+        self.fill('/a', '/b')
+        self.store.batch_size = 3
+        result = self.get('/a', '/b', '/c', names=['{ns}a'])
+        self.assertDictEqual(result, {'/a': {'{ns}a': b'<a/>'},
+                                      '/b': {'{ns}a': b'<a/>'},
+                                      '/c': {}})
+        self.assertDictEqual(self.get('/a', names=[]), {'/a': {}})
+
+    def testMove(self):
+        self.fill('/dir', '/dir/f.txt', '/dir-2/f.txt', '/new/old.txt')
+        self.run_coro(self.store.move('/dir', '/new'))
+        result = self.get('/dir', '/dir/f.txt', '/dir-2/f.txt', '/new',
+                          '/new/f.txt', '/new/old.txt', names=['{ns}a'])
+        self.assertListEqual([p for p, v in result.items() if v],
+                             ['/dir-2/f.txt', '/new', '/new/f.txt'])
+
+    def testCopy(self):
+        self.fill('/dir/f.txt')
+        self.run_coro(self.store.copy('/dir', '/new'))
+        result = self.get('/dir/f.txt', '/new/f.txt')
+        self.assertEqual(result['/dir/f.txt'], result['/new/f.txt'])
+        self.assertTrue(result['/new/f.txt'])
+
+    def testDelete(self):
+        self.fill('/dir', '/dir/f.txt', '/dir.txt')
+        self.run_coro(self.store.delete('/dir'))
+        result = self.get('/dir', '/dir/f.txt', '/dir.txt')
+        self.assertListEqual([p for p, v in result.items() if v],
+                             ['/dir.txt'])
+        self.run_coro(self.store.delete('/'))
+        self.assertDictEqual(self.get('/dir.txt'), {'/dir.txt': {}})
+
+
+@async_test
+class PropPatchTestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = DummyResource('prefix')
+
+    @classmethod
+    def tearDownClass(cls):
+        DummyResource._root = None
+
+    def init_app(self, loop):
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False)
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        self.root._resources.clear()
+
+    async def propfind(self, url, body=None, depth=0):
+        response = await self.client.request(
+            'PROPFIND', url, headers={'Depth': str(depth)}, body=body)
+        self.assertEqual(response.status, 207)
+        return et.fromstring(response.body)
+
+    async def testPropPatch(self):
+        await fill_file(self.root / 'f.txt')
+        response = await self.client.request('PROPPATCH', '/prefix/f.txt',
+                                             body=PROPPATCH)
+        self.assertEqual(response.status, 207)
+        doc = et.fromstring(response.body)
+        ns = {'D': 'DAV:'}
+        self.assertEqual(doc.xpath('//D:status', namespaces=ns)[0].text,
+                         'HTTP/1.1 200 OK')
+        self.assertEqual(len(doc.xpath('//D:prop/*', namespaces=ns)), 3)
+
+        body = b'''<?xml version="1.0" encoding="utf-8" ?>
+<D:propfind xmlns:D="DAV:" xmlns:Z="urn:schemas-microsoft-com:"><D:prop>
+    <Z:Win32FileAttributes/><Z:Win32LastAccessTime/><D:displayname/>
+</D:prop></D:propfind>'''
+        doc = await self.propfind('/prefix/', body, depth=1)
+        props = doc.xpath('//D:response[D:href="/prefix/f.txt"]//D:prop/*',
+                          namespaces=ns)
+        self.assertListEqual([p.tag for p in props],
+                             ['{DAV:}displayname', '{DAV:}resourcetype',
+                              ATTRS])
+        self.assertEqual(props[2].text, '00000020')
+
+        # allprop includes dead properties
+        doc = await self.propfind('/prefix/f.txt')
+        self.assertEqual(len(doc.xpath('//Z:Win32FileAttributes', namespaces={
+            'Z': 'urn:schemas-microsoft-com:'})), 1)
+
+    async def testProtectedProperty(self):
+        await fill_file(self.root / 'f.txt')
+        body = b'''<?xml version="1.0" encoding="utf-8" ?>
+<D:propertyupdate xmlns:D="DAV:" xmlns:Z="urn:z">
+    <D:set><D:prop><D:getetag>1</D:getetag><Z:x>1</Z:x></D:prop></D:set>
+</D:propertyupdate>'''
+        response = await self.client.request('PROPPATCH', '/prefix/f.txt',
+                                             body=body)
+        self.assertEqual(response.status, 207)
+        doc = et.fromstring(response.body)
+        statuses = doc.xpath('//D:status/text()', namespaces={'D': 'DAV:'})
+        self.assertListEqual(statuses, ['HTTP/1.1 403 Forbidden',
+                                        'HTTP/1.1 424 Failed Dependency'])
+
+    async def testPropPatchErrors(self):
+        response = await self.client.request('PROPPATCH', '/prefix/none.txt',
+                                             body=PROPPATCH)
+        self.assertEqual(response.status, 404)
+        response = await self.client.request('PROPPATCH', '/prefix/',
+                                             body=b'<D:x xmlns:D="DAV:"/>')
+        self.assertEqual(response.status, 400)
+
+    async def testMoveAndDelete(self):
+        d = await self.root.make_collection('dir')
+        await fill_file(d / 'f.txt')
+        response = await self.client.request('PROPPATCH', '/prefix/dir/f.txt',
+                                             body=PROPPATCH)
+        self.assertEqual(response.status, 207)
+        response = await self.client.request(
+            'MOVE', '/prefix/dir/f.txt',
+            headers={'Destination': '/prefix/dir/g.txt'})
+        self.assertEqual(response.status, 201)
+        doc = await self.propfind('/prefix/dir/g.txt')
+        self.assertEqual(len(doc.xpath('//Z:Win32FileAttributes', namespaces={
+            'Z': 'urn:schemas-microsoft-com:'})), 1)
+        # resource is moved into existing collection
+        await self.root.make_collection('other')
+        response = await self.client.request(
+            'MOVE', '/prefix/dir/g.txt',
+            headers={'Destination': '/prefix/other'})
+        self.assertEqual(response.status, 201)
+        doc = await self.propfind('/prefix/other/g.txt')
+        self.assertEqual(len(doc.xpath('//Z:Win32FileAttributes', namespaces={
+            'Z': 'urn:schemas-microsoft-com:'})), 1)
+        response = await self.client.request(
+            'MOVE', '/prefix/other/g.txt',
+            headers={'Destination': '/prefix/dir/g.txt'})
+        self.assertEqual(response.status, 201)
+        response = await self.client.delete('/prefix/dir/')
+        self.assertEqual(response.status, 200)
+        d = await self.root.make_collection('dir')
+        await fill_file(d / 'g.txt')
+        doc = await self.propfind('/prefix/dir/g.txt')
+        self.assertEqual(len(doc.xpath('//Z:Win32FileAttributes', namespaces={
+            'Z': 'urn:schemas-microsoft-com:'})), 0)
+
+
+@async_test
+class DefaultStoreTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        self.root = FileSystemResource('prefix', root_dir=self.root_dir)
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False)
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.root_dir)
+
+    async def testFileStore(self):
+        await fill_file(self.root / 'f.txt')
+        response = await self.client.request('PROPPATCH', '/prefix/f.txt',
+                                             body=PROPPATCH)
+        self.assertEqual(response.status, 207)
+        self.assertIn(STORE_NAME, os.listdir(self.root_dir))
+        # properties survive server restart
+        store = default_store(self.root_dir)
+        try:
+            self.assertIn(ATTRS, (await store.get(['/f.txt']))['/f.txt'])
+            self.assertFalse(store.process_local)
+        finally:
+            store.close()
+        # store is hidden from clients
+        response = await self.client.request('PROPFIND', '/prefix/',
+                                             headers={'Depth': '1'})
+        self.assertNotIn(STORE_NAME, response.text)
+        response = await self.client.put('/prefix/' + STORE_NAME,
+                                         body=b'x')
+        self.assertEqual(response.status, 403)
+
+    def testMemoryStore(self):
+        store = default_store()
+        self.assertTrue(store.process_local)
+        store.close()
+        with self.assertLogs('aiodav.properties', 'WARNING'):
+            store = default_store(os.path.join(self.root_dir, 'missing'))
+        self.assertTrue(store.process_local)
+        store.close()
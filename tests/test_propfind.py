@@ -0,0 +1,141 @@
+# coding: utf-8
+import os
+from unittest import TestCase, mock
+
+from lxml import etree as et
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav.contrib import setup
+from aiodav.propfind import (PropfindParser, PropfindRequest, parse_propfind,
+                             ALLPROP, ALLPROP_REQUEST, PROPNAME, PROP)
+from aiodav.resources.dummy import DummyResource
+from tests.helpers import fill_file
+
+
+__all__ = ['PropfindParserTestCase', 'PropfindViewTestCase']
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                       'fixtures', 'second_propfind.xml')
+
+ALLPROP_BODY = b'''<?xml version="1.0" encoding="utf-8" ?>
+<propfind xmlns="DAV:"><allprop/></propfind>'''
+
+NS = {'D': 'DAV:'}
+
+
+class PropfindParserTestCase(TestCase):
+
+    def testFastPath(self):
+        with mock.patch('lxml.etree.fromstring') as fromstring:
+            self.assertIs(parse_propfind(b''), ALLPROP_REQUEST)
+            self.assertIs(parse_propfind(ALLPROP_BODY), ALLPROP_REQUEST)
+            self.assertIs(parse_propfind(
+                b'<D:propfind xmlns:D="DAV:">\n  <D:allprop/>\n'
+                b'</D:propfind>'), ALLPROP_REQUEST)
+        self.assertFalse(fromstring.called)
+        # element prefix is not bound to DAV: namespace
+        with self.assertRaises(et.XMLSyntaxError):
+            parse_propfind(b'<D:propfind xmlns:D="DAV:"><X:allprop/>'
+                           b'</D:propfind>')
+
+    def testParse(self):
+        with open(FIXTURE, 'rb') as f:
+            body = f.read()
+        self.assertEqual(parse_propfind(body), PropfindRequest(
+            PROP, ('resourcetype', 'getcontentlength'), ()))
+        self.assertEqual(parse_propfind(
+            b'<D:propfind xmlns:D="DAV:"><D:propname/></D:propfind>'),
+            PropfindRequest(PROPNAME, (), ()))
+        request = parse_propfind(
+            b'<D:propfind xmlns:D="DAV:" xmlns:Z="urn:z"><D:allprop/>'
+            b'<D:include><D:lockdiscovery/><Z:color/></D:include>'
+            b'</D:propfind>')
+        self.assertEqual(request, PropfindRequest(
+            ALLPROP, (), ('lockdiscovery', '{urn:z}color')))
+        self.assertEqual(request.names, ('lockdiscovery', '{urn:z}color'))
+        for body in (b'<D:lockinfo xmlns:D="DAV:"/>',
+                     b'<D:propfind xmlns:D="DAV:"/>'):
+            with self.assertRaises(ValueError):
+                parse_propfind(body)
+
+    def testCache(self):
+        parser = PropfindParser(max_body_size=100, cache_size=2)
+        bodies = [b'<propfind xmlns="DAV:"><prop><%s/></prop></propfind>' % n
+                  for n in (b'a', b'b', b'c')]
+        first = parser.parse(bodies[0])
+        with mock.patch('aiodav.propfind.parse_propfind') as parse:
+            self.assertIs(parser.parse(bodies[0]), first)
+        self.assertFalse(parse.called)
+        parser.parse(bodies[1])
+        parser.parse(bodies[0])
+        parser.parse(bodies[2])
+        # least recently used body is evicted
+        self.assertListEqual(list(parser._cache), [bodies[0], bodies[2]])
+        with self.assertRaises(ValueError):
+            parser.parse(b' ' * 101)
+
+
+@async_test
+class PropfindViewTestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = DummyResource('prefix')
+
+    @classmethod
+    def tearDownClass(cls):
+        DummyResource._root = None
+
+    def init_app(self, loop):
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False,
+              mount_options={'prefix': {
+                  'propfind_parser': PropfindParser(max_body_size=1024),
+                  'max_xml_body_size': 1024}})
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        self.root._resources.clear()
+
+    async def propfind(self, body, depth='0'):
+        response = await self.client.request(
+            'PROPFIND', '/prefix/f.txt', body=body, headers={'Depth': depth})
+        self.assertEqual(response.status, 207)
+        return et.fromstring(response.text.encode('utf-8'))
+
+    async def testPropname(self):
+        await fill_file(self.root / 'f.txt')
+        xml = await self.propfind(
+            b'<D:propfind xmlns:D="DAV:"><D:propname/></D:propfind>')
+        prop = xml.xpath('//D:prop', namespaces=NS)[0]
+        names = [e.tag for e in prop]
+        self.assertIn('{DAV:}getcontentlength', names)
+        self.assertIn('{DAV:}resourcetype', names)
+        self.assertTrue(all(e.text is None and not len(e) for e in prop))
+
+    async def testAllpropInclude(self):
+        await fill_file(self.root / 'f.txt')
+        xml = await self.propfind(ALLPROP_BODY)
+        self.assertListEqual(xml.xpath('//D:lockdiscovery', namespaces=NS),
+                             [])
+        xml = await self.propfind(
+            b'<D:propfind xmlns:D="DAV:"><D:allprop/>'
+            b'<D:include><D:lockdiscovery/></D:include></D:propfind>')
+        self.assertEqual(
+            len(xml.xpath('//D:lockdiscovery', namespaces=NS)), 1)
+        self.assertEqual(
+            len(xml.xpath('//D:getcontentlength', namespaces=NS)), 1)
+
+    async def testInvalidBody(self):
+        response = await self.client.request('PROPFIND', '/prefix/',
+                                             body=b'<propfind')
+        self.assertEqual(response.status, 400)
+        response = await self.client.request('PROPFIND', '/prefix/',
+                                             body=b' ' * 1025)
+        self.assertEqual(response.status, 413)
+        for method in 'PROPPATCH', 'LOCK', 'SEARCH', 'REPORT':
+            response = await self.client.request(method, '/prefix/',
+                                                 body=b' ' * 1025)
+            self.assertEqual(response.status, 413, method)
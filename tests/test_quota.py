@@ -0,0 +1,183 @@
+# coding: utf-8
+import asyncio
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from lxml import etree as et
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav.contrib import setup
+from aiodav.quota import Quota
+from aiodav.resources import FileSystemResource
+from aiodav.resources.dummy import DummyResource
+from tests.helpers import fill_file
+
+
+__all__ = ['QuotaTestCase', 'QuotaViewTestCase']
+
+PROPFIND = b'''<?xml version="1.0" encoding="utf-8" ?>
+<D:propfind xmlns:D="DAV:">
+    <D:prop><D:quota-used-bytes/><D:quota-available-bytes/></D:prop>
+</D:propfind>'''
+
+
+class QuotaTestCase(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.root = DummyResource('prefix')
+        self.quota = Quota(limit=100)
+
+    def tearDown(self):
+        self.loop.close()
+        self.root._resources.clear()
+        DummyResource._root = None
+
+    def run_coro(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def fill_tree(self):
+        d = self.run_coro(self.root.make_collection('dir'))
+        sub = self.run_coro(d.make_collection('sub'))
+        self.run_coro(fill_file(self.root / 'a.txt', b'1' * 10))
+        self.run_coro(fill_file(d / 'b.txt', b'2' * 20))
+        self.run_coro(fill_file(sub / 'c.txt', b'3' * 30))
+        self.run_coro(self.quota.ensure(self.root))
+
+    def testCompute(self):
+        self.fill_tree()
+        self.assertEqual(self.quota.used, 60)
+        self.assertEqual(self.quota.available, 40)
+        self.assertEqual(self.quota.usage('/dir'), 50)
+        self.assertEqual(self.quota.usage('/dir/sub'), 30)
+        self.assertIsNone(self.quota.usage('/a.txt'))
+
+    def testSymlinkLoop(self):
+        root_dir = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(root_dir, 'dir'))
+            with open(os.path.join(root_dir, 'dir', 'f.txt'), 'wb') as f:
+                f.write(b'x' * 10)
+            os.symlink(root_dir, os.path.join(root_dir, 'dir', 'loop'))
+            root = FileSystemResource('prefix', root_dir=root_dir)
+            self.run_coro(self.quota.ensure(root))
+            self.assertEqual(self.quota.used, 10)
+            self.assertEqual(self.quota.usage('/dir/loop'), 0)
+        finally:
+            shutil.rmtree(root_dir)
+
+    def testAllows(self):
+        self.fill_tree()
+        self.assertTrue(self.quota.allows(40))
+        self.assertFalse(self.quota.allows(41))
+        self.assertTrue(self.quota.allows(None))
+        self.quota.add('/new.txt', 40)
+        self.assertFalse(self.quota.allows(None))
+        self.assertTrue(Quota().allows(10 ** 12))
+
+    def testUpdates(self):
+        self.fill_tree()
+        self.quota.add('/dir/sub/c.txt', 5)
+        self.assertEqual(self.quota.usage('/dir'), 55)
+        self.quota.copy('/dir/sub', '/copy')
+        self.assertEqual(self.quota.usage('/copy'), 35)
+        self.assertEqual(self.quota.used, 100)
+        self.quota.move('/dir/sub', '/moved')
+        self.assertEqual(self.quota.usage('/dir'), 20)
+        self.assertEqual(self.quota.usage('/moved'), 35)
+        self.quota.move('/a.txt', '/dir/a.txt', 10)
+        self.assertEqual(self.quota.usage('/dir'), 30)
+        self.quota.remove('/moved')
+        self.quota.remove('/dir/b.txt', 20)
+        self.assertEqual(self.quota.usage('/dir'), 10)
+        self.assertEqual(self.quota.used, 45)
+        self.quota.make_collection('/dir/new')
+        self.assertEqual(self.quota.usage('/dir/new'), 0)
+
+
+@async_test
+class QuotaViewTestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = DummyResource('prefix')
+
+    @classmethod
+    def tearDownClass(cls):
+        DummyResource._root = None
+
+    def init_app(self, loop):
+        app = web.Application(loop=loop)
+        self.quota = Quota(limit=20)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False,
+              mount_options={'prefix': {'quota': self.quota}})
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        self.root._resources.clear()
+
+    async def propfind(self, url):
+        response = await self.client.request('PROPFIND', url, body=PROPFIND,
+                                             headers={'Depth': '1'})
+        self.assertEqual(response.status, 207)
+        doc = et.fromstring(response.body)
+        ns = {'D': 'DAV:'}
+        return {
+            r.findtext('D:href', namespaces=ns): (
+                r.findtext('.//D:quota-used-bytes', namespaces=ns),
+                r.findtext('.//D:quota-available-bytes', namespaces=ns))
+            for r in doc.xpath('//D:response', namespaces=ns)}
+
+    async def testPutLimit(self):
+        response = await self.client.put('/prefix/f.txt', body=b'1' * 15)
+        self.assertEqual(response.status, 201)
+        response = await self.client.put('/prefix/g.txt', body=b'2' * 10)
+        self.assertEqual(response.status, 507)
+        self.assertFalse((self.root / 'g.txt')._exists)
+        # overwrite is accounted by size difference
+        response = await self.client.put('/prefix/f.txt', body=b'3' * 20)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.quota.used, 20)
+
+    async def testPutStreamLimit(self):
+        # body length is not known in advance
+        response = await self.client.put(
+            '/prefix/f.txt', body=b'1' * 25, headers={'CONTENT-LENGTH': '1'})
+        self.assertEqual(response.status, 507)
+        self.assertFalse((self.root / 'f.txt')._exists)
+        self.assertEqual(self.quota.used, 0)
+        response = await self.client.put(
+            '/prefix/f.txt', body=b'1' * 20, headers={'CONTENT-LENGTH': '1'})
+        self.assertEqual(response.status, 201)
+        self.assertEqual(self.quota.used, 20)
+
+    async def testPropfind(self):
+        await self.client.request('MKCOL', '/prefix/dir/')
+        await self.client.put('/prefix/dir/f.txt', body=b'1' * 5)
+        await self.client.put('/prefix/g.txt', body=b'2' * 3)
+        props = await self.propfind('/prefix/')
+        self.assertEqual(props['/prefix/'], ('8', '12'))
+        self.assertEqual(props['/prefix/dir'], ('5', '12'))
+        self.assertEqual(props['/prefix/g.txt'], (None, None))
+
+    async def testMoveCopyDelete(self):
+        await self.client.request('MKCOL', '/prefix/dir/')
+        await self.client.put('/prefix/dir/f.txt', body=b'1' * 5)
+        response = await self.client.request(
+            'COPY', '/prefix/dir/f.txt',
+            headers={'Destination': '/prefix/f.txt'})
+        self.assertEqual(response.status, 201)
+        self.assertEqual(self.quota.used, 10)
+        response = await self.client.request(
+            'MOVE', '/prefix/f.txt',
+            headers={'Destination': '/prefix/g.txt'})
+        self.assertEqual(response.status, 201)
+        self.assertEqual(self.quota.usage('/dir'), 5)
+        self.assertEqual(self.quota.used, 10)
+        response = await self.client.delete('/prefix/dir/')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.quota.used, 5)
@@ -0,0 +1,172 @@
+# coding: utf-8
+import asyncio
+import shutil
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from lxml import etree as et
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav import conf, views
+from aiodav.contrib import setup, add_mount, remove_mount
+from aiodav.resources import FileSystemResource
+from aiodav.resources.index import MetadataIndex
+from aiodav.routing import MountDispatcher
+from tests.helpers import fill_file
+from tests.test_locks import LOCKINFO
+from tests.test_search import searchrequest
+from tests.test_sync import sync_body
+
+
+__all__ = ['MountDispatcherTestCase', 'RuntimeMountsTestCase',
+           'RootMountTestCase']
+
+NS = {'D': 'DAV:'}
+
+
+class MountDispatcherTestCase(TestCase):
+
+    def setUp(self):
+        self.dispatcher = MountDispatcher()
+        for prefix in ('a', 'a/b/c', 'x'):
+            self.add(prefix)
+
+    def add(self, prefix):
+        self.dispatcher.add_mount(
+            prefix, views.ResourceView.with_resource(None, prefix))
+
+    def assertMatch(self, path, prefix, relative):
+        route, rel = self.dispatcher.match(path)
+        self.assertEqual((route.handler.prefix, rel), (prefix, relative))
+
+    def testLongestPrefix(self):
+        self.assertMatch('/a', 'a', '')
+        self.assertMatch('/a/', 'a', '/')
+        self.assertMatch('/a/b', 'a', '/b')
+        self.assertMatch('/a/b/c/d', 'a/b/c', '/d')
+        self.assertMatch('/x/%D1%84%20.txt', 'x', '/ф .txt')
+        self.assertIsNone(self.dispatcher.match('/ab'))
+        self.assertIsNone(self.dispatcher.match('/'))
+
+    def testRemove(self):
+        self.add('a/b')
+        self.assertMatch('/a/b/d', 'a/b', '/d')
+        self.dispatcher.remove_mount('a/b/c')
+        self.assertMatch('/a/b/c', 'a/b', '/c')
+        self.dispatcher.remove_mount('a/b')
+        self.assertMatch('/a/b/c', 'a', '/b/c')
+        self.assertDictEqual(self.dispatcher._root.children['a'].children, {})
+        self.assertEqual(len(self.dispatcher), 2)
+        with self.assertRaises(KeyError):
+            self.dispatcher.remove_mount('a/b')
+        with self.assertRaises(ValueError):
+            self.add('/x/')
+
+
+@async_test
+class RuntimeMountsTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        self.app = web.Application(loop=loop)
+        setup(self.app, mounts={'prefix': FileSystemResource(
+            'prefix', root_dir=self.root_dir)}, hack_debugtoolbar=False)
+        return self.app
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.root_dir)
+
+    async def testAddRemove(self):
+        response = await self.client.request('PROPFIND', '/other/')
+        self.assertEqual(response.status, 404)
+        add_mount(self.app, 'other',
+                  FileSystemResource('other', root_dir=self.root_dir))
+        response = await self.client.request('PROPFIND', '/other/')
+        self.assertEqual(response.status, 207)
+        self.assertListEqual(
+            sorted(self.app[conf.APP_KEY]['mounts']), ['other', 'prefix'])
+        route, _ = self.app[conf.APP_KEY]['dispatcher'].match('/other/')
+        feed = route.handler.kw['change_feed']
+        store = route.handler.kw['property_store']
+        await feed.watch_journal()
+        self.assertIsNotNone(feed._watcher)
+
+        remove_mount(self.app, 'other')
+        response = await self.client.request('PROPFIND', '/other/')
+        self.assertEqual(response.status, 404)
+        # watcher and store of removed mount are closed
+        self.assertIsNone(feed._watcher)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            await store.get(['/'])
+        response = await self.client.request('PROPFIND', '/prefix/')
+        self.assertEqual(response.status, 207)
+
+    async def testPrefixSlashes(self):
+        resource = FileSystemResource('other', root_dir=self.root_dir)
+        add_mount(self.app, '/other/', resource)
+        self.assertIn('other', self.app[conf.APP_KEY]['mounts'])
+        response = await self.client.request('PROPFIND', '/other/')
+        self.assertEqual(response.status, 207)
+        with self.assertRaises(ValueError):
+            add_mount(self.app, 'other', resource)
+        self.assertIs(remove_mount(self.app, 'other'), resource)
+        self.assertListEqual(list(self.app[conf.APP_KEY]['mounts']),
+                             ['prefix'])
+
+
+@async_test
+class RootMountTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        # filesystem search requires metadata index
+        self.index = MetadataIndex(':memory:', self.root_dir,
+                                   rescan_interval=3600, loop=loop)
+        self.root = FileSystemResource('', root_dir=self.root_dir,
+                                       index=self.index)
+        app = web.Application(loop=loop)
+        setup(app, prefix='/index/', hack_debugtoolbar=False,
+              mounts={'': self.root})
+        return app
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.index.stop())
+        self.index.close()
+        super().tearDown()
+        shutil.rmtree(self.root_dir)
+
+    async def request(self, method, path, body, status=207, headers=None):
+        response = await self.client.request(method, path, body=body,
+                                             headers=headers)
+        self.assertEqual(response.status, status)
+        return et.fromstring(response.text.encode('utf-8'))
+
+    async def testSearch(self):
+        await fill_file(self.root / 'a.txt')
+        self.index.start()
+        while not self.index.fresh:
+            await asyncio.sleep(0.01)
+        xml = await self.request('SEARCH', '/', searchrequest('/'))
+        self.assertListEqual(xml.xpath('D:response/D:href/text()',
+                                       namespaces=NS), ['/a.txt'])
+
+    async def testSyncCollection(self):
+        await fill_file(self.root / 'a.txt')
+        xml = await self.request('REPORT', '/', sync_body())
+        token = xml.findtext('{DAV:}sync-token')
+        self.assertListEqual(xml.xpath('D:response/D:href/text()',
+                                       namespaces=NS), ['/a.txt'])
+        response = await self.client.delete('/a.txt')
+        self.assertEqual(response.status, 200)
+        xml = await self.request('REPORT', '/', sync_body(token))
+        self.assertListEqual(xml.xpath('D:response/D:href/text()',
+                                       namespaces=NS), ['/a.txt'])
+
+    async def testLockRoot(self):
+        await fill_file(self.root / 'a.txt')
+        xml = await self.request('LOCK', '/a.txt', LOCKINFO % b'exclusive',
+                                 status=200, headers={'Timeout': 'Second-60'})
+        self.assertListEqual(xml.xpath('//D:lockroot/D:href/text()',
+                                       namespaces=NS), ['/a.txt'])
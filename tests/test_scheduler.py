@@ -0,0 +1,98 @@
+# coding: utf-8
+import asyncio
+import threading
+from unittest import TestCase
+
+from aiohttp_tests import async_test
+
+from aiodav.resources import FileSystemResource
+from aiodav.scheduler import IOScheduler, METADATA, BULK
+from tests.test_filesystem_backend import FileSystemBackendTestCase
+
+
+__all__ = ['IOSchedulerTestCase', 'ScheduledFileSystemBackendTestCase']
+
+
+class IOSchedulerTestCase(TestCase):
+
+    def setUp(self):
+        self.order = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def block(self):
+        self.started.set()
+        self.gate.wait(5)
+
+    def call(self, name):
+        self.order.append(name)
+        return name
+
+    def testWeightedOrder(self):
+        scheduler = IOScheduler(1, weights={METADATA: 2, BULK: 1},
+                                limits={BULK: 1})
+        blocker = scheduler.submit(BULK, self.block)
+        self.started.wait(5)
+        futures = [scheduler.submit(BULK, self.call, 'b%d' % i)
+                   for i in range(3)]
+        futures += [scheduler.submit(METADATA, self.call, 'm%d' % i)
+                    for i in range(4)]
+        self.assertEqual(scheduler.queued(BULK), 3)
+        self.assertEqual(scheduler.queued(METADATA), 4)
+        self.gate.set()
+        for future in [blocker] + futures:
+            future.result(5)
+        scheduler.shutdown()
+        # metadata calls take two slots for each bulk slot
+        self.assertListEqual(self.order,
+                             ['m0', 'b0', 'm1', 'm2', 'b1', 'm3', 'b2'])
+
+    def testBulkLimit(self):
+        scheduler = IOScheduler(2)
+        bulk = [scheduler.submit(BULK, self.block) for _ in range(2)]
+        # second bulk call waits, leaving a thread for metadata
+        metadata = scheduler.submit(METADATA, self.call, 'm')
+        self.assertEqual(metadata.result(5), 'm')
+        self.assertFalse(any(f.done() for f in bulk))
+        self.gate.set()
+        for future in bulk:
+            future.result(5)
+        scheduler.shutdown()
+
+    def testRun(self):
+        loop = asyncio.new_event_loop()
+        scheduler = IOScheduler(2, loop=loop)
+        try:
+            result = loop.run_until_complete(
+                scheduler.run('populate_props', self.call, 'stat'))
+            self.assertEqual(result, 'stat')
+            with self.assertRaises(ZeroDivisionError):
+                loop.run_until_complete(
+                    scheduler.run('get_content', lambda: 1 / 0))
+        finally:
+            scheduler.shutdown()
+            loop.close()
+        with self.assertRaises(RuntimeError):
+            scheduler.submit(METADATA, self.call, 'late')
+
+
+@async_test
+class ScheduledFileSystemBackendTestCase(FileSystemBackendTestCase):
+    """ Filesystem backend tests with blocking calls made in scheduler."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.scheduler = IOScheduler(4)
+        cls.root = FileSystemResource('prefix', root_dir=cls.root_dir,
+                                      scheduler=cls.scheduler)
+
+    @classmethod
+    def create_resource(cls, *args, **kwargs):
+        kwargs.setdefault('scheduler', cls.scheduler)
+        return super().create_resource(*args, **kwargs)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.scheduler.shutdown()
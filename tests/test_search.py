@@ -0,0 +1,226 @@
+# coding: utf-8
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from lxml import etree as et
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav.contrib import setup
+from aiodav.resources import AbstractResource, FileSystemResource
+from aiodav.resources.dummy import DummyResource
+from aiodav.search import (SearchError, SearchQuery, parse_searchrequest,
+                           query_from_params, DEPTH_INFINITY)
+from tests.helpers import fill_file
+
+
+__all__ = ['SearchQueryTestCase', 'SearchViewTestCase']
+
+SEARCH = '''<?xml version="1.0" encoding="utf-8" ?>
+<D:searchrequest xmlns:D="DAV:">
+  <D:basicsearch>
+    <D:select><D:prop><D:displayname/><D:getcontentlength/></D:prop></D:select>
+    <D:from><D:scope>
+      <D:href>%s</D:href><D:depth>%s</D:depth>
+    </D:scope></D:from>
+    <D:where>%s</D:where>
+    <D:orderby><D:order>
+      <D:prop><D:getcontentlength/></D:prop><D:descending/>
+    </D:order></D:orderby>
+    <D:limit><D:nresults>10</D:nresults></D:limit>
+  </D:basicsearch>
+</D:searchrequest>'''
+
+WHERE = '''<D:and>
+  <D:like><D:prop><D:displayname/></D:prop><D:literal>%.txt</D:literal></D:like>
+  <D:gt><D:prop><D:getcontentlength/></D:prop><D:literal>3</D:literal></D:gt>
+  <D:not><D:is-collection/></D:not>
+</D:and>'''
+
+
+def searchrequest(href='/prefix/', depth='infinity', where=WHERE):
+    return (SEARCH % (href, depth, where)).encode('utf-8')
+
+
+class SearchQueryTestCase(TestCase):
+
+    def testParseSearchRequest(self):
+        query = parse_searchrequest(searchrequest('/prefix/dir/'), 'prefix')
+        self.assertEqual(query.scope, '/dir')
+        self.assertIs(query.depth, DEPTH_INFINITY)
+        self.assertListEqual(query.props, ['displayname', 'getcontentlength'])
+        self.assertEqual(query.where, ('and', [
+            ('like', 'name', '%.txt'),
+            ('gt', 'size', 3),
+            ('not', ('is-collection',)),
+        ]))
+        self.assertListEqual(query.order_by, [('size', True)])
+        self.assertEqual(query.limit, 10)
+
+    def testRelativeScope(self):
+        query = parse_searchrequest(searchrequest('sub', '1'), 'prefix',
+                                    base='dir')
+        self.assertEqual(query.scope, '/dir/sub')
+        self.assertEqual(query.depth, 1)
+
+    def testDateLiteral(self):
+        where = ('<D:lt><D:prop><D:getlastmodified/></D:prop>'
+                 '<D:literal>Mon, 01 Jan 2018 00:00:00 GMT</D:literal></D:lt>')
+        query = parse_searchrequest(searchrequest(where=where), 'prefix')
+        self.assertEqual(query.where, ('lt', 'mtime', 1514764800.0))
+
+    def testInvalidRequests(self):
+        invalid = [
+            '<D:eq><D:prop><D:getetag/></D:prop><D:literal/></D:eq>',
+            '<D:contains>text</D:contains>',
+            '<D:gt><D:prop><D:getcontentlength/></D:prop>'
+            '<D:literal>big</D:literal></D:gt>',
+            '<D:like><D:prop><D:getcontentlength/></D:prop>'
+            '<D:literal>1%</D:literal></D:like>',
+        ]
+        for where in invalid:
+            with self.assertRaises(SearchError):
+                parse_searchrequest(searchrequest(where=where), 'prefix')
+        with self.assertRaises(SearchError):
+            parse_searchrequest(searchrequest(depth='2'), 'prefix')
+        with self.assertRaises(SearchError):
+            parse_searchrequest(b'<D:searchrequest xmlns:D="DAV:"/>', 'prefix')
+
+    def testQueryFromParams(self):
+        query = query_from_params({
+            'search': 'f_*.txt', 'min_size': '10', 'type': 'file',
+            'modified_after': '2018-01-01', 'order': '-name', 'limit': '5',
+            'depth': '1'}, 'dir')
+        self.assertEqual(query.scope, '/dir')
+        self.assertEqual(query.depth, 1)
+        self.assertEqual(query.where, ('and', [
+            ('like', 'name', 'f\\_%.txt'),
+            ('gte', 'size', 10),
+            ('gte', 'mtime', 1514764800),
+            ('not', ('is-collection',)),
+        ]))
+        self.assertListEqual(query.order_by, [('name', True)])
+        self.assertEqual(query.limit, 5)
+        for params in {'type': 'link'}, {'order': 'etag'}, {'limit': 'x'}:
+            with self.assertRaises(SearchError):
+                query_from_params(params, '/')
+
+    def testSelect(self):
+        query = SearchQuery(where=('or', [
+            ('like', 'name', 'A%'), ('is-collection',)]),
+            order_by=[('size', False)], limit=2)
+        candidates = [
+            ('a1', {'name': 'a1', 'size': 3, 'is_collection': False}),
+            ('b', {'name': 'b', 'size': 0, 'is_collection': True}),
+            ('c', {'name': 'c', 'size': 1, 'is_collection': False}),
+            ('a2', {'name': 'a2', 'size': 2, 'is_collection': False}),
+        ]
+        self.assertListEqual(query.select(candidates), ['b', 'a2'])
+
+    def testDefaultSearchSymlinkLoop(self):
+        root_dir = tempfile.mkdtemp()
+        loop = asyncio.new_event_loop()
+        try:
+            os.mkdir(os.path.join(root_dir, 'dir'))
+            os.symlink(root_dir, os.path.join(root_dir, 'dir', 'loop'))
+            root = FileSystemResource('prefix', root_dir=root_dir)
+            loop.run_until_complete(root.populate_props())
+            # tree walk of backends without index
+            results = loop.run_until_complete(AbstractResource.search(
+                root, SearchQuery()))
+            self.assertListEqual(sorted(r.path for r in results),
+                                 ['/', '/dir', '/dir/loop'])
+        finally:
+            loop.close()
+            shutil.rmtree(root_dir)
+
+
+@async_test
+class SearchViewTestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = DummyResource('prefix')
+        cls.root_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        DummyResource._root = None
+        shutil.rmtree(cls.root_dir)
+
+    def init_app(self, loop):
+        app = web.Application(loop=loop)
+        fs = FileSystemResource('fs', root_dir=self.root_dir)
+        setup(app, mounts={'prefix': self.root, 'fs': fs},
+              hack_debugtoolbar=False)
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        self.root._resources.clear()
+
+    async def fill(self):
+        d = await self.root.make_collection('dir')
+        await fill_file(d / 'long.txt', content=b'long content')
+        await fill_file(d / 'short.txt', content=b'abc')
+        await fill_file(self.root / 'root.txt', content=b'root file content')
+        await fill_file(self.root / 'image.png', content=b'binary content')
+
+    async def testSearch(self):
+        await self.fill()
+        response = await self.client.request('SEARCH', '/prefix/',
+                                             body=searchrequest())
+        self.assertEqual(response.status, 207)
+        doc = et.fromstring(response.body)
+        ns = {'D': 'DAV:'}
+        hrefs = doc.xpath('//D:response/D:href/text()', namespaces=ns)
+        self.assertListEqual(hrefs, ['/prefix/root.txt',
+                                     '/prefix/dir/long.txt'])
+        props = doc.xpath('//D:response[1]//D:prop/*', namespaces=ns)
+        self.assertListEqual([p.tag for p in props], [
+            '{DAV:}getcontentlength', '{DAV:}displayname',
+            '{DAV:}resourcetype'])
+
+    async def testSearchDepth(self):
+        await self.fill()
+        response = await self.client.request(
+            'SEARCH', '/prefix/', body=searchrequest(depth='1'))
+        doc = et.fromstring(response.body)
+        hrefs = doc.xpath('//D:response/D:href/text()',
+                          namespaces={'D': 'DAV:'})
+        self.assertListEqual(hrefs, ['/prefix/root.txt'])
+
+    async def testSearchJSON(self):
+        await self.fill()
+        response = await self.client.get(
+            '/prefix/dir/?search=*.txt&order=name')
+        self.assertEqual(response.status, 200)
+        names = [r['path'] for r in json.loads(response.text)['results']]
+        self.assertListEqual(names, ['/dir/long.txt', '/dir/short.txt'])
+        response = await self.client.get('/prefix/?search=content')
+        self.assertListEqual(json.loads(response.text)['results'], [])
+        response = await self.client.get('/prefix/?search=&type=collection')
+        names = [r['path'] for r in json.loads(response.text)['results']]
+        self.assertListEqual(names, ['/', '/dir'])
+
+    async def testSearchErrors(self):
+        response = await self.client.request('SEARCH', '/prefix/',
+                                             body=b'<invalid')
+        self.assertEqual(response.status, 400)
+        response = await self.client.get('/prefix/?search=&limit=x')
+        self.assertEqual(response.status, 400)
+        response = await self.client.request(
+            'SEARCH', '/prefix/', body=searchrequest('/prefix/none/'))
+        self.assertEqual(response.status, 404)
+        # filesystem search requires metadata index
+        response = await self.client.request('SEARCH', '/fs/',
+                                             body=searchrequest('/fs/'))
+        self.assertEqual(response.status, 501)
+
+    def testOptions(self):
+        response = self.client.request('OPTIONS', '/prefix/')
+        self.assertEqual(response.headers['DASL'], '<DAV:basicsearch>')
@@ -0,0 +1,135 @@
+# coding: utf-8
+import argparse
+import functools
+import logging
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from unittest import TestCase, mock, skipUnless
+
+from aiohttp import web
+
+from aiodav import server
+from aiodav.__main__ import main, mount, parse_args
+
+
+__all__ = ['ServeOptionsTestCase', 'SupervisorTestCase']
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def static_app():
+    """ Application without mount state, served by several workers."""
+    app = web.Application()
+    app.router.add_static('/data/', os.environ['AIODAV_TEST_ROOT'])
+    return app
+
+
+class ServeOptionsTestCase(TestCase):
+
+    def testMount(self):
+        self.assertEqual(mount('/data/=/srv/data'), ('data', '/srv/data'))
+        with self.assertRaises(argparse.ArgumentTypeError):
+            mount('/srv/data')
+
+    def testParseArgs(self):
+        options = parse_args(['serve', '-w', '3', '-m', 'a=/tmp/a',
+                              '-m', 'b=/tmp/b'])
+        self.assertEqual(options.workers, 3)
+        self.assertListEqual(options.mounts, [('a', '/tmp/a'),
+                                              ('b', '/tmp/b')])
+        with self.assertRaises(SystemExit), mock.patch('sys.stderr'):
+            parse_args(['serve', '-m', 'a=/tmp/a', '--app', 'app:app'])
+
+    def testProcessLocalState(self):
+        root_dir = tempfile.mkdtemp()
+        try:
+            factory = functools.partial(server.mounts_app,
+                                        {'data': root_dir})
+            self.assertIn('data: lock_manager',
+                          server.app_process_local_state(factory))
+            with mock.patch.dict(os.environ, AIODAV_TEST_ROOT=root_dir):
+                self.assertListEqual(
+                    server.app_process_local_state(static_app), [])
+            with self.assertLogs('aiodav.server', logging.ERROR), \
+                    mock.patch('logging.basicConfig'):
+                self.assertEqual(
+                    main(['serve', '-w', '2', '-m', 'data=%s' % root_dir]), 2)
+        finally:
+            shutil.rmtree(root_dir)
+        self.assertEqual(parse_args(['serve']).workers, 1)
+
+    def testDefaultThreads(self):
+        self.assertGreaterEqual(server.default_threads(1000), 4)
+        self.assertGreaterEqual(server.default_threads(1),
+                                server.default_threads(2))
+
+
+@skipUnless(hasattr(os, 'fork'), 'fork is required')
+class SupervisorTestCase(TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.root_dir, 'file.txt'), 'wb') as f:
+            f.write(b'CONTENT')
+        self.log = tempfile.TemporaryFile()
+        env = dict(os.environ, AIODAV_TEST_ROOT=self.root_dir)
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'aiodav', 'serve', '--host', '127.0.0.1',
+             '--port', '0', '-w', '2', '--app', 'tests.test_server:static_app'],
+            cwd=ROOT, env=env, stderr=self.log, start_new_session=True)
+        self.port = int(self.wait_log(r'Listening on [\d.]+:(\d+)')[0])
+        self.workers = self.wait_log(r'Started worker (\d+)', count=2)
+        self.wait_log(r'Workers are listening')
+
+    def tearDown(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+        self.log.close()
+        shutil.rmtree(self.root_dir)
+
+    def wait_log(self, pattern, count=1, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            self.log.seek(0)
+            found = re.findall(pattern, self.log.read().decode())
+            if len(found) >= count:
+                return found
+            if time.monotonic() > deadline:
+                self.fail("%s not found in log" % pattern)
+            time.sleep(0.05)
+
+    def get(self, path):
+        url = 'http://127.0.0.1:%s%s' % (self.port, path)
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.read()
+
+    def testServe(self):
+        self.assertEqual(self.get('/data/file.txt'), b'CONTENT')
+        self.process.send_signal(signal.SIGTERM)
+        self.assertEqual(self.process.wait(10), 0)
+        self.wait_log(r'Worker \d+ exited with 0', count=2)
+
+    def testRestartCrashed(self):
+        os.kill(int(self.workers[0]), signal.SIGKILL)
+        self.wait_log(r'Worker %s crashed' % self.workers[0])
+        self.wait_log(r'Started worker (\d+)', count=3)
+        self.assertEqual(self.get('/data/file.txt'), b'CONTENT')
+
+    def testReload(self):
+        self.process.send_signal(signal.SIGHUP)
+        self.wait_log(r'Workers are listening', count=2)
+        started = self.wait_log(r'Started worker (\d+)', count=4)
+        for pid in self.workers:
+            self.wait_log(r'Worker %s exited with 0' % pid)
+        self.assertNotIn(self.workers[0], started[2:])
+        self.assertEqual(self.get('/data/file.txt'), b'CONTENT')
@@ -0,0 +1,253 @@
+# coding: utf-8
+import asyncio
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from lxml import etree as et
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav import events
+from aiodav.contrib import setup
+from aiodav.events import ChangeEvent, ChangeJournal, InvalidSyncToken
+from aiodav.resources import FileSystemResource
+from aiodav.search import DEPTH_INFINITY
+from aiodav.sync import (SyncError, SyncRequest, UnsupportedReport,
+                         parse_sync_collection)
+from tests.helpers import fill_file
+
+
+__all__ = ['ChangeJournalTestCase', 'SyncCollectionTestCase']
+
+NS = {'D': 'DAV:'}
+
+
+def sync_body(token='', level='1', limit=None):
+    limit = ('<D:limit><D:nresults>%d</D:nresults></D:limit>' % limit
+             if limit else '')
+    return ('<?xml version="1.0" encoding="utf-8" ?>'
+            '<D:sync-collection xmlns:D="DAV:">'
+            '<D:sync-token>%s</D:sync-token>'
+            '<D:sync-level>%s</D:sync-level>%s'
+            '<D:prop><D:getcontentlength/></D:prop>'
+            '</D:sync-collection>' % (token, level, limit)).encode('utf-8')
+
+
+class ChangeJournalTestCase(TestCase):
+
+    def record(self, journal, type, path, destination=None):
+        journal.record(ChangeEvent(0, type, path, destination))
+
+    def testChanges(self):
+        journal = ChangeJournal()
+        token = journal.token()
+        self.record(journal, events.CREATED, '/a')
+        self.record(journal, events.MODIFIED, '/dir/b')
+        self.record(journal, events.MODIFIED, '/a')
+        self.record(journal, events.MOVED, '/dir/c', '/dir/sub/c')
+        since = journal.parse_token(token)
+        self.assertListEqual(journal.changes(since), [
+            (2, '/dir/b', events.MODIFIED),
+            (3, '/a', events.MODIFIED),
+            (4, '/dir/c', events.DELETED),
+            (5, '/dir/sub/c', events.MOVED)])
+        self.assertListEqual(
+            [c[1] for c in journal.changes(since, '/dir', depth=1)],
+            ['/dir/b', '/dir/c'])
+        self.assertListEqual(journal.changes(4, '/dir'),
+                             [(5, '/dir/sub/c', events.MOVED)])
+
+    def testTokens(self):
+        journal = ChangeJournal(max_entries=2)
+        first = journal.token()
+        for path in ('/a', '/b', '/a'):
+            self.record(journal, events.MODIFIED, path)
+        # '/a' change is compacted into single entry
+        self.assertEqual(len(journal), 2)
+        self.assertEqual(journal.parse_token(first), 0)
+        self.record(journal, events.MODIFIED, '/c')
+        with self.assertRaises(InvalidSyncToken):
+            journal.parse_token(first)
+        self.assertEqual(journal.parse_token(journal.token(2)), 2)
+        for token in ('urn:other', ChangeJournal().token(),
+                      journal.token(10)):
+            with self.assertRaises(InvalidSyncToken):
+                journal.parse_token(token)
+        self.record(journal, events.RESET, '/')
+        with self.assertRaises(InvalidSyncToken):
+            journal.parse_token(journal.token(4))
+        self.assertListEqual(journal.changes(journal.parse_token(
+            journal.token())), [])
+
+    def testWatcherStop(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        root_dir = tempfile.mkdtemp()
+        try:
+            feed = events.ChangeFeed(watch_dir=root_dir, watch_grace=0,
+                                     sync_grace=0.1)
+            loop.run_until_complete(feed.watch_journal())
+            self.assertIsNotNone(feed._watcher)
+            token = feed.journal.token()
+            feed.journal.parse_token(token)
+            loop.run_until_complete(asyncio.sleep(0.15))
+            # changes made outside aiodav are not recorded anymore
+            self.assertIsNone(feed._watcher)
+            with self.assertRaises(InvalidSyncToken):
+                feed.journal.parse_token(token)
+            feed.close()
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+            shutil.rmtree(root_dir)
+
+    def testPartialWatch(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        root_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(root_dir, 'dir'))
+        try:
+            feed = events.ChangeFeed(watch_dir=root_dir, max_watches=1)
+            token = feed.journal.token()
+            with self.assertLogs('aiodav.events', 'WARNING'):
+                loop.run_until_complete(feed.watch_journal())
+            # changes in 'dir' are not recorded
+            self.assertFalse(feed._watcher.complete)
+            for issued in (token, feed.journal.token()):
+                with self.assertRaises(InvalidSyncToken):
+                    feed.journal.parse_token(issued)
+            feed.close()
+            self.assertTrue(feed.journal.complete)
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+            shutil.rmtree(root_dir)
+
+    def testParse(self):
+        self.assertEqual(parse_sync_collection(sync_body()),
+                         SyncRequest(None, 1, None, ['getcontentlength']))
+        self.assertEqual(
+            parse_sync_collection(sync_body('t', 'infinite', 10)),
+            SyncRequest('t', DEPTH_INFINITY, 10, ['getcontentlength']))
+        with self.assertRaises(UnsupportedReport):
+            parse_sync_collection(b'<D:version-tree xmlns:D="DAV:"/>')
+        with self.assertRaises(SyncError):
+            parse_sync_collection(sync_body(level='2'))
+
+
+@async_test
+class SyncCollectionTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        self.root = FileSystemResource('prefix', root_dir=self.root_dir)
+        self.feed = events.ChangeFeed()
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False,
+              mount_options={'prefix': {'change_feed': self.feed}})
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        self.feed.close()
+        shutil.rmtree(self.root_dir)
+
+    async def report(self, body, path='/prefix/', status=207):
+        response = await self.client.request('REPORT', path, body=body)
+        self.assertEqual(response.status, status)
+        return et.fromstring(response.text.encode('utf-8'))
+
+    def parse(self, xml):
+        result = {}
+        for response in xml.xpath('D:response', namespaces=NS):
+            href = response.findtext('{DAV:}href')
+            status = response.findtext('{DAV:}status')
+            if status is None:
+                status = response.findtext('{DAV:}propstat/{DAV:}status')
+            result[href] = status.split()[1]
+        return result, xml.findtext('{DAV:}sync-token')
+
+    async def testSync(self):
+        await fill_file(self.root / 'a.txt')
+        await fill_file(self.root / 'b.txt')
+        changes, token = self.parse(await self.report(sync_body()))
+        self.assertDictEqual(changes, {'/prefix/a.txt': '200',
+                                       '/prefix/b.txt': '200'})
+
+        changes, same = self.parse(await self.report(sync_body(token)))
+        self.assertDictEqual(changes, {})
+        self.assertEqual(same, token)
+
+        response = await self.client.put('/prefix/a.txt', body=b'new')
+        self.assertEqual(response.status, 200)
+        response = await self.client.delete('/prefix/b.txt')
+        self.assertEqual(response.status, 200)
+        response = await self.client.request('MKCOL', '/prefix/dir/')
+        self.assertEqual(response.status, 201)
+        response = await self.client.put('/prefix/dir/c.txt', body=b'c')
+        self.assertEqual(response.status, 201)
+        changes, _ = self.parse(await self.report(sync_body(token)))
+        self.assertDictEqual(changes, {'/prefix/a.txt': '200',
+                                       '/prefix/b.txt': '404',
+                                       '/prefix/dir': '200'})
+
+        # moved collection is reported with its members
+        response = await self.client.request(
+            'MOVE', '/prefix/dir/', headers={'Destination': '/prefix/new/'})
+        self.assertEqual(response.status, 201)
+        changes, _ = self.parse(await self.report(
+            sync_body(token, 'infinite')))
+        self.assertDictEqual(changes, {'/prefix/a.txt': '200',
+                                       '/prefix/b.txt': '404',
+                                       '/prefix/dir': '404',
+                                       '/prefix/dir/c.txt': '404',
+                                       '/prefix/new': '200',
+                                       '/prefix/new/c.txt': '200'})
+
+    async def testSymlinkLoop(self):
+        os.mkdir(os.path.join(self.root_dir, 'dir'))
+        os.symlink(self.root_dir, os.path.join(self.root_dir, 'dir', 'loop'))
+        changes, _ = self.parse(await self.report(
+            sync_body(level='infinite')))
+        self.assertDictEqual(changes, {'/prefix/dir': '200',
+                                       '/prefix/dir/loop': '200'})
+
+    async def testLimit(self):
+        changes, token = self.parse(await self.report(sync_body()))
+        for name in 'abc':
+            await fill_file(self.root / name)
+        for name in 'abc':
+            response = await self.client.put('/prefix/%s' % name, body=b'x')
+            self.assertEqual(response.status, 200)
+        changes, next_token = self.parse(await self.report(
+            sync_body(token, limit=2)))
+        self.assertDictEqual(changes, {'/prefix/a': '200',
+                                       '/prefix/b': '200',
+                                       '/prefix/': '507'})
+        changes, _ = self.parse(await self.report(sync_body(next_token)))
+        self.assertDictEqual(changes, {'/prefix/c': '200'})
+
+    async def testErrors(self):
+        xml = await self.report(sync_body('urn:unknown'), status=403)
+        self.assertIsNotNone(xml.find('{DAV:}valid-sync-token'))
+        xml = await self.report(b'<D:version-tree xmlns:D="DAV:"/>',
+                                status=403)
+        self.assertIsNotNone(xml.find('{DAV:}supported-report'))
+        response = await self.client.request('REPORT', '/prefix/',
+                                             body=b'<sync')
+        self.assertEqual(response.status, 400)
+        response = await self.client.request('REPORT', '/prefix/missing/',
+                                             body=sync_body())
+        self.assertEqual(response.status, 404)
+
+    async def testPartialWatch(self):
+        os.mkdir(os.path.join(self.root_dir, 'dir'))
+        self.feed.watch_dir = self.root_dir
+        self.feed.max_watches = 1
+        with self.assertLogs('aiodav.events', 'WARNING'):
+            changes, token = self.parse(await self.report(sync_body()))
+        self.assertDictEqual(changes, {'/prefix/dir': '200'})
+        # client falls back to full sync
+        xml = await self.report(sync_body(token), status=403)
+        self.assertIsNotNone(xml.find('{DAV:}valid-sync-token'))
@@ -0,0 +1,232 @@
+# coding: utf-8
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from aiohttp_tests import BaseTestCase, web, async_test
+
+from aiodav.contrib import setup
+from aiodav.properties import STORE_NAME
+from aiodav.resources import FileSystemResource
+from aiodav.uploads import (RangeSet, UploadError, UploadManager,
+                            UploadSession, is_staging_name, journal_name,
+                            journal_record, parse_content_range,
+                            staging_name)
+from tests.helpers import content_reader, fill_file, read_file
+
+
+__all__ = ['UploadHelpersTestCase', 'UploadViewTestCase']
+
+
+class UploadHelpersTestCase(TestCase):
+
+    def testParseContentRange(self):
+        self.assertEqual(parse_content_range('bytes 0-9/100'), (0, 9, 100))
+        self.assertEqual(parse_content_range('bytes 10-19/*'), (10, 19, None))
+        for value in ('bytes 10-9/100', 'bytes 0-100/100', 'bytes */100',
+                      'items 0-1/2'):
+            with self.assertRaises(UploadError):
+                parse_content_range(value)
+
+    def testStagingName(self):
+        self.assertTrue(is_staging_name(staging_name('f.txt', 'abc')))
+        self.assertTrue(is_staging_name(journal_name('f.txt', 'abc')))
+        for name in ('f.txt', '.f.txt', '.aiodav-upload-abc',
+                     'f.aiodav-upload-abc', '.f.txt.upload-abc'):
+            self.assertFalse(is_staging_name(name))
+
+    def testReplay(self):
+        with mock.patch('time.time', return_value=50):
+            session = UploadSession('abc', '/f.txt', None)
+        with mock.patch('time.time', return_value=100):
+            records = [journal_record('start'), journal_record('size', 8),
+                       journal_record('part', 4, 8)]
+        session.replay(records + ['90.000 part 0 2'])
+        self.assertEqual(session.size, 8)
+        self.assertListEqual(list(session.ranges), [(0, 2), (4, 8)])
+        self.assertEqual(session.touched, 100)
+        with self.assertRaises(UploadError):
+            session.replay(['100.000 size 10'])
+
+    def testRangeSet(self):
+        ranges = RangeSet()
+        for start, end in ((10, 20), (30, 40), (0, 5), (45, 50)):
+            ranges.add(start, end)
+        self.assertListEqual(list(ranges), [(0, 5), (10, 20), (30, 40),
+                                            (45, 50)])
+        self.assertFalse(ranges.covers(50))
+        ranges.add(5, 45)
+        self.assertListEqual(list(ranges), [(0, 50)])
+        self.assertTrue(ranges.covers(50))
+        self.assertEqual(ranges.received, 50)
+
+    def testExpire(self):
+        manager = UploadManager(expire=10)
+        with mock.patch('time.time', return_value=100):
+            session = manager.create('id', '/f.txt', None)
+            busy = manager.create('busy', '/g.txt', None)
+            busy.pending = 1
+        with mock.patch('time.time', return_value=111):
+            self.assertListEqual(manager.collect_expired(), [session])
+        self.assertIsNone(manager.get('id'))
+        self.assertIs(manager.get('busy'), busy)
+        with self.assertRaises(UploadError):
+            manager.create('../id', '/f.txt', None)
+
+
+@async_test
+class UploadViewTestCase(BaseTestCase):
+
+    def init_app(self, loop):
+        self.root_dir = tempfile.mkdtemp()
+        self.root = FileSystemResource('prefix', root_dir=self.root_dir)
+        app = web.Application(loop=loop)
+        setup(app, mounts={'prefix': self.root}, hack_debugtoolbar=False)
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.root_dir)
+
+    def listdir(self):
+        """ Returns root directory files except property store."""
+        return [n for n in os.listdir(self.root_dir) if n != STORE_NAME]
+
+    async def put_part(self, url, data, first, total='*'):
+        return await self.client.put(url, body=data, headers={
+            'Content-Range': 'bytes %s-%s/%s' % (
+                first, first + len(data) - 1, total)})
+
+    async def testPutRange(self):
+        await fill_file(self.root / 'f.txt', b'0123456789')
+        response = await self.put_part('/prefix/f.txt', b'ABC', 8)
+        self.assertEqual(response.status, 204)
+        content = await read_file(self.root / 'f.txt')
+        self.assertEqual(content, b'01234567ABC')
+
+        response = await self.client.put(
+            '/prefix/f.txt', body=b'AB',
+            headers={'Content-Range': 'bytes 0-2/3'})
+        self.assertEqual(response.status, 400)
+
+    async def testPutRangeLongBody(self):
+        await fill_file(self.root / 'f.txt', b'0123456789')
+        # body without reliable length is longer than its range
+        response = await self.client.put(
+            '/prefix/f.txt', body=b'ABCDEF',
+            headers={'Content-Range': 'bytes 2-4/*', 'CONTENT-LENGTH': '3'})
+        self.assertEqual(response.status, 400)
+        content = await read_file(self.root / 'f.txt')
+        self.assertEqual(content, b'0123456789')
+
+    async def testUpload(self):
+        url = '/prefix/f.txt?upload=abc'
+        response = await self.put_part(url, b'DEF', 3)
+        self.assertEqual(response.status, 202)
+        # parts are uploaded concurrently
+        responses = await asyncio.gather(
+            self.put_part(url, b'GH', 6, total=8),
+            self.put_part(url, b'A', 0))
+        self.assertListEqual([r.status for r in responses], [202, 202])
+        self.assertFalse(os.path.exists(os.path.join(self.root_dir, 'f.txt')))
+
+        response = await self.client.get(url)
+        status = json.loads(response.text)
+        self.assertEqual(status['size'], 8)
+        self.assertListEqual(status['received'], [[0, 0], [3, 7]])
+        self.assertFalse(status['complete'])
+
+        response = await self.put_part(url, b'BC', 1)
+        self.assertEqual(response.status, 201)
+        content = await read_file(self.root / 'f.txt')
+        self.assertEqual(content, b'ABCDEFGH')
+        self.assertListEqual(self.listdir(), ['f.txt'])
+        response = await self.client.get(url)
+        self.assertEqual(response.status, 404)
+
+    async def testStagingHidden(self):
+        url = '/prefix/f.txt?upload=abc'
+        await self.put_part(url, b'DATA', 0, total=10)
+        # staged content and journal
+        self.assertEqual(len(self.listdir()), 2)
+        response = await self.client.get(
+            '/prefix/', headers={'Accept': 'application/json'})
+        self.assertListEqual(json.loads(response.text)['descendants'], [])
+        for name in staging_name('f.txt', 'abc'), journal_name('f.txt', 'abc'):
+            response = await self.client.request('PROPFIND',
+                                                 '/prefix/' + name)
+            self.assertIn(b'404 Not Found', response.body)
+
+    async def testStagingReserved(self):
+        await fill_file(self.root / 'f.txt', b'DATA')
+        name = staging_name('f.txt', 'abc')
+        response = await self.client.put('/prefix/' + name, body=b'X')
+        self.assertEqual(response.status, 403)
+        response = await self.client.request('MKCOL', '/prefix/%s/' % name)
+        self.assertEqual(response.status, 403)
+        for method in 'MOVE', 'COPY':
+            response = await self.client.request(
+                method, '/prefix/f.txt',
+                headers={'Destination': '/prefix/' + name})
+            self.assertEqual(response.status, 403)
+        self.assertListEqual(self.listdir(), ['f.txt'])
+
+    async def testResume(self):
+        url = '/prefix/f.txt?upload=abc'
+        response = await self.put_part(url, b'ABCD', 0, total=8)
+        self.assertEqual(response.status, 202)
+        manager = next(iter(self.app['aiodav']['dispatcher'])).handler.kw[
+            'upload_manager']
+        # another server process receives a part
+        resource = self.root / 'f.txt'
+        await resource.put_upload_part('abc', content_reader(b'EF'), 4)
+        await resource.log_upload('abc', journal_record('part', 4, 6))
+        response = await self.client.get(url)
+        self.assertListEqual(json.loads(response.text)['received'],
+                             [[0, 5]])
+        # server restart
+        manager.remove(manager.get('abc'))
+        response = await self.put_part(url, b'GH', 6)
+        self.assertEqual(response.status, 201)
+        content = await read_file(self.root / 'f.txt')
+        self.assertEqual(content, b'ABCDEFGH')
+        self.assertListEqual(self.listdir(), ['f.txt'])
+
+    async def testFailedPendingPart(self):
+        url = '/prefix/f.txt?upload=abc'
+        response = await self.put_part(url, b'EFGH', 4, total=8)
+        self.assertEqual(response.status, 202)
+        session = self.app['aiodav']['dispatcher']
+        session = next(iter(session)).handler.kw['upload_manager'].get('abc')
+        # retried part completes upload while first attempt is in progress
+        session.pending += 1
+        response = await self.put_part(url, b'ABCD', 0)
+        self.assertEqual(response.status, 202)
+        session.pending -= 1
+        # first attempt fails
+        response = await self.client.put(url, body=b'ABCDEF', headers={
+            'Content-Range': 'bytes 0-3/8', 'CONTENT-LENGTH': '4'})
+        self.assertEqual(response.status, 400)
+        await asyncio.sleep(0.05)
+        content = await read_file(self.root / 'f.txt')
+        self.assertEqual(content, b'ABCDEFGH')
+
+    async def testAbortUpload(self):
+        url = '/prefix/f.txt?upload=abc'
+        await self.put_part(url, b'DATA', 0, total=10)
+        response = await self.client.get('/prefix/other.txt?upload=abc')
+        self.assertEqual(response.status, 409)
+        response = await self.client.delete(url)
+        self.assertEqual(response.status, 204)
+        self.assertListEqual(self.listdir(), [])
+        response = await self.client.delete(url)
+        self.assertEqual(response.status, 404)
+
+    async def testUploadSizeMismatch(self):
+        url = '/prefix/f.txt?upload=abc'
+        await self.put_part(url, b'DATA', 0, total=10)
+        response = await self.put_part(url, b'DATA', 4, total=12)
+        self.assertEqual(response.status, 400)
@@ -1,5 +1,7 @@
 # coding: utf-8
 import json
+import logging
+from unittest import mock
 
 from lxml import etree as et
 
@@ -7,11 +9,13 @@ from aiodav.views import DAV_METHODS
 from aiohttp_tests import BaseTestCase, web, async_test
 
 from aiodav.contrib import setup
+from aiodav.resources import errors
 from aiodav.resources.dummy import DummyResource
-from tests.helpers import fill_file, format_time, read_file
+from tests.helpers import (fill_file, format_time, format_http_time,
+                           read_file)
 
 
-__all__ = ['WebDAVTestCase']
+__all__ = ['WebDAVTestCase', 'ServerTimingTestCase']
 
 
 @async_test
@@ -146,6 +150,17 @@ class WebDAVTestCase(BaseTestCase):
         self.assertEqual(response.headers['Content-Length'], '7')
         self.assertEqual(response.text, 'CONTENT')
 
+    async def testDownloadMissing(self):
+        response = await self.client.get('/prefix/missing.txt')
+        self.assertEqual(response.status, 404)
+        f = self.root / 'filename.txt'
+        await fill_file(f)
+        # file removed after its properties were read
+        with mock.patch.object(DummyResource, 'get_content',
+                               side_effect=errors.ResourceDoesNotExist):
+            response = await self.client.get('/prefix/filename.txt')
+        self.assertEqual(response.status, 404)
+
     async def testDownloadDirHTML(self):
         await self.root.make_collection('dir')
         response = await self.client.get('/prefix/dir/?dl=1',
@@ -440,7 +455,7 @@ class WebDAVTestCase(BaseTestCase):
         name = self.get_child(prop, 'displayname')
         self.assertEqual(name.text or '', resource.name)
         modified = self.get_child(prop, 'getlastmodified')
-        self.assertEqual(modified.text, format_time(resource.mtime))
+        self.assertEqual(modified.text, format_http_time(resource.mtime))
         created = self.get_child(prop, 'creationdate')
         self.assertEqual(created.text, format_time(resource.ctime))
         length = self.get_child(prop, 'getcontentlength')
@@ -487,3 +502,62 @@ class WebDAVTestCase(BaseTestCase):
     def assertElementName(self, element, name):
         self.assertEqual(element.tag, '{DAV:}%s' % name)
         self.assertDictEqual(element.nsmap, {'D': 'DAV:'})
+
+
+@async_test
+class ServerTimingTestCase(BaseTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.root = DummyResource('prefix')
+
+    @classmethod
+    def tearDownClass(cls):
+        DummyResource._root = None
+
+    def init_app(self, loop):
+        app = web.Application(loop=loop)
+        options = {'prefix': {'server_timing': True, 'timing_log': True}}
+        setup(app, mounts={'prefix': self.root, 'plain': self.root},
+              hack_debugtoolbar=False, mount_options=options)
+        return app
+
+    def tearDown(self):
+        super().tearDown()
+        self.root._resources.clear()
+
+    async def testPropfindPhases(self):
+        f = self.root / 'filename.txt'
+        await fill_file(f)
+        with self.assertLogs('aiodav.access', logging.INFO) as logs:
+            response = await self.client.request(
+                'PROPFIND', '/prefix/', headers={'Depth': '1'})
+        self.assertEqual(response.status, 207)
+        header = response.headers['Server-Timing']
+        phases = [m.split(';')[0] for m in header.split(', ')]
+        # collection members are populated before building propstats
+        self.assertListEqual(phases, ['instantiate', 'populate', 'propstat',
+                                      'serialize', 'total'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['method'], 'PROPFIND')
+        self.assertEqual(record['mount'], 'prefix')
+        self.assertEqual(record['status'], 207)
+        self.assertIn('serialize', record['phases'])
+
+    async def testStreamResponse(self):
+        f = self.root / 'filename.txt'
+        await fill_file(f)
+        response = await self.client.get('/prefix/filename.txt')
+        self.assertEqual(response.status, 200)
+        self.assertIn('instantiate;dur=', response.headers['Server-Timing'])
+
+    async def testErrorResponse(self):
+        response = await self.client.get('/prefix/missing.txt')
+        self.assertEqual(response.status, 404)
+        self.assertIn('total;dur=', response.headers['Server-Timing'])
+
+    async def testDisabledForMount(self):
+        response = await self.client.request('PROPFIND', '/plain/')
+        self.assertEqual(response.status, 207)
+        self.assertNotIn('Server-Timing', response.headers)